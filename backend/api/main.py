@@ -1,5 +1,6 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import cv2
 import numpy as np
 import os
@@ -7,14 +8,22 @@ import json
 import logging
 from logging.handlers import RotatingFileHandler
 import time
+import asyncio
 from typing import Dict, Any, List
+from collections import OrderedDict
 import platform
-import subprocess
 
 # Importações de módulos locais
 from ..core.adb_utils import capture_screen, simulate_touch
 from ..core.action_executor import simulate_scroll
-from ..core.image_detection import find_image_on_screen # Reutilizando se necessário, ou mantendo a lógica aqui
+from ..core.image_detection import find_image_on_screen, best_match_in_frame, load_template_gray, NOT_EVALUATED
+from ..core.device_profile import get_device_profile
+from ..core.batch_matching import first_match
+from ..core.detection_pool import get_detection_pool
+from ..core.screen_classifier import screen_index_available, classify_screen, recover_to_screen
+from ..core.device_registry import get_device_registry
+from ..core.debug_writer import get_debug_writer
+from ..core.game_state import get_game_state_service, DEFAULT_PACKAGE
 
 # Setup Logging
 _BASE_DIR_FOR_LOG = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -22,6 +31,9 @@ LOGS_DIR = os.path.join(_BASE_DIR_FOR_LOG, "logs")
 os.makedirs(LOGS_DIR, exist_ok=True)
 logger = logging.getLogger("autotouchdroid")
 logger.setLevel(logging.DEBUG)
+# Handlers próprios (console INFO + automation.log): sem propagar, a fila do logger raiz
+# (core.logger) escreveria cada linha de novo no console e o DEBUG vazaria para o log JSON
+logger.propagate = False
 formatter = logging.Formatter(fmt="%(asctime)s | %(levelname)s | %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
 if not logger.handlers:
     console_handler = logging.StreamHandler()
@@ -64,21 +76,16 @@ def load_scroll_config() -> Dict[str, Any]:
 
 SCROLL_CONFIG = load_scroll_config()
 
-# Debug visual de clique
+# Debug visual de clique (desenho e gravação em segundo plano pelo debug_writer)
 def _save_debug_click_overlay(img, click_x, click_y, rect=None, label=None):
-    try:
-        overlay = img.copy()
+    def draw(overlay):
         if rect:
             (rx, ry, rw, rh) = rect
             cv2.rectangle(overlay, (int(rx), int(ry)), (int(rx + rw), int(ry + rh)), (0, 255, 0), 2)
         cv2.circle(overlay, (int(click_x), int(click_y)), 20, (0, 0, 255), -1)
         if label:
             cv2.putText(overlay, str(label), (int(click_x) + 30, int(click_y)), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-        debug_path = os.path.join(SCREENSHOT_DIR, f"debug_click_{int(time.time())}.png")
-        cv2.imwrite(debug_path, overlay)
-        return debug_path
-    except Exception:
-        return None
+    return get_debug_writer().submit(img, "debug_click", draw, timestamped=True)
 
 @app.get("/")
 async def root():
@@ -102,56 +109,118 @@ async def list_actions():
 
 @app.get("/devices")
 async def list_devices():
+    # Estado em memória mantido pelo registro (host:track-devices): sem chamar o ADB.
+    # Propriedades lidas uma vez por conexão (só o primeiro pedido após conectar vai ao dispositivo)
     try:
-        result = subprocess.run(["adb", "devices"], capture_output=True, text=True)
-        if result.returncode != 0:
-            raise HTTPException(status_code=500, detail="Falha ao executar adb devices")
-        lines = result.stdout.strip().splitlines()
-        devices = []
-        for line in lines[1:]:
-            line = line.strip()
-            if not line:
-                continue
-            parts = line.split()
-            if len(parts) >= 2 and parts[1] == "device":
-                devices.append(parts[0])
-        return {"devices": devices}
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail="ADB não encontrado")
+        registry = get_device_registry()
+        online = registry.online_devices()
+        loop = asyncio.get_running_loop()
+        properties = {}
+        for serial in online:
+            props = await loop.run_in_executor(None, registry.properties, serial)
+            if props is not None:
+                properties[serial] = props.to_dict()
+        return {"devices": online, "states": registry.devices(), "tracking": registry.tracking,
+                "properties": properties}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/devices/{serial}/properties")
+async def device_properties(serial: str, refresh: bool = False):
+    """Resolução, densidade, modelo, versão do Android e touchscreen (nó e faixas ABS) do dispositivo."""
+    registry = get_device_registry()
+    loop = asyncio.get_running_loop()
+    props = await loop.run_in_executor(None, registry.properties, serial, refresh)
+    if props is None:
+        raise HTTPException(status_code=404, detail=f"Dispositivo {serial} não está online")
+    if not props.ok:
+        raise HTTPException(status_code=503, detail=f"Não foi possível ler as propriedades de {serial}")
+    return props.to_dict()
+
+@app.get("/devices/events")
+async def device_events():
+    """Stream (Server-Sent Events) de conexões/desconexões, começando pelo estado atual."""
+    registry = get_device_registry()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    unsubscribe = registry.subscribe(lambda event: loop.call_soon_threadsafe(queue.put_nowait, event.to_dict()))
+
+    async def stream():
+        try:
+            yield f"event: snapshot\ndata: {json.dumps(registry.devices())}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                    yield f"event: device\ndata: {json.dumps(event)}\n\n"
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            unsubscribe()
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
 @app.get("/check_game_state")
-async def check_game_state(package_name: str, device_id: str = None):
+async def check_game_state(package_name: str = DEFAULT_PACKAGE, device_id: str = None, max_age: float = None):
     """
     Verifica se o pacote informado está em execução e se está em primeiro plano.
+    Uma única chamada de shell (processo, foco, tela, resolução), com cache curta por dispositivo.
     """
-    def run(cmd):
-        try:
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            return result.returncode, result.stdout, result.stderr
-        except FileNotFoundError:
-            return 1, "", "ADB não encontrado"
-
-    base_cmd = ["adb"]
-    if device_id:
-        base_cmd += ["-s", device_id]
-
-    # Verifica se está em execução
-    rc, out, _ = run(base_cmd + ["shell", "pidof", package_name])
-    running = rc == 0 and out.strip() != ""
-
-    # Verifica se está em primeiro plano (várias abordagens)
-    foreground = False
-    rc1, out1, _ = run(base_cmd + ["shell", "dumpsys", "window", "windows"])
-    if rc1 == 0 and package_name in out1:
-        foreground = True
-    else:
-        rc2, out2, _ = run(base_cmd + ["shell", "dumpsys", "activity", "activities"])
-        if rc2 == 0 and ("mResumedActivity" in out2 and package_name in out2):
-            foreground = True
+    service = get_game_state_service()
+    loop = asyncio.get_running_loop()
+    try:
+        state = await loop.run_in_executor(None, service.get, device_id, package_name, max_age)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return state.to_dict()
+
+@app.get("/game_state/events")
+async def game_state_events(package_name: str = DEFAULT_PACKAGE, device_id: str = None):
+    """Stream (Server-Sent Events) das mudanças de estado do jogo, começando pelo estado atual."""
+    service = get_game_state_service()
+    loop = asyncio.get_running_loop()
+    try:
+        current = await loop.run_in_executor(None, service.get, device_id, package_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def on_change(state):
+        if state.device_id == device_id and state.package == package_name:
+            loop.call_soon_threadsafe(queue.put_nowait, state.to_dict())
 
-    return {"running": running, "foreground": foreground}
+    unsubscribe = service.subscribe(on_change)
+    unwatch = service.watch(device_id, package_name)
+
+    async def stream():
+        try:
+            yield f"event: snapshot\ndata: {json.dumps(current.to_dict())}\n\n"
+            while True:
+                try:
+                    state = await asyncio.wait_for(queue.get(), timeout=15)
+                    yield f"event: game_state\ndata: {json.dumps(state)}\n\n"
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            unwatch()
+            unsubscribe()
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+@app.get("/debug/artifacts")
+async def debug_artifacts_status():
+    """Estado do gravador de imagens de debug (ativo, amostragem, cota, contadores)."""
+    return get_debug_writer().status()
+
+@app.post("/debug/artifacts")
+async def debug_artifacts_configure(enabled: bool = Form(None), sample_rate: float = Form(None),
+                                    image_format: str = Form(None), quota_mb: float = Form(None)):
+    """Liga/desliga e ajusta as imagens de debug em tempo de execução."""
+    if image_format is not None and image_format.lower().lstrip(".") not in ("jpg", "jpeg", "png"):
+        raise HTTPException(status_code=400, detail="image_format deve ser jpg ou png")
+    writer = get_debug_writer()
+    writer.configure(enabled=enabled, sample_rate=sample_rate, image_format=image_format, quota_mb=quota_mb)
+    logger.info(f"Imagens de debug: {writer.status()}")
+    return writer.status()
 
 @app.post("/debug_touch")
 async def debug_touch(x: int = Form(...), y: int = Form(...), device_id: str = Form(None)):
@@ -175,7 +244,7 @@ async def debug_detect(action_name: str, template_file: str, device_id: str = No
         except Exception:
             pass
         template_full_path = os.path.join(TEMPLATES_DIR, action_name, template_file)
-        match = find_template_in_image(img, template_full_path, threshold=threshold)
+        match = find_template_in_image(img, template_full_path, threshold=threshold, device_id=device_id)
         if match:
             return {"found": True, "x": match["x"], "y": match["y"], "confidence": match["confidence"]}
         return {"found": False}
@@ -204,30 +273,24 @@ def load_sequence(action_name: str) -> List[Dict[str, Any]]:
         logger.error(f"Erro ao ler sequence.json: {e}")
         return []
 
-def find_template_in_image(image, template_path, threshold=0.8):
+def find_template_in_image(image, template_path, threshold=0.8, device_id=None):
     """Encontra o template na imagem fornecida (formato cv2/numpy)."""
     if not os.path.exists(template_path):
         logger.warning(f"Template não encontrado: {template_path}")
         return None
 
-    template = cv2.imread(template_path)
-    if template is None:
-        logger.warning(f"Falha ao carregar template (cv2): {template_path}")
+    # Template em cache (cinza) + multi-escala/escala travada quando habilitada em settings
+    max_val, box = best_match_in_frame(image, template_path, threshold=threshold, device_id=device_id)
+    if box is None:
+        # Sem caixa e score acima de NOT_EVALUATED: rejeitado pela cascata (negativo comum, sem aviso)
+        if max_val <= NOT_EVALUATED:
+            logger.warning(f"Template não avaliado (falha ao carregar ou maior que a imagem): {template_path}")
         return None
 
-    # Grayscale
-    img_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    temp_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
-
-    # Match
-    result = cv2.matchTemplate(img_gray, temp_gray, cv2.TM_CCOEFF_NORMED)
-    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-
     if max_val >= threshold:
-        h, w = temp_gray.shape
-        top_left = max_loc
-        center_x = top_left[0] + w // 2
-        center_y = top_left[1] + h // 2
+        x, y, w, h = box
+        center_x = x + w // 2
+        center_y = y + h // 2
         return {"x": center_x, "y": center_y, "confidence": float(max_val)}
     
     return None
@@ -257,27 +320,45 @@ async def process_action(
     if not sequence:
         raise HTTPException(status_code=404, detail=f"Ação '{action_name}' não encontrada ou vazia.")
 
-    # 3. Iterate Sequence to find match
+    # 3. Match all step templates in one batch (frame processed once), first step in order wins
+    steps_by_path = OrderedDict()
     for step in sequence:
         template_filename = step.get("template_file")
         if not template_filename:
             continue
-            
         template_full_path = os.path.join(TEMPLATES_DIR, action_name, template_filename)
-        
-        match = find_template_in_image(img, template_full_path)
-        
-        if match:
-            # Encontrou um passo da sequência!
-            return {
-                "found": True,
-                "step_name": step.get("name"),
-                "action": "click", # Por enquanto assume click, poderia ler de step['action_on_found']
-                "x": match["x"],
-                "y": match["y"],
-                "confidence": match["confidence"],
-                "message": f"Template {template_filename} encontrado."
-            }
+        if not os.path.exists(template_full_path):
+            logger.warning(f"Template não encontrado: {template_full_path}")
+            continue
+        steps_by_path.setdefault(template_full_path, step)
+
+    if steps_by_path and get_detection_pool() is not None:
+        # Pool de processos: templates distribuídos entre núcleos, aguardados sem bloquear o event loop
+        futures = get_detection_pool().submit(img, list(steps_by_path.keys()), threshold=0.8)
+        path, score, box = None, -1.0, None
+        for candidate, future in futures.items():
+            candidate_score, candidate_box = await asyncio.wrap_future(future)
+            if candidate_box is not None and candidate_score >= 0.8:
+                path, score, box = candidate, candidate_score, candidate_box
+                break
+    elif steps_by_path:
+        path, score, box = first_match(img, list(steps_by_path.keys()), threshold=0.8)
+    else:
+        path = None
+
+    if path is not None:
+        # Encontrou um passo da sequência!
+        step = steps_by_path[path]
+        x, y, w, h = box
+        return {
+            "found": True,
+            "step_name": step.get("name"),
+            "action": "click", # Por enquanto assume click, poderia ler de step['action_on_found']
+            "x": int(x + w // 2),
+            "y": int(y + h // 2),
+            "confidence": float(score),
+            "message": f"Template {step.get('template_file')} encontrado."
+        }
 
     # Se nenhum template for encontrado
     return {
@@ -350,8 +431,17 @@ async def start_action(action_name: str = Form(...), device_id: str = Form(None)
                     if action_type == "center_click":
                         click_x, click_y = w // 2, h // 2
                     elif action_type == "tap_absolute":
-                        click_x = int(current_step.get("x", w // 2))
-                        click_y = int(current_step.get("y", h // 2))
+                        if "nx" in current_step or "ny" in current_step:
+                            # Coordenadas normalizadas (0.0-1.0), independentes de resolução
+                            click_x = int(round(float(current_step.get("nx", 0.5)) * w))
+                            click_y = int(round(float(current_step.get("ny", 0.5)) * h))
+                        else:
+                            # x/y medidos no celular de referência (2400x1080); sem x/y, centro da tela
+                            profile = get_device_profile(device_id)
+                            ref_x, ref_y = profile.normalize(w // 2, h // 2)
+                            ref_x, ref_y = ref_x * profile.reference_width, ref_y * profile.reference_height
+                            click_x, click_y = profile.from_reference(
+                                float(current_step.get("x", ref_x)), float(current_step.get("y", ref_y)))
                     else:
                         logger.warning(f"Ação desconhecida no passo {current_step_index + 1}: {action_type}. Pulando.")
                         automation_logs.append(f"{time.strftime('%H:%M:%S')} | Ação desconhecida: {action_type}")
@@ -440,18 +530,19 @@ async def start_action(action_name: str = Form(...), device_id: str = Form(None)
                 start_y = int(cfg.get("start_y", 800))
                 center_x = int(cfg.get("center_x", 1200))
                 duration_ms = int(cfg.get("scroll_duration", 1000))
-                end_y = start_y - row_height
-                logger.info(f"Aplicando pré-scroll (fila {fila_atual}) {num_scrolls}x | ({center_x},{start_y})->({center_x},{end_y}) {duration_ms}ms")
+                start_coords, end_coords = get_device_profile(device_id).scroll_from_config(center_x, start_y, row_height)
+                logger.info(f"Aplicando pré-scroll (fila {fila_atual}) {num_scrolls}x | {start_coords}->{end_coords} {duration_ms}ms")
                 automation_logs.append(f"{time.strftime('%H:%M:%S')} | Pre-scroll fila {fila_atual}: {num_scrolls}x")
                 try:
                     for _ in range(num_scrolls):
-                        simulate_scroll(device_id=device_id, start_coords=[center_x, start_y], end_coords=[center_x, end_y], duration_ms=duration_ms)
+                        simulate_scroll(device_id=device_id, start_coords=start_coords, end_coords=end_coords, duration_ms=duration_ms)
                         time.sleep(delay_after_scroll)
                 except Exception as e:
                     logger.error(f"Erro no pré-scroll: {e}")
                     automation_logs.append(f"{time.strftime('%H:%M:%S')} | Erro no pré-scroll: {e}")
 
             found = False
+            img = None
 
             # Laço de tentativas para o passo atual
             start_wait = time.time()
@@ -475,7 +566,7 @@ async def start_action(action_name: str = Form(...), device_id: str = Form(None)
                     automation_logs.append(f"{time.strftime('%H:%M:%S')} | {err}")
                     raise HTTPException(status_code=500, detail=err)
 
-                match = find_template_in_image(img, template_full_path, threshold=threshold)
+                match = find_template_in_image(img, template_full_path, threshold=threshold, device_id=device_id)
 
                 # Limpa screenshot
                 # Não remove ainda se vamos salvar debug
@@ -507,7 +598,7 @@ async def start_action(action_name: str = Form(...), device_id: str = Form(None)
                     if bool(current_step.get("debug_overlay", False)):
                         # Reconstrói o retângulo do template pelo centro
                         try:
-                            temp_img = cv2.imread(template_full_path)
+                            temp_img = load_template_gray(template_full_path)  # Cache em memória
                             th, tw = temp_img.shape[:2] if temp_img is not None else (0, 0)
                             rx = int(match["x"] - tw // 2)
                             ry = int(match["y"] - th // 2)
@@ -546,8 +637,8 @@ async def start_action(action_name: str = Form(...), device_id: str = Form(None)
                                 start_y = int(cfg.get("start_y", 800))
                                 center_x = int(cfg.get("center_x", 1200))
                                 duration_ms = int(cfg.get("scroll_duration", 800))
-                                end_y = start_y - row_height
-                                simulate_scroll(device_id=device_id, start_coords=[center_x, start_y], end_coords=[center_x, end_y], duration_ms=duration_ms)
+                                start_coords, end_coords = get_device_profile(device_id).scroll_from_config(center_x, start_y, row_height)
+                                simulate_scroll(device_id=device_id, start_coords=start_coords, end_coords=end_coords, duration_ms=duration_ms)
                                 automation_logs.append(f"{time.strftime('%H:%M:%S')} | Scroll on_fail aplicado (fila {fila_atual})")
                                 time.sleep(delay_after_scroll)
                             elif mode == "custom":
@@ -555,8 +646,8 @@ async def start_action(action_name: str = Form(...), device_id: str = Form(None)
                                 start_y = int(scroll_on_fail.get("start_y", 800))
                                 row_height = int(scroll_on_fail.get("row_height", 230))
                                 duration_ms = int(scroll_on_fail.get("duration_ms", 800))
-                                end_y = start_y - row_height
-                                simulate_scroll(device_id=device_id, start_coords=[center_x, start_y], end_coords=[center_x, end_y], duration_ms=duration_ms)
+                                start_coords, end_coords = get_device_profile(device_id).scroll_from_config(center_x, start_y, row_height)
+                                simulate_scroll(device_id=device_id, start_coords=start_coords, end_coords=end_coords, duration_ms=duration_ms)
                                 automation_logs.append(f"{time.strftime('%H:%M:%S')} | Scroll on_fail custom aplicado")
                                 time.sleep(delay_after_scroll)
                         except Exception as e:
@@ -580,6 +671,24 @@ async def start_action(action_name: str = Form(...), device_id: str = Form(None)
                         time.sleep(attempt_delay)
 
             if not found:
+                # Identificação de tela: a tela atual pode ser a de um passo posterior (salta) ou
+                # uma tela conhecida diferente da esperada (executa a rota de recuperação)
+                if screen_index_available() and img is not None:
+                    current_screen = classify_screen(img)
+                    later = [idx for idx in range(current_step_index + 1, len(sequence))
+                             if sequence[idx].get("screen") == current_screen.name]
+                    if current_screen.known and later:
+                        msg = f"Tela atual '{current_screen.name}' é a do passo {later[0] + 1}: continuando dele."
+                        logger.info(msg)
+                        automation_logs.append(f"{time.strftime('%H:%M:%S')} | {msg}")
+                        current_step_index = later[0]
+                        continue
+                    expected_screen = current_step.get("screen")
+                    if current_screen.known and expected_screen and current_screen.name != expected_screen:
+                        if recover_to_screen(expected_screen, device_id=device_id, frame=img):
+                            automation_logs.append(f"{time.strftime('%H:%M:%S')} | Rota de recuperação: '{current_screen.name}' -> '{expected_screen}'")
+                            continue
+
                 msg = f"Passo {current_step_index + 1} não concluído após {max_attempts} tentativas. Repetindo ciclo."
                 logger.info(msg)
                 automation_logs.append(f"{time.strftime('%H:%M:%S')} | {msg}")
@@ -17,6 +17,13 @@ class ADBSettings:
     adb_path: str = field(default_factory=lambda: os.getenv('ADB_PATH', 'adb'))
     default_device_id: Optional[str] = field(default_factory=lambda: os.getenv('DEFAULT_DEVICE_ID'))
     connection_timeout: int = field(default_factory=lambda: int(os.getenv('ADB_TIMEOUT', '30')))
+    # Servidor ADB (host:track-devices do registro de dispositivos)
+    server_host: str = field(default_factory=lambda: os.getenv('ADB_SERVER_HOST', '127.0.0.1'))
+    server_port: int = field(default_factory=lambda: int(os.getenv('ANDROID_ADB_SERVER_PORT', '5037')))
+    # Tempo máximo (s) que o executor espera o dispositivo voltar após uma desconexão
+    reconnect_timeout: float = field(default_factory=lambda: float(os.getenv('ADB_RECONNECT_TIMEOUT', '60')))
+    # Idade máxima (s) do estado do jogo servido da cache (core/game_state.py)
+    game_state_ttl: float = field(default_factory=lambda: float(os.getenv('GAME_STATE_TTL', '1.0')))
     screenshot_format: str = 'png'
     screenshot_quality: int = 100
 
@@ -30,8 +37,21 @@ class DetectionSettings:
     initial_delay: float = field(default_factory=lambda: float(os.getenv('INITIAL_DELAY', '2.0')))
     use_grayscale: bool = True
     template_cache_size: int = 100
-    enable_multiscale: bool = False
+    enable_multiscale: bool = field(default_factory=lambda: os.getenv('DETECTION_MULTISCALE', 'False').lower() == 'true')
     scales: list = field(default_factory=lambda: [0.8, 1.0, 1.2])
+    # Resolução (largura, altura) em que os templates foram capturados (Samsung A73, landscape)
+    reference_resolution: tuple = (2400, 1080)
+    # Falhas consecutivas na escala travada antes de voltar a testar todas as escalas
+    multiscale_relock_after: int = 10
+    # Similaridade mínima da região de perfil para reconhecer a conta ativa (active_account)
+    active_account_threshold: float = field(default_factory=lambda: float(os.getenv('ACTIVE_ACCOUNT_THRESHOLD', '0.9')))
+    # Cascata de rejeição: correlação em resolução reduzida descarta templates ausentes antes da busca
+    # em resolução cheia (rejeita se score reduzido < threshold - margem). Desligada por padrão: ligue
+    # só depois que validate_cascade passar no corpus gravado com a margem configurada
+    enable_cascade: bool = field(default_factory=lambda: os.getenv('DETECTION_CASCADE', 'False').lower() == 'true')
+    cascade_margin: float = field(default_factory=lambda: float(os.getenv('DETECTION_CASCADE_MARGIN', '0.25')))
+    # Pacote compilado de templates (data/templates.pack, np.memmap compartilhado entre processos)
+    template_pack: bool = field(default_factory=lambda: os.getenv('TEMPLATE_PACK', 'True').lower() == 'true')
 
 
 @dataclass
@@ -40,13 +60,18 @@ class PathSettings:
     base_dir: Path = BASE_DIR
     backend_dir: Path = field(default_factory=lambda: BASE_DIR / 'backend')
     actions_folder: Path = field(default_factory=lambda: BASE_DIR / 'backend' / 'actions' / 'templates')
+    # Telas conhecidas do jogo (frames gravados + âncoras) usadas pelo classificador de tela
+    screens_folder: Path = field(default_factory=lambda: BASE_DIR / 'backend' / 'actions' / 'screens')
     screenshots_folder: Path = field(default_factory=lambda: BASE_DIR / 'temp_screenshots')
     logs_folder: Path = field(default_factory=lambda: BASE_DIR / 'logs')
+    # Estado persistente entre execuções (checkpoints dos ciclos de contas)
+    data_folder: Path = field(default_factory=lambda: Path(os.getenv('DATA_FOLDER', str(BASE_DIR / 'data'))))
     
     def __post_init__(self):
         """Cria pastas necessárias se não existirem"""
         self.screenshots_folder.mkdir(parents=True, exist_ok=True)
         self.logs_folder.mkdir(parents=True, exist_ok=True)
+        self.data_folder.mkdir(parents=True, exist_ok=True)
 
 
 @dataclass
@@ -55,10 +80,15 @@ class LoggingSettings:
     level: str = field(default_factory=lambda: os.getenv('LOG_LEVEL', 'INFO'))
     format: str = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     date_format: str = '%Y-%m-%d %H:%M:%S'
-    max_file_size: int = 10 * 1024 * 1024  # 10MB
-    backup_count: int = 5
+    max_file_size: int = field(default_factory=lambda: int(os.getenv('LOG_MAX_SIZE', str(10 * 1024 * 1024))))  # 10MB
+    backup_count: int = field(default_factory=lambda: int(os.getenv('LOG_BACKUP_COUNT', '5')))
     console_output: bool = True
     file_output: bool = True
+    # Console só com a mensagem (mesma aparência dos prints); arquivo em JSON por linha (ou 'text')
+    console_format: str = '%(message)s'
+    file_format: str = field(default_factory=lambda: os.getenv('LOG_FILE_FORMAT', 'json').lower())
+    # Fila entre quem loga e a thread que escreve; cheia = registro descartado (nunca bloqueia)
+    queue_size: int = field(default_factory=lambda: int(os.getenv('LOG_QUEUE_SIZE', '10000')))
 
 
 @dataclass
@@ -67,6 +97,10 @@ class PerformanceSettings:
     enable_cache: bool = True
     cache_duration: float = 1.0  # segundos
     max_parallel_workers: int = field(default_factory=lambda: int(os.getenv('MAX_WORKERS', '3')))
+    # Detecção em processos separados (frames via memória compartilhada); útil com 2+ dispositivos
+    enable_process_pool: bool = field(default_factory=lambda: os.getenv('DETECTION_PROCESS_POOL', 'False').lower() == 'true')
+    # Modo pipeline do executor: captura do próximo passo começa durante o delay pós-clique
+    pipelined_execution: bool = field(default_factory=lambda: os.getenv('PIPELINED_EXECUTION', 'False').lower() == 'true')
     screenshot_cache_enabled: bool = True
     template_cache_enabled: bool = True
 
@@ -77,9 +111,20 @@ class ActionSettings:
     default_click_delay: float = 0.5
     default_scroll_duration: int = 500
     enable_action_logging: bool = True
-    enable_screenshots_on_error: bool = True
+    # Flight recorder: últimos frames (cinza, reduzidos) e eventos em memória, gravados só em falhas
+    enable_screenshots_on_error: bool = field(default_factory=lambda: os.getenv('SCREENSHOTS_ON_ERROR', 'True').lower() == 'true')
+    flight_recorder_frames: int = field(default_factory=lambda: int(os.getenv('FLIGHT_RECORDER_FRAMES', '30')))
+    flight_recorder_events: int = 200
+    flight_recorder_width: int = 480
+    flight_recorder_max_dumps: int = field(default_factory=lambda: int(os.getenv('FLIGHT_RECORDER_MAX_DUMPS', '20')))
     retry_on_failure: bool = True
     max_retries: int = 3
+    # Imagens de debug (clique anotado) gravadas em segundo plano pelo debug_writer
+    debug_artifacts: bool = field(default_factory=lambda: os.getenv('DEBUG_ARTIFACTS', 'True').lower() == 'true')
+    debug_sample_rate: float = field(default_factory=lambda: float(os.getenv('DEBUG_ARTIFACTS_SAMPLE', '1.0')))
+    debug_format: str = field(default_factory=lambda: os.getenv('DEBUG_ARTIFACTS_FORMAT', 'jpg'))
+    debug_quota_mb: float = field(default_factory=lambda: float(os.getenv('DEBUG_ARTIFACTS_QUOTA_MB', '200')))
+    debug_queue_size: int = 8
 
 
 @dataclass
@@ -153,23 +198,44 @@ class Settings:
         print(f"  - Path: {self.adb.adb_path}")
         print(f"  - Device ID: {self.adb.default_device_id or 'Auto-detect'}")
         print(f"  - Timeout: {self.adb.connection_timeout}s")
+        print(f"  - Server: {self.adb.server_host}:{self.adb.server_port}")
+        print(f"  - Reconnect Timeout: {self.adb.reconnect_timeout}s")
+        print(f"  - Game State TTL: {self.adb.game_state_ttl}s")
         print()
         print("Detecção:")
         print(f"  - Threshold: {self.detection.threshold}")
         print(f"  - Max Attempts: {self.detection.max_attempts}")
         print(f"  - Attempt Delay: {self.detection.attempt_delay}s")
         print(f"  - Template Cache: {self.detection.template_cache_size}")
+        print(f"  - Multiscale: {self.detection.enable_multiscale} {self.detection.scales}")
+        print(f"  - Conta ativa (threshold): {self.detection.active_account_threshold}")
+        print(f"  - Cascata de rejeição: {self.detection.enable_cascade} (margem {self.detection.cascade_margin})")
+        print(f"  - Pacote de templates: {self.detection.template_pack}")
         print()
         print("Caminhos:")
         print(f"  - Base: {self.paths.base_dir}")
         print(f"  - Actions: {self.paths.actions_folder}")
         print(f"  - Screenshots: {self.paths.screenshots_folder}")
         print(f"  - Logs: {self.paths.logs_folder}")
+        print(f"  - Data: {self.paths.data_folder}")
         print()
         print("Performance:")
         print(f"  - Cache Enabled: {self.performance.enable_cache}")
         print(f"  - Max Workers: {self.performance.max_parallel_workers}")
+        print(f"  - Process Pool (detecção): {self.performance.enable_process_pool}")
+        print(f"  - Execução em pipeline: {self.performance.pipelined_execution}")
         print(f"  - Screenshot Cache: {self.performance.screenshot_cache_enabled}")
+        print()
+        print("Logging:")
+        print(f"  - Nível: {self.logging.level} | Arquivo: {self.logging.file_format} | Fila: {self.logging.queue_size}")
+        print()
+        print("Flight recorder (falhas):")
+        print(f"  - Ativo: {self.actions.enable_screenshots_on_error} | Frames: {self.actions.flight_recorder_frames}"
+              f" ({self.actions.flight_recorder_width}px) | Dumps mantidos: {self.actions.flight_recorder_max_dumps}")
+        print()
+        print("Debug (imagens anotadas):")
+        print(f"  - Ativo: {self.actions.debug_artifacts} | Amostragem: {self.actions.debug_sample_rate}")
+        print(f"  - Formato: {self.actions.debug_format} | Cota: {self.actions.debug_quota_mb} MB")
         print("=" * 60)
 
 
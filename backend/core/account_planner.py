@@ -0,0 +1,157 @@
+"""
+Planejador da Ordem das Contas
+Escolhe a ordem em que os ciclos visitam as contas para que cada uma termine o mais cedo possível.
+
+Em vez de percorrer accounts_config.accounts na ordem fixa, o planejador considera:
+    - custo de troca de cada conta: medido (checkpoint_store.switch_costs) ou estimado pela
+      posição no seletor de contas do Google (contas mais abaixo exigem scrolls);
+    - a conta já ativa, que não tem custo de troca e por isso vai primeiro;
+    - prontidão das tarefas: contas já concluídas na rodada ou em recarga são puladas, e as que
+      ficam disponíveis durante a rodada entram quando o relógio simulado alcança o next_due.
+
+Entre as contas disponíveis vai primeiro a de menor custo (menor tempo de processamento
+primeiro). O custo de troca depende só da conta de destino (o seletor abre sempre do topo), então
+a ordem não muda o tempo total da rodada: o que ela reduz é o instante médio de conclusão de
+cada conta (as tarefas das contas baratas terminam antes) e a espera, já que contas em recarga
+ficam para o fim e as que nunca ficam disponíveis são puladas em vez de esperadas.
+"""
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+try:
+    from .checkpoint_store import get_checkpoint_store
+except ImportError:
+    from checkpoint_store import get_checkpoint_store
+
+
+BASE_SWITCH_SECONDS = 25.0   # Logout + login sem scroll (estimativa sem medição)
+SCROLL_SECONDS = 2.5         # Cada scroll no seletor de contas (swipe + delay_after_scroll)
+FIXED_ACCOUNTS = 3           # Contas visíveis no seletor sem scroll (gled, inf, cav)
+TASK_SECONDS = 30.0          # Duração estimada de cada tarefa pendente
+
+
+@dataclass
+class PlanEntry:
+    """Uma conta no plano, com o custo estimado e o motivo da posição (ou de ter sido pulada)."""
+    account: dict
+    index: int                  # Posição em accounts_config.accounts
+    switch_seconds: float
+    tasks: list = field(default_factory=list)
+    start_at: float = 0.0       # Instante simulado (epoch) em que a conta começa
+    reason: str = ""
+
+    @property
+    def name(self):
+        return self.account.get("name")
+
+
+@dataclass
+class AccountPlan:
+    order: list                 # PlanEntry na ordem de execução
+    skipped: list               # PlanEntry puladas (reason explica)
+    started_at: float
+    estimated_seconds: float
+
+    @property
+    def accounts(self):
+        """Contas (dicts de accounts_config) na ordem planejada."""
+        return [entry.account for entry in self.order]
+
+    def explain(self):
+        """Texto com a ordem escolhida e o motivo de cada posição."""
+        lines = [f"🧭 Ordem planejada ({len(self.order)} contas, ~{self.estimated_seconds / 60:.1f} min, "
+                 f"menor custo primeiro para concluir cada conta mais cedo):"]
+        for position, entry in enumerate(self.order, start=1):
+            offset = entry.start_at - self.started_at
+            lines.append(f"   {position}. {entry.name} (+{offset:.0f}s) - {entry.reason}")
+        for entry in self.skipped:
+            lines.append(f"   ⏭️ {entry.name} - {entry.reason}")
+        return "\n".join(lines)
+
+
+def estimate_switch_seconds(index, measured=None):
+    """Custo de troca: média medida, se houver, senão base + scrolls pela posição no seletor."""
+    if measured:
+        return measured[0], f"troca ~{measured[0]:.0f}s (medida, {measured[1]} amostras)"
+    scrolls = max(0, index - (FIXED_ACCOUNTS - 1))
+    seconds = BASE_SWITCH_SECONDS + SCROLL_SECONDS * scrolls
+    detail = f"{scrolls} scroll(s)" if scrolls else "sem scroll"
+    return seconds, f"troca ~{seconds:.0f}s (estimada, {detail})"
+
+
+def plan_accounts(accounts, tasks, store=None, run=None, active_account=None, done_task=None,
+                  max_wait=0.0, task_seconds=TASK_SECONDS, now=None):
+    """
+    Monta a ordem das contas para a rodada.
+
+    Args:
+        accounts (list): Contas candidatas (dicts com "name"), na ordem do accounts_config.
+        tasks (list): Tarefas do ciclo (nomes usados no checkpoint_store).
+        store (CheckpointStore, optional): Estado das tarefas e custos medidos (padrão: global).
+        run (CycleRun, optional): Rodada atual; sem ela todas as tarefas contam como pendentes.
+        active_account (str, optional): Conta já logada (custo de troca zero).
+        done_task (str, optional): Tarefa que marca a conta inteira como concluída (ex.: "conta").
+        max_wait (float): Segundos que vale a pena esperar por uma conta em recarga no fim da rodada.
+        task_seconds (float): Duração estimada de cada tarefa pendente.
+
+    Returns:
+        AccountPlan
+    """
+    store = store or get_checkpoint_store()
+    now = time.time() if now is None else now
+    costs = store.switch_costs()
+
+    candidates, skipped = [], []
+    for index, account in enumerate(accounts):
+        name = account.get("name")
+        if name == active_account:
+            switch_seconds, cost_reason = 0.0, "conta ativa (sem troca)"
+        else:
+            switch_seconds, cost_reason = estimate_switch_seconds(index, costs.get(name))
+        entry = PlanEntry(account, index, switch_seconds, reason=cost_reason)
+
+        if run is None:
+            entry.tasks = list(tasks)
+            candidates.append((now, entry))
+            continue
+        if done_task and store.is_done(run, name, done_task):
+            entry.reason = "já concluída nesta rodada"
+            skipped.append(entry)
+            continue
+        pending = [task for task in tasks if not store.is_done(run, name, task)]
+        if not pending:
+            entry.reason = "todas as tarefas já feitas nesta rodada"
+            skipped.append(entry)
+            continue
+        due_at = min((store.next_due(run.cycle, name, task) or now) for task in pending)
+        entry.tasks = pending
+        candidates.append((max(due_at, now), entry))
+
+    # Simulação gulosa: entre as contas já disponíveis no relógio simulado, a de menor custo primeiro
+    # (o total é o mesmo em qualquer ordem; assim a conclusão média de cada conta é a mais cedo)
+    order = []
+    clock = now
+    while candidates:
+        available = [item for item in candidates if item[0] <= clock]
+        if not available:
+            due_at, entry = min(candidates, key=lambda item: item[0])
+            if due_at - clock > max_wait:
+                break
+            clock = due_at
+            continue
+        item = min(available, key=lambda item: (item[1].switch_seconds, item[1].index))
+        candidates.remove(item)
+        due_at, entry = item
+        if due_at > now:
+            entry.reason += f"; disponível às {datetime.fromtimestamp(due_at).strftime('%H:%M')}"
+        entry.start_at = clock
+        order.append(entry)
+        clock += entry.switch_seconds + task_seconds * len(entry.tasks)
+
+    for due_at, entry in sorted(candidates, key=lambda item: item[0]):
+        entry.reason = f"em recarga até {datetime.fromtimestamp(due_at).strftime('%H:%M')}"
+        skipped.append(entry)
+    skipped.sort(key=lambda entry: entry.index)
+
+    return AccountPlan(order, skipped, now, clock - now)
@@ -8,9 +8,42 @@
 # Versão: 01.00.11 -> Corrigido o caminho do template ao usar sequence_override para garantir que a pasta da ação correta seja usada.
 # Versão: 01.00.12 -> Corrigido processamento de action_before_find quando usando sequence_override.
 # Versão: 01.00.13 -> Adicionada função wait_for_template() para otimização de velocidade (substitui time.sleep por detecção ativa).
+# Versão: 01.00.14 -> device_id repassado para a detecção (escala travada por dispositivo na multi-escala).
+# Versão: 01.00.15 -> Coordenadas fixas (coords, click_offset, start/end_coords, fallback do login e scroll genérico)
+#                     convertidas da resolução de referência para o dispositivo via DeviceProfile.
+# Versão: 01.00.16 -> Detecção de wait_for_template/find_and_optionally_click via detection_pool (pool de
+#                     processos opcional) e submit_template_search() retornando Futures.
+# Versão: 01.00.17 -> Modo pipeline em execultar_acoes: a captura do próximo passo começa durante o delay
+#                     pós-clique (FramePrefetcher); frames anteriores ao último input são descartados.
+# Versão: 01.00.18 -> Identificação de tela (campo "screen" do passo): pula para o passo da tela atual ou
+#                     executa rota de recuperação (screen_classifier) em vez de esgotar as tentativas.
+# Versão: 01.00.19 -> frame_source (SharedFrameSource) e abort_event: frames lidos da captura contínua
+#                     compartilhada e esperas interrompíveis (vigia de gatilho em segundo plano).
+# Versão: 01.00.20 -> Antes de cada passo, aguarda a reconexão do dispositivo se o registro de
+#                     dispositivos (track-devices) indicar desconexão, em vez de falhar os comandos.
+# Versão: 01.00.21 -> Campo "search_roi" do passo (busca restrita a uma região), parâmetro found_positions
+#                     (posições encontradas por template) e posições de login aprendidas por conta/dispositivo
+#                     (login_position_store) em execute_login_for_account.
+# Versão: 01.00.22 -> Flight recorder: scrolls registrados como eventos e dump dos últimos frames/eventos
+#                     quando um passo esgota as tentativas sem encontrar o template.
+# Versão: 01.00.23 -> Mensagens do caminho crítico via logger (fila + thread de escrita, JSON com device/
+#                     account/action/step/duration_ms); detalhes de cada passo em DEBUG.
+# Versão: 01.00.24 -> action_before_find "scroll_to_offset": scroll em malha fechada (scroll_controller) que
+#                     mede o deslocamento real, corrige com mini-swipes e termina quando a lista para.
+# Versão: 01.00.25 -> Campo "drag" nos scrolls (simulate_scroll(drag=True) -> simulate_drag): arrasto sem
+#                     inércia; delay_after_scroll padrão cai para DRAG_SETTLE_DELAY.
+# Versão: 01.00.26 -> "scroll_to_offset" usa a própria região (scroll_roi) sem sobrescrever o roi da busca
+#                     (search_roi) usado por wait_for_template/find_and_optionally_click.
+# Versão: 01.00.27 -> Com a captura contínua parada (frame_source.stopped), as esperas voltam a capturar
+#                     por conta própria em vez de girar sem pausa até o timeout.
+# Versão: 01.00.28 -> execultar_acoes só retorna depois que a fila de logging foi escrita (flushes_logs):
+#                     as linhas dos passos não se misturam mais com os print() de progresso dos ciclos.
+# Versão: 01.00.29 -> Verificação da posição de login aprendida espera até LEARNED_VERIFY_TIMEOUT s (só na
+#                     região aprendida) antes de registrar um erro, em vez de um único frame após o toque.
 # Analista: Antigravity
 # Programador: Gled Carneiro
 # -----------------------------------------------------------------------------
+import logging
 import time
 import os
 import json
@@ -19,18 +52,63 @@ import subprocess # Importar subprocess explicitamente
 
 # Importando funções dos módulos do backend
 try:
-    from .adb_utils import capture_screen, simulate_touch
-    from .image_detection import find_image_on_screen
+    from .adb_utils import capture_screen, simulate_touch, simulate_drag
+    from .image_detection import find_image_on_screen, load_template_gray
+    from .device_profile import get_device_profile
+    from .detection_pool import detect_on_screen, detect_in_frame, submit_detection_file
+    from .frame_source import FramePrefetcher, capture_frame
+    from .screen_classifier import screen_index_available, classify_screen, recover_to_screen
+    from .device_registry import wait_if_disconnected
+    from .login_position_store import get_login_position_store
+    from .flight_recorder import record_event, dump_flight_recorder
+    from .logger import get_logger, flushes_logs
+    from .scroll_controller import get_scroll_controller
 except ImportError:
-    from adb_utils import capture_screen, simulate_touch
-    from image_detection import find_image_on_screen
+    from adb_utils import capture_screen, simulate_touch, simulate_drag
+    from image_detection import find_image_on_screen, load_template_gray
+    from device_profile import get_device_profile
+    from detection_pool import detect_on_screen, detect_in_frame, submit_detection_file
+    from frame_source import FramePrefetcher, capture_frame
+    from screen_classifier import screen_index_available, classify_screen, recover_to_screen
+    from device_registry import wait_if_disconnected
+    from login_position_store import get_login_position_store
+    from flight_recorder import record_event, dump_flight_recorder
+    from logger import get_logger, flushes_logs
+    from scroll_controller import get_scroll_controller
+
+try:
+    from backend.config.settings import settings
+except ImportError:
+    try:
+        from config.settings import settings
+    except ImportError:
+        settings = None
+
+logger = get_logger(__name__)
+
+DRAG_SETTLE_DELAY = 0.1  # Sem inércia a lista já está parada no UP: só o tempo de redesenhar
+LEARNED_VERIFY_TIMEOUT = 1.5  # Janela (s) da verificação na posição de login aprendida antes de contar um erro
+
+
+def _scroll_delay(scroll_config):
+    """delay_after_scroll do passo; sem valor explícito, arrastos (drag) quase não esperam."""
+    return scroll_config.get("delay_after_scroll", DRAG_SETTLE_DELAY if scroll_config.get("drag") else 0.5)
+
+
+def _coords_from_reference(coords, device_id=None):
+    """Converte [x, y] medido no celular de referência para o dispositivo. Retorna None se coords for inválido."""
+    if not (isinstance(coords, list) and len(coords) == 2):
+        return None
+    x, y = get_device_profile(device_id).from_reference(coords[0], coords[1])
+    return [x, y]
 
 
 # ---------------------------------------------------------------------------
 # Função de Espera Inteligente por Template (Otimização de Velocidade)
 # ---------------------------------------------------------------------------
 def wait_for_template(template_path, device_id=None, screenshot_path="temp_screenshot_wait.png", 
-                      timeout=10, interval=0.2, post_detection_delay=0.5):
+                      timeout=10, interval=0.2, post_detection_delay=0.5, first_frame=None,
+                      frame_source=None, abort_event=None, not_before=None, roi=None):
     """
     Espera até que um template apareça na tela (substitui time.sleep por detecção ativa).
     
@@ -44,9 +122,16 @@ def wait_for_template(template_path, device_id=None, screenshot_path="temp_scree
         timeout (float): Tempo máximo de espera em segundos (default: 10)
         interval (float): Intervalo entre capturas em segundos (default: 0.2)
         post_detection_delay (float): Delay APÓS detectar o template para animações (default: 0.5)
+        first_frame (CapturedFrame, optional): Frame pré-capturado (modo pipeline), testado antes
+                                               da primeira captura.
+        frame_source (SharedFrameSource, optional): Lê os frames da captura contínua em vez de capturar.
+        abort_event (threading.Event, optional): Interrompe a espera quando disparado (retorna None).
+        not_before (float, optional): Com frame_source, só usa frames capturados a partir deste
+                                      instante (time.monotonic). Default: o início da chamada.
+        roi (list, optional): Região [x, y, w, h] (pixels da tela) em que o template é procurado.
     
     Returns:
-        tuple: (x, y, w, h) se encontrado, None se timeout
+        tuple: (x, y, w, h) se encontrado, None se timeout ou abortado
     
     Example:
         # Ao invés de:
@@ -66,25 +151,46 @@ def wait_for_template(template_path, device_id=None, screenshot_path="temp_scree
         except OSError:
             screenshot_path = os.path.basename(screenshot_path)  # Fallback to current directory
     
-    print(f"⏳ Aguardando template '{os.path.basename(template_path)}' (timeout: {timeout}s)...")
+    logger.debug("⏳ Aguardando template '%s' (timeout: %ss)...", os.path.basename(template_path), timeout,
+                 extra={"device": device_id})
+
+    if first_frame is not None:
+        result = detect_in_frame(first_frame.image, template_path, device_id=device_id, roi=roi)
+        if result:
+            return result
+    if not_before is None:
+        not_before = time.monotonic()
     
     while (time.time() - start_time) < timeout:
+        if abort_event is not None and abort_event.is_set():
+            logger.info("🛑 Espera por '%s' interrompida.", os.path.basename(template_path), extra={"device": device_id})
+            return None
         attempts += 1
+        if frame_source is not None and frame_source.stopped:
+            frame_source = None  # Captura contínua encerrada: segue com capturas próprias (sem girar em vazio)
         
-        # Captura e detecta
-        if not capture_screen(device_id=device_id, output_path=screenshot_path):
-            # Se falhar a captura, aguarda e tenta novamente
-            time.sleep(interval)
-            continue
-        
-        result = find_image_on_screen(screenshot_path, template_path)
-        
-        # Limpa screenshot temporário
-        if os.path.exists(screenshot_path):
-            try:
-                os.remove(screenshot_path)
-            except (PermissionError, Exception):
-                pass  # Ignora erros de remoção
+        if frame_source is not None:
+            # Frame da captura contínua compartilhada (sempre um frame ainda não testado)
+            frame = frame_source.wait_next(not_before, timeout=max(0.1, timeout - (time.time() - start_time)))
+            if frame is None:
+                continue
+            not_before = frame.timestamp + 1e-6
+            result = detect_in_frame(frame.image, template_path, device_id=device_id, roi=roi)
+        else:
+            # Captura e detecta
+            if not capture_screen(device_id=device_id, output_path=screenshot_path):
+                # Se falhar a captura, aguarda e tenta novamente
+                _pause(interval, abort_event)
+                continue
+            
+            result = detect_on_screen(screenshot_path, template_path, device_id=device_id, roi=roi)
+            
+            # Limpa screenshot temporário
+            if os.path.exists(screenshot_path):
+                try:
+                    os.remove(screenshot_path)
+                except (PermissionError, Exception):
+                    pass  # Ignora erros de remoção
         
         if result:
             elapsed = time.time() - start_time
@@ -95,13 +201,16 @@ def wait_for_template(template_path, device_id=None, screenshot_path="temp_scree
             
             return result
         
-        # Intervalo entre tentativas
-        time.sleep(interval)
+        # Intervalo entre tentativas (com frame_source, a própria espera pelo frame novo já cadencia)
+        if frame_source is None:
+            _pause(interval, abort_event)
     
     # Timeout atingido
     elapsed = time.time() - start_time
-    print(f"⏱️ Timeout após {attempts} tentativas ({elapsed:.2f}s)")
-    print(f"⚠️ Template '{os.path.basename(template_path)}' não encontrado")
+    logger.warning("⚠️ Template '%s' não encontrado: timeout após %d tentativas (%.2fs)",
+                   os.path.basename(template_path), attempts, elapsed,
+                   extra={"device": device_id, "template": os.path.basename(template_path),
+                          "attempts": attempts, "duration_ms": round(elapsed * 1000)})
     return None
 
 
@@ -115,7 +224,8 @@ def capturar_posicao_login_cav_dinamica(device_id=None):
     Returns:
         tuple: (x, y) coordenadas do login_cav ou None se não encontrado
     """
-    template_path = os.path.join("backend", "actions", "templates", "fazer_login", "04_login_cav.png")
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    template_path = os.path.join(backend_dir, "actions", "templates", "fazer_login", "04_login_cav.png")
     
     if not os.path.exists(template_path):
         print(f"⚠️  Template '04_login_cav.png' não encontrado em: {template_path}")
@@ -127,7 +237,7 @@ def capturar_posicao_login_cav_dinamica(device_id=None):
         capture_screen(device_id, screenshot_path)
         
         # Buscar o template na tela
-        result = find_image_on_screen(template_path, screenshot_path)
+        result = find_image_on_screen(screenshot_path, template_path, device_id=device_id)
         
         if result:
             # Calcular coordenadas do centro do template (como faz o sistema normal)
@@ -197,14 +307,18 @@ def calcular_posicao_conta_relativa(account_name, account_index, device_id=None)
             'description': f"{account_name} (índice {account_index}): detecção normal"
         }
     else:
-        # Contas c52+ (índice 3+): capturar posição dinâmica da login_cav + scroll incremental
-        print(f"🔍 Capturando posição dinâmica do login_cav para {account_name}...")
-        cav_position = capturar_posicao_login_cav_dinamica(device_id)
+        # Contas c52+ (índice 3+): posição aprendida da login_cav (sem captura extra) ou posição dinâmica
+        learned_cav = get_login_position_store().get(device_id, "login_cav")
+        if learned_cav and get_login_position_store().is_valid_for(learned_cav, device_id):
+            cav_position = tuple(learned_cav["click"])
+        else:
+            print(f"🔍 Capturando posição dinâmica do login_cav para {account_name}...")
+            cav_position = capturar_posicao_login_cav_dinamica(device_id)
         
         if cav_position is None:
             # Fallback para posição fixa se não conseguir capturar dinamicamente
             print(f"⚠️  Usando posição de fallback para {account_name}")
-            cav_position = (753, 966)  # Posição de fallback baseada no último teste
+            cav_position = get_device_profile(device_id).from_reference(753, 966)  # Posição de fallback baseada no último teste (referência 2400x1080)
         
         scroll_count = int((account_index - 2) * SCROLL_PRECISION_FACTOR)  # Aplicar fator de precisão
         resultado = {
@@ -223,7 +337,7 @@ def calcular_posicao_conta_relativa(account_name, account_index, device_id=None)
     return resultado
 
 
-def simulate_scroll(device_id=None, direction="up", duration_ms=500, start_coords=None, end_coords=None):
+def simulate_scroll(device_id=None, direction="up", duration_ms=500, start_coords=None, end_coords=None, drag=False):
     """
     Simula um gesto de scroll na tela do dispositivo Android usando adb shell input swipe.
 
@@ -233,9 +347,12 @@ def simulate_scroll(device_id=None, direction="up", duration_ms=500, start_coord
         duration_ms (int, optional): Duração do gesto de swipe em milissegundos.
         start_coords (list, optional): Lista de 2 ints [x, y] para as coordenadas de início do swipe. Se fornecido, direction é ignorado.
         end_coords (list, optional): Lista de 2 ints [x, y] para as coordenadas de fim do swipe. Se fornecido, direction é ignorado.
+        drag (bool, optional): Arrasto sem inércia (simulate_drag: DOWN/MOVE/UP com o dedo parado antes de
+                               soltar) em vez de 'input swipe'. duration_ms é ignorado.
 
-    Note: Se start_coords e end_coords não forem fornecidos, o scroll usará coordenadas genéricas centrais baseadas em Landscape (2400x1080).
-          AJUSTE estas coordenadas genéricas se a resolução do seu dispositivo for diferente.
+    Note: Se start_coords e end_coords não forem fornecidos, o scroll usará coordenadas genéricas centrais
+          calculadas a partir da resolução real do dispositivo (DeviceProfile, landscape).
+          start_coords/end_coords já devem estar em pixels do dispositivo.
     """
     final_start_x, final_start_y = 0, 0
     final_end_x, final_end_y = 0, 0
@@ -246,9 +363,10 @@ def simulate_scroll(device_id=None, direction="up", duration_ms=500, start_coord
         final_end_x, final_end_y = end_coords
         # print(f"Simulando scroll de coordenadas específicas: ({final_start_x}, {final_start_y}) para ({final_end_x}, {final_end_y})")
     else:
-        # Usar coordenadas genéricas baseadas na direção (Landscape 2400x1080)
-        landscape_width = 2400  # Largura em modo paisagem
-        landscape_height = 1080 # Altura em modo paisagem
+        # Usar coordenadas genéricas baseadas na direção (Landscape, resolução real do dispositivo)
+        profile = get_device_profile(device_id)
+        landscape_width = profile.width  # Largura em modo paisagem
+        landscape_height = profile.height # Altura em modo paisagem
         center_x_landscape = landscape_width // 2
 
         if direction == "up":
@@ -265,13 +383,20 @@ def simulate_scroll(device_id=None, direction="up", duration_ms=500, start_coord
             print(f"Aviso: Direção de scroll '{direction}' desconhecida e coordenadas não fornecidas. Pulando scroll.")
             return # Não executa o scroll se a configuração for inválida
 
+    if drag:
+        simulate_drag([final_start_x, final_start_y], [final_end_x, final_end_y], device_id)
+        return
+
     command = ["adb"]
     if device_id:
         command.extend(["-s", device_id])
     # input swipe <x1> <y1> <x2> <y2> [duration_ms]
     command.extend(["shell", "input", "swipe", str(final_start_x), str(final_start_y), str(final_end_x), str(final_end_y), str(duration_ms)])
 
-    print(f"⚠️  Scroll simulado no dispositivo {device_id} iniciando em {final_start_x}, {final_start_y} para {final_end_x}, {final_end_y} em {duration_ms}ms")
+    record_event(device_id, "scroll", start=[final_start_x, final_start_y], end=[final_end_x, final_end_y],
+                 duration_ms=duration_ms)
+    logger.debug("⚠️  Scroll simulado no dispositivo %s iniciando em %s, %s para %s, %s em %sms",
+                 device_id, final_start_x, final_start_y, final_end_x, final_end_y, duration_ms, extra={"device": device_id})
 
     try:
         result = subprocess.run(command, check=True, capture_output=True, text=True, timeout=(duration_ms / 1000.0) + 5) # Timeout um pouco maior que a duração do swipe
@@ -292,7 +417,38 @@ def simulate_scroll(device_id=None, direction="up", duration_ms=500, start_coord
 
 
 # Função auxiliar para encontrar e, opcionalmente, clicar em um template com tentativas
-def find_and_optionally_click(template_path, device_id=None, screenshot_path="temp_screenshot_for_find.png", max_attempts=1, attempt_delay=1, initial_delay=0):
+def submit_template_search(template_paths, device_id=None, screenshot_path="temp_screenshot_search.png", per_template=True):
+    """
+    Captura a tela uma vez e envia a busca de vários templates para o pool de detecção.
+
+    Não bloqueia esperando a detecção: o chamador decide quando (e se) aguardar cada resultado,
+    podendo, por exemplo, disparar a busca em vários dispositivos antes de esperar.
+
+    Args:
+        template_paths (list): Caminhos dos templates.
+        device_id (str, optional): O ID do dispositivo Android.
+        screenshot_path (str, optional): Caminho temporário para a screenshot.
+        per_template (bool): Distribui os templates entre workers (True) ou processa em lote (False).
+
+    Returns:
+        dict: caminho -> Future com (score, (x, y, w, h) ou None), ou None se a captura falhar.
+    """
+    if not capture_screen(device_id=device_id, output_path=screenshot_path):
+        print("Falha ao capturar a tela para a busca de templates.")
+        return None
+    try:
+        # O frame é lido (e copiado para memória compartilhada) antes de retornar
+        return submit_detection_file(screenshot_path, template_paths, device_id=device_id, per_template=per_template)
+    finally:
+        if os.path.exists(screenshot_path):
+            try:
+                os.remove(screenshot_path)
+            except Exception:
+                pass
+
+
+def find_and_optionally_click(template_path, device_id=None, screenshot_path="temp_screenshot_for_find.png", max_attempts=1, attempt_delay=1, initial_delay=0, first_frame=None,
+                              frame_source=None, abort_event=None, not_before=None, roi=None):
     """
     Tenta encontrar um template em capturas de tela repetidas.
 
@@ -303,6 +459,13 @@ def find_and_optionally_click(template_path, device_id=None, screenshot_path="te
         max_attempts (int, optional): Número máximo de tentativas para encontrar o template.
         attempt_delay (float, optional): Tempo de espera em segundos entre as tentativas.
         initial_delay (float, optional): Tempo de espera em segundos antes da primeira tentativa.
+        first_frame (CapturedFrame, optional): Frame pré-capturado (modo pipeline). É testado antes
+                                               das tentativas e não conta como tentativa: se não
+                                               encontrar, segue o fluxo normal com captura nova.
+        frame_source (SharedFrameSource, optional): Lê os frames da captura contínua em vez de capturar.
+        abort_event (threading.Event, optional): Interrompe as tentativas quando disparado.
+        not_before (float, optional): Com frame_source, só usa frames capturados a partir deste instante.
+        roi (list, optional): Região [x, y, w, h] (pixels da tela) em que o template é procurado.
 
     Returns:
         tuple: Retorna (True, (center_x, center_y)) se a imagem foi encontrada,
@@ -313,7 +476,8 @@ def find_and_optionally_click(template_path, device_id=None, screenshot_path="te
     # Adicionar um atraso antes da primeira tentativa
     if initial_delay > 0:
         # print(f"Aguardando {initial_delay} segundos antes da primeira tentativa...")
-        time.sleep(initial_delay)
+        if _pause(initial_delay, abort_event):
+            return (False, None)
 
     # Ensure the directory for the temp screenshot exists
     temp_dir = os.path.dirname(screenshot_path)
@@ -328,9 +492,38 @@ def find_and_optionally_click(template_path, device_id=None, screenshot_path="te
 
     found_position = None # Initialize found_position outside the loop
     mostra_tentativas = False
+
+    if first_frame is not None:
+        image_position = detect_in_frame(first_frame.image, template_path, device_id=device_id, roi=roi)
+        if image_position:
+            x, y, w, h = image_position
+            return (True, (x + w // 2, y + h // 2))
+
+    if not_before is None:
+        not_before = time.monotonic()
+
     for attempt in range(1, max_attempts + 1):
+        if abort_event is not None and abort_event.is_set():
+            return (False, None)
+        if frame_source is not None and frame_source.stopped:
+            frame_source = None  # Captura contínua encerrada: segue com capturas próprias
+        if frame_source is not None:
+            frame = frame_source.wait_next(not_before)
+            image_position = None
+            if frame is not None:
+                not_before = frame.timestamp + 1e-6
+                image_position = detect_in_frame(frame.image, template_path, device_id=device_id, roi=roi)
+            if image_position:
+                x, y, w, h = image_position
+                found_position = (True, (x + w // 2, y + h // 2))
+                break
+            if attempt < max_attempts:
+                _pause(attempt_delay, abort_event)
+            continue
+
         if mostra_tentativas:
-            print(f"Tentativa {attempt}/{max_attempts} para encontrar o template '{os.path.basename(template_path)}'.")
+            logger.debug("Tentativa %d/%d para encontrar o template '%s'.", attempt, max_attempts,
+                         os.path.basename(template_path), extra={"device": device_id})
             mostra_tentativas = False
 
         # 1. Capturar a tela
@@ -348,13 +541,13 @@ def find_and_optionally_click(template_path, device_id=None, screenshot_path="te
 
             if attempt < max_attempts:
                  print(f"Aguardando {attempt_delay} segundos antes da próxima tentativa...")
-                 time.sleep(attempt_delay)
+                 _pause(attempt_delay, abort_event)
             continue # Tenta novamente se a captura falhou
 
 
         # 2. Procurar pela imagem (template) na screenshot
         # find_image_on_screen já lida com erros de leitura de arquivo de imagem dentro dela
-        image_position = find_image_on_screen(screenshot_path, template_path)
+        image_position = detect_on_screen(screenshot_path, template_path, device_id=device_id, roi=roi)
 
         # Clean up temp screenshot after find_image_on_screen is done with it
         if os.path.exists(screenshot_path):
@@ -380,7 +573,7 @@ def find_and_optionally_click(template_path, device_id=None, screenshot_path="te
             # print(f"Template '{os.path.basename(template_path)}' não encontrado na tentativa {attempt}.") # Comentado para evitar muita verbosidade
             if attempt < max_attempts:
                  print(f"Aguardando {attempt_delay} segundos antes da próxima tentativa...")
-                 time.sleep(attempt_delay)
+                 _pause(attempt_delay, abort_event)
             # Continue o loop para a próxima tentativa se não for a última
 
 
@@ -388,11 +581,71 @@ def find_and_optionally_click(template_path, device_id=None, screenshot_path="te
     if found_position:
         return found_position
     else:
-        print(f"Template '{os.path.basename(template_path)}' não encontrado após {max_attempts} tentativas.")
+        logger.warning("Template '%s' não encontrado após %d tentativas.", os.path.basename(template_path), max_attempts,
+                       extra={"device": device_id, "template": os.path.basename(template_path), "attempts": max_attempts})
         return (False, None) # Retorna False se o template não foi encontrado após todas as tentativas
 
 
-def execultar_acoes(action_name, device_id=None, sequence_override=None, account_name=None, fila_atual=None):
+def _pause(seconds, abort_event=None):
+    """Pausa interrompível: retorna True se abort_event foi disparado antes (ou durante) a espera."""
+    if abort_event is None:
+        if seconds > 0:
+            time.sleep(seconds)
+        return False
+    return abort_event.wait(max(0, seconds))
+
+
+def _aborted(abort_event):
+    return abort_event is not None and abort_event.is_set()
+
+
+def _current_frame(device_id, frame_source=None, not_before=None):
+    """Frame atual: da captura contínua compartilhada (se houver) ou de uma captura nova."""
+    if frame_source is not None:
+        frame = frame_source.wait_next(not_before if not_before is not None else time.monotonic())
+        if frame is not None:
+            return frame
+    return capture_frame(device_id)
+
+
+def _inter_step_delay(step_type, wait_enabled):
+    """Pausa entre passos: mínima no modo otimizado (wait_for_template), padrão nos demais."""
+    if step_type == "template" and wait_enabled:
+        return 0.1
+    return 0.5
+
+
+def _can_use_prefetch(step_config):
+    """Indica se o passo pode usar um frame pré-capturado (template sem scroll/espera antes da busca)."""
+    return (isinstance(step_config, dict)
+            and step_config.get("type") == "template"
+            and not step_config.get("action_before_find")
+            and not step_config.get("initial_delay", 0)
+            and step_config.get("prefetch", True))
+
+
+def _find_step_for_screen(action_sequence, start_index, screen_name):
+    """Índice do primeiro passo a partir de start_index marcado com "screen": screen_name, ou None."""
+    for index in range(start_index, len(action_sequence)):
+        step = action_sequence[index]
+        if isinstance(step, dict) and step.get("screen") == screen_name:
+            return index
+    return None
+
+
+def _prefetch_after_input(prefetcher, next_step, input_ts, settle):
+    """Modo pipeline: agenda a captura do próximo passo para ficar pronta ao fim do delay pós-input."""
+    if prefetcher is None:
+        return
+    if _can_use_prefetch(next_step):
+        prefetcher.schedule_after_input(input_ts, settle)
+    else:
+        prefetcher.cancel()
+
+
+@flushes_logs
+def execultar_acoes(action_name, device_id=None, sequence_override=None, account_name=None, fila_atual=None, pipelined=None,
+                    frame_source=None, abort_event=None, found_positions=None):
     """
     Executa uma sequência de ações lidas de um arquivo sequence.json
     na pasta da ação, onde cada item no JSON define um passo
@@ -405,6 +658,22 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
                                            em vez de carregar do arquivo sequence.json.
                                            Útil para sequências dinâmicas (como login por conta).
         account_name (str, optional): O nome da conta sendo executada (para logs melhorados).
+        pipelined (bool, optional): Modo pipeline: a captura da tela do próximo passo começa durante
+                                    o delay pós-clique e só é usada se for posterior ao último input.
+                                    None usa settings.performance.pipelined_execution.
+                                    Um passo pode recusar o frame pré-capturado com "prefetch": false.
+        frame_source (SharedFrameSource, optional): Captura contínua compartilhada (ex.: com o vigia de
+                                                    gatilho). Os passos leem frames dela em vez de capturar;
+                                                    substitui o modo pipeline.
+        abort_event (threading.Event, optional): Quando disparado, a execução para no próximo ponto de
+                                                 espera/busca (as pausas são interrompíveis) e retorna False.
+        found_positions (dict, optional): Preenchido com template_file -> {"center", "size", "click"}
+                                          (pixels da tela) de cada template encontrado.
+
+    Passos de template podem declarar "screen": "<nome>" (tela esperada, ver screen_classifier).
+    Se a tela atual for a de um passo posterior, a execução pula para ele; se for outra tela
+    conhecida, a rota de recuperação gravada é executada antes da busca.
+    "search_roi": [x, y, w, h] (referência 2400x1080) restringe a busca do template a essa região.
 
     Returns:
         bool: True se a execução da ação foi considerada bem-sucedida (terminou sem erros críticos
@@ -512,9 +781,35 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
     # print(f"\n🚀 INICIANDO EXECUÇÃO DA AÇÃO: '{action_name}' ({len(action_sequence)} passos)")
     # print("=" * 60)
     
+    if pipelined is None:
+        pipelined = bool(settings is not None and getattr(settings.performance, "pipelined_execution", False))
+    prefetcher = FramePrefetcher(device_id) if pipelined and frame_source is None else None
+    last_input_ts = time.monotonic()  # Instante do último toque/scroll (frames anteriores são obsoletos)
+    skip_until = 0         # Identificação de tela: passos antes deste índice são pulados
+    carried_frame = None   # Frame já classificado, reaproveitado pelo passo de destino do salto
+
     for i, step_config in enumerate(action_sequence):
+        if i < skip_until:
+            continue
+        if _aborted(abort_event):
+            logger.info("🛑 Ação '%s' interrompida antes do passo %d.", action_name, i + 1,
+                        extra={"device": device_id, "account": account_name, "action": action_name, "step": i + 1})
+            if prefetcher is not None:
+                prefetcher.cancel()
+            return False
+        # Dispositivo caiu (evento do registro): espera a reconexão em vez de falhar os comandos ADB
+        if not wait_if_disconnected(device_id):
+            logger.error("❌ Dispositivo não reconectou. Ação '%s' interrompida no passo %d.", action_name, i + 1,
+                         extra={"device": device_id, "account": account_name, "action": action_name, "step": i + 1})
+            if prefetcher is not None:
+                prefetcher.cancel()
+            return False
         step_number = i + 1
+        next_step = action_sequence[i + 1] if i + 1 < len(action_sequence) else None
         step_name = step_config.get("name", f"Passo {step_number}") # Usar nome do JSON ou default
+        step_started = time.monotonic()
+        # Campos estruturados dos registros deste passo (linha JSON no arquivo de log)
+        step_log = {"device": device_id, "account": account_name, "action": action_name, "step": step_number}
 
         # print(f"\n🎯 PASSO {step_number}/{len(action_sequence)}: {step_name}")
         
@@ -525,7 +820,7 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
             template_filename = step_config.get("template_file", "N/A")
             template_info = f" - Template: {template_filename}"
         
-        print(f"\n{fila_atual} - Acao: {action_name} {step_name}")
+        logger.info("%s - Acao: %s %s", fila_atual, action_name, step_name, extra=step_log)
         # print("-" * 40)
 
         step_type = step_config.get("type")
@@ -540,6 +835,8 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
             action_on_found = step_config.get("action_on_found", "click") # Default action is click
             click_delay = step_config.get("click_delay", 0.5) # Default delay
             click_offset = step_config.get("click_offset", [0, 0]) # Obter o offset do JSON, default [0, 0]
+            if isinstance(click_offset, list) and len(click_offset) == 2:
+                click_offset = list(get_device_profile(device_id).offset(click_offset[0], click_offset[1])) # Offset medido na referência
             max_attempts = step_config.get("max_attempts", 1) # Default 1 attempt
             attempt_delay = step_config.get("attempt_delay", 1.0) # Default 1 second delay between attempts
             initial_delay = step_config.get("initial_delay", 0) # Novo campo para atraso inicial
@@ -549,9 +846,12 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
             wait_timeout = step_config.get("wait_timeout", 10)  # Timeout de espera
             wait_interval = step_config.get("wait_interval", 0.2)  # Intervalo entre capturas
             post_delay = step_config.get("post_detection_delay", 0.5)  # Delay após detectar
+            search_roi = step_config.get("search_roi")  # Região [x, y, w, h] na referência (busca restrita)
+            roi = get_device_profile(device_id).roi(*search_roi) if isinstance(search_roi, list) and len(search_roi) == 4 else None
 
             if not template_filename:
-                print(f"Erro: Passo {step_number} ('{step_name}') do tipo 'template' não especifica 'template_file'. Pulando passo.")
+                logger.error("Erro: Passo %d ('%s') do tipo 'template' não especifica 'template_file'. Pulando passo.",
+                             step_number, step_name, extra=step_log)
                 step_success = False
                 continue # Pula para o próximo passo se faltar o template_file.
 
@@ -563,6 +863,38 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
             template_path = os.path.join(action_folder, template_filename)
 
 
+            # Modo pipeline: frame do passo capturado durante o delay do passo anterior
+            first_frame = None
+            if carried_frame is not None:
+                if _can_use_prefetch(step_config) and carried_frame.timestamp >= last_input_ts:
+                    first_frame = carried_frame
+                carried_frame = None
+            if prefetcher is not None:
+                if first_frame is None and _can_use_prefetch(step_config):
+                    first_frame = prefetcher.take(not_before=last_input_ts)
+                else:
+                    prefetcher.cancel()
+            elif frame_source is not None and first_frame is None and _can_use_prefetch(step_config):
+                first_frame = frame_source.latest(not_before=last_input_ts)
+
+            # --- Identificação de tela (opcional): salto para o passo certo ou rota de recuperação ---
+            expected_screen = step_config.get("screen")
+            if expected_screen and screen_index_available():
+                screen_frame = first_frame or _current_frame(device_id, frame_source, last_input_ts)
+                current_screen = classify_screen(screen_frame.image)
+                if current_screen.known and current_screen.name != expected_screen:
+                    jump_to = _find_step_for_screen(action_sequence, i + 1, current_screen.name)
+                    if jump_to is not None:
+                        logger.info("🧭 Tela atual '%s' é a do passo %d: pulando para ele.", current_screen.name, jump_to + 1,
+                                    extra=step_log)
+                        skip_until, carried_frame = jump_to, screen_frame
+                        continue
+                    if recover_to_screen(expected_screen, device_id, frame=screen_frame.image):
+                        last_input_ts = time.monotonic()
+                    screen_frame = None  # A tela mudou (ou não é a esperada): não reaproveitar
+                if screen_frame is not None and first_frame is None and _can_use_prefetch(step_config):
+                    first_frame = screen_frame
+
             # --- Processar action_before_find ---
             action_before = step_config.get("action_before_find")
             if action_before and isinstance(action_before, dict):
@@ -570,32 +902,56 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
                  if before_type == "scroll":
                       scroll_direction = action_before.get("direction", "up")
                       scroll_duration = action_before.get("duration_ms", 500)
-                      delay_after_scroll = action_before.get("delay_after_scroll", 0.5)
-                      scroll_start_coords = action_before.get("start_coords") # Pode ser None
-                      scroll_end_coords = action_before.get("end_coords") # Pode ser None
+                      delay_after_scroll = _scroll_delay(action_before)
+                      scroll_start_coords = _coords_from_reference(action_before.get("start_coords"), device_id) # Pode ser None
+                      scroll_end_coords = _coords_from_reference(action_before.get("end_coords"), device_id) # Pode ser None
 
-                      print(f"Executando ação antes de encontrar template: Scroll.")
+                      logger.debug("Executando ação antes de encontrar template: Scroll.", extra=step_log)
                       simulate_scroll(
                           device_id=device_id,
                           direction=scroll_direction,
                           duration_ms=scroll_duration,
                           start_coords=scroll_start_coords, # Passa as coords específicas se existirem
-                          end_coords=scroll_end_coords
+                          end_coords=scroll_end_coords,
+                          drag=bool(action_before.get("drag"))
                       )
-                      time.sleep(delay_after_scroll) # Delay após o scroll
+                      last_input_ts = time.monotonic()
+                      _pause(delay_after_scroll, abort_event) # Delay após o scroll
+
+                 elif before_type == "scroll_to_offset":
+                      # Sem delay fixo: retorna quando a lista para (valores na resolução de referência)
+                      profile = get_device_profile(device_id)
+                      scroll_roi = action_before.get("roi")  # Região da lista (a de busca, roi, não muda)
+                      tolerance = action_before.get("tolerance")
+                      result = get_scroll_controller(device_id).scroll_to_offset(
+                          profile.length(action_before.get("offset", 0)),
+                          roi=profile.roi(*scroll_roi) if isinstance(scroll_roi, list) and len(scroll_roi) == 4 else None,
+                          duration_ms=action_before.get("duration_ms", 500),
+                          tolerance=profile.length(tolerance) if tolerance is not None else None,
+                          max_corrections=action_before.get("max_corrections", 2),
+                          frame_source=frame_source,
+                          abort_event=abort_event
+                      )
+                      last_input_ts = time.monotonic()
+                      logger.debug("Scroll até offset %s: alcançado %.0f px em %d swipe(s), %.2fs%s.", result.target,
+                                   result.achieved, result.swipes, result.elapsed,
+                                   "" if result.settled else " (lista ainda em movimento)", extra=step_log)
 
                  elif before_type == "wait":
                       wait_duration = action_before.get("duration_seconds")
                       if isinstance(wait_duration, (int, float)) and wait_duration > 0:
-                          print(f"Executando ação antes de encontrar template: Esperando por {wait_duration} segundos.")
-                          time.sleep(wait_duration)
+                          logger.debug("Executando ação antes de encontrar template: Esperando por %s segundos.",
+                                       wait_duration, extra=step_log)
+                          _pause(wait_duration, abort_event)
                       else:
-                          print(f"Aviso: Configuração inválida para action_before_find wait em {step_name}.")
+                          logger.warning("Aviso: Configuração inválida para action_before_find wait em %s.", step_name,
+                                         extra=step_log)
 
                  else:
                       # Ignora chaves que começam com '#' (usadas para comentários no JSON)
                       if before_type and not before_type.startswith("#"):
-                           print(f"Aviso: Tipo de action_before_find '{before_type}' no {step_name} desconhecido/não implementado.")
+                           logger.warning("Aviso: Tipo de action_before_find '%s' no %s desconhecido/não implementado.",
+                                          before_type, step_name, extra=step_log)
 
 
             # --- Tentar encontrar o template ---
@@ -605,15 +961,21 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
             
             if wait_enabled:
                 # ========== MODO OTIMIZADO: wait_for_template ==========
-                print(f"🔍 PROCURANDO TEMPLATE {template_filename} MODO OTIMIZADO (wait_for_template)")
-                print(f"⏱️  Timeout: {wait_timeout}s | Intervalo: {wait_interval}s | Delay pós-detecção: {post_delay}s")
+                logger.debug("🔍 PROCURANDO TEMPLATE %s MODO OTIMIZADO (wait_for_template) | Timeout: %ss | "
+                             "Intervalo: %ss | Delay pós-detecção: %ss", template_filename, wait_timeout, wait_interval,
+                             post_delay, extra=step_log)
                 
                 result = wait_for_template(
                     template_path,
                     device_id=device_id,
                     timeout=wait_timeout,
                     interval=wait_interval,
-                    post_detection_delay=post_delay
+                    post_detection_delay=post_delay,
+                    first_frame=first_frame,
+                    frame_source=frame_source,
+                    abort_event=abort_event,
+                    not_before=last_input_ts,
+                    roi=roi
                 )
                 
                 if result:
@@ -628,13 +990,9 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
                     
             else:
                 # ========== MODO TRADICIONAL: find_and_optionally_click ==========
-                print(f"🔍 PROCURANDO TEMPLATE  {template_filename} MODO TRADICIONAL (find_and_optionally_click)")
-                print(f"🎯 Ação ao encontrar: {action_on_found}")
-                print(f"🔄 Máximo de tentativas: {max_attempts}")
-                print(f"⏱️  Delay entre tentativas: {attempt_delay}s")
-                
-                if initial_delay > 0:
-                    print(f"⏳ Delay inicial: {initial_delay}s")
+                logger.debug("🔍 PROCURANDO TEMPLATE %s MODO TRADICIONAL (find_and_optionally_click) | Ação: %s | "
+                             "Tentativas: %s | Delay entre tentativas: %ss | Delay inicial: %ss", template_filename,
+                             action_on_found, max_attempts, attempt_delay, initial_delay, extra=step_log)
                 
                 # print("🔎 Iniciando busca na tela...")
                 
@@ -644,11 +1002,31 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
                     device_id=device_id,
                     max_attempts=max_attempts,
                     attempt_delay=attempt_delay,
-                    initial_delay=initial_delay # Passando o novo parâmetro
+                    initial_delay=initial_delay, # Passando o novo parâmetro
+                    first_frame=first_frame,
+                    frame_source=frame_source,
+                    abort_event=abort_event,
+                    not_before=last_input_ts,
+                    roi=roi
                 )
 
+            if _aborted(abort_event):
+                # Gatilho disparado durante a busca: não toca na tela
+                logger.info("🛑 Ação '%s' interrompida no passo %d.", action_name, step_number, extra=step_log)
+                if prefetcher is not None:
+                    prefetcher.cancel()
+                return False
+
             if found:
                 # print(f"✅ TEMPLATE ENCONTRADO! Coordenadas: {coords}")
+                if found_positions is not None and coords:
+                    template_gray = load_template_gray(template_path)
+                    offset = click_offset if isinstance(click_offset, list) and len(click_offset) == 2 else [0, 0]
+                    found_positions[template_filename] = {
+                        "center": tuple(coords),
+                        "size": tuple(template_gray.shape[1::-1]) if template_gray is not None else None,
+                        "click": (coords[0] + offset[0], coords[1] + offset[1]),
+                    }
                 
                 if action_on_found == "click":
                     # Verificar se temos coordenadas forçadas (posicionamento relativo)
@@ -664,8 +1042,10 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
                     # Aguarda DEPOIS de detectar mas ANTES de clicar
                     # Isso garante que animações (como slide) terminem antes do clique
                     if wait_enabled and post_delay > 0:
-                        print(f"⏳ Aguardando {post_delay}s pós-detecção (animação)...")
-                        time.sleep(post_delay)
+                        logger.debug("⏳ Aguardando %ss pós-detecção (animação)...", post_delay, extra=step_log)
+                        if _pause(post_delay, abort_event):
+                            logger.info("🛑 Ação '%s' interrompida antes do clique.", action_name, extra=step_log)
+                            return False
 
                     # Aplicar o click_offset, se for uma lista válida de 2 elementos
                     if isinstance(click_offset, list) and len(click_offset) == 2:
@@ -677,20 +1057,27 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
                     else:
                          # Validar se click_offset foi especificado mas não é uma lista de 2 ints
                          if "click_offset" in step_config:
-                              print(f"⚠️  Aviso: Configuração de click_offset inválida ({click_offset}) em {step_name}. Esperado [x, y].")
-                         print(f"👆 CLICANDO EM: ({center_x}, {center_y})")
+                              logger.warning("⚠️  Aviso: Configuração de click_offset inválida (%s) em %s. Esperado [x, y].",
+                                             click_offset, step_name, extra=step_log)
+                         logger.debug("👆 CLICANDO EM: (%s, %s)", center_x, center_y, extra=step_log)
                          simulate_touch(center_x, center_y, device_id=device_id) # Clica no centro se o offset for inválido ou não especificado
+                    last_input_ts = time.monotonic()
+                    _prefetch_after_input(prefetcher, next_step, last_input_ts,
+                                          (0 if wait_enabled else click_delay) + _inter_step_delay(step_type, wait_enabled))
 
                     # OTIMIZAÇÃO: No modo otimizado, post_detection_delay JÁ cumpre o papel de click_delay
                     if not wait_enabled and click_delay > 0:
                         #  print(f"⏳ Aguardando {click_delay}s após o clique...")
-                         time.sleep(click_delay)
+                         _pause(click_delay, abort_event)
                     elif wait_enabled:
-                         print(f"⚡ Modo otimizado: click_delay ignorado (post_detection_delay já aplicado)")
+                         logger.debug("⚡ Modo otimizado: click_delay ignorado (post_detection_delay já aplicado)", extra=step_log)
                     
                     # Log de sucesso melhorado
                     account_info = f" - Conta: {account_name}" if account_name else ""
-                    print(f"🎉 SUCESSO [Passo {step_number}] - Template: {os.path.basename(template_path)} - Acao: {action_name}{account_info}")
+                    logger.info("🎉 SUCESSO [Passo %d] - Template: %s - Acao: %s%s", step_number, template_filename,
+                                action_name, account_info,
+                                extra=dict(step_log, template=template_filename,
+                                           duration_ms=round((time.monotonic() - step_started) * 1000)))
                     step_success = True # Passo de template/click bem-sucedido
                 
                 elif action_on_found == "scroll_then_click":
@@ -704,9 +1091,9 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
                         if after_type == "scroll":
                             scroll_direction = action_after.get("direction", "down")
                             scroll_duration = action_after.get("duration_ms", 500)
-                            delay_after_scroll_after = action_after.get("delay_after_scroll", 0.5)
-                            scroll_start_coords = action_after.get("start_coords")
-                            scroll_end_coords = action_after.get("end_coords")
+                            delay_after_scroll_after = _scroll_delay(action_after)
+                            scroll_start_coords = _coords_from_reference(action_after.get("start_coords"), device_id)
+                            scroll_end_coords = _coords_from_reference(action_after.get("end_coords"), device_id)
 
                             # print(f"📜 PRIMEIRO: Executando scroll {scroll_direction} por {scroll_duration}ms")
                             simulate_scroll(
@@ -714,10 +1101,12 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
                                 direction=scroll_direction,
                                 duration_ms=scroll_duration,
                                 start_coords=scroll_start_coords,
-                                end_coords=scroll_end_coords
+                                end_coords=scroll_end_coords,
+                                drag=bool(action_after.get("drag"))
                             )
+                            last_input_ts = time.monotonic()
                             # print(f"⏳ Aguardando {delay_after_scroll_after}s após o scroll...")
-                            time.sleep(delay_after_scroll_after)
+                            _pause(delay_after_scroll_after, abort_event)
                     
                     # AGORA executa o clique
                     center_x, center_y = coords
@@ -725,38 +1114,48 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
                     # APLICAR POST_DETECTION_DELAY AQUI (no modo otimizado)
                     # Aguarda DEPOIS de detectar mas ANTES de clicar
                     if wait_enabled and post_delay > 0:
-                        print(f"⏳ Aguardando {post_delay}s pós-detecção (animação)...")
-                        time.sleep(post_delay)
+                        logger.debug("⏳ Aguardando %ss pós-detecção (animação)...", post_delay, extra=step_log)
+                        if _pause(post_delay, abort_event):
+                            logger.info("🛑 Ação '%s' interrompida antes do clique.", action_name, extra=step_log)
+                            return False
                     
                     if isinstance(click_offset, list) and len(click_offset) == 2:
                          final_click_x = center_x + click_offset[0]
                          final_click_y = center_y + click_offset[1]
-                         print(f"🎯 Aplicando offset [{click_offset[0]}, {click_offset[1]}]")
-                         print(f"👆 SEGUNDO: CLICANDO EM: ({final_click_x}, {final_click_y})")
+                         logger.debug("👆 SEGUNDO: CLICANDO EM: (%s, %s) (offset [%s, %s])", final_click_x, final_click_y,
+                                      click_offset[0], click_offset[1], extra=step_log)
                          simulate_touch(final_click_x, final_click_y, device_id=device_id)
                     else:
                          if "click_offset" in step_config:
-                              print(f"⚠️  Aviso: Configuração de click_offset inválida ({click_offset}) em {step_name}. Esperado [x, y].")
-                         print(f"👆 SEGUNDO: CLICANDO NO CENTRO: ({center_x}, {center_y})")
+                              logger.warning("⚠️  Aviso: Configuração de click_offset inválida (%s) em %s. Esperado [x, y].",
+                                             click_offset, step_name, extra=step_log)
+                         logger.debug("👆 SEGUNDO: CLICANDO NO CENTRO: (%s, %s)", center_x, center_y, extra=step_log)
                          simulate_touch(center_x, center_y, device_id=device_id)
+                    last_input_ts = time.monotonic()
+                    _prefetch_after_input(prefetcher, next_step, last_input_ts,
+                                          (0 if wait_enabled else click_delay) + _inter_step_delay(step_type, wait_enabled))
 
                     # OTIMIZAÇÃO: No modo otimizado, post_detection_delay JÁ cumpre o papel de click_delay
                     if not wait_enabled and click_delay > 0:
                         #  print(f"⏳ Aguardando {click_delay}s após o clique...")
-                         time.sleep(click_delay)
+                         _pause(click_delay, abort_event)
                     elif wait_enabled:
-                         print(f"⚡ Modo otimizado: click_delay ignorado (post_detection_delay já aplicado)")
+                         logger.debug("⚡ Modo otimizado: click_delay ignorado (post_detection_delay já aplicado)", extra=step_log)
                     
                     # Log de sucesso melhorado para scroll_then_click
                     account_info = f" - Conta: {account_name}" if account_name else ""
-                    print(f"🎉 SUCESSO [Passo {step_number}] - Template: {os.path.basename(template_path)} - Acao: {action_name}{account_info}")
+                    logger.info("🎉 SUCESSO [Passo %d] - Template: %s - Acao: %s%s", step_number, template_filename,
+                                action_name, account_info,
+                                extra=dict(step_log, template=template_filename,
+                                           duration_ms=round((time.monotonic() - step_started) * 1000)))
                     step_success = True
                     # Não executar action_after_find novamente, pois já foi executado
                 # TODO: Adicionar outros tipos de action_on_found aqui (ex: swipe a partir do template)
                 else:
                     # Ignora chaves que começam com '#'
                     if action_on_found and not action_on_found.startswith("#"):
-                        print(f"Aviso: Tipo de action_on_found '{action_on_found}' no {step_name} desconhecido/não implementado. Template encontrado, mas ação não executada.")
+                        logger.warning("Aviso: Tipo de action_on_found '%s' no %s desconhecido/não implementado. "
+                                       "Template encontrado, mas ação não executada.", action_on_found, step_name, extra=step_log)
                         step_success = False # Considera falha se a ação no template não puder ser executada/reconhecida
 
             else:
@@ -766,6 +1165,26 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
                 # print(f"⚠️  PASSO FALHOU: {step_name}")
                 # print(f"🛑 PARANDO EXECUÇÃO PARA ANÁLISE DO PROBLEMA...")
                 step_success = False # Passo de template falhou
+
+                # Antes de desistir: se a tela atual for a de um passo posterior, continua a partir dele
+                if screen_index_available():
+                    later_screens = {s.get("screen") for s in action_sequence[i + 1:] if isinstance(s, dict) and s.get("screen")}
+                    if later_screens:
+                        screen_frame = _current_frame(device_id, frame_source, last_input_ts)
+                        current_screen = classify_screen(screen_frame.image)
+                        if current_screen.name in later_screens:
+                            jump_to = _find_step_for_screen(action_sequence, i + 1, current_screen.name)
+                            logger.info("🧭 Template não encontrado, mas a tela '%s' é a do passo %d: continuando dele.",
+                                        current_screen.name, jump_to + 1, extra=step_log)
+                            skip_until, carried_frame = jump_to, screen_frame
+                            continue
+
+                if prefetcher is not None:
+                    prefetcher.cancel()
+                logger.warning("❌ FALHA [Passo %d] - Template: %s - Acao: %s", step_number, template_filename, action_name,
+                               extra=dict(step_log, template=template_filename,
+                                          duration_ms=round((time.monotonic() - step_started) * 1000)))
+                dump_flight_recorder(device_id, f"timeout {action_name} {step_name}")
                 return False  # Para a execução imediatamente
 
 
@@ -778,28 +1197,34 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
                  if after_type == "scroll":
                       scroll_direction = action_after.get("direction", "down")
                       scroll_duration = action_after.get("duration_ms", 500)
-                      delay_after_scroll_after = action_after.get("delay_after_scroll", 0.5) # Delay config for after scroll
-                      scroll_start_coords = action_after.get("start_coords") # Pode ser None
-                      scroll_end_coords = action_after.get("end_coords") # Pode ser None
+                      delay_after_scroll_after = _scroll_delay(action_after) # Delay config for after scroll
+                      scroll_start_coords = _coords_from_reference(action_after.get("start_coords"), device_id) # Pode ser None
+                      scroll_end_coords = _coords_from_reference(action_after.get("end_coords"), device_id) # Pode ser None
 
 
-                      print(f"Executando ação após encontrar template: Scroll.")
+                      logger.debug("Executando ação após encontrar template: Scroll.", extra=step_log)
                       simulate_scroll(
                            device_id=device_id,
                            direction=scroll_direction,
                            duration_ms=scroll_duration,
                            start_coords=scroll_start_coords, # Passa as coords específicas se existirem
-                           end_coords=scroll_end_coords
+                           end_coords=scroll_end_coords,
+                           drag=bool(action_after.get("drag"))
                       )
-                      time.sleep(delay_after_scroll_after) # Delay após o scroll
+                      last_input_ts = time.monotonic()
+                      _prefetch_after_input(prefetcher, next_step, last_input_ts,
+                                            delay_after_scroll_after + _inter_step_delay(step_type, wait_enabled))
+                      _pause(delay_after_scroll_after, abort_event) # Delay após o scroll
 
                  elif after_type == "wait":
                       wait_duration = action_after.get("duration_seconds")
                       if isinstance(wait_duration, (int, float)) and wait_duration > 0:
-                          print(f"Executando ação após encontrar template: Esperando por {wait_duration} segundos.")
-                          time.sleep(wait_duration)
+                          logger.debug("Executando ação após encontrar template: Esperando por %s segundos.",
+                                       wait_duration, extra=step_log)
+                          _pause(wait_duration, abort_event)
                       else:
-                          print(f"Aviso: Configuração inválida para action_after_find wait em {step_name}.")
+                          logger.warning("Aviso: Configuração inválida para action_after_find wait em %s.", step_name,
+                                         extra=step_log)
 
 
                  # Adicionar aqui a lógica para verificar a imagem de sucesso APÓS este passo se configurado
@@ -815,18 +1240,22 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
 
         elif step_type == "coords":
              # Implementar lógica para clicar em coordenadas diretas
-             coords = step_config.get("coordinates")
+             coords = _coords_from_reference(step_config.get("coordinates"), device_id)
              click_delay_coords = step_config.get("click_delay", 0.5)
-             if isinstance(coords, list) and len(coords) == 2:
+             if coords is not None:
                   x, y = coords
-                  print(f"Executando {step_name}: Clicar em coordenadas diretas ({x}, {y}).")
+                  logger.debug("Executando %s: Clicar em coordenadas diretas (%s, %s).", step_name, x, y, extra=step_log)
                   simulate_touch(x, y, device_id=device_id)
+                  last_input_ts = time.monotonic()
+                  _prefetch_after_input(prefetcher, next_step, last_input_ts,
+                                        max(click_delay_coords, 0) + _inter_step_delay(step_type, False))
                   if click_delay_coords > 0:
-                       time.sleep(click_delay_coords)
-                  print(f"{step_name} (coordenadas diretas) concluído com sucesso.")
+                       _pause(click_delay_coords, abort_event)
+                  logger.info("%s (coordenadas diretas) concluído com sucesso.", step_name, extra=step_log)
                   step_success = True
              else:
-                  print(f"Erro: Passo {step_number} ('{step_name}') do tipo 'coords' não especifica 'coordinates' válidas ([x, y]). Pulando passo.")
+                  logger.error("Erro: Passo %d ('%s') do tipo 'coords' não especifica 'coordinates' válidas ([x, y]). "
+                               "Pulando passo.", step_number, step_name, extra=step_log)
                   step_success = False
 
 
@@ -834,36 +1263,41 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
              # Implementar lógica para scroll direto
              scroll_direction = step_config.get("direction", "up")
              scroll_duration = step_config.get("duration_ms", 500)
-             delay_after_scroll = step_config.get("delay_after_scroll", 0.5)
-             scroll_start_coords = step_config.get("start_coords")
-             scroll_end_coords = step_config.get("end_coords")
+             delay_after_scroll = _scroll_delay(step_config)
+             scroll_start_coords = _coords_from_reference(step_config.get("start_coords"), device_id)
+             scroll_end_coords = _coords_from_reference(step_config.get("end_coords"), device_id)
              
-             print(f"🔄 Executando {step_name}: Scroll {scroll_direction} por {scroll_duration}ms")
+             logger.debug("🔄 Executando %s: Scroll %s por %sms", step_name, scroll_direction, scroll_duration, extra=step_log)
              simulate_scroll(
                  device_id=device_id,
                  direction=scroll_direction,
                  duration_ms=scroll_duration,
                  start_coords=scroll_start_coords,
-                 end_coords=scroll_end_coords
+                 end_coords=scroll_end_coords,
+                 drag=bool(step_config.get("drag"))
              )
+             last_input_ts = time.monotonic()
+             _prefetch_after_input(prefetcher, next_step, last_input_ts,
+                                   max(delay_after_scroll, 0) + _inter_step_delay(step_type, False))
              
              if delay_after_scroll > 0:
-                 print(f"⏳ Aguardando {delay_after_scroll}s após o scroll...")
-                 time.sleep(delay_after_scroll)
+                 logger.debug("⏳ Aguardando %ss após o scroll...", delay_after_scroll, extra=step_log)
+                 _pause(delay_after_scroll, abort_event)
              
-             print(f"✅ {step_name} concluído com sucesso.")
+             logger.info("✅ %s concluído com sucesso.", step_name, extra=step_log)
              step_success = True
 
         elif step_type == "wait":
              # Implementar lógica para esperar um tempo fixo
              wait_time = step_config.get("duration_seconds")
              if isinstance(wait_time, (int, float)) and wait_time > 0:
-                  print(f"Executando {step_name}: Esperando por {wait_time} segundos.")
-                  time.sleep(wait_time)
-                  print(f"{step_name} (espera) concluído com sucesso.")
+                  logger.debug("Executando %s: Esperando por %s segundos.", step_name, wait_time, extra=step_log)
+                  _pause(wait_time, abort_event)
+                  logger.info("%s (espera) concluído com sucesso.", step_name, extra=step_log)
                   step_success = True
              else:
-                  print(f"Erro: Passo {step_number} ('{step_name}') do tipo 'wait' não especifica 'duration_seconds' válida. Pulando passo.")
+                  logger.error("Erro: Passo %d ('%s') do tipo 'wait' não especifica 'duration_seconds' válida. Pulando passo.",
+                               step_number, step_name, extra=step_log)
                   step_success = False
 
 
@@ -874,7 +1308,8 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
         else:
              # Ignora chaves que começam com '#'
              if step_type and not step_type.startswith("#"):
-                  print(f"Erro: Passo {step_number} ('{step_name}') tem tipo '{step_type}' desconhecido ou faltando. Pulando passo.")
+                  logger.error("Erro: Passo %d ('%s') tem tipo '%s' desconhecido ou faltando. Pulando passo.",
+                               step_number, step_name, step_type, extra=step_log)
              step_success = False # Considera falha se o tipo for inválido/não implementado
 
         # --- VERIFICAR IMAGEM DE SUCESSO APÓS EXECUTAR O PASSO ---
@@ -901,19 +1336,16 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
         #     print(f"💡 Verifique se o template existe e está visível na tela!")
         
         # print("=" * 50)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Passo %d concluído em %.0f ms", step_number, (time.monotonic() - step_started) * 1000,
+                         extra=dict(step_log, type=step_type, success=step_success,
+                                    duration_ms=round((time.monotonic() - step_started) * 1000)))
         
         # OTIMIZAÇÃO: Delay entre passos reduzido no modo otimizado
-        # No modo otimizado, wait_for_template já gerencia a espera necessária
-        if step_type == "template" and wait_enabled:
-            # Modo otimizado: delay mínimo apenas para estabilidade
-            # print("⚡ Modo otimizado: delay entre passos reduzido (0.1s)")
-            time.sleep(0.1)
-        elif action_name == "pegar_recursos":
-            # print("⏳ Aguardando 0.5 segundos antes do próximo passo...")
-            time.sleep(0.5)  # Delay reduzido para recursos já visíveis
-        else:
-            # print("⏳ Aguardando 0.5 segundos antes do próximo passo...")
-            time.sleep(0.5)  # Pausa padrão entre passos para observação
+        # No modo otimizado, wait_for_template já gerencia a espera necessária (0.1s só para estabilidade);
+        # nos demais, pausa padrão de 0.5s entre passos para observação.
+        # No modo pipeline, a captura do próximo passo já está correndo durante esta pausa.
+        _pause(_inter_step_delay(step_type, step_type == "template" and wait_enabled), abort_event)
         
         # REMOVENDO VERIFICAÇÃO DE SUCESSO DAQUI TEMPORARIAMENTE para simplificar
         # if sequence_override is None and success_image_config and isinstance(success_image_config, dict) and step_success: # Verifica após um passo bem-sucedido
@@ -936,6 +1368,8 @@ def execultar_acoes(action_name, device_id=None, sequence_override=None, account
     # A lógica de retorno True/False agora deve refletir se a sequência terminou SEM um erro crítico em um passo.
     # Se um template NÃO for encontrado, a função já retorna False.
     # Se o loop terminar sem um retorno False anterior, significa que todos os passos foram processados (ou pulados).
+    if prefetcher is not None:
+        prefetcher.cancel()
     return True # Retorna True se a função chegou ao fim da sequência sem interrupção por erro de template.
 
 
@@ -988,15 +1422,24 @@ def execute_login_for_account(account_info, original_sequence, device_id=None):
         account_index = 0
 
     print(f"\n--- Tentando fazer login com a conta: {account_name} (índice: {account_index}) ---")
-    
-    # Calcular posicionamento relativo para esta conta
-    posicionamento = calcular_posicao_conta_relativa(account_name, account_index, device_id)
-    print(f"📍 {posicionamento['description']}")
+
+    # Posição aprendida num login anterior: dispensa a descoberta (captura extra e tentativas com scroll)
+    position_store = get_login_position_store()
+    learned = position_store.get(device_id, account_name)
+    if learned and not position_store.is_valid_for(learned, device_id):
+        learned = None  # Aprendida em outra resolução
+    if learned:
+        print(f"📍 {account_name}: posição aprendida {tuple(learned['click'])} (acertos: {learned.get('hits', 0)})")
+    else:
+        # Calcular posicionamento relativo para esta conta
+        posicionamento = calcular_posicao_conta_relativa(account_name, account_index, device_id)
+        print(f"📍 {posicionamento['description']}")
 
     # Criar uma sequência TEMPORÁRIA para esta conta, incluindo o passo do Google (se existir)
     # e APENAS o passo do template de email correspondente à conta atual.
     modified_sequence_for_execution = []
     email_template_step_found = False # Renomeado para maior clareza
+    account_step = None  # Passo original da conta (usado para aprender a posição e no fallback)
 
     for step in original_sequence:
         step_type = step.get("type")
@@ -1014,7 +1457,21 @@ def execute_login_for_account(account_info, original_sequence, device_id=None):
             # Na função execute_login_for_account, simplesmente adicionar o passo:
             elif template_filename and template_filename.endswith('.png') and account_name in template_filename:
                 print(f"  Incluindo passo de template específico da conta '{account_name}'")
-                print(f"  📜 O scroll será executado via action_before_find do JSON")
+                account_step = json.loads(json.dumps(modified_step))
+                if learned:
+                    # Uma única verificação na região aprendida, após o mesmo scroll do login anterior
+                    print(f"  🎯 Verificação rápida na posição aprendida (região {learned['search_roi']})")
+                    if learned.get("scroll"):
+                        modified_step["action_before_find"] = learned["scroll"]
+                    else:
+                        modified_step.pop("action_before_find", None)
+                    # Espera curta (só a região aprendida) para a lista terminar de assentar: um único frame
+                    # logo após o toque contava como erro e a posição acabava descartada sem motivo
+                    modified_step.update({"initial_delay": 0, "max_attempts": 1, "wait_for_template": True,
+                                          "wait_timeout": LEARNED_VERIFY_TIMEOUT,
+                                          "search_roi": learned["search_roi"]})
+                else:
+                    print(f"  📜 O scroll será executado via action_before_find do JSON")
                 modified_sequence_for_execution.append(modified_step)
                 email_template_step_found = True
 
@@ -1052,7 +1509,31 @@ def execute_login_for_account(account_info, original_sequence, device_id=None):
     # Chamamos a função execultar_acoes, passando a sequência modificada como override
     # O nome da ação ("fazer_login") ainda é necessário para que execultar_acoes saiba onde encontrar os templates
     # (na pasta acoes/fazer_login) e também a imagem de sucesso configurada no JSON principal dessa ação.
-    login_execution_success = execultar_acoes(action_name="fazer_login", device_id=device_id, sequence_override=modified_sequence_for_execution)
+    found_positions = {}
+    login_execution_success = execultar_acoes(action_name="fazer_login", device_id=device_id,
+                                              sequence_override=modified_sequence_for_execution,
+                                              found_positions=found_positions)
+
+    account_template = account_step.get("template_file")
+    if learned:
+        if login_execution_success and account_template in found_positions:
+            position_store.record_hit(device_id, account_name)
+        else:
+            # Verificação falhou: busca completa só do passo da conta (a lista já está rolada)
+            print(f"⚠️ {account_name} fora da posição aprendida. Buscando na tela inteira...")
+            position_store.record_miss(device_id, account_name)
+            fallback_step = json.loads(json.dumps(account_step))
+            fallback_step.pop("action_before_find", None)
+            fallback_step["initial_delay"] = 0
+            found_positions = {}
+            login_execution_success = execultar_acoes(action_name="fazer_login", device_id=device_id,
+                                                      sequence_override=[fallback_step],
+                                                      found_positions=found_positions)
+            learned = None
+
+    if login_execution_success and not learned and account_template in found_positions:
+        position_store.learn(device_id, account_name, found_positions[account_template],
+                             scroll=account_step.get("action_before_find"))
 
     # A função execultar_acoes agora retorna True se a imagem de sucesso for encontrada
     # (ou a sequência terminar sem erros em execução normal sem override), e False em caso de erro.
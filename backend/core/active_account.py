@@ -0,0 +1,252 @@
+"""
+Detector da Conta Ativa
+Reconhece qual conta está logada comparando uma região pequena da tela principal (avatar e
+nome do perfil, ao lado do botão VIP) com recortes de referência de cada conta.
+
+Os recortes são aprendidos sozinhos: depois de um login, quando a tela principal aparece com a
+região de perfil, ela é gravada como referência da conta que acabou de entrar. Com isso os ciclos
+trocam de conta só quando a conta ativa é outra (logout + login custam vários segundos e scrolls);
+quando o celular já está na conta certa (ex.: após reiniciar o script) a troca é pulada.
+
+Referências: settings.paths.data_folder / "active_accounts" / <dispositivo> / <conta>.png
+"""
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+try:
+    from .detection_pool import detect_in_frame
+    from .device_profile import get_device_profile
+    from .frame_source import capture_frame
+    from .checkpoint_store import get_checkpoint_store
+except ImportError:
+    from detection_pool import detect_in_frame
+    from device_profile import get_device_profile
+    from frame_source import capture_frame
+    from checkpoint_store import get_checkpoint_store
+
+try:
+    from backend.config.settings import settings
+except ImportError:
+    try:
+        from config.settings import settings
+    except ImportError:
+        settings = None
+
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Âncora da região de perfil: botão VIP da tela principal (mesmo template do passo 1 do logout)
+ANCHOR_TEMPLATE = os.path.join(_BACKEND_DIR, "actions", "templates", "fazer_logout", "01_vip_perfil.png")
+# Região do perfil relativa ao centro da âncora [dx, dy, w, h] (referência 2400x1080):
+# avatar 100 px à esquerda do VIP (click_offset do logout) e o nome logo abaixo
+PROFILE_REGION = (-190, -60, 300, 120)
+MIN_MARGIN = 0.03  # Diferença mínima entre a melhor e a segunda melhor referência
+
+
+def _default_folder():
+    if settings is not None:
+        return str(settings.paths.data_folder / "active_accounts")
+    return os.path.join(os.path.dirname(_BACKEND_DIR), "data", "active_accounts")
+
+
+def _threshold():
+    if settings is None:
+        return 0.9
+    return getattr(settings.detection, "active_account_threshold", 0.9)
+
+
+class ActiveAccountDetector:
+    """
+    Identifica a conta logada pela região de perfil.
+
+    Exemplo:
+        detector = get_active_account_detector()
+        conta, score = detector.detect(device_id)      # (None, 0.0) fora da tela principal
+        if conta != "login_cav":
+            ...  # logout + login
+        detector.learn("login_cav", device_id)         # tela principal já na conta nova
+    """
+
+    def __init__(self, folder=None):
+        self.folder = folder or _default_folder()
+        self._lock = threading.Lock()
+        self._references = {}  # device_id -> {conta: recorte em tons de cinza}
+
+    def _device_folder(self, device_id):
+        return os.path.join(self.folder, str(device_id or "default"))
+
+    def _load(self, device_id):
+        with self._lock:
+            refs = self._references.get(device_id)
+            if refs is not None:
+                return refs
+            refs = {}
+            folder = self._device_folder(device_id)
+            if os.path.isdir(folder):
+                for filename in sorted(os.listdir(folder)):
+                    if filename.endswith(".png"):
+                        crop = cv2.imread(os.path.join(folder, filename), cv2.IMREAD_GRAYSCALE)
+                        if crop is not None:
+                            refs[filename[:-4]] = crop
+            self._references[device_id] = refs
+            return refs
+
+    def accounts(self, device_id=None):
+        """Contas com recorte de referência neste dispositivo."""
+        return sorted(self._load(device_id))
+
+    def profile_crop(self, frame, device_id=None):
+        """Recorte (tons de cinza) da região de perfil, ou None se a tela principal não está visível."""
+        if frame is None or not os.path.exists(ANCHOR_TEMPLATE):
+            return None
+        box = detect_in_frame(frame, ANCHOR_TEMPLATE, device_id=device_id)
+        if box is None:
+            return None
+        anchor_x, anchor_y = box[0] + box[2] // 2, box[1] + box[3] // 2
+        profile = get_device_profile(device_id)
+        dx, dy = profile.offset(PROFILE_REGION[0], PROFILE_REGION[1])
+        w, h = profile.offset(PROFILE_REGION[2], PROFILE_REGION[3])
+        x0, y0 = max(0, anchor_x + dx), max(0, anchor_y + dy)
+        x1, y1 = min(frame.shape[1], x0 + w), min(frame.shape[0], y0 + h)
+        if x1 - x0 < 8 or y1 - y0 < 8:
+            return None
+        crop = frame[y0:y1, x0:x1]
+        return cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+
+    @staticmethod
+    def _similarity(crop, reference):
+        if reference.shape != crop.shape:
+            reference = cv2.resize(reference, (crop.shape[1], crop.shape[0]), interpolation=cv2.INTER_AREA)
+        score = float(cv2.matchTemplate(crop, reference, cv2.TM_CCOEFF_NORMED)[0][0])
+        return score if np.isfinite(score) else 0.0  # Região lisa (desvio zero) gera nan
+
+    def detect(self, device_id=None, frame=None):
+        """
+        Conta ativa pela região de perfil.
+
+        Returns:
+            tuple: (nome da conta, score) ou (None, melhor score) se não reconhecida, se a tela
+                   principal não está visível ou se ainda não há referências.
+        """
+        refs = self._load(device_id)
+        if not refs:
+            return None, 0.0
+        if frame is None:
+            frame = capture_frame(device_id).image
+        crop = self.profile_crop(frame, device_id)
+        if crop is None:
+            return None, 0.0
+        scores = sorted(((self._similarity(crop, ref), name) for name, ref in refs.items()), reverse=True)
+        best_score, best_name = scores[0]
+        second = scores[1][0] if len(scores) > 1 else -1.0
+        if best_score >= _threshold() and best_score - second >= MIN_MARGIN:
+            return best_name, best_score
+        return None, best_score
+
+    def learn(self, account_name, device_id=None, frame=None):
+        """Grava a região de perfil atual como referência da conta. Retorna True se gravou."""
+        if frame is None:
+            frame = capture_frame(device_id).image
+        crop = self.profile_crop(frame, device_id)
+        if crop is None:
+            return False
+        folder = self._device_folder(device_id)
+        os.makedirs(folder, exist_ok=True)
+        cv2.imwrite(os.path.join(folder, f"{account_name}.png"), crop)
+        with self._lock:
+            self._references.setdefault(device_id, {})[account_name] = crop
+        print(f"🪪 Referência de perfil aprendida: {account_name}")
+        return True
+
+    def forget(self, account_name, device_id=None):
+        path = os.path.join(self._device_folder(device_id), f"{account_name}.png")
+        if os.path.exists(path):
+            os.remove(path)
+        with self._lock:
+            self._references.get(device_id, {}).pop(account_name, None)
+
+
+_detector = None
+_detector_lock = threading.Lock()
+_last_login = {}  # device_id -> conta do último login bem-sucedido (ainda sem referência confirmada)
+
+
+def get_active_account_detector():
+    """Instância global (referências em settings.paths.data_folder / "active_accounts")."""
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            _detector = ActiveAccountDetector()
+        return _detector
+
+
+def known_active_account(device_id=None):
+    """Conta ativa sem trocar nada: último login deste processo ou perfil reconhecido na tela."""
+    if _last_login.get(device_id):
+        return _last_login[device_id]
+    detector = get_active_account_detector()
+    if not detector.accounts(device_id):
+        return None
+    return detector.detect(device_id)[0]
+
+
+def _record_switch(account_name, started):
+    """Guarda a duração da troca (logout + login) para o planejador de contas."""
+    try:
+        get_checkpoint_store().record_switch_cost(account_name, time.monotonic() - started)
+    except Exception as e:
+        print(f"⚠️ Não foi possível registrar o custo de troca de {account_name}: {e}")
+
+
+def switch_to_account(account_name, login_fn, logout_fn, device_id=None):
+    """
+    Garante que account_name está ativa, fazendo logout/login só se necessário.
+
+    Args:
+        login_fn (callable): login_fn() -> bool, faz login em account_name (a partir da tela de contas).
+        logout_fn (callable): logout_fn(conta_ativa) -> bool, desloga a conta ativa.
+
+    Returns:
+        bool: True se account_name está ativa ao final.
+    """
+    detector = get_active_account_detector()
+    pending = _last_login.pop(device_id, None)
+    active, score = None, 0.0
+    frame = None
+    if pending or detector.accounts(device_id):  # Sem referências nem login anterior: nada a comparar
+        frame = capture_frame(device_id).image
+        active, score = detector.detect(device_id, frame=frame)
+
+    # A conta do último login ainda sem referência: aprende agora, com a tela principal visível
+    if active is None and pending and pending not in detector.accounts(device_id):
+        if detector.learn(pending, device_id, frame=frame):
+            active, score = detector.detect(device_id, frame=frame)
+
+    if active == account_name:
+        print(f"⏭️ {account_name} já está ativa (perfil reconhecido, score {score:.2f}). Troca de conta pulada.")
+        return True
+
+    started = time.monotonic()
+    if active is not None:
+        print(f"🔄 Conta ativa: {active} → trocando para {account_name}")
+        logout_fn(active)
+    elif pending:
+        # Conta logada conhecida pelo processo, mas o perfil não foi confirmado na tela
+        logout_fn(pending)
+
+    if login_fn():
+        _last_login[device_id] = account_name
+        _record_switch(account_name, started)
+        return True
+
+    if active is None and not pending:
+        # Estado desconhecido (ex.: logada numa conta ainda sem referência): desloga e tenta de novo
+        print(f"⚠️ Login de {account_name} falhou com conta ativa desconhecida. Tentando após logout...")
+        logout_fn(None)
+        if login_fn():
+            _last_login[device_id] = account_name
+            return True
+    return False
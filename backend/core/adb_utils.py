@@ -1,15 +1,32 @@
 # Nome do Arquivo: 2162f8ef_adb_utils.py
 # Descrição: Contém funções utilitárias para interagir com dispositivos Android via ADB (captura, toque, scroll, getevent).
 # Versão: 01.00.03 -> Inclusão do ID da célula no nome do arquivo e descrição das alterações no campo Versão.
+# Versão: 01.00.04 -> Adicionada capture_screen_array(): captura via 'adb exec-out screencap -p' direto para memória.
+# Versão: 01.00.05 -> Adicionada simulate_back() (tecla BACK N vezes em uma única chamada de shell).
+# Versão: 01.00.06 -> Toques e BACK registrados no flight recorder (últimos eventos antes de uma falha).
+# Versão: 01.00.07 -> Adicionada simulate_drag(): arrasto sem inércia (input motionevent DOWN/MOVE/UP em uma
+#                     única chamada de shell, com o dedo parado antes do UP).
+# Versão: 01.00.08 -> get_touch_event_coordinates() usa o nó do touchscreen das propriedades do dispositivo
+#                     (device_registry) em vez de /dev/input/event5 fixo.
+# Versão: 01.00.09 -> simulate_drag() só marca o aparelho sem motionevent quando 'input' imprime o uso/comando
+#                     desconhecido; erro de transporte falha só a chamada (sem cair para o swipe para sempre).
 # Analista: Gemini
 # Programador: Gled Carneiro
 # -----------------------------------------------------------------------------
 import cv2
+import numpy as np
 import subprocess
 import os
 import time
 import re
 
+try:
+    from .flight_recorder import record_event
+    from .device_registry import get_device_properties
+except ImportError:
+    from flight_recorder import record_event
+    from device_registry import get_device_properties
+
 # --- Função para capturar evento de toque ---
 def get_touch_event_coordinates(device_id=None):
     """
@@ -25,12 +42,12 @@ def get_touch_event_coordinates(device_id=None):
     command = ["adb"]
     if device_id:
         command.extend(["-s", device_id])
-    # Use getevent -l no device específico identificado na saída do usuário
-    # Aumentei o timeout para dar mais tempo para o toque.
-    # Removi o grep inicial para ver toda a saída do getevent para depuração.
-    # Direcionando para /dev/input/event5 com base na saída do usuário
+    # Nó do touchscreen lido das propriedades do dispositivo (getevent -pl, uma vez por conexão).
+    # Sem ele, escuta todos os dispositivos de entrada (só o touchscreen emite ABS_MT_POSITION_*).
     # Reduzi o timeout para 15s, se 30s for muito longo em alguns casos. Ajuste conforme necessário.
-    command.extend(["shell", "timeout 15 getevent -l /dev/input/event5"])
+    props = get_device_properties(device_id)
+    touch_device = props.touch_device if props is not None and props.touch_device else ""
+    command.extend(["shell", f"timeout 15 getevent -l {touch_device}".strip()])
 
     print("Aguardando toque na tela do dispositivo. Toque na tela.")
 
@@ -198,6 +215,49 @@ def capture_screen(device_id=None, output_path="screenshot.png"):
              print(f"Aviso: Falha ao tentar remover arquivo temporário no dispositivo após erro inesperado: {rm_e}")
         return False
 
+# --- Função para capturar a tela direto para a memória (sem arquivo no celular ou no PC) ---
+def capture_screen_array(device_id=None, timeout=10):
+    """
+    Captura a tela do dispositivo Android e retorna a imagem decodificada em memória.
+
+    Usa 'adb exec-out screencap -p' (PNG pelo stdout), evitando as 3 chamadas de
+    screencap/pull/rm e a escrita/leitura de arquivos temporários.
+
+    Args:
+        device_id (str, optional): O ID do dispositivo. Se None, usa o dispositivo padrão.
+        timeout (float, optional): Timeout do comando adb em segundos.
+
+    Returns:
+        numpy.ndarray: Imagem BGR, ou None em caso de erro.
+    """
+    command = ["adb"]
+    if device_id:
+        command.extend(["-s", device_id])
+    command.extend(["exec-out", "screencap", "-p"])
+
+    try:
+        result = subprocess.run(command, check=True, capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired as e:
+        print(f"Erro de timeout ao executar comando adb: {e.cmd}")
+        return None
+    except subprocess.CalledProcessError as e:
+        print(f"Erro ao capturar a tela: {e}")
+        if e.stderr:
+            print(f"Stderr: {e.stderr.decode(errors='replace').strip()}")
+        return None
+    except FileNotFoundError:
+        print("Erro: adb não encontrado. Certifique-se de que o Android SDK está instalado e no PATH.")
+        return None
+
+    if not result.stdout:
+        print("Erro ao capturar a tela: saída vazia do screencap.")
+        return None
+    image = cv2.imdecode(np.frombuffer(result.stdout, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        print("Erro ao decodificar a screenshot recebida do dispositivo.")
+    return image
+
+
 def simulate_touch(x, y, device_id=None):
     """
     Simula um toque na tela do dispositivo Android usando adb.
@@ -212,6 +272,7 @@ def simulate_touch(x, y, device_id=None):
         command.extend(["-s", device_id])
     # O comando 'input tap' simula um toque nas coordenadas (x, y)
     command.extend(["shell", "input", "tap", str(x), str(y)])
+    record_event(device_id, "tap", x=x, y=y)
 
     try:
         # Adicionado um pequeno timeout para o comando adb input
@@ -231,6 +292,108 @@ def simulate_touch(x, y, device_id=None):
         print(f"Ocorreu um erro inesperado durante a simulação do toque: {e}")
 
 
+def simulate_back(device_id=None, times=1, delay=0.3):
+    """
+    Pressiona a tecla BACK do Android N vezes.
+
+    Args:
+        device_id (str, optional): O ID do dispositivo. Se None, usa o dispositivo padrão.
+        times (int): Quantidade de vezes.
+        delay (float): Intervalo entre as teclas (executado no próprio celular).
+
+    Returns:
+        bool: True se o comando foi executado, False em caso de erro.
+    """
+    command = ["adb"]
+    if device_id:
+        command.extend(["-s", device_id])
+    # Uma única chamada de shell para as N teclas (evita N round trips do adb)
+    presses = "; ".join([f"input keyevent 4; sleep {delay}"] * max(1, int(times)))
+    command.extend(["shell", presses])
+    record_event(device_id, "back", times=times)
+    try:
+        subprocess.run(command, check=True, capture_output=True, timeout=5 + times * (delay + 1))
+        return True
+    except subprocess.TimeoutExpired as e:
+        print(f"Erro de timeout ao executar BACK: {e.cmd}")
+    except subprocess.CalledProcessError as e:
+        print(f"Erro ao executar BACK: {e}")
+    except FileNotFoundError:
+        print("Erro: adb não encontrado. Certifique-se de que o Android SDK está instalado e no PATH.")
+    return False
+
+
+_motionevent_support = {}  # device_id -> False se o aparelho não tem 'input motionevent'
+
+
+def simulate_drag(start, end, device_id=None, steps=6, hold_ms=150, fallback_duration_ms=1500):
+    """
+    Arrasta de start até end sem inércia.
+
+    Envia DOWN, MOVEs intermediários, uma pausa com o dedo parado e UP (input motionevent) numa
+    única chamada de shell. Como a velocidade no UP é zero, a lista para exatamente onde o dedo
+    soltou: não há fling, então o deslocamento não depende do tempo do gesto e não é preciso
+    esperar a lista assentar.
+
+    Em aparelhos sem 'input motionevent' (Android 9 ou anterior) usa um 'input swipe' lento
+    (fallback_duration_ms), que reduz mas não elimina a inércia.
+
+    Args:
+        start (list): [x, y] inicial, em pixels do dispositivo.
+        end (list): [x, y] final, em pixels do dispositivo.
+        device_id (str, optional): O ID do dispositivo. Se None, usa o dispositivo padrão.
+        steps (int): Quantidade de MOVEs entre DOWN e UP.
+        hold_ms (int): Tempo com o dedo parado no ponto final antes do UP.
+        fallback_duration_ms (int): Duração do swipe lento usado sem motionevent.
+
+    Returns:
+        bool: True se o comando foi executado, False em caso de erro.
+    """
+    (x0, y0), (x1, y1) = [int(v) for v in start], [int(v) for v in end]
+    command = ["adb"]
+    if device_id:
+        command.extend(["-s", device_id])
+
+    record_event(device_id, "drag", start=[x0, y0], end=[x1, y1])
+    if _motionevent_support.get(device_id, True):
+        steps = max(1, int(steps))
+        moves = [f"input motionevent MOVE {round(x0 + (x1 - x0) * i / steps)} {round(y0 + (y1 - y0) * i / steps)}"
+                 for i in range(1, steps + 1)]
+        script = "; ".join([f"input motionevent DOWN {x0} {y0}"] + moves +
+                           [f"sleep {hold_ms / 1000.0:.3f}", f"input motionevent UP {x1} {y1}"])
+        try:
+            result = subprocess.run(command + ["shell", script], capture_output=True, text=True,
+                                    timeout=10 + steps)
+        except subprocess.TimeoutExpired as e:
+            print(f"Erro de timeout ao simular o arrasto: {e.cmd}")
+            return False
+        except FileNotFoundError:
+            print("Erro: adb não encontrado. Certifique-se de que o Android SDK está instalado e no PATH.")
+            return False
+        output = (result.stdout + result.stderr).lower()
+        if "usage:" not in output and "unknown command" not in output:
+            if result.returncode == 0:
+                return True
+            # Falha de transporte (USB/adb): só esta chamada falhou, o aparelho continua com motionevent
+            print(f"Erro ao simular o arrasto: {(result.stderr or result.stdout).strip()}")
+            return False
+        # 'input' sem motionevent imprime o uso e não toca na tela: lembra e cai para o swipe lento
+        print(f"⚠️ 'input motionevent' indisponível em {device_id or 'dispositivo padrão'}. Usando swipe lento.")
+        _motionevent_support[device_id] = False
+
+    command.extend(["shell", "input", "swipe", str(x0), str(y0), str(x1), str(y1), str(fallback_duration_ms)])
+    try:
+        subprocess.run(command, check=True, capture_output=True, timeout=fallback_duration_ms / 1000.0 + 5)
+        return True
+    except subprocess.TimeoutExpired as e:
+        print(f"Erro de timeout ao simular o arrasto: {e.cmd}")
+    except subprocess.CalledProcessError as e:
+        print(f"Erro ao simular o arrasto: {e}")
+    except FileNotFoundError:
+        print("Erro: adb não encontrado. Certifique-se de que o Android SDK está instalado e no PATH.")
+    return False
+
+
 def get_action_sequence(action_folder_path):
     """
     Lista os arquivos de imagem (.png) em uma pasta de ação, ordenados pelo nome.
@@ -0,0 +1,336 @@
+"""
+Correlação em Lote (vários templates por frame)
+Calcula a transformada de Fourier do frame e as somas locais (imagens integrais) uma única vez
+e correlaciona todos os templates contra elas, com o mesmo resultado de cv2.TM_CCOEFF_NORMED.
+
+Com N templates, o loop tradicional chama cv2.matchTemplate N vezes e cada chamada refaz todo
+o trabalho do lado do frame. Aqui o custo de cada template extra é só: produto de espectros,
+uma DFT inversa e a normalização (as estatísticas de janela são compartilhadas entre templates
+de mesmo tamanho). O espectro de cada template também fica em cache. Templates com máscara
+(canal alfa ou <nome>_mask.png) não cabem na correlação por FFT e usam cv2.matchTemplate com máscara.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+try:
+    from .image_detection import (load_template_gray, load_template_mask, _get_template_pyramid, _to_gray,
+                                  _match_single, _detection_setting, _locked_scales, _cache_lock,
+                                  DEFAULT_THRESHOLD)
+except ImportError:
+    from image_detection import (load_template_gray, load_template_mask, _get_template_pyramid, _to_gray,
+                                 _match_single, _detection_setting, _locked_scales, _cache_lock,
+                                 DEFAULT_THRESHOLD)
+
+
+# Mesmas constantes usadas pelo OpenCV na normalização (templmatch.cpp)
+_DBL_EPSILON = np.finfo(np.float64).eps
+_FLT_EPSILON = np.finfo(np.float32).eps
+
+# Maior janela cuja ΣI² (até 255² por pixel) cabe em int32
+_MAX_INT32_WINDOW_AREA = (2 ** 31 - 1) // (255 * 255)
+
+# Cache de espectros: (id do template, shape do template, tamanho da DFT) -> (template, espectro, norma)
+_spectrum_cache = OrderedDict()
+_spectrum_lock = threading.Lock()
+_SPECTRUM_CACHE_SIZE = 64
+
+
+def _template_spectrum(template_gray, dft_size):
+    """
+    Retorna (espectro, norma) do template com média zero, preenchido até dft_size.
+
+    O cache usa a identidade do array: templates vêm do cache de image_detection, então o
+    mesmo arquivo devolve o mesmo objeto enquanto não for modificado em disco.
+    """
+    key = (id(template_gray), template_gray.shape, dft_size)
+    with _spectrum_lock:
+        cached = _spectrum_cache.get(key)
+        # Confere o objeto para não reaproveitar um id() reciclado pelo garbage collector
+        if cached is not None and cached[0] is template_gray:
+            _spectrum_cache.move_to_end(key)
+            return cached[1], cached[2]
+
+    t = template_gray.astype(np.float64)
+    t -= t.mean()
+    templ_norm = float(np.sqrt(np.sum(t * t)))
+
+    padded = np.zeros(dft_size, dtype=np.float32)
+    padded[:t.shape[0], :t.shape[1]] = t
+    spectrum = cv2.dft(padded)  # Formato CCS compacto (DFT real, metade do trabalho)
+
+    with _spectrum_lock:
+        _spectrum_cache[key] = (template_gray, spectrum, templ_norm)
+        while len(_spectrum_cache) > _SPECTRUM_CACHE_SIZE:
+            _spectrum_cache.popitem(last=False)
+    return spectrum, templ_norm
+
+
+class FrameCorrelator:
+    """
+    Pré-processa um frame uma vez para correlacioná-lo com vários templates.
+
+    Exemplo:
+        correlator = FrameCorrelator(frame)
+        for template in templates:
+            score, loc = correlator.best(template)
+    """
+
+    def __init__(self, frame):
+        gray = _to_gray(frame)
+        self.gray = gray  # Templates com máscara são comparados direto (matchTemplate com máscara)
+        self.height, self.width = gray.shape[:2]
+
+        # Tamanho da DFT >= frame: a correlação circular coincide com a linear na região válida
+        self.dft_size = (cv2.getOptimalDFTSize(self.height), cv2.getOptimalDFTSize(self.width))
+        padded = np.zeros(self.dft_size, dtype=np.float32)
+        padded[:self.height, :self.width] = gray
+        self._spectrum = cv2.dft(padded)
+
+        # Imagens integrais de I e I² para somas de janela em O(1). ΣI² do frame inteiro não cabe
+        # em int32, mas a de uma janela pequena cabe: guardando a integral módulo 2^32, a diferença
+        # dos 4 cantos (com overflow) dá a soma exata da janela, com metade do tráfego de memória.
+        self._sum, self._sqsum64 = cv2.integral2(gray, sdepth=cv2.CV_32S, sqdepth=cv2.CV_64F)
+        self._sqsum32 = self._sqsum64.astype(np.int64).astype(np.int32)
+        self._window_cache = {}
+
+    def _window_sum(self, integral, th, tw):
+        """Soma de todas as janelas th x tw a partir de uma imagem integral."""
+        rows, cols = self.height - th + 1, self.width - tw + 1
+        out = np.subtract(integral[th:th + rows, tw:tw + cols], integral[:rows, tw:tw + cols])
+        out -= integral[th:th + rows, :cols]
+        out += integral[:rows, :cols]
+        return out
+
+    def _inverse_window_norm(self, th, tw):
+        """
+        Retorna 1/sqrt(soma dos desvios² da janela) para todas as janelas th x tw (float32).
+
+        Compartilhado entre templates do mesmo tamanho. Janelas (quase) constantes recebem 0,
+        como no OpenCV, que zera o denominador nesses casos.
+        """
+        inv_norm = self._window_cache.get((th, tw))
+        if inv_norm is not None:
+            return inv_norm
+
+        area = th * tw
+        wnd_sum = self._window_sum(self._sum, th, tw).astype(np.int64)
+        if area <= _MAX_INT32_WINDOW_AREA:
+            wnd_sum2 = self._window_sum(self._sqsum32, th, tw).astype(np.int64)
+        else:
+            wnd_sum2 = self._window_sum(self._sqsum64, th, tw).astype(np.int64)
+
+        # N·(ΣI² - (ΣI)²/N) em inteiros: exato, sem cancelamento numérico
+        scaled_diff2 = wnd_sum2 * np.int64(area)
+        scaled_diff2 -= wnd_sum * wnd_sum
+        scaled_diff2 = scaled_diff2.astype(np.float32)
+
+        # Janela plana: diff2 <= min(0.5, 10·FLT_EPSILON·ΣI²). O segundo termo só importa nas
+        # poucas janelas que já passam no primeiro, então é avaliado apenas nelas.
+        flat = scaled_diff2 <= np.float32(0.5 * area)
+        if flat.any():
+            candidates = np.flatnonzero(flat)
+            limit = (10 * _FLT_EPSILON * area) * wnd_sum2.ravel()[candidates]
+            flat.ravel()[candidates] = scaled_diff2.ravel()[candidates] <= limit
+        scaled_diff2[flat] = np.inf
+        inv_norm = cv2.divide(np.float32(np.sqrt(area)), cv2.sqrt(scaled_diff2))
+        self._window_cache[(th, tw)] = inv_norm
+        return inv_norm
+
+    def correlate(self, template_gray):
+        """
+        Mapa de resultado equivalente a cv2.matchTemplate(frame, template, TM_CCOEFF_NORMED).
+
+        Returns:
+            numpy.ndarray: Mapa float32 (H-h+1, W-w+1), ou None se o template não cabe no frame.
+        """
+        th, tw = template_gray.shape[:2]
+        if th > self.height or tw > self.width:
+            return None
+        rows, cols = self.height - th + 1, self.width - tw + 1
+
+        spectrum, templ_norm = _template_spectrum(template_gray, self.dft_size)
+        if templ_norm < _DBL_EPSILON:
+            # Template uniforme: o OpenCV define o resultado como 1 em todo o mapa
+            return np.ones((rows, cols), dtype=np.float32)
+
+        product = cv2.mulSpectrums(self._spectrum, spectrum, 0, conjB=True)
+        corr = cv2.idft(product, flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)
+
+        result = corr[:rows, :cols] * self._inverse_window_norm(th, tw)
+        result *= np.float32(1.0 / templ_norm)
+
+        # Mesma regra de saturação do OpenCV: |r| pouco acima de 1 (erro numérico) vira ±1,
+        # valores bem acima de 1 (denominador degenerado) viram 0. Raro, então só nos pontos afetados.
+        over = np.abs(result) >= 1.0
+        if over.any():
+            values = result[over]
+            result[over] = np.where(np.abs(values) < 1.125, np.sign(values), 0.0)
+        return result
+
+    def best(self, template_gray):
+        """Retorna (score, (x, y)) do melhor ponto, ou (-1.0, None) se o template não cabe no frame."""
+        result = self.correlate(template_gray)
+        if result is None:
+            return -1.0, None
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        return float(max_val), max_loc
+
+
+def match_many(screenshot, template_paths, threshold=None, device_id=None, multiscale=None):
+    """
+    Procura vários templates no mesmo frame, compartilhando o processamento do frame.
+
+    Segue as mesmas regras de best_match_in_frame (multi-escala e escala travada por dispositivo);
+    cada escala da pirâmide entra no lote como um template a mais.
+
+    Args:
+        screenshot (numpy.ndarray): Frame BGR ou em tons de cinza.
+        template_paths (list): Caminhos dos templates.
+        threshold (float, optional): Limiar (default: settings.detection.threshold).
+        device_id (str, optional): ID do dispositivo (chave da escala travada).
+        multiscale (bool, optional): Força ligar/desligar multi-escala. None usa settings.
+
+    Returns:
+        dict: caminho -> (score, (x, y, w, h) ou None), na mesma ordem de template_paths.
+    """
+    if threshold is None:
+        threshold = _detection_setting("threshold", DEFAULT_THRESHOLD)
+    if multiscale is None:
+        multiscale = _detection_setting("enable_multiscale", False)
+
+    correlator = FrameCorrelator(screenshot)
+    resolution = (correlator.width, correlator.height)
+    lock_key = (device_id, resolution)
+
+    results = OrderedDict()
+    for template_path in template_paths:
+        if not multiscale:
+            template_gray = load_template_gray(template_path)
+            candidates = [(1.0, template_gray)] if template_gray is not None else None
+            lock = None
+        else:
+            candidates = _get_template_pyramid(template_path, resolution)
+            with _cache_lock:
+                lock = _locked_scales.get(lock_key)
+            if candidates and lock is not None:
+                candidates = [item for item in candidates if item[0] == lock["scale"]] or candidates
+
+        if not candidates:
+            print(f"Erro: Não foi possível carregar o template de {template_path}")
+            results[template_path] = (-1.0, None)
+            continue
+
+        best_score, best_box, best_scale = -1.0, None, None
+        for scale, template_gray in candidates:
+            mask = load_template_mask(template_path, template_gray.shape)
+            if mask is None:
+                score, loc = correlator.best(template_gray)
+            else:
+                score, loc = _match_single(correlator.gray, template_gray, mask)
+            if loc is not None and score > best_score:
+                h, w = template_gray.shape[:2]
+                best_score, best_box, best_scale = score, (loc[0], loc[1], w, h), scale
+        results[template_path] = (best_score, best_box)
+
+        # Só trava a escala com um acerto; falhas de templates que simplesmente não estão na
+        # tela não devem derrubar a escala travada (diferente da busca de um único template).
+        if multiscale and best_box is not None and best_score >= threshold:
+            with _cache_lock:
+                _locked_scales[lock_key] = {"scale": best_scale, "misses": 0}
+
+    return results
+
+
+def first_match(screenshot, template_paths, threshold=None, device_id=None, multiscale=None):
+    """
+    Retorna o primeiro template (na ordem dada) presente no frame.
+
+    Returns:
+        tuple: (caminho, score, (x, y, w, h)) ou (None, melhor_score, None) se nenhum passou do limiar.
+    """
+    if threshold is None:
+        threshold = _detection_setting("threshold", DEFAULT_THRESHOLD)
+    results = match_many(screenshot, template_paths, threshold=threshold,
+                         device_id=device_id, multiscale=multiscale)
+    best_score = -1.0
+    for template_path, (score, box) in results.items():
+        if box is not None and score >= threshold:
+            return template_path, score, box
+        best_score = max(best_score, score)
+    return None, best_score, None
+
+
+def benchmark(frame, templates, repeats=3):
+    """
+    Compara o loop de cv2.matchTemplate com o lote (mesmo frame, mesmos templates).
+
+    O lote é medido "frio" (espectros dos templates calculados na hora) e "quente" (espectros
+    em cache, o caso normal de polling, em que os templates se repetem a cada frame).
+
+    Returns:
+        dict: tempos médios em ms e maior diferença absoluta entre os mapas de resultado.
+    """
+    gray = _to_gray(frame)
+    loop_times, cold_times, warm_times = [], [], []
+    max_diff = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        expected = [cv2.matchTemplate(gray, t, cv2.TM_CCOEFF_NORMED) for t in templates]
+        loop_times.append(time.perf_counter() - start)
+
+        with _spectrum_lock:
+            _spectrum_cache.clear()
+        start = time.perf_counter()
+        correlator = FrameCorrelator(gray)
+        got = [correlator.correlate(t) for t in templates]
+        cold_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        correlator = FrameCorrelator(gray)
+        for t in templates:
+            correlator.correlate(t)
+        warm_times.append(time.perf_counter() - start)
+
+        for e, g in zip(expected, got):
+            max_diff = max(max_diff, float(np.max(np.abs(e - g))))
+
+    return {
+        "templates": len(templates),
+        "loop_ms": 1000 * sum(loop_times) / repeats,
+        "batch_cold_ms": 1000 * sum(cold_times) / repeats,
+        "batch_ms": 1000 * sum(warm_times) / repeats,
+        "max_abs_diff": max_diff,
+    }
+
+
+if __name__ == '__main__':
+    import glob
+    import os
+    import sys
+
+    # Uso: python batch_matching.py [screenshot.png template1.png template2.png ...]
+    # Sem argumentos: templates de fazer_login colados em um frame sintético 2400x1080.
+    if len(sys.argv) > 2:
+        frame = cv2.imread(sys.argv[1])
+        templates = [load_template_gray(p) for p in sys.argv[2:]]
+    else:
+        backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        paths = sorted(glob.glob(os.path.join(backend_dir, "actions", "templates", "fazer_login", "*.png")))
+        templates = [load_template_gray(p) for p in paths]
+        rng = np.random.default_rng(0)
+        frame = cv2.GaussianBlur(rng.integers(0, 256, (1080, 2400), dtype=np.uint8), (7, 7), 0)
+        for i, t in enumerate(t for t in templates if t is not None):
+            y, x = 40 + (i % 5) * 200, 100 + (i // 5) * 1100
+            if y + t.shape[0] <= frame.shape[0] and x + t.shape[1] <= frame.shape[1]:
+                frame[y:y + t.shape[0], x:x + t.shape[1]] = t
+    templates = [t for t in templates if t is not None]
+
+    print(f"{'N':>3} | {'loop (ms)':>10} | {'lote frio (ms)':>14} | {'lote (ms)':>10} | diferença máx.")
+    for n in range(1, len(templates) + 1):
+        r = benchmark(frame, templates[:n])
+        print(f"{r['templates']:>3} | {r['loop_ms']:>10.1f} | {r['batch_cold_ms']:>14.1f} | "
+              f"{r['batch_ms']:>10.1f} | {r['max_abs_diff']:.2e}")
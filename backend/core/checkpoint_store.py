@@ -0,0 +1,238 @@
+"""
+Checkpoints Persistentes dos Ciclos de Contas
+Registro durável (SQLite) do que já foi feito em cada ciclo, por conta e por tarefa.
+
+Os ciclos (ciclo_completo_todas_contas, ciclo_rally_tres_contas, ciclo_rally_intercalado)
+guardavam o progresso só em memória: depois de uma queda do USB ou de um crash, a rodada
+recomeçava da primeira conta, refazendo logins e coletas. Aqui cada rodada de um ciclo fica
+aberta no banco até terminar; ao reiniciar o script, a rodada aberta é retomada e as tarefas
+já concluídas nela são puladas. Cada tarefa também guarda quando volta a estar disponível
+(next_due), para tarefas com recarga (ex.: baú), e o custo medido de trocar para cada conta
+(usado pelo account_planner para ordenar as contas).
+
+Cada escrita é confirmada imediatamente (modo WAL), então o estado sobrevive a um kill.
+"""
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+try:
+    from backend.config.settings import settings
+except ImportError:
+    try:
+        from config.settings import settings
+    except ImportError:
+        settings = None
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cycle_run (
+    cycle       TEXT PRIMARY KEY,
+    run_number  INTEGER NOT NULL,
+    started_at  REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS task_state (
+    cycle    TEXT NOT NULL,
+    account  TEXT NOT NULL,
+    task     TEXT NOT NULL,
+    status   TEXT NOT NULL,
+    done_at  REAL,
+    next_due REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    detail   TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (cycle, account, task)
+);
+CREATE TABLE IF NOT EXISTS switch_cost (
+    account     TEXT PRIMARY KEY,
+    avg_seconds REAL NOT NULL,
+    samples     INTEGER NOT NULL,
+    updated_at  REAL NOT NULL
+);
+"""
+
+
+def _default_db_path():
+    if settings is not None:
+        return str(settings.paths.data_folder / "checkpoints.db")
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(os.path.dirname(backend_dir), "data", "checkpoints.db")
+
+
+@dataclass
+class CycleRun:
+    """Rodada de um ciclo: aberta até finish_cycle; resumed indica que veio de uma execução anterior."""
+    cycle: str
+    number: int
+    started_at: float
+    resumed: bool = False
+
+
+class CheckpointStore:
+    """
+    Estado durável das tarefas por conta.
+
+    Exemplo:
+        store = CheckpointStore()
+        run = store.begin_cycle("ciclo_completo")
+        for account in accounts:
+            if store.is_done(run, account["name"], "pegar_bau"):
+                continue   # já feito nesta rodada (antes da queda)
+            ...
+            store.mark_done(run, account["name"], "pegar_bau", interval=4 * 3600)
+        store.finish_cycle(run)
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or _default_db_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ------------------------------------------------------------------
+    # Rodadas
+    # ------------------------------------------------------------------
+    def begin_cycle(self, cycle, resume_within=None):
+        """
+        Retoma a rodada aberta do ciclo ou abre uma nova.
+
+        Args:
+            cycle (str): Nome do ciclo (ex.: "ciclo_rally_tres_contas").
+            resume_within (float, optional): Idade máxima (segundos) de uma rodada aberta para ser
+                                             retomada. Rodadas mais antigas são descartadas (útil
+                                             quando o que foi feito perde a validade, ex.: rallys).
+
+        Returns:
+            CycleRun
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT run_number, started_at, finished_at FROM cycle_run WHERE cycle = ?", (cycle,)).fetchone()
+            if row is not None and row[2] is None and (resume_within is None or now - row[1] <= resume_within):
+                return CycleRun(cycle, row[0], row[1], resumed=True)
+            number = (row[0] + 1) if row is not None else 1
+            self._conn.execute(
+                "INSERT INTO cycle_run (cycle, run_number, started_at, finished_at) VALUES (?, ?, ?, NULL) "
+                "ON CONFLICT(cycle) DO UPDATE SET run_number = excluded.run_number, "
+                "started_at = excluded.started_at, finished_at = NULL",
+                (cycle, number, now))
+        return CycleRun(cycle, number, now)
+
+    def finish_cycle(self, run):
+        """Fecha a rodada: a próxima chamada a begin_cycle abre uma rodada nova."""
+        with self._lock:
+            self._conn.execute("UPDATE cycle_run SET finished_at = ? WHERE cycle = ? AND run_number = ?",
+                               (time.time(), run.cycle, run.number))
+
+    # ------------------------------------------------------------------
+    # Tarefas
+    # ------------------------------------------------------------------
+    def mark_done(self, run, account, task, interval=None, detail=None):
+        """
+        Registra a tarefa como concluída agora.
+
+        Args:
+            interval (float, optional): Segundos até a tarefa voltar a estar disponível (next_due).
+            detail (str, optional): Informação livre (ex.: "3 rallys").
+        """
+        now = time.time()
+        next_due = now + interval if interval else None
+        self._upsert(run.cycle, account, task, "done", now, next_due, detail, now)
+
+    def mark_failed(self, run, account, task, detail=None, retry_in=None):
+        """Registra falha (mantém done_at anterior); retry_in adia a próxima tentativa."""
+        now = time.time()
+        next_due = now + retry_in if retry_in else None
+        self._upsert(run.cycle, account, task, "failed", None, next_due, detail, now)
+
+    def _upsert(self, cycle, account, task, status, done_at, next_due, detail, now):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO task_state (cycle, account, task, status, done_at, next_due, attempts, detail, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?) "
+                "ON CONFLICT(cycle, account, task) DO UPDATE SET status = excluded.status, "
+                "done_at = COALESCE(excluded.done_at, task_state.done_at), next_due = excluded.next_due, "
+                "attempts = task_state.attempts + 1, detail = excluded.detail, updated_at = excluded.updated_at",
+                (cycle, str(account), task, status, done_at, next_due, detail, now))
+
+    def get(self, cycle, account, task):
+        """Estado da tarefa como dict (status, done_at, next_due, attempts, detail) ou None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, done_at, next_due, attempts, detail FROM task_state "
+                "WHERE cycle = ? AND account = ? AND task = ?", (cycle, str(account), task)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("status", "done_at", "next_due", "attempts", "detail"), row))
+
+    def is_done(self, run, account, task):
+        """True se a tarefa foi concluída dentro da rodada atual."""
+        state = self.get(run.cycle, account, task)
+        return bool(state and state["done_at"] is not None and state["done_at"] >= run.started_at)
+
+    def is_due(self, cycle, account, task, now=None):
+        """True se a tarefa não tem recarga pendente (next_due vazio ou já passou)."""
+        state = self.get(cycle, account, task)
+        if state is None or state["next_due"] is None:
+            return True
+        return state["next_due"] <= (now if now is not None else time.time())
+
+    def should_run(self, run, account, task):
+        """Tarefa pendente nesta rodada: ainda não feita nela e fora de recarga."""
+        return not self.is_done(run, account, task) and self.is_due(run.cycle, account, task)
+
+    def next_due(self, cycle, account, task):
+        state = self.get(cycle, account, task)
+        return state["next_due"] if state else None
+
+    def summary(self, cycle):
+        """Lista de dicts com o estado de todas as tarefas do ciclo."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT account, task, status, done_at, next_due, attempts, detail FROM task_state "
+                "WHERE cycle = ? ORDER BY account, task", (cycle,)).fetchall()
+        keys = ("account", "task", "status", "done_at", "next_due", "attempts", "detail")
+        return [dict(zip(keys, row)) for row in rows]
+
+    # ------------------------------------------------------------------
+    # Custo de troca de conta
+    # ------------------------------------------------------------------
+    def record_switch_cost(self, account, seconds, alpha=0.3):
+        """Registra a duração de uma troca (logout + login) para a conta (média móvel exponencial)."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO switch_cost (account, avg_seconds, samples, updated_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(account) DO UPDATE SET "
+                "avg_seconds = switch_cost.avg_seconds + ? * (excluded.avg_seconds - switch_cost.avg_seconds), "
+                "samples = switch_cost.samples + 1, updated_at = excluded.updated_at",
+                (str(account), float(seconds), time.time(), alpha))
+
+    def switch_costs(self):
+        """{conta: (média em segundos, amostras)} das trocas medidas."""
+        with self._lock:
+            rows = self._conn.execute("SELECT account, avg_seconds, samples FROM switch_cost").fetchall()
+        return {account: (avg, samples) for account, avg, samples in rows}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_checkpoint_store():
+    """Instância global (um arquivo SQLite em settings.paths.data_folder)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CheckpointStore()
+        return _store
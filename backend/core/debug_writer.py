@@ -0,0 +1,228 @@
+"""
+Gravador de Imagens de Debug em Segundo Plano
+Recebe frames em memória com uma função de anotação e grava as imagens numa thread própria.
+
+Antes, cada clique de rally relia a screenshot do disco, desenhava as marcações e fazia
+cv2.imwrite de um PNG antes de tocar na tela. Aqui o chamador só enfileira (frame, desenho):
+o desenho, a codificação e a escrita acontecem fora do caminho do clique. A fila é limitada
+(quando cheia, a imagem é descartada em vez de segurar o clique), há amostragem, escolha de
+JPEG/PNG, cota de disco (as imagens mais antigas são apagadas) e liga/desliga em execução.
+"""
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+import cv2
+
+try:
+    from backend.config.settings import settings
+except ImportError:
+    try:
+        from config.settings import settings
+    except ImportError:
+        settings = None
+
+
+PREFIX = "debug_"  # Só arquivos com este prefixo entram na cota (e podem ser apagados)
+
+
+def _setting(name, default):
+    if settings is None:
+        return default
+    return getattr(settings.actions, name, default)
+
+
+def _default_folder():
+    if settings is not None:
+        return str(settings.paths.screenshots_folder)
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(os.path.dirname(backend_dir), "temp_screenshots")
+
+
+class DebugWriter:
+    """
+    Fila de imagens de debug gravadas por uma thread.
+
+    Exemplo:
+        def desenhar(img):
+            cv2.circle(img, (x, y), 20, (0, 0, 255), -1)
+        get_debug_writer().submit(frame.image, f"debug_click_fila_{fila}", desenhar)
+        simulate_touch(x, y)   # o clique não espera a gravação
+    """
+
+    def __init__(self, folder=None, enabled=None, sample_rate=None, image_format=None,
+                 quota_mb=None, max_queue=None, jpeg_quality=85):
+        self.folder = folder or _default_folder()
+        self.enabled = _setting("debug_artifacts", True) if enabled is None else enabled
+        self.sample_rate = _setting("debug_sample_rate", 1.0) if sample_rate is None else sample_rate
+        self.image_format = (image_format or _setting("debug_format", "jpg")).lower().lstrip(".")
+        self.quota_bytes = int(1024 * 1024 * (_setting("debug_quota_mb", 200) if quota_mb is None else quota_mb))
+        self.jpeg_quality = jpeg_quality
+        self._queue = queue.Queue(maxsize=max_queue or _setting("debug_queue_size", 8))
+        self._files = deque()  # Caminhos das imagens de debug, mais antiga primeiro
+        self._sizes = {}
+        self._total_bytes = 0
+        self._scanned = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.skipped = 0
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def set_enabled(self, enabled):
+        self.enabled = bool(enabled)
+
+    def configure(self, enabled=None, sample_rate=None, image_format=None, quota_mb=None):
+        """Ajusta em execução (ex.: pela API) sem reiniciar o processo."""
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if sample_rate is not None:
+            self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        if image_format is not None:
+            self.image_format = str(image_format).lower().lstrip(".")
+        if quota_mb is not None:
+            self.quota_bytes = int(float(quota_mb) * 1024 * 1024)
+
+    def status(self):
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "format": self.image_format,
+            "quota_mb": round(self.quota_bytes / (1024 * 1024), 1),
+            "used_mb": round(self._total_bytes / (1024 * 1024), 1),
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+            "folder": self.folder,
+        }
+
+    def submit(self, image, name, draw=None, timestamped=False):
+        """
+        Enfileira uma imagem de debug. Nunca bloqueia.
+
+        Args:
+            image (numpy.ndarray): Frame BGR em memória. Não é copiado aqui (o desenho é feito numa
+                                   cópia na thread); o chamador não deve alterá-lo depois.
+            name (str): Nome do arquivo sem extensão (recebe o prefixo "debug_" se não tiver).
+            draw (callable, optional): draw(img) desenha as marcações na cópia, na thread do gravador.
+            timestamped (bool): Acrescenta data/hora ao nome (senão o arquivo é sobrescrito).
+
+        Returns:
+            str: Caminho em que a imagem será gravada, ou None se desativado/amostrado/fila cheia.
+        """
+        if not self.enabled or image is None:
+            return None
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.skipped += 1
+            return None
+        if not name.startswith(PREFIX):
+            name = PREFIX + name
+        if timestamped:
+            name = f"{name}_{time.strftime('%Y%m%d_%H%M%S')}_{int(time.time() * 1000) % 1000:03d}"
+        path = os.path.join(self.folder, f"{name}.{self.image_format}")
+        try:
+            self._queue.put_nowait((image, path, draw))
+        except queue.Full:
+            self.dropped += 1
+            return None
+        self._ensure_thread()
+        return path
+
+    def flush(self, timeout=5.0):
+        """Espera a fila esvaziar (útil ao encerrar scripts)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    # ------------------------------------------------------------------
+    # Thread
+    # ------------------------------------------------------------------
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="debug-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            image, path, draw = self._queue.get()
+            try:
+                self._write(image, path, draw)
+            except Exception as e:
+                print(f"⚠️ Erro ao salvar imagem de debug {os.path.basename(path)}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, image, path, draw):
+        img = image.copy()
+        if draw is not None:
+            draw(img)
+        ext = os.path.splitext(path)[1]
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality] if ext in (".jpg", ".jpeg") else []
+        ok, encoded = cv2.imencode(ext, img, params)
+        if not ok:
+            raise ValueError(f"formato não suportado: {ext}")
+        os.makedirs(self.folder, exist_ok=True)
+        self._scan()
+        with open(path, "wb") as f:
+            f.write(encoded.tobytes())
+        self._track(path, len(encoded))
+        self.written += 1
+        self._enforce_quota()
+
+    def _scan(self):
+        """Na primeira escrita, contabiliza as imagens de debug que já estão na pasta."""
+        if self._scanned:
+            return
+        self._scanned = True
+        entries = []
+        for filename in os.listdir(self.folder):
+            if filename.startswith(PREFIX):
+                full = os.path.join(self.folder, filename)
+                try:
+                    stat = os.stat(full)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, full, stat.st_size))
+        for _, full, size in sorted(entries):
+            self._track(full, size)
+
+    def _track(self, path, size):
+        if path in self._sizes:  # Sobrescrito: sai da posição antiga
+            self._total_bytes -= self._sizes[path]
+            try:
+                self._files.remove(path)
+            except ValueError:
+                pass
+        self._sizes[path] = size
+        self._files.append(path)
+        self._total_bytes += size
+
+    def _enforce_quota(self):
+        while self._total_bytes > self.quota_bytes and len(self._files) > 1:
+            oldest = self._files.popleft()
+            self._total_bytes -= self._sizes.pop(oldest, 0)
+            try:
+                os.remove(oldest)
+            except OSError:
+                pass
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_debug_writer():
+    """Gravador global (pasta settings.paths.screenshots_folder)."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = DebugWriter()
+        return _writer
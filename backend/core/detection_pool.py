@@ -0,0 +1,448 @@
+"""
+Pool de Processos para Detecção de Templates
+Distribui o template matching entre núcleos da CPU. Cada worker é um processo com o próprio
+cache de templates (pré-carregado na inicialização) e lê os frames direto de memória
+compartilhada (multiprocessing.shared_memory), sem serializar a imagem.
+
+Com vários dispositivos, a detecção em threads fica presa ao GIL e a CPU do host vira o
+gargalo. Aqui cada frame é copiado uma vez para um bloco compartilhado e os templates
+(ou os frames de cada dispositivo) são processados em paralelo; o chamador recebe Futures.
+
+A escala travada da multi-escala (image_detection) vive em cada processo: a do processo principal
+vai junto com cada busca e o estado que o worker deixou volta com o resultado e é aplicado aqui,
+então uma escala travada por qualquer worker vale para as próximas buscas em todos.
+
+Ativação: PerformanceSettings.enable_process_pool (DETECTION_PROCESS_POOL=true).
+Com o pool desativado, as mesmas funções rodam no processo atual e retornam Futures já
+resolvidos, então o código chamador não muda.
+"""
+import atexit
+import glob
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+try:
+    from .image_detection import (best_match_in_frame, load_template_gray, _detection_setting, DEFAULT_THRESHOLD,
+                                  get_locked_scale, scale_lock_state, restore_scale_lock, merge_scale_lock)
+    from .batch_matching import match_many
+    from .flight_recorder import record_frame, record_event
+    from .template_pack import MASK_SUFFIX
+except ImportError:
+    from image_detection import (best_match_in_frame, load_template_gray, _detection_setting, DEFAULT_THRESHOLD,
+                                 get_locked_scale, scale_lock_state, restore_scale_lock, merge_scale_lock)
+    from batch_matching import match_many
+    from flight_recorder import record_frame, record_event
+    from template_pack import MASK_SUFFIX
+
+try:
+    from backend.config.settings import settings
+except ImportError:
+    try:
+        from config.settings import settings
+    except ImportError:
+        settings = None
+
+
+def _default_template_paths():
+    """Todos os templates de actions/templates (pré-carregados em cada worker), sem as máscaras <nome>_mask.png."""
+    if settings is not None:
+        templates_dir = str(settings.paths.actions_folder)
+    else:
+        backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        templates_dir = os.path.join(backend_dir, "actions", "templates")
+    return sorted(path for path in glob.glob(os.path.join(templates_dir, "**", "*.png"), recursive=True)
+                  if not path.endswith(MASK_SUFFIX))
+
+
+# ---------------------------------------------------------------------------
+# Lado do worker
+# ---------------------------------------------------------------------------
+def _worker_init(template_paths):
+    """Inicializador de cada processo: carrega os templates no cache local do worker."""
+    loaded = sum(1 for path in template_paths if load_template_gray(path) is not None)
+    print(f"🧵 Worker de detecção {os.getpid()} pronto ({loaded} templates em cache)")
+
+
+def _attach_frame(shm_name, shape, dtype):
+    """Abre o bloco compartilhado e retorna (shm, frame) sem copiar os pixels."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _worker_match(shm_name, shape, dtype, template_path, threshold, device_id, multiscale, resolution, lock_state):
+    """
+    Procura um template no frame compartilhado, partindo da escala travada do processo principal.
+    Retorna (score, (x, y, w, h) ou None, estado da escala travada depois da busca).
+    """
+    shm, frame = _attach_frame(shm_name, shape, dtype)
+    try:
+        restore_scale_lock(device_id, resolution, lock_state)
+        score, box = best_match_in_frame(frame, template_path, threshold=threshold, device_id=device_id,
+                                         multiscale=multiscale, resolution=resolution)
+        return score, box, scale_lock_state(device_id, resolution)
+    finally:
+        del frame  # A view precisa ser liberada antes de fechar o bloco
+        shm.close()
+
+
+def _worker_match_many(shm_name, shape, dtype, template_paths, threshold, device_id, multiscale, lock_state):
+    """
+    Procura vários templates no frame compartilhado em lote (um dispositivo por worker).
+    Retorna (caminho -> (score, box), estado da escala travada depois das buscas).
+    """
+    shm, frame = _attach_frame(shm_name, shape, dtype)
+    resolution = (shape[1], shape[0])
+    try:
+        restore_scale_lock(device_id, resolution, lock_state)
+        results = dict(match_many(frame, template_paths, threshold=threshold,
+                                  device_id=device_id, multiscale=multiscale))
+        return results, scale_lock_state(device_id, resolution)
+    finally:
+        del frame
+        shm.close()
+
+
+# ---------------------------------------------------------------------------
+# Lado do processo principal
+# ---------------------------------------------------------------------------
+class _SharedFrame:
+    """Cópia de um frame em memória compartilhada, liberada quando todos os Futures terminam."""
+
+    def __init__(self, frame, pending):
+        frame = np.ascontiguousarray(frame)
+        self.shape = frame.shape
+        self.dtype = frame.dtype.str
+        self.shm = shared_memory.SharedMemory(create=True, size=max(frame.nbytes, 1))
+        np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.shm.buf)[...] = frame
+        self._pending = pending
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+            if self._pending > 0:
+                return
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class DetectionPool:
+    """
+    Pool de processos de detecção.
+
+    Exemplo:
+        pool = DetectionPool(max_workers=4)
+        futures = pool.submit(frame, [template_a, template_b], device_id="RXCT...")
+        score, box = futures[template_a].result()
+    """
+
+    def __init__(self, max_workers=None, template_paths=None):
+        if max_workers is None:
+            max_workers = settings.performance.max_parallel_workers if settings is not None else 3
+        if template_paths is None:
+            template_paths = _default_template_paths()
+        self.max_workers = max(1, int(max_workers))
+        # 'spawn' em todas as plataformas: comportamento igual no Windows e sem herdar
+        # threads/locks do processo principal (ADB, servidor HTTP)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_worker_init,
+            initargs=(list(template_paths),),
+        )
+
+    def submit(self, frame, template_paths, threshold=None, device_id=None, multiscale=None, per_template=True,
+               resolution=None):
+        """
+        Envia um frame para detecção.
+
+        Args:
+            frame (numpy.ndarray): Frame BGR ou em tons de cinza.
+            template_paths (list): Caminhos dos templates.
+            threshold (float, optional): Limiar (usado para travar a escala na multi-escala).
+            device_id (str, optional): ID do dispositivo.
+            multiscale (bool, optional): Força ligar/desligar multi-escala.
+            per_template (bool): True distribui os templates entre os workers; False processa
+                                 todos em lote em um único worker (melhor com vários dispositivos,
+                                 cada um enviando seu frame).
+            resolution (tuple, optional): (largura, altura) da tela quando frame é um recorte (ROI);
+                                          só no modo por template.
+
+        Returns:
+            dict: caminho -> Future com (score, (x, y, w, h) ou None).
+        """
+        template_paths = list(template_paths)
+        if threshold is None:
+            threshold = _detection_setting("threshold", DEFAULT_THRESHOLD)
+        if not template_paths:
+            return {}
+        if resolution is None or not per_template:
+            resolution = (frame.shape[1], frame.shape[0])
+        resolution = tuple(resolution)
+        lock_state = scale_lock_state(device_id, resolution)
+
+        if per_template:
+            shared = _SharedFrame(frame, pending=len(template_paths))
+            futures = {}
+            for index, path in enumerate(template_paths):
+                try:
+                    future = self._executor.submit(_worker_match, shared.name, shared.shape, shared.dtype,
+                                                   path, threshold, device_id, multiscale, resolution, lock_state)
+                except Exception:
+                    # Templates não enviados nunca chamarão release: libera a parte deles
+                    for _ in range(len(template_paths) - index):
+                        shared.release()
+                    raise
+                future.add_done_callback(shared.release)
+                futures[path] = _match_future(future, device_id, resolution, lock_state)
+            return futures
+
+        shared = _SharedFrame(frame, pending=1)
+        try:
+            batch_future = self._executor.submit(_worker_match_many, shared.name, shared.shape, shared.dtype,
+                                                 template_paths, threshold, device_id, multiscale, lock_state)
+        except Exception:
+            shared.release()
+            raise
+        batch_future.add_done_callback(shared.release)
+        return _split_batch_future(batch_future, template_paths, device_id, resolution, lock_state)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def _match_future(worker_future, device_id, resolution, lock_state):
+    """Future com (score, box) do worker; a escala travada que voltou junto é aplicada neste processo."""
+    future = Future()
+
+    def _propagate(done):
+        error = done.exception()
+        if error:
+            future.set_exception(error)
+            return
+        score, box, returned_state = done.result()
+        merge_scale_lock(device_id, resolution, lock_state, returned_state)
+        future.set_result((score, box))
+
+    worker_future.add_done_callback(_propagate)
+    return future
+
+
+def _split_batch_future(batch_future, template_paths, device_id, resolution, lock_state):
+    """Converte um Future de dict em um Future por template (mesmo formato do modo por template)."""
+    futures = {path: Future() for path in template_paths}
+
+    def _propagate(done):
+        error = done.exception()
+        results = None
+        if not error:
+            results, returned_state = done.result()
+            merge_scale_lock(device_id, resolution, lock_state, returned_state)
+        for path, future in futures.items():
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(results.get(path, (-1.0, None)))
+
+    batch_future.add_done_callback(_propagate)
+    return futures
+
+
+def _resolved(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def process_pool_enabled():
+    """Indica se a detecção deve usar o pool de processos (settings/variável de ambiente)."""
+    return settings is not None and getattr(settings.performance, "enable_process_pool", False)
+
+
+def get_detection_pool():
+    """Retorna o pool global (criado sob demanda), ou None se o pool estiver desativado."""
+    global _pool
+    if not process_pool_enabled():
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = DetectionPool()
+        return _pool
+
+
+def shutdown_detection_pool(wait=True):
+    """Encerra o pool global (chamado automaticamente na saída do processo)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait)
+            _pool = None
+
+
+atexit.register(shutdown_detection_pool)
+
+
+def submit_detection(frame, template_paths, threshold=None, device_id=None, multiscale=None, per_template=True,
+                     resolution=None):
+    """
+    Envia a detecção para o pool (se ativo) ou executa no processo atual.
+    resolution (largura, altura) da tela quando frame é um recorte dela (ver best_match_in_frame).
+
+    Returns:
+        dict: caminho -> Future com (score, (x, y, w, h) ou None).
+    """
+    pool = get_detection_pool()
+    if pool is not None:
+        return pool.submit(frame, template_paths, threshold=threshold, device_id=device_id,
+                           multiscale=multiscale, per_template=per_template, resolution=resolution)
+
+    return {path: _resolved(best_match_in_frame(frame, path, threshold=threshold, device_id=device_id,
+                                                multiscale=multiscale, resolution=resolution))
+            for path in template_paths}
+
+
+def submit_detection_file(screenshot_path, template_paths, threshold=None, device_id=None, multiscale=None,
+                          per_template=True):
+    """Igual a submit_detection, lendo o frame de um arquivo de screenshot."""
+    frame = cv2.imread(screenshot_path)
+    if frame is None:
+        print(f"Erro: Não foi possível carregar a screenshot de {screenshot_path}")
+        return {path: _resolved((-1.0, None)) for path in template_paths}
+    return submit_detection(frame, template_paths, threshold=threshold, device_id=device_id,
+                            multiscale=multiscale, per_template=per_template)
+
+
+def _template_size(template_path, scale=1.0):
+    """(largura, altura) do template na escala dada, ou None se não puder ser carregado."""
+    template = load_template_gray(template_path)
+    if template is None:
+        return None
+    th, tw = template.shape[:2]
+    return int(round(tw * scale)), int(round(th * scale))
+
+
+def _crop_roi(frame, template_path, roi, scale=1.0):
+    """Recorta a ROI (x, y, w, h) do frame, limitada à tela e nunca menor que o template (na escala dada)."""
+    x, y, w, h = (int(v) for v in roi)
+    size = _template_size(template_path, scale)
+    if size is not None:
+        tw, th = size
+        if w < tw:
+            x, w = x - (tw - w) // 2, tw
+        if h < th:
+            y, h = y - (th - h) // 2, th
+    frame_h, frame_w = frame.shape[:2]
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(frame_w, x + w), min(frame_h, y + h)
+    return frame[y0:y1, x0:x1], (x0, y0)
+
+
+def _match_in_frame(frame, template_path, threshold, device_id=None, multiscale=None, resolution=None):
+    """(score, box) do template no frame, pelo pool quando ativo."""
+    try:
+        future = submit_detection(frame, [template_path], threshold=threshold, device_id=device_id,
+                                  multiscale=multiscale, resolution=resolution)[template_path]
+        return future.result()
+    except Exception as e:
+        print(f"Ocorreu um erro durante a detecção da imagem: {e}")
+        return 0.0, None
+
+
+def detect_in_frame(frame, template_path, threshold=None, device_id=None, multiscale=None, roi=None):
+    """
+    Equivalente a find_image_in_frame passando pelo pool (quando ativo).
+
+    O frame e o score de cada busca vão para o flight recorder do dispositivo.
+
+    Args:
+        roi (tuple, optional): Região (x, y, w, h) em pixels da tela. A busca fica restrita a ela
+                               (bem mais barata que o frame inteiro); o resultado continua em
+                               coordenadas da tela. Com multi-escala, o recorte usa a escala
+                               travada da tela inteira (ou a pirâmide dela, se ainda não travou).
+
+    Returns:
+        tuple: (x, y, w, h) se encontrado, ou None.
+    """
+    if threshold is None:
+        threshold = _detection_setting("threshold", DEFAULT_THRESHOLD)
+    template_name = os.path.basename(template_path)
+    record_frame(device_id, frame, template_name)
+    if roi is not None:
+        if multiscale is None:
+            multiscale = _detection_setting("enable_multiscale", False)
+        resolution = (frame.shape[1], frame.shape[0])
+        scale = (get_locked_scale(device_id, resolution) if multiscale else None) or 1.0
+        crop, (offset_x, offset_y) = _crop_roi(frame, template_path, roi, scale)
+        size = _template_size(template_path, scale)
+        if size is None or crop.shape[0] < size[1] or crop.shape[1] < size[0]:
+            return None
+        score, box = _match_in_frame(crop, template_path, threshold, device_id=device_id,
+                                     multiscale=multiscale, resolution=resolution)
+        if box is not None:
+            box = (box[0] + offset_x, box[1] + offset_y, box[2], box[3])
+    else:
+        score, box = _match_in_frame(frame, template_path, threshold, device_id=device_id, multiscale=multiscale)
+    found = box is not None and score >= threshold
+    record_event(device_id, "detect", template=template_name, score=round(float(score), 3),
+                 found=found, box=list(box) if found else None)
+    return box if found else None
+
+
+def detect_on_screen(screenshot_path, template_path, threshold=None, device_id=None, multiscale=None, roi=None):
+    """
+    Equivalente a find_image_on_screen passando pelo pool (quando ativo).
+    roi (x, y, w, h) restringe a busca a uma região da tela (ver detect_in_frame).
+
+    Returns:
+        tuple: (x, y, w, h) se encontrado, ou None.
+    """
+    frame = cv2.imread(screenshot_path)
+    if frame is None:
+        print(f"Erro: Não foi possível carregar a screenshot de {screenshot_path}")
+        return None
+    return detect_in_frame(frame, template_path, threshold=threshold, device_id=device_id, multiscale=multiscale, roi=roi)
+
+
+if __name__ == '__main__':
+    import time
+
+    # Demonstração: 4 "dispositivos" com frames sintéticos, todos os templates de fazer_login
+    templates = [p for p in _default_template_paths() if os.sep + "fazer_login" + os.sep in p]
+    rng = np.random.default_rng(0)
+    frames = [cv2.GaussianBlur(rng.integers(0, 256, (1080, 2400), dtype=np.uint8), (7, 7), 0) for _ in range(4)]
+
+    start = time.perf_counter()
+    for frame in frames:
+        match_many(frame, templates)
+    print(f"Sequencial (1 processo): {1000 * (time.perf_counter() - start):.0f} ms")
+
+    pool = DetectionPool(max_workers=os.cpu_count() or 2, template_paths=templates)
+    # Primeira rodada aquece os workers (spawn + cache de templates)
+    for frame in frames:
+        for f in pool.submit(frame, templates, per_template=False).values():
+            f.result()
+    start = time.perf_counter()
+    all_futures = [pool.submit(frame, templates, device_id=f"dev{i}", per_template=False)
+                   for i, frame in enumerate(frames)]
+    for futures in all_futures:
+        for f in futures.values():
+            f.result()
+    print(f"Pool ({pool.max_workers} workers): {1000 * (time.perf_counter() - start):.0f} ms")
+    pool.shutdown()
@@ -0,0 +1,199 @@
+"""
+Perfil Geométrico do Dispositivo
+Lê resolução e densidade do celular das propriedades do registro de dispositivos (wm size /
+wm density, uma vez por conexão) e converte coordenadas normalizadas ou de referência
+(2400x1080) em pixels do dispositivo.
+
+Todas as coordenadas "fixas" do projeto (scroll_config.json, OFFSETS_FIXOS, clique central dos mobs,
+fallback do login) foram medidas no celular de referência. Passando-as por um DeviceProfile, elas
+continuam idênticas no celular de referência e são escaladas automaticamente em outros aparelhos.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+try:
+    from backend.config.settings import settings
+except ImportError:
+    try:
+        from config.settings import settings
+    except ImportError:
+        settings = None
+
+try:
+    from .device_registry import get_device_properties, get_device_registry
+except ImportError:
+    from device_registry import get_device_properties, get_device_registry
+
+
+FALLBACK_RETRY_INTERVAL = 5.0  # Segundos entre novas consultas enquanto o perfil é o de referência (fallback)
+
+
+def _reference_resolution() -> Tuple[int, int]:
+    """Resolução (largura, altura) em landscape em que coordenadas e templates foram medidos."""
+    if settings is None:
+        return (2400, 1080)
+    return tuple(settings.detection.reference_resolution)
+
+
+@dataclass
+class DeviceProfile:
+    """Geometria de tela de um dispositivo (sempre em landscape, orientação usada pelo jogo)."""
+    device_id: Optional[str]
+    width: int
+    height: int
+    density: Optional[int] = None
+    reference_width: int = 2400
+    reference_height: int = 1080
+    is_fallback: bool = False  # True se a consulta ao ADB falhou e usamos a resolução de referência
+
+    @property
+    def scale_x(self) -> float:
+        return self.width / float(self.reference_width)
+
+    @property
+    def scale_y(self) -> float:
+        return self.height / float(self.reference_height)
+
+    @property
+    def ui_scale(self) -> float:
+        """Escala de elementos de UI (tamanhos, offsets). Acompanha o lado menor, como na multi-escala."""
+        return self.scale_y
+
+    def point(self, nx: float, ny: float) -> Tuple[int, int]:
+        """Converte coordenadas normalizadas (0.0-1.0) em pixels do dispositivo."""
+        return int(round(nx * self.width)), int(round(ny * self.height))
+
+    def normalize(self, x: float, y: float) -> Tuple[float, float]:
+        """Converte pixels do dispositivo em coordenadas normalizadas (0.0-1.0)."""
+        return x / float(self.width), y / float(self.height)
+
+    def from_reference(self, x: float, y: float) -> Tuple[int, int]:
+        """Converte um ponto medido no celular de referência para pixels deste dispositivo."""
+        return int(round(x * self.scale_x)), int(round(y * self.scale_y))
+
+    def length(self, value: float) -> int:
+        """Escala uma distância (offset, altura de linha, tamanho) medida na referência."""
+        return int(round(value * self.ui_scale))
+
+    def offset(self, dx: float, dy: float) -> Tuple[int, int]:
+        """Escala um deslocamento [dx, dy] medido na referência."""
+        return self.length(dx), self.length(dy)
+
+    def roi(self, x: float, y: float, w: float, h: float) -> Tuple[int, int, int, int]:
+        """Converte uma região de interesse [x, y, w, h] da referência, limitada à tela."""
+        rx, ry = self.from_reference(x, y)
+        rw, rh = int(round(w * self.scale_x)), int(round(h * self.scale_y))
+        rx, ry = max(0, min(rx, self.width - 1)), max(0, min(ry, self.height - 1))
+        return rx, ry, min(rw, self.width - rx), min(rh, self.height - ry)
+
+    def scroll_from_config(self, center_x: float, start_y: float, row_height: float):
+        """
+        Converte uma entrada de scroll_config.json / login_scroll_config.json em coordenadas de swipe.
+
+        Returns:
+            tuple: ([x, start_y], [x, end_y]) em pixels do dispositivo.
+        """
+        x, y0 = self.from_reference(center_x, start_y)
+        y1 = y0 - self.length(row_height)
+        return [x, y0], [x, y1]
+
+
+# Cache: device_id -> DeviceProfile
+_profiles = {}
+_profiles_lock = threading.Lock()
+_fallback_retry_at = {}     # device_id -> time.monotonic() a partir do qual o fallback é consultado de novo
+_registry_subscribed = False
+
+
+def _on_device_event(event):
+    """Dispositivo conectou/desconectou: o perfil é recalculado das propriedades da nova conexão."""
+    with _profiles_lock:
+        for key in (event.serial, None):  # None: perfil do dispositivo padrão do ADB (pode ser este)
+            _profiles.pop(key, None)
+            _fallback_retry_at.pop(key, None)
+
+
+def _subscribe_registry():
+    """Assina os eventos do registro de dispositivos (uma vez, quando o registro existe)."""
+    global _registry_subscribed
+    if _registry_subscribed:
+        return
+    registry = get_device_registry(start=False)
+    if registry is None:
+        return
+    with _profiles_lock:
+        if _registry_subscribed:
+            return
+        _registry_subscribed = True
+    registry.subscribe(_on_device_event)
+
+
+def query_device_geometry(device_id=None, refresh=False):
+    """
+    Resolução e densidade das propriedades do dispositivo (device_registry, lidas uma vez por conexão).
+
+    Returns:
+        tuple: ((largura, altura), densidade) em landscape, ou (None, None) em caso de erro.
+    """
+    props = get_device_properties(device_id, refresh=refresh)
+    if props is None or not props.ok:
+        print(f"⚠️ Não foi possível consultar a geometria do dispositivo {device_id}")
+        return None, props.density if props is not None else None
+    # 'wm size' reporta a tela em retrato; o jogo roda em landscape
+    return (max(props.width, props.height), min(props.width, props.height)), props.density
+
+
+def get_device_profile(device_id=None, refresh=False) -> DeviceProfile:
+    """
+    Retorna o perfil geométrico do dispositivo, consultando o ADB apenas na primeira vez.
+
+    Se a consulta falhar, retorna um perfil com a resolução de referência (conversões viram
+    identidade) e só tenta consultar de novo depois de FALLBACK_RETRY_INTERVAL segundos.
+    O perfil é descartado quando o registro de dispositivos reporta conexão/desconexão.
+
+    Args:
+        device_id (str, optional): ID do dispositivo Android.
+        refresh (bool): Força nova consulta (ex.: após reconexão ou 'wm size' alterado).
+    """
+    with _profiles_lock:
+        profile = _profiles.get(device_id)
+        if profile is not None and not refresh:
+            if not profile.is_fallback or time.monotonic() < _fallback_retry_at.get(device_id, 0.0):
+                return profile
+
+    ref_w, ref_h = _reference_resolution()
+    size, density = query_device_geometry(device_id, refresh=refresh)
+    _subscribe_registry()
+    if size is None:
+        profile = DeviceProfile(device_id, ref_w, ref_h, density, ref_w, ref_h, is_fallback=True)
+    else:
+        profile = DeviceProfile(device_id, size[0], size[1], density, ref_w, ref_h)
+
+    with _profiles_lock:
+        _profiles[device_id] = profile
+        if profile.is_fallback:
+            _fallback_retry_at[device_id] = time.monotonic() + FALLBACK_RETRY_INTERVAL
+    return profile
+
+
+def clear_device_profile(device_id=None):
+    """Remove o perfil em cache (de um dispositivo ou de todos)."""
+    with _profiles_lock:
+        if device_id is None:
+            _profiles.clear()
+            _fallback_retry_at.clear()
+        else:
+            _profiles.pop(device_id, None)
+            _fallback_retry_at.pop(device_id, None)
+
+
+if __name__ == '__main__':
+    import sys
+    dev = sys.argv[1] if len(sys.argv) > 1 else None
+    p = get_device_profile(dev)
+    print(f"Dispositivo: {p.device_id or 'padrão'}")
+    print(f"  - Resolução (landscape): {p.width}x{p.height} | Densidade: {p.density}")
+    print(f"  - Escala X/Y: {p.scale_x:.3f}/{p.scale_y:.3f} | Fallback: {p.is_fallback}")
+    print(f"  - Clique central dos mobs (1200, 550) -> {p.from_reference(1200, 550)}")
@@ -0,0 +1,531 @@
+"""
+Registro de Dispositivos (ADB track-devices)
+Mapa em memória do estado de cada dispositivo, mantido por uma conexão permanente com o
+servidor ADB (serviço host:track-devices), com eventos de conexão/desconexão.
+
+Em vez de rodar `adb devices` em laço (ou a cada /status), o servidor ADB envia a lista
+completa sempre que algo muda; consultas de estado viram leitura de um dicionário e quem
+espera uma reconexão é acordado no mesmo instante em que o cabo volta.
+
+Protocolo (cliente -> servidor ADB em 127.0.0.1:5037):
+    envia  "<len hex 4>host:track-devices"
+    recebe "OKAY" e, a cada mudança, "<len hex 4><serial>\\t<estado>\\n..." (lista completa)
+
+Propriedades de cada dispositivo (resolução, densidade, modelo, versão do Android, nó de toque e
+faixas ABS do getevent) são lidas em uma chamada de shell na primeira consulta e guardadas até o
+dispositivo desconectar; device_profile e get_touch_event_coordinates leem daqui.
+"""
+import re
+import socket
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+
+try:
+    from backend.config.settings import settings
+except ImportError:
+    try:
+        from config.settings import settings
+    except ImportError:
+        settings = None
+
+
+ONLINE_STATE = "device"  # Estado ADB de um dispositivo pronto para comandos
+
+
+@dataclass
+class DeviceEvent:
+    """Mudança de estado de um dispositivo (state "offline"/"unauthorized"/... ou None se sumiu)."""
+    serial: str
+    state: str
+    previous: str
+    timestamp: float
+
+    @property
+    def connected(self) -> bool:
+        return self.state == ONLINE_STATE and self.previous != ONLINE_STATE
+
+    @property
+    def disconnected(self) -> bool:
+        return self.previous == ONLINE_STATE and self.state != ONLINE_STATE
+
+    def to_dict(self):
+        return {
+            "serial": self.serial,
+            "state": self.state,
+            "previous": self.previous,
+            "timestamp": self.timestamp,
+            "event": "connected" if self.connected else "disconnected" if self.disconnected else "changed",
+        }
+
+
+@dataclass
+class DeviceProperties:
+    """Propriedades de um dispositivo, lidas uma vez por conexão (largura/altura como o 'wm size' reporta)."""
+    serial: str
+    width: int = None
+    height: int = None
+    density: int = None
+    manufacturer: str = None
+    model: str = None
+    android_version: str = None
+    sdk: int = None
+    touch_device: str = None   # Nó do touchscreen (ex.: /dev/input/event5)
+    touch_name: str = None
+    abs_ranges: dict = None    # {"ABS_MT_POSITION_X": [min, max], ...} do touchscreen
+    timestamp: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.width is not None
+
+    def touch_range(self, axis):
+        """(min, max) do eixo ABS ("ABS_MT_POSITION_X"/"ABS_MT_POSITION_Y"), ou None."""
+        value = (self.abs_ranges or {}).get(axis)
+        return tuple(value) if value else None
+
+    def to_dict(self):
+        return {
+            "serial": self.serial,
+            "width": self.width,
+            "height": self.height,
+            "density": self.density,
+            "manufacturer": self.manufacturer,
+            "model": self.model,
+            "android_version": self.android_version,
+            "sdk": self.sdk,
+            "touch_device": self.touch_device,
+            "touch_name": self.touch_name,
+            "abs_ranges": self.abs_ranges or {},
+            "timestamp": self.timestamp,
+        }
+
+
+# Seções separadas por marcadores; getprop com chave=valor (propriedade vazia não desalinha a saída)
+_PROPERTIES_SCRIPT = (
+    "echo @wm; wm size; wm density; "
+    "echo @props; "
+    "echo manufacturer=$(getprop ro.product.manufacturer); "
+    "echo model=$(getprop ro.product.model); "
+    "echo android_version=$(getprop ro.build.version.release); "
+    "echo sdk=$(getprop ro.build.version.sdk); "
+    "echo @input; getevent -pl 2>/dev/null"
+)
+_ABS_RE = re.compile(r"(ABS_\w+)\s*:\s*value\s+-?\d+,\s*min\s+(-?\d+),\s*max\s+(-?\d+)")
+
+
+def _setting(name, default):
+    if settings is None:
+        return default
+    return getattr(settings.adb, name, default)
+
+
+def parse_device_list(payload):
+    """Converte "serial\\testado\\n..." em {serial: estado}."""
+    devices = {}
+    for line in payload.splitlines():
+        parts = line.strip().split()
+        if len(parts) >= 2:
+            devices[parts[0]] = parts[1]
+    return devices
+
+
+def parse_wm_output(output):
+    """Extrai ((largura, altura), densidade) da saída de 'wm size; wm density'. Override tem prioridade."""
+    size = None
+    override = re.search(r"Override size:\s*(\d+)x(\d+)", output)
+    physical = re.search(r"Physical size:\s*(\d+)x(\d+)", output)
+    match = override or physical
+    if match:
+        size = (int(match.group(1)), int(match.group(2)))
+
+    density = None
+    override_d = re.search(r"Override density:\s*(\d+)", output)
+    physical_d = re.search(r"Physical density:\s*(\d+)", output)
+    match_d = override_d or physical_d
+    if match_d:
+        density = int(match_d.group(1))
+    return size, density
+
+
+def parse_input_devices(output):
+    """
+    Converte a saída de 'getevent -pl' em [{"path", "name", "abs": {eixo: [min, max]}, "direct"}].
+    """
+    devices, current = [], None
+    for line in output.splitlines():
+        match = re.match(r"\s*add device \d+:\s*(\S+)", line)
+        if match:
+            current = {"path": match.group(1), "name": None, "abs": {}, "direct": False}
+            devices.append(current)
+            continue
+        if current is None:
+            continue
+        match = re.match(r'\s*name:\s*"(.*)"', line)
+        if match:
+            current["name"] = match.group(1)
+        match = _ABS_RE.search(line)
+        if match:
+            current["abs"][match.group(1)] = [int(match.group(2)), int(match.group(3))]
+        if "INPUT_PROP_DIRECT" in line:
+            current["direct"] = True
+    return devices
+
+
+def find_touch_device(devices):
+    """Touchscreen entre os dispositivos de entrada: tem ABS_MT_POSITION_X/Y, de preferência INPUT_PROP_DIRECT."""
+    touch = [d for d in devices if "ABS_MT_POSITION_X" in d["abs"] and "ABS_MT_POSITION_Y" in d["abs"]]
+    touch.sort(key=lambda d: not d["direct"])
+    return touch[0] if touch else None
+
+
+def parse_properties_output(output, serial, timestamp=None):
+    """Converte a saída do script de propriedades (seções @wm/@props/@input) em DeviceProperties."""
+    sections, current = {}, None
+    for line in output.splitlines():
+        if line.strip().startswith("@") and line.strip()[1:].isalpha():
+            current = line.strip()[1:]
+            sections[current] = []
+        elif current is not None:
+            sections[current].append(line)
+
+    size, density = parse_wm_output("\n".join(sections.get("wm", [])))
+    props = {}
+    for line in sections.get("props", []):
+        key, _, value = line.strip().partition("=")
+        if value.strip():
+            props[key] = value.strip()
+    touch = find_touch_device(parse_input_devices("\n".join(sections.get("input", []))))
+    sdk = props.get("sdk")
+
+    return DeviceProperties(
+        serial=serial,
+        width=size[0] if size else None,
+        height=size[1] if size else None,
+        density=density,
+        manufacturer=props.get("manufacturer"),
+        model=props.get("model"),
+        android_version=props.get("android_version"),
+        sdk=int(sdk) if sdk and sdk.isdigit() else None,
+        touch_device=touch["path"] if touch else None,
+        touch_name=touch["name"] if touch else None,
+        abs_ranges=touch["abs"] if touch else {},
+        timestamp=time.time() if timestamp is None else timestamp,
+    )
+
+
+class DeviceRegistry:
+    """
+    Estado dos dispositivos ADB, atualizado por eventos.
+
+    Exemplo:
+        registry = get_device_registry()
+        registry.is_online("RXCT...")                   # leitura em memória
+        registry.subscribe(lambda ev: print(ev))        # conectado/desconectado
+        registry.wait_for_device("RXCT...", timeout=60) # acorda na reconexão
+        registry.properties("RXCT...").touch_device     # propriedades em cache até desconectar
+    """
+
+    RETRY_INTERVAL = 1.0       # Espera entre tentativas de reconectar ao servidor ADB
+    START_SERVER_EVERY = 10.0  # Intervalo mínimo entre tentativas de `adb start-server`
+
+    def __init__(self, host=None, port=None, adb_path=None):
+        self.host = host or _setting("server_host", "127.0.0.1")
+        self.port = int(port or _setting("server_port", 5037))
+        self.adb_path = adb_path or _setting("adb_path", "adb")
+        self._cond = threading.Condition()
+        self._devices = {}
+        self._listeners = []
+        self._connected = False   # Conexão com o servidor ADB ativa
+        self._ready = threading.Event()  # Primeira lista recebida
+        self._stop = threading.Event()
+        self._thread = None
+        self._socket = None
+        self._last_start_server = 0.0
+        self._properties = {}        # serial -> DeviceProperties (até o dispositivo desconectar)
+        self._properties_locks = {}  # Uma leitura por vez por serial
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def tracking(self) -> bool:
+        """True enquanto a conexão track-devices está ativa (estado confiável)."""
+        return self._connected
+
+    def start(self, wait_ready=2.0):
+        """Inicia a thread de acompanhamento. Aguarda até wait_ready s pela primeira lista."""
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="adb-track-devices", daemon=True)
+            self._thread.start()
+        if wait_ready:
+            self._ready.wait(wait_ready)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        sock = self._socket
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(2.0)
+            self._thread = None
+
+    # ------------------------------------------------------------------
+    # Consultas (sem ADB)
+    # ------------------------------------------------------------------
+    def devices(self):
+        """Cópia do mapa {serial: estado}."""
+        if not self.tracking:
+            self._refresh_fallback()
+        with self._cond:
+            return dict(self._devices)
+
+    def online_devices(self):
+        return [serial for serial, state in self.devices().items() if state == ONLINE_STATE]
+
+    def state(self, serial):
+        return self.devices().get(serial)
+
+    def is_online(self, serial=None):
+        """True se o dispositivo (ou, sem serial, algum dispositivo) está pronto para comandos."""
+        devices = self.devices()
+        if serial is None:
+            return ONLINE_STATE in devices.values()
+        return devices.get(serial) == ONLINE_STATE
+
+    def subscribe(self, callback):
+        """Registra callback(DeviceEvent), chamado na thread do registro. Retorna o cancelamento."""
+        with self._cond:
+            self._listeners.append(callback)
+
+        def unsubscribe():
+            with self._cond:
+                if callback in self._listeners:
+                    self._listeners.remove(callback)
+        return unsubscribe
+
+    def properties(self, serial=None, refresh=False):
+        """
+        Propriedades do dispositivo, lidas via ADB na primeira consulta após a conexão.
+
+        Args:
+            serial (str, optional): ID do dispositivo (None = dispositivo padrão do ADB).
+            refresh (bool): Força nova leitura (ex.: após 'wm size' alterado).
+
+        Returns:
+            DeviceProperties: Com ok=False se a leitura falhou (nada fica em cache; tenta de novo
+            na próxima consulta), ou None se o registro sabe que o dispositivo está offline.
+        """
+        if serial is not None and self.tracking and not self.is_online(serial):
+            return None
+        with self._cond:
+            lock = self._properties_locks.setdefault(serial, threading.Lock())
+        with lock:
+            with self._cond:
+                cached = self._properties.get(serial)
+            if cached is not None and not refresh:
+                return cached
+            props = self._fetch_properties(serial)
+            if props.ok:
+                with self._cond:
+                    self._properties[serial] = props
+            return props
+
+    def cached_properties(self):
+        """Cópia do cache {serial: DeviceProperties} (sem ADB)."""
+        with self._cond:
+            return dict(self._properties)
+
+    def wait_for_device(self, serial=None, timeout=None):
+        """Bloqueia até o dispositivo ficar online. Retorna False no timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if (serial is None and ONLINE_STATE in self._devices.values()) or \
+                        (serial is not None and self._devices.get(serial) == ONLINE_STATE):
+                    return True
+                if self._stop.is_set():
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                # Sem track-devices ativo, acorda periodicamente para consultar via `adb devices`
+                wait = remaining if self._connected else min(remaining or 3.0, 3.0)
+                self._cond.wait(wait)
+                if not self._connected:
+                    self._cond.release()
+                    try:
+                        self._refresh_fallback()
+                    finally:
+                        self._cond.acquire()
+
+    # ------------------------------------------------------------------
+    # Internos
+    # ------------------------------------------------------------------
+    def _fetch_properties(self, serial):
+        command = [self.adb_path]
+        if serial:
+            command += ["-s", serial]
+        command += ["shell", _PROPERTIES_SCRIPT]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=10)
+            output = result.stdout
+        except (subprocess.TimeoutExpired, FileNotFoundError) as e:
+            print(f"⚠️ Não foi possível ler as propriedades do dispositivo {serial or '(padrão)'}: {e}")
+            output = ""
+        return parse_properties_output(output, serial)
+
+    def _apply(self, devices):
+        """Substitui o mapa e dispara os eventos das diferenças."""
+        now = time.time()
+        with self._cond:
+            previous = self._devices
+            self._devices = devices
+            listeners = list(self._listeners)
+            # Propriedades valem por conexão: dispositivo que saiu do ar é lido de novo ao voltar
+            for serial in set(previous) | set(devices):
+                if previous.get(serial) != devices.get(serial):
+                    self._properties.pop(serial, None)
+                    self._properties.pop(None, None)
+            self._cond.notify_all()
+        events = [DeviceEvent(serial, devices.get(serial), previous.get(serial), now)
+                  for serial in sorted(set(previous) | set(devices))
+                  if previous.get(serial) != devices.get(serial)]
+        for event in events:
+            if event.connected:
+                print(f"🔌 Dispositivo conectado: {event.serial}")
+            elif event.disconnected:
+                print(f"⚠️ Dispositivo desconectado: {event.serial} ({event.state or 'removido'})")
+            for callback in listeners:
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"⚠️ Erro em listener de dispositivos: {e}")
+
+    def _refresh_fallback(self):
+        """Sem conexão track-devices: uma consulta `adb devices` (caminho lento, só em falha)."""
+        try:
+            result = subprocess.run([self.adb_path, "devices"], capture_output=True, text=True, timeout=5)
+        except Exception:
+            return
+        lines = result.stdout.strip().splitlines()[1:]
+        self._apply(parse_device_list("\n".join(lines)))
+
+    def _start_adb_server(self):
+        now = time.monotonic()
+        if now - self._last_start_server < self.START_SERVER_EVERY:
+            return
+        self._last_start_server = now
+        try:
+            subprocess.run([self.adb_path, "start-server"], capture_output=True, timeout=10)
+        except Exception as e:
+            print(f"⚠️ Não foi possível iniciar o servidor ADB: {e}")
+
+    def _read_exact(self, sock, size):
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Conexão com o servidor ADB encerrada")
+            data += chunk
+        return data
+
+    def _track(self):
+        sock = socket.create_connection((self.host, self.port), timeout=5)
+        self._socket = sock
+        try:
+            request = b"host:track-devices"
+            sock.sendall(b"%04x" % len(request) + request)
+            status = self._read_exact(sock, 4)
+            if status != b"OKAY":
+                length = int(self._read_exact(sock, 4), 16)
+                raise ConnectionError(f"Servidor ADB recusou track-devices: {self._read_exact(sock, length)!r}")
+            sock.settimeout(None)  # A partir daqui só chegam mensagens quando algo muda
+            self._connected = True
+            while not self._stop.is_set():
+                length = int(self._read_exact(sock, 4), 16)
+                payload = self._read_exact(sock, length).decode("utf-8", errors="replace") if length else ""
+                self._apply(parse_device_list(payload))
+                self._ready.set()
+        finally:
+            self._connected = False
+            self._socket = None
+            sock.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._track()
+            except (OSError, ValueError) as e:
+                if self._stop.is_set():
+                    break
+                if isinstance(e, ConnectionRefusedError):
+                    self._start_adb_server()
+                # Servidor ADB indisponível: estado desconhecido = nenhum dispositivo online
+                if self._devices:
+                    self._apply({})
+                self._ready.set()
+            self._stop.wait(self.RETRY_INTERVAL)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_device_registry(start=True):
+    """Registro global. Com start=False não inicia o acompanhamento (retorna None se ainda não foi criado)."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            if not start:
+                return None
+            _registry = DeviceRegistry()
+        registry = _registry
+    if start and not registry.running:
+        registry.start()
+    return registry
+
+
+def get_device_properties(device_id=None, refresh=False):
+    """
+    Propriedades do dispositivo via registro global (criado sem iniciar o acompanhamento se preciso).
+
+    Returns:
+        DeviceProperties ou None (dispositivo offline).
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = DeviceRegistry()
+        registry = _registry
+    return registry.properties(device_id, refresh=refresh)
+
+
+def wait_if_disconnected(device_id=None, timeout=None):
+    """
+    Para o executor: se o registro está ativo e o dispositivo caiu, espera a reconexão.
+
+    Returns:
+        bool: True se o dispositivo está (ou voltou a ficar) online, ou se não há registro ativo.
+    """
+    registry = get_device_registry(start=False)
+    if registry is None or not registry.tracking or registry.is_online(device_id):
+        return True
+    if timeout is None:
+        timeout = _setting("reconnect_timeout", 60)
+    print(f"🔌 Dispositivo {device_id or '(padrão)'} desconectado. Aguardando reconexão (até {timeout:.0f}s)...")
+    if registry.wait_for_device(device_id, timeout=timeout):
+        print("✅ Dispositivo reconectado.")
+        time.sleep(1.0)  # Estabilização do USB antes do próximo comando
+        return True
+    return False
@@ -0,0 +1,234 @@
+"""
+Gravador de Voo (Flight Recorder)
+Buffer circular em memória, por dispositivo, com os últimos frames (tons de cinza, reduzidos)
+e os últimos eventos (toques, scrolls, detecções com score). Só vai para o disco quando algo
+dá errado: passo que esgota as tentativas, erro num ciclo ou exceção não tratada.
+
+A memória é fixa: os frames ficam num único array numpy pré-alocado (N x altura x largura) e
+cada frame novo é reduzido direto no slot seguinte; os eventos ficam numa deque com tamanho
+máximo. Com isso dá para ver o que a tela mostrava antes da falha sem arquivar screenshots o
+tempo todo.
+
+Ativação: ActionSettings.enable_screenshots_on_error.
+Dumps: settings.paths.logs_folder / "flight_recorder" / <data>_<dispositivo>_<motivo>/
+"""
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import weakref
+from collections import deque
+
+import cv2
+import numpy as np
+
+try:
+    from backend.config.settings import settings
+except ImportError:
+    try:
+        from config.settings import settings
+    except ImportError:
+        settings = None
+
+
+DUMP_MIN_INTERVAL = 30.0  # Segundos mínimos entre dumps do mesmo dispositivo (falhas em laço)
+
+
+def _setting(name, default):
+    if settings is None:
+        return default
+    return getattr(settings.actions, name, default)
+
+
+def _default_dump_folder():
+    if settings is not None:
+        return str(settings.paths.logs_folder / "flight_recorder")
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(os.path.dirname(backend_dir), "logs", "flight_recorder")
+
+
+def recorder_enabled():
+    return bool(_setting("enable_screenshots_on_error", True))
+
+
+class FlightRecorder:
+    """
+    Últimos frames e eventos de um dispositivo.
+
+    Exemplo:
+        recorder = get_flight_recorder(device_id)
+        recorder.record_frame(frame.image, label="03_fila.png")
+        recorder.record_event("tap", x=1200, y=550)
+        ...
+        recorder.dump("timeout no passo 3")   # grava frames + eventos.json
+    """
+
+    def __init__(self, device_id=None, frames=None, events=None, width=None, dump_folder=None):
+        self.device_id = device_id
+        self.capacity = int(frames or _setting("flight_recorder_frames", 30))
+        self.width = int(width or _setting("flight_recorder_width", 480))
+        ref_w, ref_h = (settings.detection.reference_resolution if settings is not None else (2400, 1080))
+        self.height = max(1, int(round(self.width * ref_h / float(ref_w))))
+        self.dump_folder = dump_folder or _default_dump_folder()
+        # Buffers pré-alocados: nenhuma alocação por frame depois daqui
+        self._frames = np.zeros((self.capacity, self.height, self.width), dtype=np.uint8)
+        self._times = np.zeros(self.capacity, dtype=np.float64)
+        self._labels = [""] * self.capacity
+        self._scratch = np.zeros((self.height, self.width, 3), dtype=np.uint8)  # Redução antes do cinza
+        self._count = 0          # Frames já gravados (o slot é _count % capacity)
+        self._last_source = None  # weakref do último frame: evita gravá-lo de novo (um por template buscado)
+        self._events = deque(maxlen=int(events or _setting("flight_recorder_events", 200)))
+        self._lock = threading.Lock()
+        self._last_dump = 0.0
+
+    def record_frame(self, image, label=""):
+        """Reduz e guarda o frame no próximo slot do anel."""
+        if image is None:
+            return
+        if self._last_source is not None and self._last_source() is image:
+            return
+        with self._lock:
+            try:
+                self._last_source = weakref.ref(image)
+            except TypeError:
+                self._last_source = None
+            slot = self._count % self.capacity
+            if image.ndim == 3:
+                cv2.resize(image, (self.width, self.height), dst=self._scratch, interpolation=cv2.INTER_AREA)
+                cv2.cvtColor(self._scratch, cv2.COLOR_BGR2GRAY, dst=self._frames[slot])
+            else:
+                cv2.resize(image, (self.width, self.height), dst=self._frames[slot], interpolation=cv2.INTER_AREA)
+            self._times[slot] = time.time()
+            self._labels[slot] = label
+            self._count += 1
+
+    def record_event(self, kind, **data):
+        data["kind"] = kind
+        data["t"] = time.time()
+        self._events.append(data)
+
+    def _snapshot(self):
+        """Cópia (ordem cronológica) dos frames e eventos, feita sob o lock."""
+        with self._lock:
+            n = min(self._count, self.capacity)
+            start = self._count - n
+            slots = [(start + i) % self.capacity for i in range(n)]
+            frames = [(self._frames[s].copy(), float(self._times[s]), self._labels[s]) for s in slots]
+            events = list(self._events)
+        return frames, events
+
+    def dump(self, reason, force=False):
+        """
+        Grava o conteúdo do anel em disco.
+
+        Returns:
+            str: Pasta do dump, ou None se desativado, vazio ou dentro do intervalo mínimo.
+        """
+        now = time.time()
+        if not force and now - self._last_dump < DUMP_MIN_INTERVAL:
+            return None
+        frames, events = self._snapshot()
+        if not frames and not events:
+            return None
+        self._last_dump = now
+        slug = re.sub(r"[^A-Za-z0-9_-]+", "_", str(reason))[:40].strip("_") or "falha"
+        folder = os.path.join(self.dump_folder,
+                              f"{time.strftime('%Y%m%d_%H%M%S')}_{self.device_id or 'default'}_{slug}")
+        try:
+            os.makedirs(folder, exist_ok=True)
+            index = []
+            for i, (image, timestamp, label) in enumerate(frames):
+                filename = f"frame_{i:02d}.png"
+                cv2.imwrite(os.path.join(folder, filename), image)
+                index.append({"file": filename, "t": timestamp, "ago": round(now - timestamp, 3), "label": label})
+            with open(os.path.join(folder, "eventos.json"), "w", encoding="utf-8") as f:
+                json.dump({"reason": str(reason), "device_id": self.device_id, "dumped_at": now,
+                           "frames": index, "events": events}, f, indent=2, ensure_ascii=False, default=str)
+            _prune_dumps(self.dump_folder)
+        except OSError as e:
+            print(f"⚠️ Não foi possível gravar o flight recorder: {e}")
+            return None
+        print(f"🛩️ Flight recorder salvo ({len(frames)} frames, {len(events)} eventos): {folder}")
+        return folder
+
+
+def _prune_dumps(dump_folder):
+    """Mantém só os dumps mais recentes (ActionSettings.flight_recorder_max_dumps)."""
+    keep = int(_setting("flight_recorder_max_dumps", 20))
+    try:
+        dumps = sorted(d for d in os.listdir(dump_folder) if os.path.isdir(os.path.join(dump_folder, d)))
+    except OSError:
+        return
+    for old in dumps[:-keep] if keep > 0 else []:
+        shutil.rmtree(os.path.join(dump_folder, old), ignore_errors=True)
+
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+_hooks_installed = False
+
+
+def get_flight_recorder(device_id=None):
+    """Gravador do dispositivo (criado no primeiro uso), ou None se desativado."""
+    if not recorder_enabled():
+        return None
+    with _recorders_lock:
+        recorder = _recorders.get(device_id)
+        if recorder is None:
+            recorder = _recorders[device_id] = FlightRecorder(device_id)
+            _install_exception_hooks()
+        return recorder
+
+
+def record_frame(device_id, image, label=""):
+    recorder = get_flight_recorder(device_id)
+    if recorder is not None:
+        recorder.record_frame(image, label)
+
+
+def record_event(device_id, kind, **data):
+    recorder = get_flight_recorder(device_id)
+    if recorder is not None:
+        recorder.record_event(kind, **data)
+
+
+def dump_flight_recorder(device_id=None, reason="falha", force=False):
+    """
+    Grava o anel do dispositivo (ou, sem device_id conhecido, de todos os dispositivos).
+
+    Returns:
+        list: Pastas gravadas (vazia se nada foi gravado).
+    """
+    with _recorders_lock:
+        if device_id in _recorders:
+            recorders = [_recorders[device_id]]
+        else:
+            recorders = list(_recorders.values())
+    folders = [recorder.dump(reason, force=force) for recorder in recorders]
+    return [folder for folder in folders if folder]
+
+
+def _install_exception_hooks():
+    """Exceção não tratada (thread principal ou outras threads): grava todos os anéis antes de sair."""
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    _hooks_installed = True
+    previous_hook = sys.excepthook
+    previous_thread_hook = threading.excepthook
+
+    def excepthook(exc_type, exc, tb):
+        if not issubclass(exc_type, KeyboardInterrupt):
+            dump_flight_recorder(None, f"excecao_{exc_type.__name__}", force=True)
+        previous_hook(exc_type, exc, tb)
+
+    def thread_excepthook(args):
+        if not issubclass(args.exc_type, SystemExit):
+            dump_flight_recorder(None, f"excecao_{args.exc_type.__name__}", force=True)
+        previous_thread_hook(args)
+
+    sys.excepthook = excepthook
+    threading.excepthook = thread_excepthook
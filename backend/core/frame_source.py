@@ -0,0 +1,259 @@
+"""
+Fontes de Frames em Memória
+Frames capturados direto para a memória (sem arquivo temporário), marcados com o instante
+da captura, e pré-captura em segundo plano para o modo pipeline do executor.
+
+No modo pipeline, a captura do frame do próximo passo começa enquanto o toque atual e o
+delay pós-clique ainda estão correndo. Todo frame carrega o timestamp (time.monotonic) do
+início da captura; o consumidor informa o instante do último input (toque/scroll) e frames
+anteriores a ele são descartados, então nunca se age sobre uma tela de antes do toque.
+
+SharedFrameSource mantém uma captura contínua de um dispositivo que vários consumidores
+leem ao mesmo tempo (ex.: o executor de ações e o vigia de gatilho), sem capturas duplicadas.
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+try:
+    from .adb_utils import capture_screen_array
+except ImportError:
+    from adb_utils import capture_screen_array
+
+
+@dataclass
+class CapturedFrame:
+    """Frame em memória com o instante (time.monotonic) em que a captura começou."""
+    image: Optional[np.ndarray]
+    timestamp: float
+    device_id: Optional[str] = None
+    duration: float = 0.0  # Tempo total da captura (ADB + decodificação), em segundos
+    source: str = field(default="adb")
+
+    @property
+    def ok(self) -> bool:
+        return self.image is not None
+
+
+def capture_frame(device_id=None) -> CapturedFrame:
+    """Captura um frame em memória, marcado com o instante de início da captura."""
+    started = time.monotonic()
+    image = capture_screen_array(device_id)
+    return CapturedFrame(image, started, device_id, time.monotonic() - started)
+
+
+class FramePrefetcher:
+    """
+    Pré-captura de um frame em segundo plano, agendada para terminar junto com um delay.
+
+    Exemplo (dentro do executor):
+        tap_ts = time.monotonic()
+        simulate_touch(x, y, device_id)
+        prefetcher.schedule_after_input(tap_ts, settle=click_delay)
+        time.sleep(click_delay)
+        frame = prefetcher.take(not_before=tap_ts)   # None se obsoleto ou falhou
+    """
+
+    # Estimativa inicial do tempo de captura (screencap PNG + transferência)
+    DEFAULT_LATENCY = 0.6
+
+    def __init__(self, device_id=None):
+        self.device_id = device_id
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._generation = 0
+        self._frame = None
+        self._pending = False
+        self._latency = self.DEFAULT_LATENCY
+
+    @property
+    def latency(self) -> float:
+        """Média móvel do tempo de captura, usada para decidir quando começar a pré-captura."""
+        return self._latency
+
+    def schedule(self, start_at):
+        """Agenda uma captura para começar em start_at (time.monotonic). Cancela a anterior."""
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self._frame = None
+            self._pending = True
+            self._ready.clear()
+        thread = threading.Thread(target=self._run, args=(generation, start_at), daemon=True)
+        thread.start()
+
+    def schedule_after_input(self, input_ts, settle):
+        """
+        Agenda a captura para o frame ficar pronto quando o delay pós-input terminar.
+
+        A captura começa em input_ts + settle - latência, nunca antes do próprio input.
+        """
+        self.schedule(input_ts + max(0.0, settle - self._latency))
+
+    def cancel(self):
+        """Descarta a pré-captura em andamento (o resultado dela será ignorado)."""
+        with self._lock:
+            self._generation += 1
+            self._frame = None
+            self._pending = False
+            self._ready.clear()
+
+    def take(self, not_before, timeout=None):
+        """
+        Retorna o frame pré-capturado, esperando se a captura ainda estiver em andamento.
+
+        Args:
+            not_before (float): Instante (time.monotonic) do último input. Frames cuja captura
+                                começou antes disso mostram a tela antiga e são descartados.
+            timeout (float, optional): Espera máxima. Default: 2x a latência média + 1s.
+
+        Returns:
+            CapturedFrame ou None (nada agendado, captura falhou ou frame obsoleto).
+        """
+        with self._lock:
+            if not self._pending:
+                return None
+        if timeout is None:
+            timeout = 2 * self._latency + 1.0
+        if not self._ready.wait(timeout):
+            self.cancel()
+            return None
+
+        with self._lock:
+            frame, self._frame = self._frame, None
+            self._pending = False
+            self._ready.clear()
+
+        if frame is None or not frame.ok:
+            return None
+        if frame.timestamp < not_before:
+            print(f"🗑️ Frame pré-capturado descartado (obsoleto: {not_before - frame.timestamp:.2f}s antes do último input)")
+            return None
+        return frame
+
+    def _run(self, generation, start_at):
+        delay = start_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        with self._lock:
+            if generation != self._generation:
+                return  # Cancelada ou substituída enquanto aguardava
+        frame = capture_frame(self.device_id)
+        with self._lock:
+            if frame.ok:
+                self._latency = 0.7 * self._latency + 0.3 * frame.duration
+            if generation != self._generation:
+                return
+            self._frame = frame
+            self._ready.set()
+
+
+class SharedFrameSource:
+    """
+    Captura contínua de um dispositivo, compartilhada entre vários consumidores.
+
+    Uma thread captura frames em sequência (respeitando min_interval entre o início de duas
+    capturas) e publica o mais recente. Consumidores esperam por um frame posterior a um
+    instante (wait_next) ou recebem cada frame por callback (subscribe).
+
+    Exemplo:
+        source = SharedFrameSource(device_id).start()
+        frame = source.wait_next(not_before=tap_ts)   # primeiro frame capturado após o toque
+        source.stop()
+    """
+
+    def __init__(self, device_id=None, min_interval=0.2):
+        self.device_id = device_id
+        self.min_interval = float(min_interval)
+        self._cond = threading.Condition()
+        self._frame = None
+        self._subscribers = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def stopped(self) -> bool:
+        """True depois de stop(): wait_next volta None na hora e quem lê deve capturar por conta própria."""
+        return self._stop.is_set()
+
+    def start(self):
+        """Inicia a thread de captura (idempotente). Retorna a própria fonte."""
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"frames-{self.device_id}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        """Para a captura e acorda quem estiver esperando por frame."""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def subscribe(self, callback):
+        """Registra callback(frame) chamado a cada frame novo (na thread de captura). Retorna o cancelamento."""
+        with self._cond:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._cond:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def latest(self, not_before=None):
+        """Último frame publicado, ou None se não houver nenhum posterior a not_before."""
+        with self._cond:
+            frame = self._frame
+        if frame is None or (not_before is not None and frame.timestamp < not_before):
+            return None
+        return frame
+
+    def wait_next(self, not_before, timeout=None):
+        """
+        Espera o primeiro frame cuja captura começou em not_before ou depois.
+
+        Returns:
+            CapturedFrame ou None (timeout ou fonte parada).
+        """
+        if timeout is None:
+            timeout = 2 * FramePrefetcher.DEFAULT_LATENCY + 1.0
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._stop.is_set():
+                if self._frame is not None and self._frame.timestamp >= not_before:
+                    return self._frame
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+        return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            frame = capture_frame(self.device_id)
+            if frame.ok:
+                with self._cond:
+                    self._frame = frame
+                    subscribers = list(self._subscribers)
+                    self._cond.notify_all()
+                for callback in subscribers:
+                    try:
+                        callback(frame)
+                    except Exception as e:
+                        print(f"⚠️ Erro em consumidor de frames: {e}")
+            remaining = self.min_interval - (time.monotonic() - frame.timestamp)
+            if remaining > 0:
+                self._stop.wait(remaining)
+            elif not frame.ok:
+                self._stop.wait(0.5)  # Captura falhou (dispositivo ocupado/desconectado): não martelar o ADB
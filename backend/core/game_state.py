@@ -0,0 +1,266 @@
+"""
+Estado do Jogo no Dispositivo
+Pacote em primeiro plano, processo do jogo, tela ligada e resolução, coletados em uma única
+chamada de `adb shell` e guardados em cache por dispositivo por um instante.
+
+O /check_game_state rodava `pidof`, `dumpsys window windows` e `dumpsys activity activities`
+em comandos separados, e o /detect_game do overlay um `dumpsys window windows` completo
+(centenas de KB) a cada poll. Aqui um script de shell roda tudo no dispositivo, filtra com
+grep antes de devolver e separa as seções por marcadores; consultas dentro do TTL leem a cache.
+Mudanças de estado (jogo abriu/fechou, tela apagou) são enviadas aos inscritos.
+
+Exemplo:
+    service = get_game_state_service()
+    state = service.get("RXCT...")              # GameState (cache de GAME_STATE_TTL s)
+    state.foreground, state.screen_on
+    unsubscribe = service.subscribe(lambda st: print(st.to_dict()))
+    unwatch = service.watch("RXCT...")          # poll em segundo plano enquanto houver interesse
+"""
+import re
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, asdict
+
+try:
+    from backend.config.settings import settings
+except ImportError:
+    try:
+        from config.settings import settings
+    except ImportError:
+        settings = None
+
+
+DEFAULT_PACKAGE = "com.nhnent.SKLEAGUE"  # League of Kingdoms
+PROBE_TIMEOUT = 10    # Segundos máximos da chamada de shell
+POLL_INTERVAL = 2.0   # Intervalo do poll em segundo plano (watch)
+
+_PACKAGE_RE = re.compile(r"^[A-Za-z0-9_.]+$")
+_FOCUS_RE = re.compile(r"(?:mCurrentFocus|mFocusedApp)=.*?\s([A-Za-z0-9_.]+)/")
+_SIZE_RE = re.compile(r"(Physical|Override) size:\s*(\d+)x(\d+)")
+_WAKE_RE = re.compile(r"mWakefulness=(\w+)")
+_DISPLAY_RE = re.compile(r"Display Power: state=(\w+)")
+
+# Seções separadas por marcadores; os grep rodam no dispositivo (só as linhas úteis voltam pelo USB)
+_PROBE_SCRIPT = (
+    "echo @pid; pidof {package}; "
+    "echo @focus; dumpsys window | grep -E 'mCurrentFocus=|mFocusedApp='; "
+    "echo @power; dumpsys power | grep -E 'mWakefulness=|Display Power: state='; "
+    "echo @size; wm size"
+)
+
+
+@dataclass
+class GameState:
+    """Estado do dispositivo/jogo em um instante (ok=False se o ADB não respondeu)."""
+    device_id: str
+    package: str
+    running: bool = False
+    foreground: bool = False
+    foreground_package: str = None
+    screen_on: bool = None
+    width: int = None
+    height: int = None
+    ok: bool = True
+    timestamp: float = 0.0
+
+    def same_as(self, other):
+        """Mesmo estado (ignora o horário da coleta)."""
+        if other is None:
+            return False
+        mine, theirs = asdict(self), asdict(other)
+        mine.pop("timestamp")
+        theirs.pop("timestamp")
+        return mine == theirs
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def _setting(name, default):
+    if settings is None:
+        return default
+    return getattr(settings.adb, name, default)
+
+
+def parse_probe_output(output, device_id, package, timestamp=None):
+    """Converte a saída do script de shell (seções @pid/@focus/@power/@size) em GameState."""
+    sections, current = {}, None
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith("@"):
+            current = line[1:]
+            sections[current] = []
+        elif line and current is not None:
+            sections[current].append(line)
+
+    focus = None
+    for line in sections.get("focus", []):
+        match = _FOCUS_RE.search(line)
+        if match:
+            focus = match.group(1)
+            if "mCurrentFocus" in line:
+                break  # Janela com foco tem prioridade sobre o app com foco
+
+    screen_on = None
+    for line in sections.get("power", []):
+        match = _WAKE_RE.search(line)
+        if match:
+            screen_on = match.group(1) == "Awake"
+            break
+        match = _DISPLAY_RE.search(line)
+        if match:
+            screen_on = match.group(1) == "ON"
+
+    width = height = None
+    for line in sections.get("size", []):
+        match = _SIZE_RE.search(line)
+        if match and (width is None or match.group(1) == "Override"):
+            width, height = int(match.group(2)), int(match.group(3))
+
+    return GameState(
+        device_id=device_id,
+        package=package,
+        running=any(part.isdigit() for line in sections.get("pid", []) for part in line.split()),
+        foreground=focus == package,
+        foreground_package=focus,
+        screen_on=screen_on,
+        width=width,
+        height=height,
+        ok="pid" in sections and "size" in sections,
+        timestamp=time.time() if timestamp is None else timestamp,
+    )
+
+
+class GameStateService:
+    """
+    Estado do jogo por dispositivo, com cache curta e notificação de mudanças.
+
+    Args:
+        ttl (float, optional): Idade máxima (s) de um estado servido da cache (padrão GAME_STATE_TTL).
+        adb_path (str, optional): Executável do ADB.
+    """
+
+    def __init__(self, ttl=None, adb_path=None):
+        self.ttl = float(ttl if ttl is not None else _setting("game_state_ttl", 1.0))
+        self.adb_path = adb_path or _setting("adb_path", "adb")
+        self._lock = threading.Lock()
+        self._cache = {}           # (device_id, package) -> GameState
+        self._probe_locks = {}     # Uma coleta por vez por chave: pedidos simultâneos reusam o resultado
+        self._listeners = []
+        self._watched = {}         # (device_id, package) -> contagem de interessados
+        self._watch_thread = None
+        self._stop = threading.Event()
+
+    def probe(self, device_id=None, package=DEFAULT_PACKAGE):
+        """Coleta o estado agora (uma chamada de shell), atualiza a cache e notifica se mudou."""
+        if not _PACKAGE_RE.match(package or ""):
+            raise ValueError(f"Nome de pacote inválido: {package!r}")
+        command = [self.adb_path]
+        if device_id:
+            command += ["-s", device_id]
+        command += ["shell", _PROBE_SCRIPT.format(package=package)]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=PROBE_TIMEOUT)
+            output = result.stdout if result.returncode == 0 or "@size" in result.stdout else ""
+        except (FileNotFoundError, subprocess.TimeoutExpired):
+            output = ""
+        state = parse_probe_output(output, device_id, package)
+        self._store(state)
+        return state
+
+    def get(self, device_id=None, package=DEFAULT_PACKAGE, max_age=None):
+        """Estado com no máximo max_age segundos (padrão: ttl); coleta de novo se a cache for mais velha."""
+        max_age = self.ttl if max_age is None else max_age
+        key = (device_id, package)
+        with self._lock:
+            probe_lock = self._probe_locks.setdefault(key, threading.Lock())
+        with probe_lock:
+            with self._lock:
+                cached = self._cache.get(key)
+            if cached is not None and time.time() - cached.timestamp <= max_age:
+                return cached
+            return self.probe(device_id, package)
+
+    def cached(self, device_id=None, package=DEFAULT_PACKAGE):
+        """Último estado coletado (sem ADB), ou None."""
+        with self._lock:
+            return self._cache.get((device_id, package))
+
+    def invalidate(self, device_id=None):
+        """Descarta a cache (de um dispositivo, ou toda com device_id=None)."""
+        with self._lock:
+            for key in [k for k in self._cache if device_id is None or k[0] == device_id]:
+                del self._cache[key]
+
+    def subscribe(self, callback):
+        """Registra callback(GameState), chamado quando o estado de um dispositivo muda. Retorna o cancelamento."""
+        with self._lock:
+            self._listeners.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._listeners:
+                    self._listeners.remove(callback)
+        return unsubscribe
+
+    def watch(self, device_id=None, package=DEFAULT_PACKAGE):
+        """Mantém o estado atualizado em segundo plano (poll de POLL_INTERVAL s). Retorna o cancelamento."""
+        key = (device_id, package)
+        with self._lock:
+            self._watched[key] = self._watched.get(key, 0) + 1
+            if self._watch_thread is None or not self._watch_thread.is_alive():
+                self._stop.clear()
+                self._watch_thread = threading.Thread(target=self._watch_loop, name="game-state", daemon=True)
+                self._watch_thread.start()
+        released = []
+
+        def unwatch():
+            with self._lock:
+                if released:
+                    return
+                released.append(True)
+                self._watched[key] -= 1
+                if self._watched[key] <= 0:
+                    del self._watched[key]
+        return unwatch
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch_loop(self):
+        while not self._stop.wait(POLL_INTERVAL):
+            with self._lock:
+                keys = list(self._watched)
+            if not keys:
+                continue
+            for device_id, package in keys:
+                try:
+                    self.get(device_id, package, max_age=POLL_INTERVAL / 2)
+                except Exception as e:
+                    print(f"⚠️ Erro ao consultar estado do jogo: {e}")
+
+    def _store(self, state):
+        key = (state.device_id, state.package)
+        with self._lock:
+            previous = self._cache.get(key)
+            self._cache[key] = state
+            listeners = list(self._listeners) if not state.same_as(previous) else []
+        for callback in listeners:
+            try:
+                callback(state)
+            except Exception as e:
+                print(f"⚠️ Erro em listener de estado do jogo: {e}")
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_game_state_service():
+    """Serviço global (a cache vale para o processo todo)."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = GameStateService()
+        return _service
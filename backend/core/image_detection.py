@@ -1,20 +1,658 @@
 # Nome do Arquivo: ce70b1cd_image_detection.py
 # Descrição: Contém funções para detecção de imagem (template matching) em screenshots.
 # Versão: 01.00.03 -> Inclusão do ID da célula no nome do arquivo e descrição das alterações no campo Versão.
+# Versão: 01.01.00 -> Cache de templates em tons de cinza, detecção multi-escala com pirâmide de templates
+#                     por resolução e escala travada por dispositivo. Detecção direto em frames em memória.
+# Versão: 01.02.00 -> Templates e versões escaladas lidos do pacote compilado (template_pack, np.memmap)
+#                     quando o PNG não mudou desde a compilação; senão o PNG é decodificado como antes.
+# Versão: 01.03.00 -> Matching com máscara: regiões transparentes do PNG (canal alfa) ou o arquivo
+#                     <nome>_mask.png são ignoradas (fundo do mapa/lista que muda); máscara em cache com o template.
+# Versão: 01.04.00 -> Cascata de rejeição: correlação em resolução reduzida descarta templates ausentes
+#                     antes do matchTemplate em resolução cheia; validate_cascade() confere no corpus gravado.
+# Versão: 01.05.00 -> find_all_images_in_frame(): todas as ocorrências acima do limiar, com supressão de
+#                     não-máximos (uma captura -> todas as linhas visíveis de uma lista).
+# Versão: 01.05.01 -> NOT_EVALUATED: falha de carga/tamanho distinta da rejeição pela cascata.
+# Versão: 01.05.02 -> best_match_in_frame(resolution=...) para recortes (ROI) usarem a pirâmide e a escala
+#                     travada da tela inteira; estado da escala travada exportável (scale_lock_state,
+#                     restore_scale_lock, merge_scale_lock) para os workers do detection_pool.
 # Analista: Gemini
 # Programador: Gled Carneiro
 # -----------------------------------------------------------------------------
+import glob
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
 import cv2
 import numpy as np
 
+try:
+    from backend.config.settings import settings
+except ImportError:
+    try:
+        from config.settings import settings
+    except ImportError:
+        settings = None  # Scripts isolados: usa os valores padrão abaixo
+
+try:
+    from .template_pack import get_template_pack, mask_file_for, _read_template, _read_mask_file
+except ImportError:
+    from template_pack import get_template_pack, mask_file_for, _read_template, _read_mask_file
+
+
+# Limiar padrão (mesmo valor histórico do projeto)
+DEFAULT_THRESHOLD = 0.8
+# Score de "template não avaliado" (falha ao carregar ou maior que o frame). Uma rejeição da cascata
+# também volta sem caixa, mas com o score reduzido, sempre maior que este valor
+NOT_EVALUATED = -1.0
+
+
+def _detection_setting(name, default):
+    """Lê um campo de settings.detection, com fallback se settings não estiver disponível."""
+    if settings is None:
+        return default
+    return getattr(settings.detection, name, default)
+
+
+# ---------------------------------------------------------------------------
+# Caches de templates
+# ---------------------------------------------------------------------------
+# _template_cache: caminho -> ((mtime, mtime da máscara), template_gray, máscara ou None)  (LRU limitado
+#                  por template_cache_size)
+# _pyramid_cache:  (caminho, resolução) -> [(escala, template_gray_escalado), ...]
+# _mask_cache:     (caminho, forma) -> máscara redimensionada para a versão escalada do template
+# _small_cache:    (caminho, forma, fator) -> template reduzido usado pela cascata de rejeição
+# _locked_scales:  (device_id, resolução) -> {'scale': float, 'misses': int}
+_template_cache = OrderedDict()
+_pyramid_cache = OrderedDict()
+_mask_cache = {}
+_small_cache = {}
+_locked_scales = {}
+_cache_lock = threading.Lock()
+
+
+def _load_template(template_path):
+    """Carrega (template_gray, máscara ou None) usando o cache; (None, None) se não puder ser carregado."""
+    try:
+        stat = os.stat(template_path)
+    except OSError:
+        return None, None
+    mask_path = mask_file_for(template_path)
+    try:
+        mask_mtime = os.path.getmtime(mask_path)
+    except OSError:
+        mask_mtime = None
+    version = (stat.st_mtime, mask_mtime)
+
+    with _cache_lock:
+        cached = _template_cache.get(template_path)
+        if cached is not None and cached[0] == version:
+            _template_cache.move_to_end(template_path)
+            return cached[1], cached[2]
+
+    pack = get_template_pack()
+    template_gray = pack.gray(template_path, stat) if pack is not None else None
+    if template_gray is not None:
+        # Máscara separada lida do disco (pode ter sido criada depois da compilação do pacote)
+        mask = _read_mask_file(mask_path, template_gray.shape) if mask_mtime is not None else pack.mask(template_path, stat)
+    else:
+        template_gray, mask = _read_template(template_path)
+        if template_gray is None:
+            return None, None
+
+    with _cache_lock:
+        _template_cache[template_path] = (version, template_gray, mask)
+        _template_cache.move_to_end(template_path)
+        max_size = _detection_setting("template_cache_size", 100)
+        while len(_template_cache) > max_size:
+            _template_cache.popitem(last=False)
+        # Template mudou: descarta as versões escaladas antigas
+        for key in [k for k in _pyramid_cache if k[0] == template_path]:
+            del _pyramid_cache[key]
+        for cache in (_mask_cache, _small_cache):
+            for key in [k for k in cache if k[0] == template_path]:
+                del cache[key]
+
+    return template_gray, mask
+
+
+def load_template_gray(template_path):
+    """
+    Carrega um template em tons de cinza, usando cache em memória.
+
+    O cache é invalidado automaticamente se o arquivo for modificado (mtime),
+    então templates recapturados com create_action_template.py são recarregados.
+    Se o pacote compilado (template_pack) tiver o mesmo PNG, o template é uma view do
+    arquivo mapeado em memória, sem decodificação.
+
+    Args:
+        template_path (str): Caminho para o arquivo do template.
+
+    Returns:
+        numpy.ndarray: Template em tons de cinza, ou None se não puder ser carregado.
+    """
+    return _load_template(template_path)[0]
+
+
+def load_template_mask(template_path, shape=None):
+    """
+    Máscara do template (255 = pixel comparado, 0 = ignorado), ou None se o template não tem.
+
+    A máscara vem das regiões transparentes do PNG (canal alfa) ou do arquivo <nome>_mask.png.
+
+    Args:
+        template_path (str): Caminho para o arquivo do template.
+        shape (tuple, optional): Forma (altura, largura) de uma versão escalada do template;
+                                 a máscara é redimensionada (vizinho mais próximo) e fica em cache.
+    """
+    template_gray, mask = _load_template(template_path)
+    if mask is None or shape is None or tuple(shape[:2]) == mask.shape:
+        return mask
+    key = (template_path, tuple(shape[:2]))
+    with _cache_lock:
+        scaled = _mask_cache.get(key)
+    if scaled is None:
+        scaled = cv2.resize(mask, (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST)
+        with _cache_lock:
+            _mask_cache[key] = scaled
+    return scaled
+
+
+def get_scales_for_resolution(resolution):
+    """
+    Calcula as escalas de template a testar para uma resolução de tela.
+
+    A escala base é a razão entre o lado menor da tela e o lado menor da resolução de
+    referência (a UI do jogo acompanha a altura em landscape). As escalas configuradas
+    em settings.detection.scales são aplicadas sobre essa base.
+
+    Args:
+        resolution (tuple): (largura, altura) do frame.
+
+    Returns:
+        list: Lista de escalas (float), ordenadas, sem repetição.
+    """
+    ref_w, ref_h = _detection_setting("reference_resolution", (2400, 1080))
+    base = min(resolution) / float(min(ref_w, ref_h))
+    scales = _detection_setting("scales", [0.8, 1.0, 1.2])
+    return sorted({round(base * s, 3) for s in scales})
+
+
+def _get_template_pyramid(template_path, resolution):
+    """Retorna [(escala, template_escalado)] para a resolução, calculando uma única vez."""
+    template_gray = load_template_gray(template_path)
+    if template_gray is None:
+        return None
+
+    key = (template_path, resolution)
+    with _cache_lock:
+        pyramid = _pyramid_cache.get(key)
+        if pyramid is not None:
+            _pyramid_cache.move_to_end(key)
+            return pyramid
+
+    pyramid = []
+    th, tw = template_gray.shape[:2]
+    pack = get_template_pack()
+    for scale in get_scales_for_resolution(resolution):
+        if scale == 1.0:
+            pyramid.append((scale, template_gray))
+            continue
+        packed = pack.scaled(template_path, scale) if pack is not None else None
+        if packed is not None:
+            pyramid.append((scale, packed))
+            continue
+        new_w, new_h = int(round(tw * scale)), int(round(th * scale))
+        if new_w < 8 or new_h < 8:
+            continue
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+        pyramid.append((scale, cv2.resize(template_gray, (new_w, new_h), interpolation=interpolation)))
+
+    with _cache_lock:
+        _pyramid_cache[key] = pyramid
+        max_size = _detection_setting("template_cache_size", 100)
+        while len(_pyramid_cache) > max_size:
+            _pyramid_cache.popitem(last=False)
+    return pyramid
+
+
+def reset_scale_lock(device_id=None):
+    """
+    Remove a escala travada de um dispositivo (ou de todos, se device_id for None).
+
+    Útil ao trocar de celular no mesmo device_id ou após mudar a resolução com 'wm size'.
+    """
+    with _cache_lock:
+        if device_id is None:
+            _locked_scales.clear()
+        else:
+            for key in [k for k in _locked_scales if k[0] == device_id]:
+                del _locked_scales[key]
+
+
+def get_locked_scale(device_id, resolution):
+    """Retorna a escala travada para o dispositivo/resolução, ou None se ainda não houver."""
+    with _cache_lock:
+        entry = _locked_scales.get((device_id, tuple(resolution)))
+        return entry["scale"] if entry else None
+
+
+def scale_lock_state(device_id, resolution):
+    """Cópia do estado da escala travada ({'scale', 'misses'}) do dispositivo/resolução, ou None."""
+    with _cache_lock:
+        entry = _locked_scales.get((device_id, tuple(resolution)))
+        return dict(entry) if entry else None
+
+
+def restore_scale_lock(device_id, resolution, state):
+    """Substitui o estado da escala travada pelo recebido (None remove a trava)."""
+    key = (device_id, tuple(resolution))
+    with _cache_lock:
+        if state:
+            _locked_scales[key] = dict(state)
+        else:
+            _locked_scales.pop(key, None)
+
+
+def merge_scale_lock(device_id, resolution, sent, returned):
+    """
+    Aplica o estado da escala travada que voltou de uma busca feita em outro processo.
+
+    sent é o estado enviado com a busca e returned o estado depois dela. Uma escala recém travada
+    (acerto) sempre vale; erros e a liberação da trava só valem se a escala daqui não mudou
+    enquanto a busca rodava (outra busca pode ter travado outra escala nesse meio tempo).
+    """
+    key = (device_id, tuple(resolution))
+    with _cache_lock:
+        current = _locked_scales.get(key)
+        if returned and returned.get("misses", 0) == 0:
+            if returned != sent:
+                _locked_scales[key] = dict(returned)
+            return
+        if (current or {}).get("scale") != (sent or {}).get("scale"):
+            return
+        if not returned:
+            _locked_scales.pop(key, None)
+        elif current is not None:
+            current["misses"] = max(current["misses"], returned["misses"])
+
+
+def _to_gray(image):
+    """Converte um frame BGR/BGRA para tons de cinza (frames já em cinza são retornados como estão)."""
+    if image.ndim == 2:
+        return image
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def _match_single(screenshot_gray, template_gray, mask=None):
+    """
+    Executa matchTemplate e retorna (score, (x, y)). Retorna (NOT_EVALUATED, None) se o template não cabe no frame.
+
+    Com máscara, só os pixels brancos da máscara entram na correlação (fundo variável ignorado).
+    """
+    sh, sw = screenshot_gray.shape[:2]
+    th, tw = template_gray.shape[:2]
+    if th > sh or tw > sw:
+        return NOT_EVALUATED, None
+    # cv2.TM_CCOEFF_NORMED é um método de comparação que funciona bem na maioria dos casos
+    if mask is None:
+        result = cv2.matchTemplate(screenshot_gray, template_gray, cv2.TM_CCOEFF_NORMED)
+    else:
+        result = cv2.matchTemplate(screenshot_gray, template_gray, cv2.TM_CCOEFF_NORMED, mask=mask)
+        # Com máscara, janelas uniformes (desvio zero) geram nan/inf em vez de 0
+        result[~np.isfinite(result)] = -1.0
+    _, max_val, _, max_loc = cv2.minMaxLoc(result)
+    return float(max_val), max_loc
+
+
+# ---------------------------------------------------------------------------
+# Cascata de rejeição rápida
+# ---------------------------------------------------------------------------
+# A maioria das buscas (espera de template, vigia de gatilho) termina em "não encontrado".
+# Antes do matchTemplate em resolução cheia, frame e template são reduzidos pela metade (1/4 dos
+# pixels, ~1/16 do custo) e correlacionados: se nem a versão reduzida chega perto do limiar, o
+# template não está na tela. Templates presentes ficaram acima de 0.77 reduzidos (1/4 perde demais
+# em templates com texto: até 0.54), então a margem padrão de 0.25 é folgada; confira com
+# validate_cascade() no corpus gravado antes de apertar DetectionSettings.cascade_margin.
+CASCADE_FACTORS = (0.5,)
+CASCADE_MIN_SIDE = 10  # Menor lado (px) do template reduzido; abaixo disso a cascata é pulada
+
+_cascade_local = threading.local()  # Frame reduzido do último frame visto, por thread
+cascade_stats = {"checked": 0, "rejected": 0}
+
+
+def _cascade_factor(template_shape):
+    side = min(template_shape[:2])
+    for factor in CASCADE_FACTORS:
+        if side * factor >= CASCADE_MIN_SIDE:
+            return factor
+    return None
+
+
+def _downsampled(screenshot, screenshot_gray, factor):
+    """Frame reduzido, calculado uma vez por frame (todos os templates da mesma busca o reutilizam)."""
+    ref = getattr(_cascade_local, "ref", None)
+    if (ref is not None and ref() is screenshot and _cascade_local.factor == factor
+            and _cascade_local.shape == screenshot_gray.shape):
+        return _cascade_local.gray
+    small = cv2.resize(screenshot_gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    try:
+        _cascade_local.ref = weakref.ref(screenshot)
+    except TypeError:
+        _cascade_local.ref = None
+    _cascade_local.factor, _cascade_local.shape, _cascade_local.gray = factor, screenshot_gray.shape, small
+    return small
+
+
+def _small_template(template_path, template_gray, factor):
+    key = (template_path, template_gray.shape, factor)
+    small = _small_cache.get(key)
+    if small is None:
+        small = cv2.resize(template_gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+        with _cache_lock:
+            _small_cache[key] = small
+    return small
+
+
+def _cascade_score(screenshot, screenshot_gray, template_path, template_gray):
+    """Score da correlação reduzida, ou None se a cascata não se aplica ao template."""
+    factor = _cascade_factor(template_gray.shape)
+    if factor is None:
+        return None
+    small_frame = _downsampled(screenshot, screenshot_gray, factor)
+    score, loc = _match_single(small_frame, _small_template(template_path, template_gray, factor))
+    return score if loc is not None else None
+
+
+def _cascade_rejects(screenshot, screenshot_gray, template_path, template_gray, threshold, mask=None):
+    """
+    (rejeitado, score reduzido). Templates com máscara não passam pela cascata (a redução
+    misturaria pixels mascarados com os válidos).
+    """
+    if mask is not None or not _detection_setting("enable_cascade", False):
+        return False, None
+    score = _cascade_score(screenshot, screenshot_gray, template_path, template_gray)
+    if score is None:
+        return False, None
+    cascade_stats["checked"] += 1
+    if score < threshold - _detection_setting("cascade_margin", 0.25):
+        cascade_stats["rejected"] += 1
+        return True, max(score, NOT_EVALUATED + 1e-6)  # Distinto de "não avaliado" mesmo no pior caso
+    return False, score
+
+
+def validate_cascade(corpus_dir=None, template_paths=None, threshold=None, margin=None):
+    """
+    Confere a cascata num corpus de frames gravados: nenhum template presente pode ser rejeitado.
+
+    Para cada frame x template compara o matchTemplate em resolução cheia com o score reduzido.
+
+    Args:
+        corpus_dir (str, optional): Pasta com frames .png (busca recursiva). Padrão: telas gravadas
+                                    (settings.paths.screens_folder) e settings.paths.screenshots_folder.
+        template_paths (list, optional): Templates a testar (padrão: todos de actions/templates).
+        threshold (float, optional): Limiar de detecção (padrão: settings.detection.threshold).
+        margin (float, optional): Margem da cascata (padrão: settings.detection.cascade_margin).
+
+    Returns:
+        dict: positives, false_negatives (lista), rejected, pairs, min_positive_score,
+              safe_margin (menor margem sem falso negativo neste corpus) e tempos (ms).
+    """
+    threshold = _detection_setting("threshold", DEFAULT_THRESHOLD) if threshold is None else threshold
+    margin = _detection_setting("cascade_margin", 0.25) if margin is None else margin
+    if corpus_dir is not None:
+        folders = [corpus_dir]
+    elif settings is not None:
+        folders = [str(settings.paths.screens_folder), str(settings.paths.screenshots_folder)]
+    else:
+        folders = []
+    frames = sorted(f for folder in folders for f in glob.glob(os.path.join(folder, "**", "*.png"), recursive=True))
+    if template_paths is None:
+        templates_dir = (str(settings.paths.actions_folder) if settings is not None
+                         else os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "actions", "templates"))
+        template_paths = sorted(p for p in glob.glob(os.path.join(templates_dir, "**", "*.png"), recursive=True)
+                                if not p.endswith("_mask.png"))
+
+    report = {"frames": 0, "pairs": 0, "positives": 0, "rejected": 0, "false_negatives": [],
+              "min_positive_score": None, "full_ms": 0.0, "cascade_ms": 0.0}
+    for frame_path in frames:
+        frame = cv2.imread(frame_path)
+        if frame is None:
+            continue
+        report["frames"] += 1
+        gray = _to_gray(frame)
+        for template_path in template_paths:
+            template_gray, mask = _load_template(template_path)
+            if template_gray is None or mask is not None:
+                continue
+            started = time.perf_counter()
+            low = _cascade_score(frame, gray, template_path, template_gray)
+            report["cascade_ms"] += (time.perf_counter() - started) * 1000
+            if low is None:
+                continue
+            started = time.perf_counter()
+            full, loc = _match_single(gray, template_gray)
+            report["full_ms"] += (time.perf_counter() - started) * 1000
+            if loc is None:
+                continue
+            report["pairs"] += 1
+            rejected = low < threshold - margin
+            report["rejected"] += rejected
+            if full >= threshold:
+                report["positives"] += 1
+                if report["min_positive_score"] is None or low < report["min_positive_score"]:
+                    report["min_positive_score"] = low
+                if rejected:
+                    report["false_negatives"].append({"frame": frame_path, "template": template_path,
+                                                      "score": round(full, 3), "cascade_score": round(low, 3)})
+    lowest = report["min_positive_score"]
+    report["safe_margin"] = round(threshold - lowest, 3) if lowest is not None else None
+    return report
+
+
+def best_match_in_frame(screenshot, template_path, threshold=None, device_id=None, multiscale=None, resolution=None):
+    """
+    Procura o template em um frame já carregado em memória e retorna o melhor resultado.
+
+    Com multi-escala desativada, o comportamento é idêntico ao matching histórico (escala 1.0).
+    Com multi-escala ativada, na primeira detecção todas as escalas da pirâmide são testadas;
+    a escala vencedora fica travada para o dispositivo e as próximas buscas usam apenas ela.
+
+    Args:
+        screenshot (numpy.ndarray): Frame BGR ou em tons de cinza.
+        template_path (str): Caminho para o template.
+        threshold (float, optional): Limiar usado para decidir se a escala deve ser travada.
+        device_id (str, optional): ID do dispositivo (chave da escala travada).
+        multiscale (bool, optional): Força ligar/desligar multi-escala. None usa settings.
+        resolution (tuple, optional): (largura, altura) da tela quando screenshot é um recorte dela
+                                      (ROI): a pirâmide e a escala travada são as da tela inteira.
+
+    Returns:
+        tuple: (score, (x, y, w, h)) do melhor resultado, ou (score, None) se nenhum
+               candidato pôde ser avaliado (template ausente ou maior que o frame: score ==
+               NOT_EVALUATED) ou se a cascata rejeitou todos (score é então o da correlação
+               reduzida, > NOT_EVALUATED).
+    """
+    if threshold is None:
+        threshold = _detection_setting("threshold", DEFAULT_THRESHOLD)
+    if multiscale is None:
+        multiscale = _detection_setting("enable_multiscale", False)
+
+    screenshot_gray = _to_gray(screenshot)
+
+    if not multiscale:
+        template_gray, mask = _load_template(template_path)
+        if template_gray is None:
+            print(f"Erro: Não foi possível carregar o template de {template_path}")
+            return NOT_EVALUATED, None
+        rejected, low_score = _cascade_rejects(screenshot, screenshot_gray, template_path, template_gray, threshold, mask)
+        if rejected:
+            return low_score, None
+        score, loc = _match_single(screenshot_gray, template_gray, mask)
+        if loc is None:
+            return score, None
+        h, w = template_gray.shape[:2]
+        return score, (loc[0], loc[1], w, h)
+
+    if resolution is None:
+        resolution = (screenshot_gray.shape[1], screenshot_gray.shape[0])
+    resolution = tuple(resolution)
+    pyramid = _get_template_pyramid(template_path, resolution)
+    if not pyramid:
+        print(f"Erro: Não foi possível carregar o template de {template_path}")
+        return NOT_EVALUATED, None
+
+    lock_key = (device_id, resolution)
+    with _cache_lock:
+        lock = _locked_scales.get(lock_key)
+        locked_scale = lock["scale"] if lock else None
+
+    candidates = pyramid
+    if locked_scale is not None:
+        candidates = [item for item in pyramid if item[0] == locked_scale] or pyramid
+
+    best_score, best_box, best_scale = NOT_EVALUATED, None, None
+    rejected_score = NOT_EVALUATED
+    for scale, template_scaled in candidates:
+        mask = load_template_mask(template_path, template_scaled.shape)
+        rejected, low_score = _cascade_rejects(screenshot, screenshot_gray, template_path, template_scaled,
+                                               threshold, mask)
+        if rejected:
+            rejected_score = max(rejected_score, low_score)
+            continue
+        score, loc = _match_single(screenshot_gray, template_scaled, mask)
+        if loc is not None and score > best_score:
+            h, w = template_scaled.shape[:2]
+            best_score, best_box, best_scale = score, (loc[0], loc[1], w, h), scale
+    if best_box is None:
+        best_score = max(best_score, rejected_score)
+
+    with _cache_lock:
+        if best_box is not None and best_score >= threshold:
+            _locked_scales[lock_key] = {"scale": best_scale, "misses": 0}
+        elif lock is not None:
+            # Escala travada errada (ex.: travou num falso positivo) não pode bloquear a detecção
+            # para sempre: após N falhas seguidas, volta a varrer todas as escalas uma vez.
+            lock["misses"] += 1
+            if lock["misses"] >= _detection_setting("multiscale_relock_after", 10):
+                _locked_scales.pop(lock_key, None)
+
+    return best_score, best_box
+
+
+def _iou(a, b):
+    """Interseção sobre união de duas caixas (x, y, w, h)."""
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    inter = max(0, x1 - x0) * max(0, y1 - y0)
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / float(union) if union > 0 else 0.0
+
+
+def find_all_images_in_frame(screenshot, template_path, threshold=None, device_id=None, multiscale=None,
+                             max_overlap=0.3, max_results=50):
+    """
+    Encontra todas as ocorrências de um template no frame (ex.: todas as linhas de uma lista).
+
+    Os picos locais do mapa de correlação acima do limiar passam por supressão de não-máximos:
+    do maior score para o menor, uma caixa é descartada se sobrepõe (IoU > max_overlap) outra
+    já aceita. O resultado vem ordenado de cima para baixo (e da esquerda para a direita).
+
+    Args:
+        screenshot (numpy.ndarray): Frame BGR ou em tons de cinza.
+        template_path (str): Caminho para o template.
+        threshold (float, optional): Limiar de confiança (default: settings.detection.threshold).
+        device_id (str, optional): ID do dispositivo (escala travada, se multi-escala).
+        multiscale (bool, optional): Com multi-escala usa a escala travada do dispositivo (se houver).
+        max_overlap (float): IoU máxima entre duas ocorrências mantidas.
+        max_results (int): Máximo de ocorrências retornadas (as de maior score).
+
+    Returns:
+        list: [(score, (x, y, w, h)), ...] ordenada por y e x; vazia se nada passar do limiar.
+    """
+    if threshold is None:
+        threshold = _detection_setting("threshold", DEFAULT_THRESHOLD)
+    if multiscale is None:
+        multiscale = _detection_setting("enable_multiscale", False)
+
+    screenshot_gray = _to_gray(screenshot)
+    template_gray, mask = _load_template(template_path)
+    if template_gray is None:
+        print(f"Erro: Não foi possível carregar o template de {template_path}")
+        return []
+    if multiscale:
+        resolution = (screenshot_gray.shape[1], screenshot_gray.shape[0])
+        locked = get_locked_scale(device_id, resolution)
+        for scale, template_scaled in (_get_template_pyramid(template_path, resolution) or []):
+            if scale == locked:
+                template_gray = template_scaled
+                mask = load_template_mask(template_path, template_scaled.shape)
+
+    th, tw = template_gray.shape[:2]
+    if th > screenshot_gray.shape[0] or tw > screenshot_gray.shape[1]:
+        return []
+    if mask is None:
+        result = cv2.matchTemplate(screenshot_gray, template_gray, cv2.TM_CCOEFF_NORMED)
+    else:
+        result = cv2.matchTemplate(screenshot_gray, template_gray, cv2.TM_CCOEFF_NORMED, mask=mask)
+        result[~np.isfinite(result)] = -1.0
+
+    # Picos locais (máximo numa vizinhança de meio template) acima do limiar
+    kernel = np.ones((max(1, th // 2) | 1, max(1, tw // 2) | 1), np.uint8)
+    peaks = (result >= threshold) & (result >= cv2.dilate(result, kernel))
+    ys, xs = np.nonzero(peaks)
+    scores = result[ys, xs]
+    order = np.argsort(-scores)
+
+    kept = []
+    for idx in order:
+        box = (int(xs[idx]), int(ys[idx]), tw, th)
+        if all(_iou(box, other) <= max_overlap for _, other in kept):
+            kept.append((float(scores[idx]), box))
+            if len(kept) >= max_results:
+                break
+    kept.sort(key=lambda item: (item[1][1], item[1][0]))
+    return kept
+
+
+def find_image_in_frame(screenshot, template_path, threshold=None, device_id=None, multiscale=None):
+    """
+    Encontra a posição de um template dentro de um frame em memória.
+
+    Args:
+        screenshot (numpy.ndarray): Frame BGR ou em tons de cinza.
+        template_path (str): Caminho para o template.
+        threshold (float, optional): Limiar de confiança (default: settings.detection.threshold).
+        device_id (str, optional): ID do dispositivo (usado pela multi-escala).
+        multiscale (bool, optional): Força ligar/desligar multi-escala.
+
+    Returns:
+        tuple: (x, y, w, h) se encontrado, ou None.
+    """
+    if threshold is None:
+        threshold = _detection_setting("threshold", DEFAULT_THRESHOLD)
+    score, box = best_match_in_frame(screenshot, template_path, threshold=threshold,
+                                     device_id=device_id, multiscale=multiscale)
+    if box is not None and score >= threshold:
+        return box
+    return None
+
+
 # Função para encontrar a posição de uma imagem na tela (lógica de detecção de imagem)
-def find_image_on_screen(screenshot_path, template_path):
+def find_image_on_screen(screenshot_path, template_path, threshold=None, device_id=None, multiscale=None):
     """
     Encontra a posição de uma imagem (template) dentro de outra imagem (screenshot).
 
     Args:
         screenshot_path (str): Caminho para o arquivo da screenshot.
         template_path (str): Caminho para o arquivo da imagem a ser detectada (template).
+        threshold (float, optional): Limiar de confiança (default: settings.detection.threshold).
+        device_id (str, optional): ID do dispositivo (usado para travar a escala na multi-escala).
+        multiscale (bool, optional): Força ligar/desligar multi-escala. None usa settings.
 
     Returns:
         tuple: Uma tupla (x, y, w, h) representando a posição e dimensões da imagem encontrada,
@@ -22,43 +660,13 @@ def find_image_on_screen(screenshot_path, template_path):
     """
     try:
         screenshot = cv2.imread(screenshot_path)
-        template = cv2.imread(template_path)
 
         if screenshot is None:
             print(f"Erro: Não foi possível carregar a screenshot de {screenshot_path}")
             return None
-        if template is None:
-            print(f"Erro: Não foi possível carregar o template de {template_path}")
-            return None
-
-        # Converta as imagens para tons de cinza
-        screenshot_gray = cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
-        template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
-
-        # Realiza o template matching
-        # cv2.TM_CCOEFF_NORMED é um método de comparação que funciona bem na maioria dos casos
-        result = cv2.matchTemplate(screenshot_gray, template_gray, cv2.TM_CCOEFF_NORMED)
 
-        # Encontra a localização do melhor resultado
-        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-
-        # Define um limiar para considerar a correspondência como válida.
-        # Você pode precisar ajustar este valor dependendo das suas imagens.
-        threshold = 0.8
-
-        if max_val >= threshold:
-            # Pega as dimensões do template
-            w, h = template_gray.shape[::-1]
-            # Pega as coordenadas do canto superior esquerdo
-            top_left = max_loc
-            # Calcula as coordenadas do canto inferior direito
-            bottom_right = (top_left[0] + w, top_left[1] + h)
-
-            # print(f"Imagem encontrada em: {top_left} a {bottom_right}")
-            return (top_left[0], top_left[1], w, h)
-        else:
-            # print("Imagem não encontrada na screenshot.") # Comentado para evitar muita verbosidade em loops de tentativa
-            return None
+        return find_image_in_frame(screenshot, template_path, threshold=threshold,
+                                   device_id=device_id, multiscale=multiscale)
 
     except Exception as e:
         print(f"Ocorreu um erro durante a detecção da imagem: {e}")
@@ -71,4 +679,25 @@ def find_image_on_screen(screenshot_path, template_path):
 # if image_position:
 #     x, y, w, h = image_position
 #     print(f"Coordenadas da imagem detectada (canto superior esquerdo): ({x}, {y})")
-#     print(f"Centro da imagem: ({x + w // 2}, {y + h // 2})")
\ No newline at end of file
+#     print(f"Centro da imagem: ({x + w // 2}, {y + h // 2})")
+
+
+if __name__ == '__main__':
+    import sys
+
+    # Uso: python image_detection.py validate_cascade [pasta_de_frames]
+    if len(sys.argv) > 1 and sys.argv[1] == "validate_cascade":
+        result = validate_cascade(sys.argv[2] if len(sys.argv) > 2 else None)
+        print(f"Frames: {result['frames']} | pares: {result['pairs']} | presentes: {result['positives']} | "
+              f"rejeitados pela cascata: {result['rejected']}")
+        print(f"Tempo: resolução cheia {result['full_ms']:.0f} ms | cascata {result['cascade_ms']:.0f} ms")
+        print(f"Menor score reduzido de um template presente: {result['min_positive_score']} "
+              f"(margem mínima segura: {result['safe_margin']})")
+        if result["false_negatives"]:
+            print(f"❌ {len(result['false_negatives'])} falsos negativos (aumente DETECTION_CASCADE_MARGIN):")
+            for miss in result["false_negatives"]:
+                print(f"   {miss['template']} em {miss['frame']}: {miss['score']} (reduzido {miss['cascade_score']})")
+        else:
+            print("✅ Nenhum template presente rejeitado pela cascata. A margem pode ser usada: DETECTION_CASCADE=true no .env.")
+    else:
+        print("Uso: python image_detection.py validate_cascade [pasta_de_frames]")
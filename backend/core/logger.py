@@ -1,19 +1,39 @@
 """
 Sistema de Logging Estruturado
 Fornece logging consistente e configurável para todo o backend
+
+Quem loga só coloca o registro numa fila (QueueHandler); uma thread (QueueListener) formata e
+escreve no console e no arquivo. Terminal lento ou disco de log ocupado não atrasam mais os
+toques, e mensagens abaixo do nível configurado custam só a checagem de nível. No arquivo cada
+registro é uma linha JSON com os campos estruturados passados em extra (device, account,
+action, step, duration_ms...).
+
+Os scripts de ciclo imprimem o progresso com print(), direto no stdout, enquanto os registros
+saem da thread do listener; flush_logs() (ou o decorador flushes_logs) espera a fila esvaziar
+para que as linhas dos passos apareçam antes do próximo print.
 """
+import atexit
+import functools
+import json
 import logging
+import queue
 import sys
+import time
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from datetime import datetime
 from typing import Optional
 
 try:
     from backend.config.settings import settings
 except ImportError:
+    try:
+        from config.settings import settings
+    except ImportError:
+        settings = None
+
+if settings is None:
     # Fallback se settings não estiver disponível
-    from pathlib import Path
     BASE_DIR = Path(__file__).resolve().parent.parent.parent
     
     class FallbackSettings:
@@ -25,6 +45,9 @@ except ImportError:
             backup_count = 5
             console_output = True
             file_output = True
+            console_format = '%(message)s'
+            file_format = 'json'
+            queue_size = 10000
         
         class Paths:
             logs_folder = BASE_DIR / 'logs'
@@ -52,12 +75,54 @@ class ColoredFormatter(logging.Formatter):
     }
     
     def format(self, record):
-        # Adicionar cor ao nível de log
+        # Adicionar cor ao nível de log (restaurado depois: o mesmo registro vai para o arquivo)
         levelname = record.levelname
         if levelname in self.COLORS:
             record.levelname = f"{self.COLORS[levelname]}{levelname}{self.COLORS['RESET']}"
-        
-        return super().format(record)
+        try:
+            return super().format(record)
+        finally:
+            record.levelname = levelname
+
+
+# Atributos que todo LogRecord tem; o que sobrar veio de extra= e vai como campo no JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Um objeto JSON por linha: ts, level, logger, msg e os campos estruturados de extra"""
+    
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    Põe o registro na fila sem formatar (a formatação fica na thread do listener) e descarta
+    em vez de esperar quando a fila está cheia.
+    """
+    
+    dropped = 0
+    
+    def prepare(self, record):
+        return record
+    
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _NonBlockingQueueHandler.dropped += 1
 
 
 class AutoTouchLogger:
@@ -66,32 +131,38 @@ class AutoTouchLogger:
     _loggers = {}
     _initialized = False
     
+    _listener = None
+    _queue = None
+    
     @classmethod
     def setup(cls, force_reinit: bool = False):
         """Configura o sistema de logging"""
         if cls._initialized and not force_reinit:
             return
+        cls.shutdown()
         
         # Criar pasta de logs se não existir
         settings.paths.logs_folder.mkdir(parents=True, exist_ok=True)
         
-        # Configurar logger raiz
+        # Configurar logger raiz (o nível é a única checagem feita na thread que loga)
         root_logger = logging.getLogger()
         root_logger.setLevel(getattr(logging, settings.logging.level.upper()))
         
         # Remover handlers existentes
         root_logger.handlers.clear()
         
+        handlers = []
+        
         # Handler para console
         if settings.logging.console_output:
             console_handler = logging.StreamHandler(sys.stdout)
             console_handler.setLevel(logging.DEBUG)
             console_formatter = ColoredFormatter(
-                settings.logging.format,
+                getattr(settings.logging, 'console_format', settings.logging.format),
                 datefmt=settings.logging.date_format
             )
             console_handler.setFormatter(console_formatter)
-            root_logger.addHandler(console_handler)
+            handlers.append(console_handler)
         
         # Handler para arquivo
         if settings.logging.file_output:
@@ -103,15 +174,53 @@ class AutoTouchLogger:
                 encoding='utf-8'
             )
             file_handler.setLevel(logging.DEBUG)
-            file_formatter = logging.Formatter(
-                settings.logging.format,
-                datefmt=settings.logging.date_format
-            )
+            if getattr(settings.logging, 'file_format', 'json') == 'json':
+                file_formatter = JsonFormatter()
+            else:
+                file_formatter = logging.Formatter(
+                    settings.logging.format,
+                    datefmt=settings.logging.date_format
+                )
             file_handler.setFormatter(file_formatter)
-            root_logger.addHandler(file_handler)
+            handlers.append(file_handler)
+        
+        # Quem loga só enfileira; a escrita acontece na thread do listener
+        log_queue = queue.Queue(maxsize=getattr(settings.logging, 'queue_size', 10000))
+        # O nível do handler repete o da raiz: registros propagados de loggers com nível próprio
+        # mais baixo (ex.: DEBUG) não passam da checagem do logger raiz, só da do handler
+        queue_handler = _NonBlockingQueueHandler(log_queue)
+        queue_handler.setLevel(root_logger.level)
+        root_logger.addHandler(queue_handler)
+        cls._queue = log_queue
+        cls._listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        cls._listener.start()
         
         cls._initialized = True
     
+    @classmethod
+    def shutdown(cls):
+        """Escreve o que ainda está na fila e para a thread (chamado também na saída do processo)"""
+        if cls._listener is not None:
+            cls._listener.stop()
+            cls._listener = None
+    
+    @classmethod
+    def flush(cls, timeout: float = 1.0) -> bool:
+        """Espera (até timeout s) o listener escrever tudo o que está na fila. Retorna se esvaziou"""
+        if cls._listener is None or cls._queue is None:
+            return True
+        deadline = time.monotonic() + timeout
+        while cls._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+    
+    @classmethod
+    def dropped(cls) -> int:
+        """Registros descartados por fila cheia"""
+        return _NonBlockingQueueHandler.dropped
+    
     @classmethod
     def get_logger(cls, name: str) -> logging.Logger:
         """
@@ -185,6 +294,7 @@ class AutoTouchLogger:
 
 # Configurar logging ao importar o módulo
 AutoTouchLogger.setup()
+atexit.register(AutoTouchLogger.shutdown)
 
 
 def get_logger(name: str = None) -> logging.Logger:
@@ -211,6 +321,22 @@ def get_logger(name: str = None) -> logging.Logger:
     return AutoTouchLogger.get_logger(name)
 
 
+def flush_logs(timeout: float = 1.0) -> bool:
+    """Espera a fila de logging ser escrita (antes de um print() que deve sair depois dos registros)"""
+    return AutoTouchLogger.flush(timeout)
+
+
+def flushes_logs(func):
+    """Decorador: ao retornar, func espera a fila de logging ser escrita (ver flush_logs)"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            AutoTouchLogger.flush()
+    return wrapper
+
+
 # Criar logger padrão para o módulo
 logger = get_logger(__name__)
 
@@ -0,0 +1,172 @@
+"""
+Posições de Login Aprendidas
+Guarda, por (dispositivo, conta), onde o botão da conta apareceu na tela de seleção do Google
+e qual scroll foi usado para chegar lá.
+
+A descoberta da posição (captura extra do login_cav, fator de scroll, até 5 tentativas com
+scroll antes de cada busca) acontece só no primeiro login bem-sucedido da conta. Nos logins
+seguintes o passo da conta é executado com o scroll gravado e uma única verificação do template
+restrita a uma região pequena (search_roi) ao redor da posição aprendida. Se a verificação
+falhar, a entrada registra um erro e o passo original (com descoberta) é usado de novo.
+
+Arquivo: settings.paths.data_folder / "login_positions.json"
+"""
+import json
+import os
+import threading
+import time
+
+try:
+    from .device_profile import get_device_profile
+except ImportError:
+    from device_profile import get_device_profile
+
+try:
+    from backend.config.settings import settings
+except ImportError:
+    try:
+        from config.settings import settings
+    except ImportError:
+        settings = None
+
+
+ROI_MARGIN = 60      # Margem (pixels da referência 2400x1080) ao redor do botão aprendido
+MAX_MISSES = 2       # Erros seguidos até a posição ser descartada e reaprendida
+
+
+def _default_path():
+    if settings is not None:
+        return str(settings.paths.data_folder / "login_positions.json")
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(os.path.dirname(backend_dir), "data", "login_positions.json")
+
+
+def _key(device_id, account_name):
+    return f"{device_id or 'default'}::{account_name}"
+
+
+class LoginPositionStore:
+    """
+    Posições aprendidas dos botões de conta.
+
+    Exemplo:
+        store = get_login_position_store()
+        entry = store.get(device_id, "login_c55")   # None se ainda não aprendida
+        ...
+        store.learn(device_id, "login_c55", found_positions["08_login_c55.png"], scroll=step["action_before_find"])
+    """
+
+    def __init__(self, path=None):
+        self.path = path or _default_path()
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Posições de login ilegíveis ({e}). Começando do zero.")
+            return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)  # Troca atômica: nunca deixa o arquivo pela metade
+
+    def get(self, device_id, account_name):
+        """Entrada aprendida (dict) ou None."""
+        with self._lock:
+            entry = self._entries.get(_key(device_id, account_name))
+            return dict(entry) if entry else None
+
+    def learn(self, device_id, account_name, position, scroll=None):
+        """
+        Grava a posição encontrada no último login bem-sucedido.
+
+        Args:
+            position (dict): Entrada de found_positions ({"center", "size", "click"}, pixels da tela).
+            scroll (dict, optional): action_before_find usado para chegar à conta (None = sem scroll).
+        """
+        if not position or not position.get("center"):
+            return
+        profile = get_device_profile(device_id)
+        cx, cy = position["center"]
+        w, h = position.get("size") or (0, 0)
+        # Região de verificação em coordenadas da referência (o executor converte com o perfil)
+        ref_cx, ref_cy = cx / profile.scale_x, cy / profile.scale_y
+        ref_w, ref_h = w / profile.scale_x, h / profile.scale_y
+        roi = [int(round(ref_cx - ref_w / 2 - ROI_MARGIN)), int(round(ref_cy - ref_h / 2 - ROI_MARGIN)),
+               int(round(ref_w + 2 * ROI_MARGIN)), int(round(ref_h + 2 * ROI_MARGIN))]
+        with self._lock:
+            key = _key(device_id, account_name)
+            previous = self._entries.get(key) or {}
+            self._entries[key] = {
+                "device_id": device_id,
+                "account": account_name,
+                "screen": [profile.width, profile.height],
+                "center": [int(cx), int(cy)],
+                "click": [int(v) for v in position.get("click", position["center"])],
+                "size": [int(w), int(h)],
+                "search_roi": roi,
+                "scroll": scroll,
+                "hits": previous.get("hits", 0),
+                "misses": 0,
+                "updated_at": time.time(),
+            }
+            self._save()
+
+    def record_hit(self, device_id, account_name):
+        self._bump(device_id, account_name, "hits")
+
+    def record_miss(self, device_id, account_name):
+        """Registra uma verificação que falhou; após MAX_MISSES seguidos a posição é descartada."""
+        self._bump(device_id, account_name, "misses")
+        entry = self.get(device_id, account_name)
+        if entry and entry.get("misses", 0) >= MAX_MISSES:
+            print(f"🗑️ Posição de login de {account_name} descartada após {MAX_MISSES} erros.")
+            self.forget(device_id, account_name)
+
+    def _bump(self, device_id, account_name, field_name):
+        with self._lock:
+            entry = self._entries.get(_key(device_id, account_name))
+            if entry is None:
+                return
+            entry[field_name] = entry.get(field_name, 0) + 1
+            if field_name == "hits":
+                entry["misses"] = 0
+            self._save()
+
+    def forget(self, device_id, account_name=None):
+        """Remove a posição de uma conta (ou, sem account_name, todas as do dispositivo)."""
+        with self._lock:
+            if account_name is not None:
+                self._entries.pop(_key(device_id, account_name), None)
+            else:
+                prefix = _key(device_id, "")
+                for key in [k for k in self._entries if k.startswith(prefix)]:
+                    del self._entries[key]
+            self._save()
+
+    def is_valid_for(self, entry, device_id):
+        """A posição só vale para a mesma resolução em que foi aprendida."""
+        profile = get_device_profile(device_id)
+        return list(entry.get("screen") or []) == [profile.width, profile.height]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_login_position_store():
+    """Instância global (arquivo JSON em settings.paths.data_folder)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LoginPositionStore()
+        return _store
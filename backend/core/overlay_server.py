@@ -5,9 +5,10 @@ e executar ações ADB no League of Kingdoms
 """
 
 import json
+import queue
 import subprocess
 import threading
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import sys
 import os
@@ -18,6 +19,8 @@ sys.path.append(backend_dir)
 
 from core.action_executor import execultar_acoes
 from core.adb_utils import capture_screen, simulate_touch
+from core.device_registry import get_device_registry
+from core.game_state import get_game_state_service, DEFAULT_PACKAGE
 
 class OverlayRequestHandler(BaseHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
@@ -31,6 +34,10 @@ class OverlayRequestHandler(BaseHTTPRequestHandler):
             self.send_status_response()
         elif parsed_path.path == '/actions':
             self.send_actions_list()
+        elif parsed_path.path == '/devices/events':
+            self.stream_device_events()
+        elif parsed_path.path == '/game_state/events':
+            self.stream_game_state_events()
         else:
             self.send_error_response(404, "Endpoint não encontrado")
     
@@ -57,10 +64,8 @@ class OverlayRequestHandler(BaseHTTPRequestHandler):
             
             print(f"Executando ação: {action_name}")
             
-            # Verificar se o ADB está disponível
-            try:
-                subprocess.run(['adb', 'devices'], capture_output=True, check=True)
-            except (subprocess.CalledProcessError, FileNotFoundError):
+            # Verificar se há dispositivo conectado (estado em memória do registro)
+            if not get_device_registry().is_online(device_id):
                 self.send_error_response(400, "ADB não encontrado ou dispositivo não conectado")
                 return
             
@@ -88,17 +93,15 @@ class OverlayRequestHandler(BaseHTTPRequestHandler):
     def handle_detect_game(self):
         """Detectar se o League of Kingdoms está aberto"""
         try:
-            # Verificar se o jogo está em primeiro plano usando ADB
-            try:
-                result = subprocess.run(['adb', 'shell', 'dumpsys', 'window', 'windows'], 
-                                      capture_output=True, text=True, check=True)
-                game_detected = "com.nhnent.SKLEAGUE" in result.stdout
-            except (subprocess.CalledProcessError, FileNotFoundError):
-                game_detected = False
+            # Estado em cache (uma chamada de shell no máximo a cada GAME_STATE_TTL s)
+            state = get_game_state_service().get(package=DEFAULT_PACKAGE)
             
             self.send_success_response({
-                'game_detected': game_detected,
-                'app_package': 'com.nhnent.SKLEAGUE'
+                'game_detected': state.foreground,
+                'app_package': DEFAULT_PACKAGE,
+                'running': state.running,
+                'screen_on': state.screen_on,
+                'foreground_package': state.foreground_package
             })
             
         except Exception as e:
@@ -110,18 +113,14 @@ class OverlayRequestHandler(BaseHTTPRequestHandler):
         try:
             print("🔍 Processando requisição /status...")
             
-            # Verificar se ADB está disponível
-            try:
-                result = subprocess.run(['adb', 'devices'], capture_output=True, text=True, check=True)
-                device_connected = 'device' in result.stdout
-                print(f"✅ ADB check: device_connected = {device_connected}")
-            except Exception as adb_error:
-                device_connected = False
-                print(f"❌ ADB error: {adb_error}")
+            # Estado dos dispositivos mantido pelo registro (track-devices): sem chamar o ADB
+            registry = get_device_registry()
+            device_connected = registry.is_online()
             
             status = {
                 'server': 'online',
                 'device_connected': device_connected,
+                'devices': registry.devices(),
                 'available_actions': ['tap', 'swipe', 'screenshot'],
                 'timestamp': 'now'
             }
@@ -136,6 +135,61 @@ class OverlayRequestHandler(BaseHTTPRequestHandler):
             traceback.print_exc()
             self.send_error_response(500, f"Erro ao obter status: {str(e)}")
     
+    def stream_device_events(self):
+        """Stream (Server-Sent Events) de conexões/desconexões de dispositivos."""
+        registry = get_device_registry()
+        events = queue.Queue()
+        unsubscribe = registry.subscribe(events.put)
+        try:
+            self.send_response(200)
+            self.send_header('Content-type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(f"event: snapshot\ndata: {json.dumps(registry.devices())}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            while True:
+                try:
+                    event = events.get(timeout=15)
+                    message = f"event: device\ndata: {json.dumps(event.to_dict())}\n\n"
+                except queue.Empty:
+                    message = ": keep-alive\n\n"
+                self.wfile.write(message.encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Cliente fechou a conexão
+        finally:
+            unsubscribe()
+    
+    def stream_game_state_events(self):
+        """Stream (Server-Sent Events) das mudanças de estado do jogo (abriu/fechou, tela apagou)."""
+        service = get_game_state_service()
+        events = queue.Queue()
+        unsubscribe = service.subscribe(lambda state: events.put(state) if state.package == DEFAULT_PACKAGE else None)
+        unwatch = service.watch(package=DEFAULT_PACKAGE)
+        try:
+            current = service.get(package=DEFAULT_PACKAGE)
+            self.send_response(200)
+            self.send_header('Content-type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(f"event: snapshot\ndata: {json.dumps(current.to_dict())}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            while True:
+                try:
+                    state = events.get(timeout=15)
+                    message = f"event: game_state\ndata: {json.dumps(state.to_dict())}\n\n"
+                except queue.Empty:
+                    message = ": keep-alive\n\n"
+                self.wfile.write(message.encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Cliente fechou a conexão
+        finally:
+            unwatch()
+            unsubscribe()
+    
     def send_actions_list(self):
         """Enviar lista de ações disponíveis"""
         try:
@@ -186,12 +240,17 @@ class OverlayRequestHandler(BaseHTTPRequestHandler):
 def start_server(host='localhost', port=8080):
     """Iniciar servidor HTTP"""
     server_address = (host, port)
-    httpd = HTTPServer(server_address, OverlayRequestHandler)
+    # Servidor com threads: o stream /devices/events não bloqueia as demais requisições
+    httpd = ThreadingHTTPServer(server_address, OverlayRequestHandler)
+    httpd.daemon_threads = True
+    get_device_registry()  # Começa a acompanhar os dispositivos antes da primeira requisição
     
     print(f"🚀 Servidor Overlay iniciado em http://{host}:{port}")
     print("📱 Endpoints disponíveis:")
     print(f"   GET  http://{host}:{port}/status - Status do servidor")
     print(f"   GET  http://{host}:{port}/actions - Lista de ações")
+    print(f"   GET  http://{host}:{port}/devices/events - Eventos de conexão (SSE)")
+    print(f"   GET  http://{host}:{port}/game_state/events - Estado do jogo (SSE)")
     print(f"   POST http://{host}:{port}/execute - Executar ação")
     print(f"   POST http://{host}:{port}/detect_game - Detectar jogo")
     print("\n🎮 Pronto para receber comandos do overlay!")
@@ -0,0 +1,445 @@
+"""
+Classificador de Telas (índice de hashes perceptuais)
+Identifica em qual tela do jogo o dispositivo está a partir de um único frame, para o
+executor pular direto para o passo certo ou executar uma rota de recuperação conhecida
+em vez de gastar tentativas/timeouts (ou apertar BACK às cegas).
+
+Estrutura em backend/actions/screens/ (settings.paths.screens_folder):
+
+    screens/
+        tela_principal/
+            frames/*.png        frames gravados da tela (python screen_classifier.py record tela_principal)
+            anchors/*.png       (opcional) recortes que só existem nessa tela, para desempate
+            screen.json         (opcional) {"routes": {"outra_tela": [passos]}, "max_distance": 12,
+                                            "require_anchor": false}
+        index.json              gerado por build_index() (hashes + ROIs das âncoras)
+
+Os passos de rota usam o formato do sequence.json: {"type": "back", "times": 1},
+{"type": "coords", "coordinates": [x, y], "click_delay": 0.5} (coordenadas na resolução de
+referência) e {"type": "wait", "duration_seconds": 1}.
+
+A classificação é um pHash (DCT 32x32 -> 64 bits) comparado por distância de Hamming com
+todos os frames gravados; âncoras só são avaliadas (em ROI pequena) quando há empate.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+import cv2
+import numpy as np
+
+try:
+    from .image_detection import load_template_gray, best_match_in_frame, _to_gray, _match_single
+    from .adb_utils import simulate_touch, simulate_back
+    from .device_profile import get_device_profile
+    from .frame_source import capture_frame
+except ImportError:
+    from image_detection import load_template_gray, best_match_in_frame, _to_gray, _match_single
+    from adb_utils import simulate_touch, simulate_back
+    from device_profile import get_device_profile
+    from frame_source import capture_frame
+
+try:
+    from backend.config.settings import settings
+except ImportError:
+    try:
+        from config.settings import settings
+    except ImportError:
+        settings = None
+
+
+# Distância de Hamming máxima (em 64 bits) para considerar a tela reconhecida
+DEFAULT_MAX_DISTANCE = 12
+# Se a segunda tela mais próxima estiver a menos disso da primeira, desempata pelas âncoras
+AMBIGUITY_MARGIN = 4
+# Margem (px, resolução de gravação) em volta da posição gravada de cada âncora
+ANCHOR_ROI_MARGIN = 40
+ANCHOR_THRESHOLD = 0.8
+
+
+def _screens_dir():
+    if settings is not None:
+        return str(settings.paths.screens_folder)
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(backend_dir, "actions", "screens")
+
+
+# ---------------------------------------------------------------------------
+# Hash perceptual
+# ---------------------------------------------------------------------------
+def phash(image):
+    """
+    Hash perceptual (pHash) de 64 bits de um frame.
+
+    Reduz para 32x32 em cinza, aplica a DCT e compara os 8x8 coeficientes de baixa frequência
+    (sem o DC) com a mediana. Robusto a escala, compressão e pequenos textos que mudam
+    (timers, contadores), sensível ao layout geral da tela.
+    """
+    gray = _to_gray(image)
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    dct = cv2.dct(small)[:8, :8].flatten()[1:]
+    bits = dct > np.median(dct)
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def _popcount64(values):
+    """Contagem de bits de um array uint64 (distância de Hamming após XOR)."""
+    as_bytes = values.view(np.uint8).reshape(-1, 8)
+    return np.unpackbits(as_bytes, axis=1).sum(axis=1)
+
+
+@dataclass
+class ScreenMatch:
+    """Resultado da classificação de um frame."""
+    name: Optional[str]
+    distance: int
+    verified: bool = False  # True se confirmado por âncora
+    elapsed_ms: float = 0.0
+
+    @property
+    def known(self) -> bool:
+        return self.name is not None
+
+
+class ScreenIndex:
+    """Índice de telas conhecidas (hashes dos frames gravados, âncoras e rotas)."""
+
+    def __init__(self, screens_dir=None):
+        self.screens_dir = screens_dir or _screens_dir()
+        self.index_path = os.path.join(self.screens_dir, "index.json")
+        self.names = []                          # nome da tela de cada hash
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.anchors = {}                        # tela -> [{"path", "roi", "size"}]
+        self.routes = {}                         # tela -> {destino: [passos]}
+        self.options = {}                        # tela -> screen.json (max_distance, require_anchor)
+
+    @property
+    def screens(self):
+        return sorted(set(self.names))
+
+    def __len__(self):
+        return len(self.names)
+
+    # --- Construção / carga ---
+    def _source_files(self):
+        files = []
+        if not os.path.isdir(self.screens_dir):
+            return files
+        for screen in sorted(os.listdir(self.screens_dir)):
+            screen_dir = os.path.join(self.screens_dir, screen)
+            if not os.path.isdir(screen_dir):
+                continue
+            for sub in ("frames", "anchors"):
+                folder = os.path.join(screen_dir, sub)
+                if os.path.isdir(folder):
+                    files.extend(os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith(".png"))
+            config = os.path.join(screen_dir, "screen.json")
+            if os.path.exists(config):
+                files.append(config)
+        return files
+
+    def is_stale(self):
+        """True se index.json não existe ou é mais antigo que algum frame/âncora/screen.json."""
+        if not os.path.exists(self.index_path):
+            return bool(self._source_files())
+        index_mtime = os.path.getmtime(self.index_path)
+        return any(os.path.getmtime(f) > index_mtime for f in self._source_files())
+
+    def build(self, save=True):
+        """Recalcula o índice a partir das pastas de telas."""
+        data = {"screens": {}}
+        if not os.path.isdir(self.screens_dir):
+            print(f"⚠️ Pasta de telas não encontrada: {self.screens_dir}")
+        else:
+            for screen in sorted(os.listdir(self.screens_dir)):
+                screen_dir = os.path.join(self.screens_dir, screen)
+                frames_dir = os.path.join(screen_dir, "frames")
+                if not os.path.isdir(frames_dir):
+                    continue
+
+                frames = [cv2.imread(os.path.join(frames_dir, f)) for f in sorted(os.listdir(frames_dir))
+                          if f.endswith(".png")]
+                frames = [f for f in frames if f is not None]
+                if not frames:
+                    continue
+
+                options = {}
+                config_path = os.path.join(screen_dir, "screen.json")
+                if os.path.exists(config_path):
+                    try:
+                        with open(config_path, "r", encoding="utf-8") as f:
+                            options = json.load(f)
+                    except (OSError, json.JSONDecodeError) as e:
+                        print(f"⚠️ screen.json inválido em '{screen}': {e}")
+
+                anchors = []
+                anchors_dir = os.path.join(screen_dir, "anchors")
+                if os.path.isdir(anchors_dir):
+                    reference = frames[0]
+                    ref_h, ref_w = reference.shape[:2]
+                    for name in sorted(os.listdir(anchors_dir)):
+                        if not name.endswith(".png"):
+                            continue
+                        path = os.path.join(anchors_dir, name)
+                        # Posição da âncora no frame gravado -> ROI pequena para a verificação
+                        score, box = best_match_in_frame(reference, path, multiscale=False)
+                        roi = None
+                        if box is not None and score >= ANCHOR_THRESHOLD:
+                            x, y, w, h = box
+                            x0, y0 = max(0, x - ANCHOR_ROI_MARGIN), max(0, y - ANCHOR_ROI_MARGIN)
+                            x1, y1 = min(ref_w, x + w + ANCHOR_ROI_MARGIN), min(ref_h, y + h + ANCHOR_ROI_MARGIN)
+                            roi = [x0, y0, x1 - x0, y1 - y0]
+                        anchors.append({"file": os.path.relpath(path, self.screens_dir).replace(os.sep, "/"),
+                                        "roi": roi, "size": [ref_w, ref_h]})
+
+                data["screens"][screen] = {
+                    "hashes": [format(phash(f), "016x") for f in frames],
+                    "anchors": anchors,
+                    "routes": options.get("routes", {}),
+                    "max_distance": options.get("max_distance", DEFAULT_MAX_DISTANCE),
+                    "require_anchor": bool(options.get("require_anchor", False)),
+                }
+
+        self._load_data(data)
+        if save and data["screens"]:
+            with open(self.index_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            print(f"✅ Índice de telas salvo: {len(data['screens'])} telas, {len(self.names)} frames")
+        return self
+
+    def load(self):
+        """Carrega index.json (reconstruindo se estiver desatualizado)."""
+        if self.is_stale():
+            return self.build(save=True)
+        if not os.path.exists(self.index_path):
+            return self  # Nenhuma tela gravada ainda: índice vazio
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self._load_data(json.load(f))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ Erro ao ler {self.index_path}: {e}. Reconstruindo...")
+            self.build(save=True)
+        return self
+
+    def _load_data(self, data):
+        names, hashes = [], []
+        self.anchors, self.routes, self.options = {}, {}, {}
+        for screen, entry in data.get("screens", {}).items():
+            for value in entry.get("hashes", []):
+                names.append(screen)
+                hashes.append(int(value, 16))
+            self.anchors[screen] = [
+                {"path": os.path.join(self.screens_dir, a["file"]), "roi": a.get("roi"), "size": a.get("size")}
+                for a in entry.get("anchors", [])
+            ]
+            self.routes[screen] = entry.get("routes", {})
+            self.options[screen] = {"max_distance": entry.get("max_distance", DEFAULT_MAX_DISTANCE),
+                                    "require_anchor": entry.get("require_anchor", False)}
+        self.names = names
+        self.hashes = np.array(hashes, dtype=np.uint64)
+
+    # --- Classificação ---
+    def _verify_anchor(self, gray, screen):
+        """True se alguma âncora da tela for encontrada (na ROI gravada, escalada para o frame)."""
+        for anchor in self.anchors.get(screen, []):
+            template = load_template_gray(anchor["path"])
+            if template is None:
+                continue
+            region = gray
+            roi, size = anchor.get("roi"), anchor.get("size")
+            if roi and size:
+                sx, sy = gray.shape[1] / float(size[0]), gray.shape[0] / float(size[1])
+                x, y, w, h = int(roi[0] * sx), int(roi[1] * sy), int(roi[2] * sx), int(roi[3] * sy)
+                region = gray[y:y + h, x:x + w]
+                if abs(sx - 1.0) > 0.02 or abs(sy - 1.0) > 0.02:
+                    template = cv2.resize(template, None, fx=sx, fy=sy, interpolation=cv2.INTER_AREA)
+            score, _ = _match_single(region, template)
+            if score >= ANCHOR_THRESHOLD:
+                return True
+        return False
+
+    def classify(self, frame):
+        """
+        Identifica a tela de um frame.
+
+        Returns:
+            ScreenMatch: name=None se nenhuma tela conhecida estiver perto o suficiente.
+        """
+        start = time.perf_counter()
+        if frame is None or len(self.names) == 0:
+            return ScreenMatch(None, 64, elapsed_ms=(time.perf_counter() - start) * 1000)
+
+        gray = _to_gray(frame)
+        distances = _popcount64(self.hashes ^ np.uint64(phash(gray)))
+
+        # Menor distância por tela, em ordem crescente
+        best = {}
+        for name, distance in zip(self.names, distances.tolist()):
+            if distance < best.get(name, 65):
+                best[name] = distance
+        ranked = sorted(best.items(), key=lambda item: item[1])
+
+        result = ScreenMatch(None, ranked[0][1])
+        candidates = [(n, d) for n, d in ranked if d <= self.options[n]["max_distance"]]
+        if candidates:
+            top_name, top_distance = candidates[0]
+            ambiguous = [(n, d) for n, d in candidates if d - top_distance < AMBIGUITY_MARGIN]
+            if len(ambiguous) == 1 and not self.options[top_name]["require_anchor"]:
+                result = ScreenMatch(top_name, top_distance)
+            else:
+                # Empate (ou tela que exige âncora): a primeira candidata com âncora confirmada vence
+                # Sem âncora confirmada, a tela fica como desconhecida (melhor que um palpite errado)
+                for name, distance in ambiguous:
+                    if self.anchors.get(name) and self._verify_anchor(gray, name):
+                        result = ScreenMatch(name, distance, verified=True)
+                        break
+
+        result.elapsed_ms = (time.perf_counter() - start) * 1000
+        return result
+
+    # --- Rotas ---
+    def find_route(self, from_screen, to_screen):
+        """Menor sequência de passos (BFS nas rotas de screen.json) de uma tela para outra, ou None."""
+        if from_screen == to_screen:
+            return []
+        queue = deque([(from_screen, [])])
+        visited = {from_screen}
+        while queue:
+            screen, steps = queue.popleft()
+            for target, route in self.routes.get(screen, {}).items():
+                if target in visited:
+                    continue
+                if target == to_screen:
+                    return steps + list(route)
+                visited.add(target)
+                queue.append((target, steps + list(route)))
+        return None
+
+
+_index = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+# Intervalo mínimo entre verificações de mudança nas pastas de telas (listar arquivos custa mais que classificar)
+_STALE_CHECK_INTERVAL = 5.0
+
+
+def get_screen_index(reload=False):
+    """Índice global, carregado sob demanda (e recarregado se as pastas de telas mudarem)."""
+    global _index, _index_checked_at
+    with _index_lock:
+        now = time.monotonic()
+        if _index is None or reload:
+            _index = ScreenIndex().load()
+            _index_checked_at = now
+        elif now - _index_checked_at > _STALE_CHECK_INTERVAL:
+            _index_checked_at = now
+            if _index.is_stale():
+                _index = ScreenIndex().load()
+        return _index
+
+
+def screen_index_available():
+    """True se existe ao menos uma tela gravada."""
+    return len(get_screen_index()) > 0
+
+
+def classify_screen(frame):
+    """Identifica a tela do frame usando o índice global."""
+    return get_screen_index().classify(frame)
+
+
+def execute_route(steps, device_id=None):
+    """Executa os passos de uma rota (back/coords/wait)."""
+    profile = get_device_profile(device_id)
+    for step in steps:
+        step_type = step.get("type")
+        if step_type == "back":
+            simulate_back(device_id, times=int(step.get("times", 1)), delay=float(step.get("delay", 0.3)))
+        elif step_type == "coords":
+            coords = step.get("coordinates")
+            if isinstance(coords, list) and len(coords) == 2:
+                x, y = profile.from_reference(coords[0], coords[1])
+                simulate_touch(x, y, device_id=device_id)
+            time.sleep(float(step.get("click_delay", 0.5)))
+        elif step_type == "wait":
+            time.sleep(float(step.get("duration_seconds", 0.5)))
+        elif step_type and not step_type.startswith("#"):
+            print(f"⚠️ Passo de rota '{step_type}' não suportado (use back/coords/wait).")
+
+
+def recover_to_screen(target_screen, device_id=None, frame=None, max_hops=3):
+    """
+    Leva o dispositivo até uma tela conhecida usando as rotas gravadas.
+
+    Args:
+        target_screen (str): Nome da tela de destino.
+        device_id (str, optional): ID do dispositivo.
+        frame (numpy.ndarray, optional): Frame atual (evita uma captura).
+        max_hops (int): Máximo de rotas executadas (re-classificando entre elas).
+
+    Returns:
+        bool: True se o dispositivo terminou na tela de destino.
+    """
+    index = get_screen_index()
+    if len(index) == 0:
+        return False  # Nenhuma tela gravada: o chamador usa o fallback dele
+    for _ in range(max_hops):
+        if frame is None:
+            frame = capture_frame(device_id).image
+        current = index.classify(frame)
+        if current.name == target_screen:
+            return True
+        if not current.known:
+            print(f"❓ Tela atual desconhecida (distância {current.distance}); sem rota para '{target_screen}'.")
+            return False
+        route = index.find_route(current.name, target_screen)
+        if route is None:
+            print(f"⚠️ Sem rota conhecida de '{current.name}' para '{target_screen}'.")
+            return False
+        print(f"🧭 Recuperação: '{current.name}' -> '{target_screen}' ({len(route)} passos)")
+        execute_route(route, device_id)
+        frame = None
+    return index.classify(capture_frame(device_id).image).name == target_screen
+
+
+def record_screen(screen_name, device_id=None):
+    """Captura o frame atual e salva em screens/<tela>/frames/ (reconstrua o índice depois)."""
+    frame = capture_frame(device_id)
+    if not frame.ok:
+        print("❌ Falha ao capturar a tela.")
+        return None
+    frames_dir = os.path.join(_screens_dir(), screen_name, "frames")
+    os.makedirs(frames_dir, exist_ok=True)
+    path = os.path.join(frames_dir, f"{int(time.time())}.png")
+    cv2.imwrite(path, frame.image)
+    print(f"💾 Frame da tela '{screen_name}' salvo em {path}")
+    return path
+
+
+if __name__ == '__main__':
+    import sys
+
+    # Uso:
+    #   python screen_classifier.py build
+    #   python screen_classifier.py record <nome_da_tela> [device_id]
+    #   python screen_classifier.py classify [device_id | arquivo.png]
+    command = sys.argv[1] if len(sys.argv) > 1 else "classify"
+    if command == "build":
+        ScreenIndex().build(save=True)
+    elif command == "record" and len(sys.argv) > 2:
+        record_screen(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+    elif command == "classify":
+        arg = sys.argv[2] if len(sys.argv) > 2 else None
+        image = cv2.imread(arg) if arg and arg.endswith(".png") else capture_frame(arg).image
+        match = classify_screen(image)
+        print(f"Tela: {match.name or 'desconhecida'} | distância {match.distance} | "
+              f"âncora {'sim' if match.verified else 'não'} | {match.elapsed_ms:.1f} ms")
+    else:
+        print("Uso: python screen_classifier.py [build | record <tela> [device] | classify [device|arquivo.png]]")
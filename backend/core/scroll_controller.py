@@ -0,0 +1,206 @@
+"""
+Controlador de Scroll em Malha Fechada
+Executa um swipe e acompanha, frame a frame, quanto a lista realmente andou (correlação de fase,
+scroll_tracking). Retorna assim que o movimento para, informa o deslocamento alcançado e, se ficou
+aquém ou passou do alvo, faz um mini-swipe de correção.
+
+O simulate_scroll é de malha aberta: dispara o swipe e dorme delay_after_scroll (0.5-0.8 s) sem
+saber se a lista parou nem quanto andou. Aqui a espera termina quando dois frames seguidos mostram
+a lista parada, e o ganho medido (px andados por px de swipe) de cada dispositivo é guardado para
+dimensionar os próximos swipes. O gesto padrão é o arrasto sem inércia (adb_utils.simulate_drag):
+a lista para sob o dedo, então a correção quase nunca é necessária.
+
+Uso em sequence.json (action_before_find):
+    {"type": "scroll_to_offset", "offset": 450, "duration_ms": 600,
+     "roi": [0, 220, 2400, 860], "tolerance": 25, "max_corrections": 2}
+    (valores na resolução de referência; offset > 0 = a lista avança, o conteúdo sobe na tela)
+"""
+import math
+import threading
+import time
+from dataclasses import dataclass
+
+try:
+    from .adb_utils import simulate_drag
+    from .device_profile import get_device_profile
+    from .frame_source import capture_frame
+    from .scroll_tracking import measure_scroll, STALL_PX, MIN_RESPONSE
+    from .flight_recorder import record_event
+except ImportError:
+    from adb_utils import simulate_drag
+    from device_profile import get_device_profile
+    from frame_source import capture_frame
+    from scroll_tracking import measure_scroll, STALL_PX, MIN_RESPONSE
+    from flight_recorder import record_event
+
+
+MIN_SWIPE = 30        # px (dispositivo): swipes menores ficam dentro da tolerância de toque e não rolam
+SETTLE_FRAMES = 2     # Medidas seguidas sem movimento para considerar a lista parada
+SETTLE_TIMEOUT = 2.0  # Segundos máximos esperando a lista parar depois de um swipe
+DEFAULT_GAIN = 1.0    # px andados por px de arrasto antes da primeira medida (sem inércia a lista acompanha o dedo)
+MAX_STEP = 0.45       # Fração da altura da lista por swipe: frames antes/depois com mais da metade em comum
+
+
+@dataclass
+class ScrollResult:
+    """Resultado de um scroll controlado (px do dispositivo)."""
+    target: float
+    achieved: float
+    swipes: int
+    settled: bool   # False se a lista ainda se movia no fim do tempo (ou a medida falhou)
+    elapsed: float
+
+    @property
+    def error(self) -> float:
+        return self.target - self.achieved
+
+
+class ScrollController:
+    """
+    Scroll com medida do deslocamento real e correção.
+
+    Exemplo:
+        controller = get_scroll_controller(device_id)
+        result = controller.scroll_to_offset(450, roi=(0, 220, 2400, 860))
+        print(result.achieved, result.swipes)
+    """
+
+    def __init__(self, device_id=None, swipe=None):
+        """swipe(start, end, duration_ms), opcional: substitui o arrasto padrão (ex.: 'input swipe')."""
+        self.device_id = device_id
+        self._swipe = swipe
+        self.gain = DEFAULT_GAIN
+        self._lock = threading.Lock()
+
+    def _do_swipe(self, start, end, duration_ms):
+        if self._swipe is not None:
+            self._swipe(start, end, duration_ms)
+        else:
+            simulate_drag(start, end, self.device_id)
+
+    def _frame(self, frame_source=None, not_before=None):
+        if frame_source is not None:
+            frame = frame_source.wait_next(not_before if not_before is not None else time.monotonic())
+            if frame is not None:
+                return frame.image
+        return capture_frame(self.device_id).image
+
+    def _swipe_coords(self, length, roi, screen_height, x=None):
+        """
+        Swipe de length px (positivo = conteúdo sobe) centrado na região da lista, com as duas
+        pontas dentro da tela (um ganho medido baixo pode pedir um swipe maior que a tela).
+        """
+        rx, ry, rw, rh = roi
+        x = rx + rw // 2 if x is None else x
+        center_y = ry + rh // 2
+        half = int(round(length / 2.0))
+        limit = min(center_y, screen_height - 1 - center_y)
+        half = max(-limit, min(limit, half))
+        return [x, center_y + half], [x, center_y - half]
+
+    def _settle(self, baseline, roi, expected, frame_source, abort_event, timeout):
+        """
+        Acompanha a lista depois do swipe até ela parar.
+
+        Returns:
+            tuple: (deslocamento desde baseline, parou, último frame). O primeiro frame é comparado
+                   com baseline (desempatado por expected); os seguintes com o frame anterior, em
+                   que o movimento é pequeno.
+        """
+        deadline = time.monotonic() + timeout
+        previous = baseline
+        moved, still, first = 0.0, 0, True
+        while time.monotonic() < deadline:
+            if abort_event is not None and abort_event.is_set():
+                return moved, False, previous
+            frame = self._frame(frame_source)
+            if frame is None:
+                return moved, False, previous
+            dy, response = measure_scroll(previous, frame, roi, expected=expected if first else None)
+            if response < MIN_RESPONSE:
+                return moved, False, previous  # A tela mudou: não dá para seguir medindo
+            moved += dy
+            previous = frame
+            if not first and abs(dy) < STALL_PX:
+                still += 1
+                if still >= SETTLE_FRAMES - 1:
+                    return moved, True, frame
+            else:
+                still = 0
+            first = False
+        return moved, False, previous
+
+    def scroll_to_offset(self, offset, roi=None, duration_ms=500, tolerance=None, max_corrections=2,
+                         x=None, frame_source=None, abort_event=None, timeout=SETTLE_TIMEOUT):
+        """
+        Rola a lista offset px (dispositivo; positivo = a lista avança) e corrige o erro.
+
+        Args:
+            offset (float): Deslocamento desejado do conteúdo.
+            roi (tuple, optional): Região (x, y, w, h) da lista; padrão: a tela inteira.
+            duration_ms (int): Duração de cada swipe (só com swipe próprio; o arrasto não tem inércia).
+            tolerance (float, optional): Erro aceito; padrão 25 px de referência.
+            max_corrections (int): Mini-swipes de correção depois do swipe principal.
+            x (int, optional): Coluna do swipe; padrão: centro da região.
+            frame_source (SharedFrameSource, optional): Frames da captura contínua.
+            abort_event (threading.Event, optional): Interrompe o acompanhamento.
+
+        Returns:
+            ScrollResult
+        """
+        profile = get_device_profile(self.device_id)
+        if roi is None:
+            roi = (0, 0, profile.width, profile.height)
+        if tolerance is None:
+            tolerance = profile.length(25)
+        max_step = roi[3] * MAX_STEP
+        steps = max(1, int(math.ceil(abs(offset) / max_step)))
+        started = time.monotonic()
+        baseline = self._frame(frame_source)
+        achieved, swipes, settled = 0.0, 0, True
+
+        for _ in range(steps + max(0, int(max_corrections))):
+            remaining = offset - achieved
+            if baseline is None or (swipes and abs(remaining) <= tolerance):
+                break
+            # Passos longos são divididos: deslocamentos acima de MAX_STEP da região não são medidos com segurança
+            length = max(-max_step, min(max_step, remaining)) / self.gain
+            if abs(length) < MIN_SWIPE:
+                break
+            start, end = self._swipe_coords(length, roi, profile.height, x)
+            length = float(start[1] - end[1])  # Comprimento real depois de limitado à tela
+            if abs(length) < MIN_SWIPE:
+                break
+            swiped_at = time.monotonic()
+            self._do_swipe(start, end, duration_ms)
+            swipes += 1
+            moved, settled, baseline = self._settle(baseline, roi, length * self.gain, frame_source, abort_event,
+                                                    timeout + duration_ms / 1000.0)
+            achieved += moved
+            if settled and abs(moved) >= STALL_PX:
+                self._learn(moved / length)
+            record_event(self.device_id, "scroll_measured", target=round(remaining, 1), swipe=round(length, 1),
+                         moved=round(moved, 1), settled=settled, seconds=round(time.monotonic() - swiped_at, 3))
+            if not settled:
+                break
+
+        return ScrollResult(float(offset), float(achieved), swipes, settled, time.monotonic() - started)
+
+    def _learn(self, gain):
+        """Média móvel do ganho medido (ignora medidas absurdas, ex.: fim da lista)."""
+        if 0.2 <= gain <= 5.0:
+            with self._lock:
+                self.gain = 0.7 * self.gain + 0.3 * gain
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_scroll_controller(device_id=None):
+    """Controlador do dispositivo (o ganho aprendido vale para o processo todo)."""
+    with _controllers_lock:
+        controller = _controllers.get(device_id)
+        if controller is None:
+            controller = _controllers[device_id] = ScrollController(device_id)
+        return controller
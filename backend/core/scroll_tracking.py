@@ -0,0 +1,165 @@
+"""
+Rastreamento de Scroll por Correlação de Fase
+Mede quanto o conteúdo de uma lista andou entre dois frames (correlação de fase via FFT) e guarda as
+linhas vistas em coordenadas absolutas da lista.
+
+Os swipes do ADB não andam exatamente a distância pedida (inércia, aceleração, fim da lista):
+contar "N scrolls de 230 px" erra a posição conforme a lista cresce. Aqui cada frame capturado
+depois de um scroll é comparado com o anterior; o deslocamento medido converte o y de cada linha
+na tela em posição na lista, e um deslocamento ~0 indica que a lista chegou ao fim.
+
+Exemplo:
+    index = ListIndex(roi=(0, 200, 2400, 880), merge_distance=115)
+    index.measure(frame)                 # primeiro frame: referência (offset 0)
+    index.add_rows([340, 570, 800])      # y das linhas na tela
+    simulate_scroll(...)
+    moved = index.measure(novo_frame)    # quanto a lista avançou (None se a tela mudou)
+    index.screen_y(index.rows[3])        # onde a 4ª linha está na tela agora
+"""
+import bisect
+
+import cv2
+import numpy as np
+
+
+MIN_RESPONSE = 0.05  # Pico da correlação abaixo disso: frames sem relação (a tela mudou)
+STALL_PX = 3         # Deslocamento menor que isso (px do dispositivo): lista parada
+MEASURE_SCALE = 0.5  # Redução antes da correlação (a medida volta multiplicada)
+STALL_RESPONSE = 0.8   # Pico em ~0 com esta altura: frames praticamente iguais (lista não andou)
+NEAR_PEAK_RATIO = 0.3  # Pico perto do esperado vence o global se tiver ao menos esta fração da altura
+
+
+def _prepare(image, roi, scale):
+    if roi is not None:
+        x, y, w, h = roi
+        image = image[y:y + h, x:x + w]
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    if scale != 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return np.float32(gray)
+
+
+def _vertical_correlation(a, b):
+    """Superfície de correlação de fase reduzida ao eixo vertical: valor por deslocamento dy."""
+    window = cv2.createHanningWindow((a.shape[1], a.shape[0]), cv2.CV_32F)
+    cross = np.fft.rfft2(a * window) * np.conj(np.fft.rfft2(b * window))
+    cross /= np.abs(cross) + 1e-9
+    surface = np.fft.irfft2(cross, s=a.shape)
+    # Scroll vertical: só as colunas de deslocamento horizontal ~0 interessam
+    return np.max(surface[:, [0, 1, -1]], axis=1)
+
+
+def _peak(profile, candidates):
+    """Melhor deslocamento (com ajuste sub-pixel por parábola) entre os índices candidatos."""
+    i = int(candidates[np.argmax(profile[candidates])])
+    n = len(profile)
+    left, center, right = profile[(i - 1) % n], profile[i], profile[(i + 1) % n]
+    denominator = left - 2 * center + right
+    shift = 0.5 * (left - right) / denominator if denominator else 0.0
+    dy = i if i <= n // 2 else i - n
+    return dy + shift, float(center)
+
+
+def measure_scroll(previous, current, roi=None, expected=None, tolerance=None, scale=MEASURE_SCALE):
+    """
+    Deslocamento vertical do conteúdo entre dois frames.
+
+    Linhas de lista são parecidas entre si, então a correlação também tem picos a cada altura de
+    linha. Com expected (distância pedida ao swipe), o pico dentro de expected ± tolerance é
+    preferido, a menos que o pico global seja bem mais forte ou os frames sejam praticamente
+    iguais (lista parada no fim).
+
+    Args:
+        previous, current (numpy.ndarray): Frames (BGR ou cinza) do mesmo tamanho.
+        roi (tuple, optional): Região (x, y, w, h) da lista; fora dela (cabeçalho, abas) não rola.
+        expected (float, optional): Deslocamento esperado (px do dispositivo).
+        tolerance (float, optional): Janela em torno de expected (padrão: 40% de expected).
+        scale (float): Redução aplicada antes da correlação.
+
+    Returns:
+        tuple: (dy, response). dy > 0 quando o conteúdo subiu na tela (a lista avançou);
+               response é a altura do pico (0.0 se não deu para medir).
+    """
+    a = _prepare(previous, roi, scale)
+    b = _prepare(current, roi, scale)
+    if a.shape != b.shape or min(a.shape) < 16:
+        return 0.0, 0.0
+    profile = _vertical_correlation(a, b)
+    n = len(profile)
+    dy, response = _peak(profile, np.arange(n))
+    if expected is not None:
+        tolerance = abs(expected) * 0.4 if tolerance is None else tolerance
+        shifts = np.where(np.arange(n) <= n // 2, np.arange(n), np.arange(n) - n)
+        near = np.flatnonzero(np.abs(shifts - expected * scale) <= tolerance * scale)
+        stalled = abs(dy) < STALL_PX * scale and response >= STALL_RESPONSE
+        if len(near) and not stalled and abs(dy - expected * scale) > tolerance * scale:
+            near_dy, near_response = _peak(profile, near)
+            if near_response >= NEAR_PEAK_RATIO * response:
+                dy, response = near_dy, near_response
+    return float(dy / scale), response
+
+
+class ListIndex:
+    """
+    Linhas de uma lista rolável em coordenadas absolutas.
+
+    A origem (offset 0) é o primeiro frame medido depois de reset(): y absoluto = y na tela
+    + quanto a lista avançou desde então. As linhas ficam ordenadas de cima para baixo e linhas
+    vistas de novo (em frames diferentes) são fundidas pela distância.
+
+    Args:
+        roi (tuple, optional): Região (x, y, w, h) da lista na tela.
+        merge_distance (float): Linhas mais próximas que isso (px) são a mesma linha.
+        anchor (tuple, optional): Caixa (x, y, w, h) do elemento fixo acima da lista (cabeçalho).
+    """
+
+    def __init__(self, roi=None, merge_distance=50, anchor=None):
+        self.roi = roi
+        self.anchor = anchor
+        self.merge_distance = merge_distance
+        self.rows = []
+        self.offset = 0.0
+        self._last = None
+
+    def reset(self):
+        """Lista de volta ao topo (ex.: tela reaberta): o próximo frame medido é a nova origem."""
+        self.offset = 0.0
+        self._last = None
+
+    def measure(self, frame, expected=None):
+        """
+        Compara o frame com o anterior e acumula o deslocamento.
+
+        Args:
+            expected (float, optional): Distância pedida ao swipe (desempata picos repetidos).
+
+        Returns:
+            float: Quanto a lista avançou desde o frame anterior (0.0 no primeiro frame), ou
+                   None se os frames não se correspondem (a tela mudou); o offset fica como estava.
+        """
+        if self._last is None:
+            self._last = frame
+            return 0.0
+        dy, response = measure_scroll(self._last, frame, self.roi, expected=expected)
+        if response < MIN_RESPONSE:
+            return None
+        self._last = frame
+        self.offset += dy
+        return dy
+
+    def add_rows(self, screen_ys):
+        """Registra linhas vistas no frame atual (y na tela). Retorna quantas eram novas."""
+        added = 0
+        for y in screen_ys:
+            absolute = y + self.offset
+            i = bisect.bisect_left(self.rows, absolute)
+            near = [self.rows[j] for j in (i - 1, i) if 0 <= j < len(self.rows)]
+            if any(abs(r - absolute) <= self.merge_distance for r in near):
+                continue
+            self.rows.insert(i, absolute)
+            added += 1
+        return added
+
+    def screen_y(self, absolute_y):
+        """Posição atual na tela de um y absoluto."""
+        return int(round(absolute_y - self.offset))
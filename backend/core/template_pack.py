@@ -0,0 +1,418 @@
+"""
+Pacote Compilado de Templates (memory-mapped)
+Compila todos os PNGs de actions/templates num único arquivo binário, lido com np.memmap.
+
+Cada processo (API, overlay, scripts de utils/, workers do pool de detecção) decodificava os
+mesmos PNGs por conta própria. Com o pacote, o template em tons de cinza é só uma view do
+arquivo mapeado: não há decodificação na carga e as páginas são compartilhadas pelo sistema
+operacional entre todos os processos que abrem o mesmo pacote.
+
+Conteúdo:
+    templates.pack       cabeçalho (hash e tamanho, conferidos com o índice ao abrir) e arrays uint8
+                         contíguos (alinhados em 64 bytes): template em cinza, máscara (canal alfa
+                         ou arquivo <nome>_mask.png) e versões pré-escaladas
+    templates.pack.json  índice: offset/forma de cada array, mtime/tamanho/sha1 do PNG de origem
+                         (e mtime/tamanho da máscara <nome>_mask.png), passos do sequence.json que
+                         usam o template e o hash do conteúdo todo
+
+Um template só é lido do pacote se o PNG e a máscara separada não mudaram desde a compilação
+(mtime e tamanho iguais; máscara criada ou apagada também conta); senão image_detection decodifica
+o PNG como antes. Recompile depois de recapturar templates:
+
+    python template_pack.py build [--resolution 1600x720 ...]
+    python template_pack.py info
+
+Local: settings.paths.data_folder / "templates.pack" (ativação: DetectionSettings.template_pack).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+try:
+    from backend.config.settings import settings
+except ImportError:
+    try:
+        from config.settings import settings
+    except ImportError:
+        settings = None
+
+
+PACK_VERSION = 3  # 2: mtime/tamanho do <nome>_mask.png no índice; 3: cabeçalho com o hash do índice
+ALIGNMENT = 64              # Offsets alinhados para leitura vetorizada direto do mapeamento
+PACK_MAGIC = b"ATDPACK\0"  # Cabeçalho: magic (8) + sha256 do conteúdo (32) + bytes (8), em HEADER_SIZE bytes
+HEADER_SIZE = 64
+MASK_SUFFIX = "_mask.png"   # Máscara em arquivo separado (branco = pixel considerado)
+# Campos do passo do sequence.json guardados como metadados do template
+STEP_FIELDS = ("name", "action_on_found", "click_offset", "search_roi", "screen", "wait_for_template",
+               "wait_timeout", "max_attempts", "threshold")
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _templates_dir():
+    if settings is not None:
+        return str(settings.paths.actions_folder)
+    return os.path.join(_BACKEND_DIR, "actions", "templates")
+
+
+def _default_pack_path():
+    if settings is not None:
+        return str(settings.paths.data_folder / "templates.pack")
+    return os.path.join(os.path.dirname(_BACKEND_DIR), "data", "templates.pack")
+
+
+def pack_enabled():
+    if settings is None:
+        return True
+    return bool(getattr(settings.detection, "template_pack", True))
+
+
+def _scale_key(scale):
+    return f"{round(float(scale), 3):.3f}"
+
+
+def _read_template(path):
+    """(cinza, máscara ou None) do PNG, com o mesmo resultado de cv2.imread + BGR2GRAY."""
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        return None, None
+    mask = None
+    if image.dtype != np.uint8:
+        image = cv2.imread(path)  # 16 bits: converte como o carregamento normal
+    if image.ndim == 2:
+        gray = image
+    elif image.shape[2] == 4:
+        alpha = image[:, :, 3]
+        if alpha.min() < 255:
+            mask = np.where(alpha > 0, 255, 0).astype(np.uint8)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+    else:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    companion = mask_file_for(path)
+    if os.path.exists(companion):
+        mask = _read_mask_file(companion, gray.shape)
+    return gray, mask
+
+
+def mask_file_for(template_path):
+    """Caminho da máscara separada do template (<nome>_mask.png)."""
+    return template_path[:-4] + MASK_SUFFIX
+
+
+def _read_mask_file(mask_path, shape):
+    """Máscara binária (0/255) do arquivo, ou None se ilegível, de outro tamanho ou toda branca."""
+    loaded = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
+    if loaded is None or loaded.shape != tuple(shape[:2]):
+        print(f"⚠️ Máscara ignorada (ilegível ou tamanho diferente do template): {mask_path}")
+        return None
+    mask = np.where(loaded > 127, 255, 0).astype(np.uint8)
+    return mask if mask.min() == 0 else None
+
+
+def _mask_file_stat(template_path):
+    """{"mtime_ns", "size"} da máscara separada do template, ou None se ela não existe."""
+    try:
+        stat = os.stat(mask_file_for(template_path))
+    except OSError:
+        return None
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _scaled(gray, scale):
+    th, tw = gray.shape[:2]
+    new_w, new_h = int(round(tw * scale)), int(round(th * scale))
+    if new_w < 8 or new_h < 8:
+        return None
+    interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+    return cv2.resize(gray, (new_w, new_h), interpolation=interpolation)
+
+
+def _sequence_metadata(templates_dir):
+    """relpath do template -> passos do sequence.json (da mesma ação) que o usam."""
+    metadata = {}
+    for action in sorted(os.listdir(templates_dir)):
+        sequence_path = os.path.join(templates_dir, action, "sequence.json")
+        if not os.path.isfile(sequence_path):
+            continue
+        try:
+            with open(sequence_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ sequence.json inválido em '{action}': {e}")
+            continue
+        steps = data.get("sequence", []) if isinstance(data, dict) else data
+        for number, step in enumerate(steps if isinstance(steps, list) else [], start=1):
+            if not isinstance(step, dict) or not step.get("template_file"):
+                continue
+            info = {"action": action, "step": number}
+            info.update({k: step[k] for k in STEP_FIELDS if k in step})
+            metadata.setdefault(f"{action}/{step['template_file']}", []).append(info)
+    return metadata
+
+
+def build_pack(templates_dir=None, pack_path=None, resolutions=None):
+    """
+    Compila os templates num pacote.
+
+    Args:
+        templates_dir (str, optional): Pasta de templates (padrão: settings.paths.actions_folder).
+        pack_path (str, optional): Arquivo de saída (padrão: data/templates.pack).
+        resolutions (list, optional): Resoluções (largura, altura) das telas em uso; as escalas de
+                                      cada uma (get_scales_for_resolution) são pré-calculadas.
+                                      Padrão: resolução de referência.
+
+    Returns:
+        dict: Índice gravado em <pack>.json.
+    """
+    try:
+        from .image_detection import get_scales_for_resolution
+    except ImportError:
+        from image_detection import get_scales_for_resolution
+
+    templates_dir = templates_dir or _templates_dir()
+    pack_path = pack_path or _default_pack_path()
+    if not resolutions:
+        resolutions = [tuple(settings.detection.reference_resolution) if settings is not None else (2400, 1080)]
+    scales = sorted({s for resolution in resolutions for s in get_scales_for_resolution(tuple(resolution))})
+
+    sources = []
+    for root, dirs, files in os.walk(templates_dir):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.endswith(".png") and not filename.endswith(MASK_SUFFIX):
+                sources.append(os.path.join(root, filename))
+
+    metadata = _sequence_metadata(templates_dir)
+    entries = {}
+    content_hash = hashlib.sha256()
+    content_hash.update(json.dumps(scales).encode("utf-8"))  # As escalas também mudam o layout
+    os.makedirs(os.path.dirname(pack_path) or ".", exist_ok=True)
+    tmp_path = pack_path + ".tmp"
+    tmp_index_path = pack_path + ".json.tmp"
+    offset = HEADER_SIZE
+
+    with open(tmp_path, "wb") as out:
+        out.write(b"\0" * HEADER_SIZE)  # Preenchido no fim, quando o hash é conhecido
+
+        def write_array(array):
+            nonlocal offset
+            padding = (-offset) % ALIGNMENT
+            out.write(b"\0" * padding)
+            offset += padding
+            array = np.ascontiguousarray(array, dtype=np.uint8)
+            out.write(array.tobytes())
+            record = {"offset": offset, "shape": list(array.shape)}
+            offset += array.nbytes
+            return record
+
+        for path in sources:
+            gray, mask = _read_template(path)
+            if gray is None:
+                print(f"⚠️ Template ilegível ignorado: {path}")
+                continue
+            rel = os.path.relpath(path, templates_dir).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                raw = f.read()
+            content_hash.update(rel.encode("utf-8"))
+            content_hash.update(raw)
+            mask_file = _mask_file_stat(path)
+            if mask_file is not None:
+                with open(mask_file_for(path), "rb") as f:
+                    content_hash.update(f.read())
+            stat = os.stat(path)
+            entry = {
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "sha1": hashlib.sha1(raw).hexdigest(),
+                "mask_file": mask_file,
+                "gray": write_array(gray),
+                "mask": write_array(mask) if mask is not None else None,
+                "scales": {},
+                "steps": metadata.get(rel, []),
+            }
+            for scale in scales:
+                if scale == 1.0:
+                    continue
+                scaled = _scaled(gray, scale)
+                if scaled is not None:
+                    entry["scales"][_scale_key(scale)] = write_array(scaled)
+            entries[rel] = entry
+
+        out.seek(0)
+        out.write(_header(content_hash.digest(), offset))
+
+    index = {
+        "version": PACK_VERSION,
+        "hash": content_hash.hexdigest(),
+        "created_at": time.time(),
+        "resolutions": [list(r) for r in resolutions],
+        "bytes": offset,
+        "templates": entries,
+    }
+    with open(tmp_index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1, ensure_ascii=False)
+    # Pacote e índice trocados um depois do outro: quem abrir (ou um crash) entre as duas trocas vê
+    # um par desencontrado, que TemplatePack recusa pelo cabeçalho (hash/tamanho diferentes do índice)
+    try:
+        os.replace(tmp_path, pack_path)
+    except OSError as e:
+        # Windows não substitui arquivo mapeado: feche os processos que estão usando o pacote
+        os.remove(tmp_path)
+        os.remove(tmp_index_path)
+        raise OSError(f"Não foi possível substituir {pack_path} (em uso por outro processo?): {e}") from e
+    os.replace(tmp_index_path, pack_path + ".json")
+    print(f"📦 Pacote de templates: {len(entries)} templates, {offset / 1024:.0f} KB, "
+          f"escalas {scales} -> {pack_path}")
+    return index
+
+
+def _header(digest, total_bytes):
+    header = PACK_MAGIC + digest + int(total_bytes).to_bytes(8, "little")
+    return header + b"\0" * (HEADER_SIZE - len(header))
+
+
+def _read_header(pack_path):
+    """(hash hex, bytes) do cabeçalho do pacote, ou (None, None) se não é um pacote válido."""
+    with open(pack_path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or not header.startswith(PACK_MAGIC):
+        return None, None
+    start = len(PACK_MAGIC)
+    return header[start:start + 32].hex(), int.from_bytes(header[start + 32:start + 40], "little")
+
+
+class TemplatePack:
+    """
+    Pacote compilado aberto com np.memmap (somente leitura).
+
+    Exemplo:
+        pack = get_template_pack()
+        gray = pack.gray(template_path) if pack else None   # None se o PNG mudou ou não está no pacote
+    """
+
+    def __init__(self, pack_path=None, templates_dir=None):
+        self.pack_path = pack_path or _default_pack_path()
+        self.templates_dir = os.path.abspath(templates_dir or _templates_dir())
+        with open(self.pack_path + ".json", "r", encoding="utf-8") as f:
+            self.index = json.load(f)
+        if self.index.get("version") != PACK_VERSION:
+            raise ValueError(f"versão do pacote {self.index.get('version')} != {PACK_VERSION}")
+        # Pacote e índice precisam ser da mesma compilação (troca interrompida ou leitura no meio dela)
+        header_hash, header_bytes = _read_header(self.pack_path)
+        size = os.path.getsize(self.pack_path)
+        if header_hash != self.index.get("hash") or header_bytes != self.index.get("bytes") or size != header_bytes:
+            raise ValueError("pacote e índice de compilações diferentes")
+        self._data = np.memmap(self.pack_path, dtype=np.uint8, mode="r")
+        self.templates = self.index.get("templates", {})
+
+    @property
+    def content_hash(self):
+        return self.index.get("hash")
+
+    def __len__(self):
+        return len(self.templates)
+
+    def _view(self, record):
+        shape = tuple(record["shape"])
+        count = int(np.prod(shape))
+        return self._data[record["offset"]:record["offset"] + count].reshape(shape)
+
+    def _entry(self, template_path, stat=None):
+        """Entrada do template, só se o PNG e a máscara separada ainda são os mesmos da compilação."""
+        rel = os.path.relpath(os.path.abspath(template_path), self.templates_dir)
+        if rel.startswith(".."):
+            return None
+        entry = self.templates.get(rel.replace(os.sep, "/"))
+        if entry is None:
+            return None
+        try:
+            stat = stat or os.stat(template_path)
+        except OSError:
+            return None
+        if stat.st_mtime_ns != entry["mtime_ns"] or stat.st_size != entry["size"]:
+            return None
+        if _mask_file_stat(template_path) != entry.get("mask_file"):
+            return None  # <nome>_mask.png editado, criado ou apagado depois da compilação
+        return entry
+
+    def gray(self, template_path, stat=None):
+        entry = self._entry(template_path, stat)
+        return self._view(entry["gray"]) if entry else None
+
+    def mask(self, template_path, stat=None):
+        entry = self._entry(template_path, stat)
+        return self._view(entry["mask"]) if entry and entry.get("mask") else None
+
+    def scaled(self, template_path, scale, stat=None):
+        entry = self._entry(template_path, stat)
+        if not entry:
+            return None
+        record = entry["scales"].get(_scale_key(scale))
+        return self._view(record) if record else None
+
+    def steps(self, template_path):
+        """Passos do sequence.json que usam o template (metadados da compilação)."""
+        rel = os.path.relpath(os.path.abspath(template_path), self.templates_dir).replace(os.sep, "/")
+        return self.templates.get(rel, {}).get("steps", [])
+
+    def stale_templates(self):
+        """Templates do pacote cujo PNG (ou máscara separada) mudou ou sumiu desde a compilação."""
+        return [rel for rel in self.templates
+                if self._entry(os.path.join(self.templates_dir, rel)) is None]
+
+
+_pack = None
+_pack_loaded = False
+_pack_lock = threading.Lock()
+
+
+def get_template_pack(reload=False):
+    """Pacote global (aberto no primeiro uso), ou None se desativado, inexistente ou inválido."""
+    global _pack, _pack_loaded
+    with _pack_lock:
+        if _pack_loaded and not reload:
+            return _pack
+        _pack_loaded = True
+        _pack = None
+        pack_path = _default_pack_path()
+        if not pack_enabled() or not os.path.exists(pack_path + ".json"):
+            return None
+        try:
+            _pack = TemplatePack(pack_path)
+        except (OSError, ValueError, KeyError, json.JSONDecodeError) as e:
+            print(f"⚠️ Pacote de templates ignorado ({e}). Recompile: python template_pack.py build")
+        return _pack
+
+
+if __name__ == '__main__':
+    import sys
+
+    # Uso:
+    #   python template_pack.py build [--resolution 1600x720 ...]
+    #   python template_pack.py info
+    command = sys.argv[1] if len(sys.argv) > 1 else "info"
+    if command == "build":
+        args = sys.argv[2:]
+        resolutions = []
+        for flag, value in zip(args, args[1:]):
+            if flag == "--resolution":
+                w, h = value.lower().split("x")
+                resolutions.append((int(w), int(h)))
+        build_pack(resolutions=resolutions or None)
+    elif command == "info":
+        pack = get_template_pack()
+        if pack is None:
+            print(f"Nenhum pacote em {_default_pack_path()} (python template_pack.py build)")
+        else:
+            stale = pack.stale_templates()
+            print(f"📦 {len(pack)} templates | hash {pack.content_hash[:12]} | "
+                  f"{pack.index.get('bytes', 0) / 1024:.0f} KB | desatualizados: {len(stale)}")
+            for rel in stale:
+                print(f"   ⚠️ {rel}")
+    else:
+        print("Uso: python template_pack.py [build [--resolution LxA ...] | info]")
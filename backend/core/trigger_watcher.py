@@ -0,0 +1,91 @@
+"""
+Vigia de Gatilho em Segundo Plano
+Verifica um template (ex.: aviso de novo rally) em cada frame de uma SharedFrameSource e
+sinaliza o loop principal por um threading.Event.
+
+O loop principal não precisa capturar a tela antes de cada passo para checar o gatilho: o
+evento é passado como abort_event para execultar_acoes, cujas esperas e buscas retornam
+assim que ele é disparado (no máximo um frame depois de o gatilho aparecer na tela).
+"""
+import os
+import threading
+import time
+
+try:
+    from .detection_pool import detect_in_frame
+except ImportError:
+    from detection_pool import detect_in_frame
+
+
+class TriggerWatcher:
+    """
+    Thread que procura um template em cada frame novo da fonte compartilhada.
+
+    Exemplo:
+        source = SharedFrameSource(device_id).start()
+        watcher = TriggerWatcher(source, GATILHO_TEMPLATE, device_id=device_id).start()
+        execultar_acoes("matar_mobs", device_id, frame_source=source, abort_event=watcher.event)
+        if watcher.triggered:
+            ...
+        watcher.stop()
+    """
+
+    def __init__(self, source, template_path, device_id=None, threshold=None, on_trigger=None):
+        self.source = source
+        self.template_path = template_path
+        self.device_id = device_id if device_id is not None else source.device_id
+        self.threshold = threshold
+        self.on_trigger = on_trigger
+        self.event = threading.Event()
+        self.detected_at = None  # Timestamp (time.monotonic) do frame em que o gatilho apareceu
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def triggered(self) -> bool:
+        return self.event.is_set()
+
+    def start(self):
+        """Inicia a verificação (a fonte precisa estar rodando; o vigia termina junto com ela). Retorna o próprio vigia."""
+        if not os.path.exists(self.template_path):
+            print(f"⚠️ Template de gatilho não encontrado: {self.template_path}. Vigia desativado.")
+            return self
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="trigger-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def reset(self):
+        """Rearma o vigia depois que o gatilho foi tratado."""
+        self.detected_at = None
+        self.event.clear()
+
+    def _run(self):
+        not_before = time.monotonic()
+        while not self._stop.is_set():
+            frame = self.source.wait_next(not_before, timeout=1.0)
+            if frame is None:
+                if self.source.stopped:
+                    break  # Fonte parada: wait_next voltaria None na hora e o laço giraria sem pausa
+                continue
+            not_before = frame.timestamp + 1e-6  # Próximo frame, nunca o mesmo duas vezes
+            if self.event.is_set():
+                continue
+            if detect_in_frame(frame.image, self.template_path, threshold=self.threshold,
+                               device_id=self.device_id) is not None:
+                self.detected_at = frame.timestamp
+                print(f"🚨 GATILHO DETECTADO! ({os.path.basename(self.template_path)}, "
+                      f"{1000 * (time.monotonic() - frame.timestamp):.0f} ms após a captura)")
+                self.event.set()
+                if self.on_trigger is not None:
+                    try:
+                        self.on_trigger(frame)
+                    except Exception as e:
+                        print(f"⚠️ Erro no callback do gatilho: {e}")
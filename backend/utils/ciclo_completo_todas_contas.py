@@ -4,13 +4,22 @@ Descrição: Executa o ciclo completo (Login → Pegar Baú → Pegar Recursos 
            para todas as contas configuradas automaticamente.
            
 Fluxo para cada conta:
-    1. Login na conta
+    1. Login na conta (com logout da conta anterior, pulados se ela já estiver ativa)
     2. Pegar baús
     3. Pegar recursos
-    4. Logout
+    4. Logout (adiado para a próxima troca de conta)
     5. Repetir para próxima conta
 
 Versão: 01.00.00 - Criação inicial do utilitário automatizado
+Versão: 01.01.00 - Checkpoints persistentes (checkpoint_store): após queda/crash a rodada
+                   é retomada, pulando contas e tarefas já concluídas
+Versão: 01.02.00 - Troca de conta sob demanda (active_account): o logout passa a ser feito só
+                   na troca seguinte, e logout/login são pulados quando a conta já está ativa
+Versão: 01.03.00 - Ordem das contas pelo planejador (account_planner): conta ativa primeiro,
+                   menor custo de troca antes, contas sem tarefa disponível puladas
+Versão: 01.03.01 - Erro crítico numa conta grava o flight recorder (últimos frames e eventos)
+Versão: 01.03.02 - Contas puladas pelo checkpoint (execute_account_cycle retorna None) contadas à parte
+                   no resumo, também sem o planejador
 Analista: Claude (Gemini Advanced)
 Programador: Gled Carneiro
 -----------------------------------------------------------------------------
@@ -34,6 +43,10 @@ sys.path.append(os.path.join(backend_dir, 'core'))
 sys.path.append(os.path.join(backend_dir, 'config'))
 
 from action_executor import execultar_acoes, execute_login_for_account
+from checkpoint_store import get_checkpoint_store
+from active_account import switch_to_account, known_active_account
+from account_planner import plan_accounts
+from flight_recorder import dump_flight_recorder
 
 # Importa a lista de contas
 try:
@@ -71,6 +84,16 @@ DELAY_ENTRE_ACOES = 2
 DELAY_APOS_LOGOUT = 5
 DELAY_APOS_FALHA = 5
 
+# Checkpoints: nome do ciclo no banco e recarga de cada tarefa (segundos; None = sem recarga)
+CHECKPOINT_CYCLE = "ciclo_completo_todas_contas"
+INTERVALO_TAREFAS = {
+    PEGAR_BAU_ACTION: None,
+    PEGAR_RECURSOS_ACTION: None,
+}
+
+# Ordem das contas: True = planejador (custo de troca + recarga das tarefas); False = ordem do accounts_config
+USAR_PLANEJADOR = True
+
 # Pasta de ações
 ACOES_FOLDER = os.path.join(backend_dir, "actions", "templates")
 
@@ -130,8 +153,68 @@ def load_sequence(action_name):
         return None
 
 
+def executar_tarefa(action_name, account_name, descricao, pendentes, store=None, run=None):
+    """
+    Executa uma tarefa de coleta da conta e registra o resultado no checkpoint.
+    Tarefas fora de `pendentes` (já feitas nesta rodada ou em recarga) são puladas.
+    """
+    if action_name not in pendentes:
+        print(f"⏭️ {descricao} já coletados nesta rodada (checkpoint): {account_name}")
+        return True
+    
+    try:
+        success = execultar_acoes(
+            action_name,
+            device_id=DEVICE_ID,
+            account_name=account_name
+        )
+        
+        if success:
+            print(f"✅ {descricao} coletados: {account_name}")
+            if store is not None:
+                store.mark_done(run, account_name, action_name, interval=INTERVALO_TAREFAS.get(action_name))
+        else:
+            print(f"⚠️ Falha ao coletar {descricao.lower()}: {account_name}")
+            if store is not None:
+                store.mark_failed(run, account_name, action_name)
+            
+        time.sleep(DELAY_ENTRE_ACOES)
+        return success
+        
+    except Exception as e:
+        print(f"❌ ERRO ao pegar {descricao.lower()} de {account_name}: {e}")
+        if store is not None:
+            store.mark_failed(run, account_name, action_name, detail=str(e))
+        # Continua mesmo com erro
+        return False
+
+
+def fazer_logout(logout_sequence, account_name=None):
+    """Executa a sequência de logout da conta ativa (chamado por switch_to_account)."""
+    try:
+        logout_success = execultar_acoes(
+            action_name=LOGOUT_ACTION,
+            device_id=DEVICE_ID,
+            sequence_override=logout_sequence,
+            account_name=account_name
+        )
+        
+        if logout_success:
+            print(f"✅ Logout bem-sucedido: {account_name or 'conta ativa'}")
+        else:
+            print(f"⚠️ Falha no logout: {account_name or 'conta ativa'}")
+            
+        time.sleep(DELAY_APOS_LOGOUT)
+        return logout_success
+        
+    except Exception as e:
+        print(f"❌ ERRO durante logout de {account_name or 'conta ativa'}: {e}")
+        time.sleep(DELAY_APOS_LOGOUT)
+        return False
+
+
 def execute_account_cycle(account, account_number, total_accounts, 
-                          login_sequence, logout_sequence):
+                          login_sequence, logout_sequence, store=None, run=None):
     """
     Executa o ciclo completo para uma conta
     
@@ -141,26 +224,42 @@ def execute_account_cycle(account, account_number, total_accounts,
         total_accounts: Total de contas
         login_sequence: Sequência de login carregada
         logout_sequence: Sequência de logout carregada
+        store: CheckpointStore (opcional) - tarefas já feitas na rodada são puladas
+        run: CycleRun da rodada atual (obrigatório com store)
         
     Returns:
-        True se o ciclo foi completado com sucesso, False caso contrário
+        True se o ciclo foi completado com sucesso, False caso contrário,
+        None se a conta foi pulada (já concluída ou sem tarefas pendentes no checkpoint)
     """
     account_name = account.get('name')
     
     print_header(f"CONTA {account_number}/{total_accounts}: {account_name}")
     print(f"⏰ Início: {datetime.now().strftime('%H:%M:%S')}")
     
+    # Checkpoint: conta já concluída nesta rodada ou sem tarefas pendentes -> nem faz login
+    pendentes = [PEGAR_BAU_ACTION, PEGAR_RECURSOS_ACTION]
+    if store is not None:
+        if store.is_done(run, account_name, "conta"):
+            print(f"⏭️ {account_name} já concluída nesta rodada (checkpoint). Pulando.")
+            return None
+        pendentes = [task for task in pendentes if store.should_run(run, account_name, task)]
+        if not pendentes:
+            print(f"⏭️ {account_name}: nenhuma tarefa pendente (checkpoint). Pulando login.")
+            store.mark_done(run, account_name, "conta")
+            return None
+    
     cycle_start_time = time.time()
     
     # ========================================================================
-    # PASSO 1: LOGIN
+    # PASSO 1: TROCA DE CONTA (logout da conta ativa + login, só se necessário)
     # ========================================================================
-    print_step(1, 4, f"LOGIN - {account_name}")
+    print_step(1, 3, f"LOGIN - {account_name}")
     
     try:
-        login_success = execute_login_for_account(
-            account, 
-            login_sequence, 
+        login_success = switch_to_account(
+            account_name,
+            login_fn=lambda: execute_login_for_account(account, login_sequence, device_id=DEVICE_ID),
+            logout_fn=lambda conta_ativa: fazer_logout(logout_sequence, conta_ativa),
             device_id=DEVICE_ID
         )
         
@@ -181,72 +280,19 @@ def execute_account_cycle(account, account_number, total_accounts,
     # ========================================================================
     # PASSO 2: PEGAR BAÚS
     # ========================================================================
-    print_step(2, 4, f"PEGAR BAÚS - {account_name}")
-    
-    try:
-        bau_success = execultar_acoes(
-            PEGAR_BAU_ACTION,
-            device_id=DEVICE_ID,
-            account_name=account_name
-        )
-        
-        if bau_success:
-            print(f"✅ Baús coletados: {account_name}")
-        else:
-            print(f"⚠️ Falha ao coletar baús: {account_name}")
-            
-        time.sleep(DELAY_ENTRE_ACOES)
-        
-    except Exception as e:
-        print(f"❌ ERRO ao pegar baús de {account_name}: {e}")
-        # Continua mesmo com erro
+    print_step(2, 3, f"PEGAR BAÚS - {account_name}")
+    executar_tarefa(PEGAR_BAU_ACTION, account_name, "Baús", pendentes, store, run)
     
     # ========================================================================
     # PASSO 3: PEGAR RECURSOS
     # ========================================================================
-    print_step(3, 4, f"PEGAR RECURSOS - {account_name}")
-    
-    try:
-        recursos_success = execultar_acoes(
-            PEGAR_RECURSOS_ACTION,
-            device_id=DEVICE_ID,
-            account_name=account_name
-        )
-        
-        if recursos_success:
-            print(f"✅ Recursos coletados: {account_name}")
-        else:
-            print(f"⚠️ Falha ao coletar recursos: {account_name}")
-            
-        time.sleep(DELAY_ENTRE_ACOES)
-        
-    except Exception as e:
-        print(f"❌ ERRO ao pegar recursos de {account_name}: {e}")
-        # Continua mesmo com erro
+    print_step(3, 3, f"PEGAR RECURSOS - {account_name}")
+    executar_tarefa(PEGAR_RECURSOS_ACTION, account_name, "Recursos", pendentes, store, run)
     
-    # ========================================================================
-    # PASSO 4: LOGOUT
-    # ========================================================================
-    print_step(4, 4, f"LOGOUT - {account_name}")
+    # O logout fica para a próxima troca de conta (pulado se a próxima conta for esta mesma)
     
-    try:
-        logout_success = execultar_acoes(
-            action_name=LOGOUT_ACTION,
-            device_id=DEVICE_ID,
-            sequence_override=logout_sequence,
-            account_name=account_name
-        )
-        
-        if logout_success:
-            print(f"✅ Logout bem-sucedido: {account_name}")
-        else:
-            print(f"⚠️ Falha no logout: {account_name}")
-            
-        time.sleep(DELAY_APOS_LOGOUT)
-        
-    except Exception as e:
-        print(f"❌ ERRO durante logout de {account_name}: {e}")
-        time.sleep(DELAY_APOS_LOGOUT)
+    if store is not None:
+        store.mark_done(run, account_name, "conta")
     
     # ========================================================================
     # RESUMO DO CICLO
@@ -311,35 +357,61 @@ def main():
     # ========================================================================
     print_header("🔄 INICIANDO EXECUÇÃO DO CICLO")
     
+    # Checkpoint: retoma a rodada interrompida (queda de USB/crash) ou abre uma nova
+    store = get_checkpoint_store()
+    run = store.begin_cycle(CHECKPOINT_CYCLE)
+    if run.resumed:
+        print(f"♻️ Retomando rodada #{run.number} iniciada em "
+              f"{datetime.fromtimestamp(run.started_at).strftime('%Y-%m-%d %H:%M:%S')} (contas concluídas serão puladas)")
+    
     start_time = time.time()
+    interrompido = False
     successful_accounts = 0
     failed_accounts = 0
+    skipped_accounts = 0
     
-    for index, account in enumerate(accounts, start=1):
+    contas_rodada = accounts
+    if USAR_PLANEJADOR:
+        plano = plan_accounts(accounts, [PEGAR_BAU_ACTION, PEGAR_RECURSOS_ACTION], store=store, run=run,
+                              active_account=known_active_account(DEVICE_ID), done_task="conta")
+        print(plano.explain())
+        contas_rodada = plano.accounts
+        skipped_accounts = len(plano.skipped)  # Já concluídas ou em recarga: não contam como sucesso
+    
+    for index, account in enumerate(contas_rodada, start=1):
         try:
             success = execute_account_cycle(
                 account=account,
                 account_number=index,
-                total_accounts=len(accounts),
+                total_accounts=len(contas_rodada),
                 login_sequence=login_sequence,
-                logout_sequence=logout_sequence
+                logout_sequence=logout_sequence,
+                store=store,
+                run=run
             )
             
-            if success:
+            if success is None:
+                skipped_accounts += 1  # Pulada pelo checkpoint: não conta como sucesso
+            elif success:
                 successful_accounts += 1
             else:
                 failed_accounts += 1
                 
         except KeyboardInterrupt:
             print("\n\n⚠️ EXECUÇÃO INTERROMPIDA PELO USUÁRIO")
-            print(f"Contas processadas: {index - 1}/{len(accounts)}")
+            print(f"Contas processadas: {index - 1}/{len(contas_rodada)}")
+            interrompido = True
             break
             
         except Exception as e:
             print(f"\n❌ ERRO CRÍTICO ao processar conta {account.get('name')}: {e}")
+            dump_flight_recorder(DEVICE_ID, f"erro {account.get('name')}", force=True)
             failed_accounts += 1
             time.sleep(DELAY_APOS_FALHA)
     
+    if not interrompido:
+        store.finish_cycle(run)
+    
     # ========================================================================
     # RESUMO FINAL
     # ========================================================================
@@ -348,14 +420,19 @@ def main():
     print_header("📊 RESUMO FINAL")
     print(f"✅ Contas processadas com sucesso: {successful_accounts}")
     print(f"❌ Contas com falha: {failed_accounts}")
+    if skipped_accounts:
+        print(f"⏭️ Contas puladas (já concluídas ou em recarga): {skipped_accounts}")
     print(f"📊 Total de contas: {len(accounts)}")
     print(f"⏱️ Tempo total de execução: {total_duration:.1f}s ({total_duration/60:.1f} min)")
     print(f"⏰ Término: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
-    if successful_accounts == len(accounts):
+    contas_pendentes = len(accounts) - skipped_accounts  # Puladas pelo planejador ou pelo checkpoint
+    if contas_pendentes <= 0:
+        print("\n⏭️ NENHUMA CONTA PENDENTE: todas foram puladas nesta rodada")
+    elif successful_accounts == contas_pendentes:
         print("\n🎉 TODAS AS CONTAS FORAM PROCESSADAS COM SUCESSO!")
     elif successful_accounts > 0:
-        print(f"\n⚠️ EXECUÇÃO PARCIAL: {successful_accounts}/{len(accounts)} contas processadas")
+        print(f"\n⚠️ EXECUÇÃO PARCIAL: {successful_accounts}/{contas_pendentes} contas processadas")
     else:
         print("\n❌ NENHUMA CONTA FOI PROCESSADA COM SUCESSO")
     
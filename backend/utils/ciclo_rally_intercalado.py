@@ -13,6 +13,15 @@ Fluxo otimizado:
               aproveitando melhor o tempo de 5min dos rallys.
 
 Versão: 01.00.00 - Criação com lógica intercalada
+Versão: 01.01.00 - Checkpoints persistentes (checkpoint_store): após queda/crash o ciclo
+                   retoma na fila/conta em que parou
+Versão: 01.02.00 - Troca de conta sob demanda (active_account): o logout passa a ser feito só
+                   na troca seguinte, e logout/login são pulados quando a conta já está ativa
+Versão: 01.03.00 - Ordem das contas pelo planejador (account_planner): conta ativa primeiro,
+                   depois a de menor custo de troca; contas já concluídas na rodada por último
+Versão: 01.03.01 - Login por template fixo com captura em memória; imagem de debug gravada
+                   em segundo plano (debug_writer)
+Versão: 01.03.02 - Erro crítico grava o flight recorder (últimos frames e eventos)
 Analista: Gemini Advanced
 Programador: Gled Carneiro
 -----------------------------------------------------------------------------
@@ -24,6 +33,8 @@ import time
 import json
 from datetime import datetime
 
+import cv2
+
 # Adiciona os diretórios necessários ao path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 backend_dir = os.path.dirname(current_dir)
@@ -37,7 +48,14 @@ sys.path.append(os.path.join(backend_dir, 'config'))
 
 from action_executor import execultar_acoes, execute_login_for_account, simulate_scroll
 from adb_utils import simulate_touch, capture_screen
-from image_detection import find_image_on_screen
+from image_detection import find_image_on_screen, find_image_in_frame
+from device_profile import get_device_profile
+from checkpoint_store import get_checkpoint_store
+from active_account import switch_to_account, known_active_account
+from account_planner import plan_accounts
+from frame_source import capture_frame
+from debug_writer import get_debug_writer
+from flight_recorder import dump_flight_recorder
 
 # Importa a lista de contas
 try:
@@ -70,6 +88,7 @@ RALLY_ACTION = "entrar_rallys"
 
 # Configurações de Rally
 MAX_FILAS = 9
+# Offsets (px na resolução de referência 2400x1080) - escalados via DeviceProfile
 OFFSETS_FIXOS = {
     1: 140,
     2: 360,
@@ -99,6 +118,14 @@ ACOES_FOLDER = os.path.join(backend_dir, "actions", "templates")
 # Contas a processar (apenas as 3 primeiras)
 CONTAS_ATIVAS = [0, 1, 2]  # Índices das contas (conta1, conta2, conta3)
 
+# Ordem das contas: True = planejador (conta ativa e menor custo de troca primeiro); False = CONTAS_ATIVAS
+USAR_PLANEJADOR = True
+
+# Checkpoints: nome do ciclo no banco e idade máxima de uma rodada para ser retomada
+# (cada fila tem janela de ~5 min: rodadas mais antigas recomeçam da fila 1)
+CHECKPOINT_CYCLE = "ciclo_rally_intercalado"
+RETOMAR_RODADA_ATE = 10 * 60
+
 
 # ============================================================================
 # FUNÇÕES AUXILIARES
@@ -237,6 +264,8 @@ def execute_login_with_fixed_template(account_index, account_name, login_sequenc
             scroll_duration = 1000
         
         end_y = start_y - row_height
+        # Valores do JSON estão na resolução de referência -> pixels do dispositivo
+        start_coords, end_coords = get_device_profile(device_id).scroll_from_config(center_x, start_y, row_height)
         
         print(f"📜 Scroll Config para Conta {account_index + 1}:")
         print(f"   • Scrolls: {num_scrolls}x")
@@ -246,8 +275,8 @@ def execute_login_with_fixed_template(account_index, account_name, login_sequenc
         
         try:
             for i in range(num_scrolls):
-                simulate_scroll(device_id, start_coords=[center_x, start_y], 
-                              end_coords=[center_x, end_y], duration_ms=scroll_duration)
+                simulate_scroll(device_id, start_coords=start_coords, 
+                              end_coords=end_coords, duration_ms=scroll_duration)
                 time.sleep(0.8)
             time.sleep(0.5)
         except Exception as e:
@@ -255,11 +284,12 @@ def execute_login_with_fixed_template(account_index, account_name, login_sequenc
             return False
     
     # 3. DETECTAR TEMPLATE FIXO E CLICAR
-    offset_y = login_scroll_config.get(account_key, {}).get("offset_y", LOGIN_OFFSET_CLICK_APOS_SCROLL)
-    screenshot_path = os.path.join(project_root, "temp_screenshots", "temp_screenshot_login.png")
+    offset_y = get_device_profile(device_id).length(
+        login_scroll_config.get(account_key, {}).get("offset_y", LOGIN_OFFSET_CLICK_APOS_SCROLL))
     
-    capture_screen(device_id, screenshot_path)
-    result = find_image_on_screen(screenshot_path, TEMPLATE_PREPARA_TELA_LOGIN)
+    # Captura em memória: o mesmo frame serve para a detecção e para a imagem de debug
+    frame = capture_frame(device_id)
+    result = find_image_in_frame(frame.image, TEMPLATE_PREPARA_TELA_LOGIN) if frame.image is not None else None
     
     if result is None:
         print(f"⚠️ Template fixo de login não encontrado.")
@@ -274,31 +304,22 @@ def execute_login_with_fixed_template(account_index, account_name, login_sequenc
     print(f"📍 Template encontrado em ({x}, {y}) | Centro: ({center_x}, {center_y})")
     print(f"👆 Clicando na Conta {account_index + 1} → Centro Y ({center_y}) + Offset ({offset_y}) = {click_y}")
     
-    # 4. GERAR IMAGEM DE DEBUG
-    try:
-        import cv2
-        debug_img = cv2.imread(screenshot_path)
-        if debug_img is not None:
-            # Retângulo verde ao redor do template
-            cv2.rectangle(debug_img, (x, y), (x + w, y + h), (0, 255, 0), 2)
-            
-            # Círculo vermelho no ponto de clique
-            cv2.circle(debug_img, (click_x, click_y), 20, (0, 0, 255), -1)
-            
-            # Linha azul mostrando o offset
-            cv2.line(debug_img, (click_x, center_y), (click_x, click_y), (255, 0, 0), 2)
-            
-            # Texto informativo
-            cv2.putText(debug_img, f"Conta {account_index + 1} (+{offset_y})", 
-                       (click_x + 30, click_y), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-            
-            # Salvar imagem
-            debug_filename = os.path.join(project_root, "temp_screenshots", 
-                                         f"debug_login_conta_{account_index + 1}.png")
-            cv2.imwrite(debug_filename, debug_img)
-            print(f"🖼️  Debug salvo: {debug_filename}")
-    except Exception as e:
-        print(f"⚠️ Erro ao salvar debug visual: {e}")
+    # 4. GERAR IMAGEM DE DEBUG (desenho e gravação em segundo plano, fora do caminho do clique)
+    def desenhar_login(debug_img):
+        # Retângulo verde ao redor do template
+        cv2.rectangle(debug_img, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        
+        # Círculo vermelho no ponto de clique
+        cv2.circle(debug_img, (click_x, click_y), 20, (0, 0, 255), -1)
+        
+        # Linha azul mostrando o offset
+        cv2.line(debug_img, (click_x, center_y), (click_x, click_y), (255, 0, 0), 2)
+        
+        # Texto informativo
+        cv2.putText(debug_img, f"Conta {account_index + 1} (+{offset_y})", 
+                   (click_x + 30, click_y), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+    
+    get_debug_writer().submit(frame.image, f"debug_login_conta_{account_index + 1}", desenhar_login)
     
     # 5. CLICAR NA CONTA
     time.sleep(0.5)
@@ -353,12 +374,13 @@ def processar_fila_unica(fila_num, rally_sequence, scroll_config, fila_atual):
             start_y = 800
             scroll_duration = 1000
         
-        end_y = start_y - row_height
+        # Valores do JSON estão na resolução de referência -> pixels do dispositivo
+        start_coords, end_coords = get_device_profile(DEVICE_ID).scroll_from_config(center_x, start_y, row_height)
         
         try:
             for i in range(num_scrolls):
-                simulate_scroll(DEVICE_ID, start_coords=[center_x, start_y], 
-                              end_coords=[center_x, end_y], duration_ms=scroll_duration)
+                simulate_scroll(DEVICE_ID, start_coords=start_coords, 
+                              end_coords=end_coords, duration_ms=scroll_duration)
                 time.sleep(0.6)  # Reduzido de 0.8
             time.sleep(0.4)  # Reduzido de 0.5
         except Exception as e:
@@ -366,7 +388,7 @@ def processar_fila_unica(fila_num, rally_sequence, scroll_config, fila_atual):
             return False
 
     # 2. DETECTAR E CLICAR NA FILA
-    offset_y = OFFSETS_FIXOS.get(fila_num, OFFSET_CLICK_APOS_SCROLL)
+    offset_y = get_device_profile(DEVICE_ID).length(OFFSETS_FIXOS.get(fila_num, OFFSET_CLICK_APOS_SCROLL))
     template_path = get_template_path("03_fila.png")
     screenshot_path = os.path.join(project_root, "temp_screenshots", "temp_screenshot_rally.png")
     
@@ -411,11 +433,31 @@ def processar_fila_unica(fila_num, rally_sequence, scroll_config, fila_atual):
         return False
 
 
+def fazer_logout(logout_sequence, account_name=None):
+    """Executa a sequência de logout da conta ativa (chamado por switch_to_account)."""
+    try:
+        execute_back(times=5, delay=0.2)  # Delay reduzido
+        time.sleep(0.8)  # Reduzido de 1.0
+        
+        logout_success = execultar_acoes(
+            action_name=LOGOUT_ACTION,
+            device_id=DEVICE_ID,
+            sequence_override=logout_sequence,
+            account_name=account_name
+        )
+        print(f"✅ Logout: {account_name or 'conta ativa'}")
+        time.sleep(DELAY_APOS_LOGOUT)
+        return logout_success
+    except Exception as e:
+        print(f"⚠️ Erro no logout: {e}")
+        return False
+
+
 def processar_fila_para_conta(account, fila_num, login_sequence, logout_sequence, 
                                rally_sequence, scroll_config, login_scroll_config):
     """
     Processa uma fila específica para uma conta:
-    Login → Entrar na fila → Logout
+    Troca de conta (se necessária) → Entrar na fila → Tela principal
     
     Returns:
         True se conseguiu entrar no rally, False caso contrário
@@ -442,8 +484,12 @@ def processar_fila_para_conta(account, fila_num, login_sequence, logout_sequence
             print(f"❌ Conta não encontrada: {account_name}")
             return False
         
-        if not execute_login_with_fixed_template(account_index, account_name, login_sequence, 
-                                                 login_scroll_config, device_id=DEVICE_ID):
+        if not switch_to_account(
+                account_name,
+                login_fn=lambda: execute_login_with_fixed_template(account_index, account_name, login_sequence,
+                                                                   login_scroll_config, device_id=DEVICE_ID),
+                logout_fn=lambda conta_ativa: fazer_logout(logout_sequence, conta_ativa),
+                device_id=DEVICE_ID):
             print(f"❌ Falha no login: {account_name}")
             return False
         print(f"✅ Login: {account_name}")
@@ -462,21 +508,9 @@ def processar_fila_para_conta(account, fila_num, login_sequence, logout_sequence
     except Exception as e:
         print(f"❌ Erro ao processar fila: {e}")
     
-    # 3. LOGOUT
-    try:
-        execute_back(times=5, delay=0.2)  # Delay reduzido
-        time.sleep(0.8)  # Reduzido de 1.0
-        
-        execultar_acoes(
-            action_name=LOGOUT_ACTION,
-            device_id=DEVICE_ID,
-            sequence_override=logout_sequence,
-            account_name=account_name
-        )
-        print(f"✅ Logout: {account_name}")
-        time.sleep(DELAY_APOS_LOGOUT)
-    except Exception as e:
-        print(f"⚠️ Erro no logout: {e}")
+    # 3. TELA PRINCIPAL (o logout fica para a próxima troca de conta)
+    execute_back(times=5, delay=0.2)  # Delay reduzido
+    time.sleep(0.8)  # Reduzido de 1.0
     
     # Resumo
     duration = time.time() - start_time
@@ -540,11 +574,18 @@ def main():
     print_header("🔄 INICIANDO CICLO INTERCALADO")
     
     ciclo_numero = 0
+    store = get_checkpoint_store()
     
     while True:
         ciclo_numero += 1
         print_header(f"🔁 CICLO #{ciclo_numero}")
         
+        # Checkpoint: retoma a rodada interrompida (queda de USB/crash) se ainda for recente
+        run = store.begin_cycle(CHECKPOINT_CYCLE, resume_within=RETOMAR_RODADA_ATE)
+        if run.resumed:
+            print(f"♻️ Retomando rodada #{run.number} iniciada em "
+                  f"{datetime.fromtimestamp(run.started_at).strftime('%H:%M:%S')} (filas já feitas serão puladas)")
+        
         ciclo_start_time = time.time()
         stats = {
             'total_tentativas': 0,
@@ -560,9 +601,21 @@ def main():
             
             fila_start_time = time.time()
             
-            # Processar cada conta nesta fila
-            for idx in CONTAS_ATIVAS:
+            # Processar cada conta nesta fila (ordem do planejador: começa pela conta já logada)
+            ordem = CONTAS_ATIVAS
+            if USAR_PLANEJADOR:
+                plano = plan_accounts([accounts[i] for i in CONTAS_ATIVAS], [f"fila_{fila_num}"], store=store,
+                                      run=run, active_account=known_active_account(DEVICE_ID))
+                print(plano.explain())
+                ordem = [CONTAS_ATIVAS[entry.index] for entry in plano.order + plano.skipped]
+            
+            for idx in ordem:
                 account = accounts[idx]
+                task = f"fila_{fila_num}"
+                
+                if store.is_done(run, account.get('name'), task):
+                    print(f"⏭️ {account.get('name')} → Fila {fila_num} já processada nesta rodada (checkpoint).")
+                    continue
                 
                 try:
                     stats['total_tentativas'] += 1
@@ -581,9 +634,11 @@ def main():
                     if success:
                         stats['total_sucessos'] += 1
                         stats['por_conta'][idx]['sucessos'] += 1
+                    # Fila processada (entrou ou não havia rally): não repetir ao retomar
+                    store.mark_done(run, account.get('name'), task, detail="entrou" if success else "sem rally")
                     
                     # Delay mínimo entre contas
-                    if idx != CONTAS_ATIVAS[-1]:
+                    if idx != ordem[-1]:
                         time.sleep(DELAY_ENTRE_CONTAS)
                         
                 except KeyboardInterrupt:
@@ -591,12 +646,15 @@ def main():
                     return
                 except Exception as e:
                     print(f"❌ ERRO CRÍTICO: {e}")
+                    dump_flight_recorder(DEVICE_ID, f"erro fila {fila_num}", force=True)
                     time.sleep(DELAY_APOS_FALHA)
             
             # Resumo da fila
             fila_duration = time.time() - fila_start_time
             print(f"\n⏱️ Fila {fila_num} concluída em {fila_duration:.1f}s ({fila_duration/60:.1f} min)")
         
+        store.finish_cycle(run)
+        
         # ====================================================================
         # RESUMO DO CICLO
         # ====================================================================
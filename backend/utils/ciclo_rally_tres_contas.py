@@ -3,13 +3,21 @@ Nome do Arquivo: ciclo_rally_tres_contas.py
 Descrição: Executa ciclo contínuo de rally para 3 contas específicas.
            
 Fluxo para cada conta:
-    1. Login na conta
+    1. Login na conta (com logout da conta anterior, pulados se ela já estiver ativa)
     2. Executar 9 iterações de entrar_rallys (com scroll cego)
-    3. Logout
+    3. Voltar à tela principal (logout adiado para a próxima troca de conta)
     4. Repetir para próxima conta
     5. Após conta3, retornar para conta1 (ciclo infinito)
 
 Versão: 01.00.00 - Criação inicial do utilitário automatizado
+Versão: 01.01.00 - Checkpoints persistentes (checkpoint_store): após queda/crash o ciclo
+                   retoma na conta em que parou, sem refazer login e rallys das anteriores
+Versão: 01.02.00 - Troca de conta sob demanda (active_account): o logout passa a ser feito só
+                   na troca seguinte, e logout/login são pulados quando a conta já está ativa
+Versão: 01.03.00 - Ordem das contas pelo planejador (account_planner): conta ativa primeiro,
+                   depois a de menor custo de troca; contas já concluídas na rodada por último
+Versão: 01.03.01 - Erro crítico numa conta grava o flight recorder (últimos frames e eventos)
+Versão: 01.03.02 - Contas já concluídas na rodada (checkpoint) contadas como puladas, não como sucesso
 Analista: Gemini Advanced
 Programador: Gled Carneiro
 -----------------------------------------------------------------------------
@@ -35,6 +43,11 @@ sys.path.append(os.path.join(backend_dir, 'config'))
 from action_executor import execultar_acoes, execute_login_for_account, simulate_scroll
 from adb_utils import simulate_touch, capture_screen
 from image_detection import find_image_on_screen
+from device_profile import get_device_profile
+from checkpoint_store import get_checkpoint_store
+from active_account import switch_to_account, known_active_account
+from account_planner import plan_accounts
+from flight_recorder import dump_flight_recorder
 
 # Importa a lista de contas
 try:
@@ -68,6 +81,7 @@ RALLY_ACTION = "entrar_rallys"
 # Configurações de Rally
 MAX_ITERACOES_RALLY = 9
 MAX_FILAS = 9
+# Offsets (px na resolução de referência 2400x1080) - escalados via DeviceProfile
 OFFSETS_FIXOS = {
     1: 140,
     2: 360,
@@ -88,6 +102,14 @@ ACOES_FOLDER = os.path.join(backend_dir, "actions", "templates")
 # Contas a processar (apenas as 3 primeiras)
 CONTAS_ATIVAS = [0, 1, 2]  # Índices das contas (conta1, conta2, conta3)
 
+# Ordem das contas: True = planejador (conta ativa e menor custo de troca primeiro); False = CONTAS_ATIVAS
+USAR_PLANEJADOR = True
+
+# Checkpoints: nome do ciclo no banco e idade máxima de uma rodada para ser retomada
+# (rallys expiram: depois disso a rodada recomeça da conta1)
+CHECKPOINT_CYCLE = "ciclo_rally_tres_contas"
+RETOMAR_RODADA_ATE = 30 * 60
+
 
 # ============================================================================
 # FUNÇÕES AUXILIARES
@@ -226,12 +248,13 @@ def processar_fila(fila_num, rally_sequence, scroll_config, fila_atual):
             start_y = 800
             scroll_duration = 1000
         
-        end_y = start_y - row_height
+        # Valores do JSON estão na resolução de referência -> pixels do dispositivo
+        start_coords, end_coords = get_device_profile(DEVICE_ID).scroll_from_config(center_x, start_y, row_height)
         
         try:
             for i in range(num_scrolls):
-                simulate_scroll(DEVICE_ID, start_coords=[center_x, start_y], 
-                              end_coords=[center_x, end_y], duration_ms=scroll_duration)
+                simulate_scroll(DEVICE_ID, start_coords=start_coords, 
+                              end_coords=end_coords, duration_ms=scroll_duration)
                 time.sleep(0.8)
             
             time.sleep(0.5)
@@ -241,7 +264,7 @@ def processar_fila(fila_num, rally_sequence, scroll_config, fila_atual):
             return 'ERROR'
 
     # 2. DETECTAR E CLICAR NA FILA
-    offset_y = OFFSETS_FIXOS.get(fila_num, OFFSET_CLICK_APOS_SCROLL)
+    offset_y = get_device_profile(DEVICE_ID).length(OFFSETS_FIXOS.get(fila_num, OFFSET_CLICK_APOS_SCROLL))
     template_path = get_template_path("03_fila.png")
     screenshot_path = os.path.join(project_root, "temp_screenshots", "temp_screenshot_rally.png")
     
@@ -364,11 +387,39 @@ def executar_rally_completo(rally_sequence, scroll_config, account_name):
 # FUNÇÃO DE CICLO POR CONTA
 # ============================================================================
 
+def fazer_logout(logout_sequence, account_name=None):
+    """Executa a sequência de logout da conta ativa (chamado por switch_to_account)."""
+    try:
+        # Reset para tela principal antes do logout
+        execute_back(times=5)
+        time.sleep(1.0)
+        
+        logout_success = execultar_acoes(
+            action_name=LOGOUT_ACTION,
+            device_id=DEVICE_ID,
+            sequence_override=logout_sequence,
+            account_name=account_name
+        )
+        
+        if logout_success:
+            print(f"✅ Logout bem-sucedido: {account_name or 'conta ativa'}")
+        else:
+            print(f"⚠️ Falha no logout: {account_name or 'conta ativa'}")
+            
+        time.sleep(DELAY_APOS_LOGOUT)
+        return logout_success
+        
+    except Exception as e:
+        print(f"❌ ERRO durante logout de {account_name or 'conta ativa'}: {e}")
+        time.sleep(DELAY_APOS_LOGOUT)
+        return False
+
+
 def execute_account_cycle(account, account_number, total_accounts, 
                           login_sequence, logout_sequence, rally_sequence, scroll_config):
     """
     Executa o ciclo completo para uma conta:
-    Login -> 9x Rally -> Logout
+    Troca de conta (se necessária) -> 9x Rally -> Tela principal
     
     Args:
         account: Dicionário com informações da conta
@@ -395,9 +446,10 @@ def execute_account_cycle(account, account_number, total_accounts,
     print_step(1, 3, f"LOGIN - {account_name}")
     
     try:
-        login_success = execute_login_for_account(
-            account, 
-            login_sequence, 
+        login_success = switch_to_account(
+            account_name,
+            login_fn=lambda: execute_login_for_account(account, login_sequence, device_id=DEVICE_ID),
+            logout_fn=lambda conta_ativa: fazer_logout(logout_sequence, conta_ativa),
             device_id=DEVICE_ID
         )
         
@@ -430,32 +482,13 @@ def execute_account_cycle(account, account_number, total_accounts,
         # Continua mesmo com erro para fazer logout
     
     # ========================================================================
-    # PASSO 3: LOGOUT
+    # PASSO 3: TELA PRINCIPAL (o logout fica para a próxima troca de conta)
     # ========================================================================
-    print_step(3, 3, f"LOGOUT - {account_name}")
+    print_step(3, 3, f"TELA PRINCIPAL - {account_name}")
     
-    try:
-        # Reset para tela principal antes do logout
-        execute_back(times=5)
-        time.sleep(1.0)
-        
-        logout_success = execultar_acoes(
-            action_name=LOGOUT_ACTION,
-            device_id=DEVICE_ID,
-            sequence_override=logout_sequence,
-            account_name=account_name
-        )
-        
-        if logout_success:
-            print(f"✅ Logout bem-sucedido: {account_name}")
-        else:
-            print(f"⚠️ Falha no logout: {account_name}")
-            
-        time.sleep(DELAY_APOS_LOGOUT)
-        
-    except Exception as e:
-        print(f"❌ ERRO durante logout de {account_name}: {e}")
-        time.sleep(DELAY_APOS_LOGOUT)
+    # Reset para tela principal: é nela que a conta ativa é reconhecida e o logout começa
+    execute_back(times=5)
+    time.sleep(1.0)
     
     # ========================================================================
     # RESUMO DO CICLO
@@ -521,20 +554,40 @@ def main():
     print_header("🔄 INICIANDO CICLO INFINITO")
     
     ciclo_numero = 0
+    store = get_checkpoint_store()
     
     while True:
         ciclo_numero += 1
         print_header(f"🔁 CICLO #{ciclo_numero}")
         
+        # Checkpoint: retoma a rodada interrompida (queda de USB/crash) se ainda for recente
+        run = store.begin_cycle(CHECKPOINT_CYCLE, resume_within=RETOMAR_RODADA_ATE)
+        if run.resumed:
+            print(f"♻️ Retomando rodada #{run.number} iniciada em "
+                  f"{datetime.fromtimestamp(run.started_at).strftime('%H:%M:%S')} (contas concluídas serão puladas)")
+        
         ciclo_start_time = time.time()
         successful_accounts = 0
         failed_accounts = 0
+        skipped_accounts = 0
+        
+        # Processar apenas as 3 primeiras contas (ordem do planejador: começa pela conta já logada)
+        ordem = CONTAS_ATIVAS
+        if USAR_PLANEJADOR:
+            plano = plan_accounts([accounts[i] for i in CONTAS_ATIVAS], ["rallys"], store=store, run=run,
+                                  active_account=known_active_account(DEVICE_ID))
+            print(plano.explain())
+            ordem = [CONTAS_ATIVAS[entry.index] for entry in plano.order + plano.skipped]
         
-        # Processar apenas as 3 primeiras contas
-        for idx in CONTAS_ATIVAS:
+        for idx in ordem:
             account = accounts[idx]
             account_number = idx + 1
             
+            if store.is_done(run, account.get('name'), "rallys"):
+                print(f"⏭️ {account.get('name')} já concluída nesta rodada (checkpoint). Pulando.")
+                skipped_accounts += 1
+                continue
+            
             try:
                 success = execute_account_cycle(
                     account=account,
@@ -548,11 +601,13 @@ def main():
                 
                 if success:
                     successful_accounts += 1
+                    store.mark_done(run, account.get('name'), "rallys")
                 else:
                     failed_accounts += 1
+                    store.mark_failed(run, account.get('name'), "rallys")
                     
                 # Delay entre contas
-                if idx != CONTAS_ATIVAS[-1]:  # Não espera após última conta
+                if idx != ordem[-1]:  # Não espera após última conta
                     print(f"\n⏳ Aguardando {DELAY_ENTRE_CONTAS}s antes da próxima conta...")
                     time.sleep(DELAY_ENTRE_CONTAS)
                     
@@ -563,9 +618,12 @@ def main():
                 
             except Exception as e:
                 print(f"\n❌ ERRO CRÍTICO ao processar conta {account.get('name')}: {e}")
+                dump_flight_recorder(DEVICE_ID, f"erro {account.get('name')}", force=True)
                 failed_accounts += 1
                 time.sleep(DELAY_APOS_FALHA)
         
+        store.finish_cycle(run)
+        
         # ====================================================================
         # RESUMO DO CICLO
         # ====================================================================
@@ -574,13 +632,18 @@ def main():
         print_header(f"📊 RESUMO DO CICLO #{ciclo_numero}")
         print(f"✅ Contas processadas com sucesso: {successful_accounts}")
         print(f"❌ Contas com falha: {failed_accounts}")
+        if skipped_accounts:
+            print(f"⏭️ Contas puladas (já concluídas nesta rodada): {skipped_accounts}")
         print(f"⏱️ Tempo do ciclo: {ciclo_duration:.1f}s ({ciclo_duration/60:.1f} min)")
         print(f"⏰ Término do ciclo: {datetime.now().strftime('%H:%M:%S')}")
         
-        if successful_accounts == len(CONTAS_ATIVAS):
+        contas_pendentes = len(CONTAS_ATIVAS) - skipped_accounts
+        if contas_pendentes == 0:
+            print(f"\n⏭️ CICLO #{ciclo_numero}: todas as contas já estavam concluídas nesta rodada")
+        elif successful_accounts == contas_pendentes:
             print(f"\n🎉 CICLO #{ciclo_numero} COMPLETO! Reiniciando para conta1...")
         else:
-            print(f"\n⚠️ CICLO #{ciclo_numero} PARCIAL: {successful_accounts}/{len(CONTAS_ATIVAS)} contas processadas")
+            print(f"\n⚠️ CICLO #{ciclo_numero} PARCIAL: {successful_accounts}/{contas_pendentes} contas processadas")
         
         print_separator()
         
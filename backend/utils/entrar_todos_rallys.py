@@ -1,6 +1,9 @@
 # Nome do Arquivo: entrar_todos_rallys.py
 # Descrição: Bot de Rally com Tarefas Secundárias (Baú, Recursos, Mobs) - Versão 4.2
 # Versão: 04.02.00 (Scroll Configurável via JSON)
+# Versão: 04.03.00 (Linhas da lista detectadas numa captura: template opcional de linha + supressão de não-máximos)
+# Versão: 04.04.00 (Lista indexada numa única varredura por ciclo; posições medidas por correlação de fase)
+# Versão: 04.04.01 (Filas visitadas na mesma sessão da lista; grade fixa limitada a MAX_FILAS)
 # Analista: Antigravity
 # Programador: Gled Carneiro
 # -----------------------------------------------------------------------------
@@ -12,6 +15,8 @@ import json
 import subprocess
 from datetime import datetime
 
+import cv2
+
 # ---------------------------------------------------------------------------
 # Configuração de caminho e importação de módulos do projeto
 # ---------------------------------------------------------------------------
@@ -24,7 +29,15 @@ if project_root not in sys.path:
 sys.path.append(os.path.join(backend_dir, "core"))
 from action_executor import execultar_acoes, simulate_scroll
 from adb_utils import simulate_touch, capture_screen
-from image_detection import find_image_on_screen
+from image_detection import find_image_on_screen, find_all_images_in_frame
+from device_profile import get_device_profile
+from screen_classifier import recover_to_screen
+from frame_source import SharedFrameSource, capture_frame
+from trigger_watcher import TriggerWatcher
+from device_registry import get_device_registry
+from detection_pool import detect_in_frame
+from debug_writer import get_debug_writer
+from scroll_tracking import ListIndex, STALL_PX
 
 # ---------------------------------------------------------------------------
 # Configurações
@@ -38,12 +51,24 @@ except Exception:
 
 RALLY_ACTION_NAME = "entrar_rallys"
 MAX_FILAS = 9
+# Offsets (px na resolução de referência 2400x1080) - escalados via DeviceProfile
 OFFSETS_FIXOS = {
     1: 140,
     2: 360,
     3: 590
 }
 OFFSET_CLICK_APOS_SCROLL = 650
+# Template opcional de uma linha da lista de rallys (em actions/templates/entrar_rallys). Se existir,
+# todas as linhas visíveis saem de uma única captura e o clique vai para a linha mais próxima da
+# posição calculada pelo cabeçalho (03_fila.png) + offset; sem ele, vale só o offset fixo.
+ROW_TEMPLATE = "03_fila_linha.png"
+ROW_SNAP_TOLERANCE = 115  # px (referência): meia altura de linha
+# Índice da lista: uma varredura por ciclo mede a posição de todas as linhas; cada fila é depois
+# trazida à tela com um swipe da distância exata, em vez de N scrolls contados a partir do topo
+ROW_PITCH = 225              # px (referência) entre linhas; sem ROW_TEMPLATE a grade parte de OFFSETS_FIXOS[1]
+INDEX_SCROLL_DISTANCE = 300  # px (referência) por swipe medido: frames com mais da metade em comum
+INDEX_MAX_SCROLLS = 8        # Swipes máximos da varredura (para antes se a lista parar de rolar)
+VISIT_MAX_SCROLLS = 8        # Swipes máximos para trazer uma linha indexada à tela
 
 # FLAG GLOBAL: Controla se o bot está em modo Rally ou Tarefas Secundárias
 FLAG_RALLY = True
@@ -58,18 +83,8 @@ TEMPLATE_PREPARA_ENVIAR_TROPAS = os.path.join(project_root, "backend", "actions"
 # Funções Auxiliares
 # ---------------------------------------------------------------------------
 def verificar_dispositivo_conectado():
-    """Verifica se o dispositivo está conectado via ADB."""
-    try:
-        result = subprocess.run(
-            ["adb", "devices"], 
-            capture_output=True, 
-            text=True, 
-            timeout=5
-        )
-        # Verifica se o DEVICE_ID está na lista de dispositivos
-        return DEVICE_ID in result.stdout and "device" in result.stdout
-    except Exception:
-        return False
+    """Verifica se o dispositivo está conectado (estado em memória do registro track-devices)."""
+    return get_device_registry().is_online(DEVICE_ID)
 
 def aguardar_reconexao():
     """Aguarda o dispositivo reconectar. Retorna quando conectado."""
@@ -86,22 +101,19 @@ def aguardar_reconexao():
     print("="*80)
     print()  # Linha em branco
     
-    tentativas = 0
-    while True:
-        tentativas += 1
-        
-        if verificar_dispositivo_conectado():
-            print("\n\n" + "="*80)
-            print(f"✅ DISPOSITIVO RECONECTADO! (após {tentativas} tentativas)")
-            print("="*80)
-            print("🔄 Resetando estado e reiniciando bot...")
-            time.sleep(2.0)  # Aguarda estabilização
-            return True
-        
-        # Mostra contador em linha única (sobrescreve)
-        print(f"\r⏳ Tentativa {tentativas}... ", end='', flush=True)
-        
-        time.sleep(3.0)  # Aguarda 3s entre verificações
+    # O registro acorda esta espera no instante em que o ADB reporta o dispositivo de volta
+    inicio = time.time()
+    registry = get_device_registry()
+    while not registry.wait_for_device(DEVICE_ID, timeout=30):
+        # Mostra o tempo de espera em linha única (sobrescreve)
+        print(f"\r⏳ Aguardando há {time.time() - inicio:.0f}s... ", end='', flush=True)
+    
+    print("\n\n" + "="*80)
+    print(f"✅ DISPOSITIVO RECONECTADO! (após {time.time() - inicio:.0f}s)")
+    print("="*80)
+    print("🔄 Resetando estado e reiniciando bot...")
+    time.sleep(2.0)  # Aguarda estabilização
+    return True
 
 def execute_back(times=1, delay=0.3):
     """Executa o comando BACK N vezes."""
@@ -207,12 +219,162 @@ def navegar_para_lista_rallys(rally_sequence, fila_atual):
     
     return False
 
-def processar_fila(fila_num, rally_sequence, scroll_config, fila_atual):
+def localizar_filas(frame_image):
+    """Centros (x, y) de todas as linhas visíveis da lista, de cima para baixo. [] sem ROW_TEMPLATE."""
+    row_path = get_template_path(ROW_TEMPLATE)
+    if frame_image is None or not os.path.exists(row_path):
+        return []
+    ocorrencias = find_all_images_in_frame(frame_image, row_path, device_id=DEVICE_ID)
+    return [(x + w // 2, y + h // 2) for _, (x, y, w, h) in ocorrencias]
+
+def linhas_detectadas():
+    """True se as linhas da lista vêm do ROW_TEMPLATE (sem ele, a grade fixa de ROW_PITCH)."""
+    return os.path.exists(get_template_path(ROW_TEMPLATE))
+
+def na_lista_rallys():
+    """True se a lista de rallys (cabeçalho 03_fila.png) está na tela agora."""
+    frame = capture_frame(DEVICE_ID)
+    if frame.image is None:
+        return False
+    return detect_in_frame(frame.image, get_template_path("03_fila.png"), device_id=DEVICE_ID) is not None
+
+def faixa_visivel(indice):
+    """Faixa (y mínimo, y máximo) da tela em que uma linha da lista está inteira e clicável."""
+    _, topo, _, altura = indice.roi
+    margem = get_device_profile(DEVICE_ID).length(ROW_PITCH) // 3
+    return topo + margem, topo + altura - margem
+
+def linhas_visiveis(frame_image, indice):
+    """
+    y (tela) das linhas visíveis no frame: detectadas pelo ROW_TEMPLATE ou, sem ele, pela grade
+    fixa (cabeçalho + OFFSETS_FIXOS[1] + k * ROW_PITCH) deslocada pelo quanto a lista já rolou.
+    """
+    linhas = localizar_filas(frame_image)
+    if linhas:
+        return [ly for _, ly in linhas]
+    profile = get_device_profile(DEVICE_ID)
+    _, header_y, _, header_h = indice.anchor
+    primeira = header_y + header_h // 2 + profile.length(OFFSETS_FIXOS[1])  # y absoluto (lista no topo)
+    passo = profile.length(ROW_PITCH)
+    minimo, maximo = faixa_visivel(indice)
+    ys = []
+    y = indice.screen_y(primeira)
+    while y <= maximo:
+        if y >= minimo:
+            ys.append(y)
+        y += passo
+    return ys
+
+def indexar_lista_rallys(scroll_config):
+    """
+    Varre a lista de rallys uma única vez, do topo até a lista parar de rolar, e devolve um ListIndex
+    com a posição absoluta de cada linha. None se o cabeçalho (03_fila.png) não aparece.
+
+    Cada swipe é medido por correlação de fase entre o frame anterior e o atual: as linhas vistas em
+    frames diferentes caem na mesma coordenada da lista mesmo quando o swipe anda mais ou menos que o
+    pedido. Ao final a lista fica rolada (indice.offset diz onde).
+    """
+    profile = get_device_profile(DEVICE_ID)
+    frame = capture_frame(DEVICE_ID)
+    header = detect_in_frame(frame.image, get_template_path("03_fila.png"), device_id=DEVICE_ID) if frame.image is not None else None
+    if header is None:
+        print("⚠️ Cabeçalho da lista (03_fila.png) não encontrado. Seguindo sem índice.")
+        return None
+    
+    _, header_y, _, header_h = header
+    topo = header_y + header_h
+    altura_tela, largura_tela = frame.image.shape[:2]
+    indice = ListIndex(roi=(0, topo, largura_tela, altura_tela - topo),
+                       merge_distance=profile.length(ROW_SNAP_TOLERANCE), anchor=header)
+    indice.measure(frame.image)
+    indice.add_rows(linhas_visiveis(frame.image, indice))
+    
+    config = scroll_config.get("4", {})
+    start_coords, end_coords = profile.scroll_from_config(config.get("center_x", 1200), config.get("start_y", 800), INDEX_SCROLL_DISTANCE)
+    distancia = profile.length(INDEX_SCROLL_DISTANCE)
+    swipes = 0
+    for swipes in range(1, INDEX_MAX_SCROLLS + 1):
+        simulate_scroll(DEVICE_ID, start_coords=start_coords, end_coords=end_coords, duration_ms=config.get("scroll_duration", 1000))
+        time.sleep(0.8)
+        frame = capture_frame(DEVICE_ID)
+        andou = indice.measure(frame.image, expected=distancia) if frame.image is not None else None
+        if andou is None:
+            print("⚠️ A tela mudou durante a varredura da lista. Usando o índice parcial.")
+            break
+        indice.add_rows(linhas_visiveis(frame.image, indice))
+        if andou < STALL_PX:
+            break  # Fim da lista
+    
+    print(f"🗂️ Lista indexada: {len(indice.rows)} linhas em {swipes} swipes (rolagem total {indice.offset:.0f}px)")
+    return indice
+
+def mostrar_linha(indice, fila_num, scroll_config):
+    """
+    Rola a lista, a partir de onde ela estiver, até a linha indexada fila_num ficar visível.
+
+    A distância de cada swipe sai do índice (quanto falta para a linha chegar ao meio da lista) e o
+    deslocamento real é medido por correlação de fase. Se o frame não corresponde mais ao último
+    medido (a tela foi reaberta), a lista é tratada como de volta ao topo.
+
+    Returns:
+        tuple: (frame, y do clique) ou None se a linha não pôde ser trazida à tela.
+    """
+    profile = get_device_profile(DEVICE_ID)
+    alvo = indice.rows[fila_num - 1]
+    minimo, maximo = faixa_visivel(indice)
+    meio = (minimo + maximo) // 2
+    maximo_swipe = profile.length(INDEX_SCROLL_DISTANCE)
+    config = scroll_config.get("4", {})
+    scroll_x = profile.from_reference(config.get("center_x", 1200), 0)[0]
+    esperado = None
+    
+    for _ in range(VISIT_MAX_SCROLLS + 1):
+        frame = capture_frame(DEVICE_ID)
+        if frame.image is None:
+            return None
+        if indice.measure(frame.image, expected=esperado) is None:
+            indice.reset()
+            indice.measure(frame.image)
+        
+        y = indice.screen_y(alvo)
+        if minimo <= y <= maximo:
+            linhas = localizar_filas(frame.image)
+            if linhas:
+                linha_y = min((ly for _, ly in linhas), key=lambda ly: abs(ly - y))
+                if abs(linha_y - y) <= profile.length(ROW_SNAP_TOLERANCE):
+                    y = linha_y
+            return frame, y
+        
+        # Swipe da distância que falta (limitado ao que ainda dá para medir); positivo = lista avança
+        esperado = max(-maximo_swipe, min(maximo_swipe, y - meio))
+        inicio_y = maximo if esperado > 0 else minimo
+        simulate_scroll(DEVICE_ID, start_coords=[scroll_x, inicio_y], end_coords=[scroll_x, inicio_y - esperado],
+                        duration_ms=config.get("scroll_duration", 1000))
+        time.sleep(0.8)
+    return None
+
+def processar_fila(fila_num, rally_sequence, scroll_config, fila_atual, indice=None):
     """
     Processa uma única fila.
+    Com o índice da lista (indexar_lista_rallys), a fila é trazida à tela pela posição medida;
+    sem ele, pelos scrolls do scroll_config.json a partir do topo.
     """
     # print(f"\n🎯 [Fila {fila_num}] Iniciando processamento...")
     
+    if indice is not None and fila_num <= len(indice.rows):
+        # 1-2. LINHA INDEXADA: swipe direto até a posição, sem recontar scrolls
+        alvo = mostrar_linha(indice, fila_num, scroll_config)
+        if alvo is None:
+            print(f"⚠️ Fila {fila_num} não pôde ser trazida à tela pelo índice.")
+            return 'REFRESH'
+        frame, click_y = alvo
+        x, y, w, h = indice.anchor
+        center_x = x + w // 2
+        center_y = y + h // 2
+        click_x = center_x
+        offset_y = click_y - center_y
+        return clicar_e_juntar(fila_num, rally_sequence, fila_atual, frame, (x, y, w, h), click_x, click_y, offset_y)
+    
     # 1. SCROLL (se necessário) - USA CONFIGURAÇÕES DO JSON
     if fila_num >= 4:
         fila_key = str(fila_num)
@@ -233,7 +395,8 @@ def processar_fila(fila_num, rally_sequence, scroll_config, fila_atual):
             start_y = 800
             scroll_duration = 1000
         
-        end_y = start_y - row_height
+        # Valores do JSON estão na resolução de referência -> pixels do dispositivo
+        start_coords, end_coords = get_device_profile(DEVICE_ID).scroll_from_config(center_x, start_y, row_height)
         
         # print(f"📜 Scroll Config para Fila {fila_num}:")
         # print(f"   • Scrolls: {num_scrolls}x")
@@ -243,7 +406,7 @@ def processar_fila(fila_num, rally_sequence, scroll_config, fila_atual):
         
         try:
             for i in range(num_scrolls):
-                simulate_scroll(DEVICE_ID, start_coords=[center_x, start_y], end_coords=[center_x, end_y], duration_ms=scroll_duration)
+                simulate_scroll(DEVICE_ID, start_coords=start_coords, end_coords=end_coords, duration_ms=scroll_duration)
                 time.sleep(0.8)
             
             time.sleep(0.5)
@@ -253,12 +416,12 @@ def processar_fila(fila_num, rally_sequence, scroll_config, fila_atual):
             return 'ERROR'
 
     # 2. DETECTAR E CLICAR NA FILA
-    offset_y = OFFSETS_FIXOS.get(fila_num, OFFSET_CLICK_APOS_SCROLL)
+    offset_y = get_device_profile(DEVICE_ID).length(OFFSETS_FIXOS.get(fila_num, OFFSET_CLICK_APOS_SCROLL))
     template_path = get_template_path("03_fila.png")
-    screenshot_path = os.path.join(project_root, "temp_screenshots", "temp_screenshot_rally.png")
     
-    capture_screen(DEVICE_ID, screenshot_path)
-    result = find_image_on_screen(screenshot_path, template_path)
+    # Captura em memória: o mesmo frame serve para a detecção e para a imagem de debug
+    frame = capture_frame(DEVICE_ID)
+    result = detect_in_frame(frame.image, template_path, device_id=DEVICE_ID) if frame.image is not None else None
     
     if result is None:
         print(f"⚠️ Fila {fila_num} (template 03_fila.png) não encontrada.")
@@ -271,24 +434,31 @@ def processar_fila(fila_num, rally_sequence, scroll_config, fila_atual):
     click_x = center_x
     click_y = center_y + offset_y
     
+    # Linha detectada mais próxima da posição calculada (corrige scroll que parou fora do passo)
+    linhas = localizar_filas(frame.image)
+    if linhas:
+        linha_y = min((ly for _, ly in linhas), key=lambda ly: abs(ly - click_y))
+        if abs(linha_y - click_y) <= get_device_profile(DEVICE_ID).length(ROW_SNAP_TOLERANCE):
+            click_y = linha_y
+    
+    return clicar_e_juntar(fila_num, rally_sequence, fila_atual, frame, result, click_x, click_y, offset_y)
+
+def clicar_e_juntar(fila_num, rally_sequence, fila_atual, frame, header, click_x, click_y, offset_y):
+    """Clica na linha da fila e segue Juntar → Tropas → Marchar. Retorna o status da fila."""
+    x, y, w, h = header
+    center_y = y + h // 2
+    
     # print(f"📍 Template encontrado em ({x}, {y}) | Centro: ({center_x}, {center_y})")
     # print(f"👆 Clicando na Fila {fila_num} -> Centro Y ({center_y}) + Offset ({offset_y}) = {click_y}")
     
-    # Debug Visual
-    try:
-        import cv2
-        debug_img = cv2.imread(screenshot_path)
-        if debug_img is not None:
-            cv2.rectangle(debug_img, (x, y), (x + w, y + h), (0, 255, 0), 2)
-            cv2.circle(debug_img, (click_x, click_y), 20, (0, 0, 255), -1)
-            cv2.line(debug_img, (click_x, center_y), (click_x, click_y), (255, 0, 0), 2)
-            cv2.putText(debug_img, f"Fila {fila_num} (+{offset_y})", (click_x + 30, click_y), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-            
-            debug_filename = os.path.join(project_root, "temp_screenshots", f"debug_click_fila_{fila_num}.png")
-            cv2.imwrite(debug_filename, debug_img)
-            print(f"🖼️  Debug salvo: {debug_filename}")
-    except Exception as e:
-        print(f"⚠️ Erro ao salvar debug visual: {e}")
+    # Debug Visual (desenho e gravação em segundo plano, fora do caminho do clique)
+    def desenhar_fila(debug_img):
+        cv2.rectangle(debug_img, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cv2.circle(debug_img, (click_x, click_y), 20, (0, 0, 255), -1)
+        cv2.line(debug_img, (click_x, center_y), (click_x, click_y), (255, 0, 0), 2)
+        cv2.putText(debug_img, f"Fila {fila_num} (+{offset_y})", (click_x + 30, click_y), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+    
+    get_debug_writer().submit(frame.image, f"debug_click_fila_{fila_num}", desenhar_fila)
 
     time.sleep(0.5)
     simulate_touch(click_x, click_y, device_id=DEVICE_ID)
@@ -332,40 +502,63 @@ def processar_fila(fila_num, rally_sequence, scroll_config, fila_atual):
 # Tarefas Secundárias (com verificação de gatilho integrada)
 # ---------------------------------------------------------------------------
 
-def executar_com_gatilho(action_name, step_index, sequence, mob_number=""):
+def executar_com_gatilho(action_name, step_index, sequence, mob_number="", watcher=None, source=None):
     """
-    Executa um passo de uma ação, mas ANTES verifica o gatilho.
+    Executa um passo de uma ação, interrompendo-o se o gatilho aparecer.
+
+    O gatilho é verificado pelo TriggerWatcher em cada frame da captura contínua (source), não
+    por uma captura antes de cada passo: as esperas do passo são interrompidas pelo evento do vigia.
+    Sem vigia (template de gatilho ausente), apenas executa o passo.
     Retorna True se o gatilho foi detectado (interrompe), False caso contrário.
     """
     global FLAG_RALLY
     
-    # Captura a tela para o passo atual
-    screenshot_path = os.path.join(project_root, "temp_screenshots", "temp_screenshot_rally.png")
-    capture_screen(DEVICE_ID, screenshot_path)
-    
-    # VERIFICA O GATILHO ANTES DE EXECUTAR O PASSO
-    if verificar_gatilho(screenshot_path):
+    if watcher is not None and watcher.triggered:
         FLAG_RALLY = True
         return True  # Gatilho detectado, interrompe
     
-    # Se não detectou, executa o passo normalmente
-    execultar_acoes(action_name, device_id=DEVICE_ID, account_name="current", sequence_override=[sequence[step_index]], fila_atual=mob_number)
+    execultar_acoes(action_name, device_id=DEVICE_ID, account_name="current", sequence_override=[sequence[step_index]],
+                    fila_atual=mob_number, frame_source=source, abort_event=watcher.event if watcher is not None else None)
+    
+    if watcher is not None and watcher.triggered:
+        FLAG_RALLY = True
+        return True
     return False  # Continua normalmente
 
+
+def aguardar_ou_gatilho(seconds, watcher):
+    """Espera seconds, retornando True assim que o gatilho disparar."""
+    if watcher is None:
+        time.sleep(seconds)
+        return False
+    return watcher.event.wait(seconds)
+
 def executar_tarefas_secundarias():
     """
     Executa tarefas na ordem: Baú → Recursos → Mobs (infinito).
     Interrompe imediatamente se o gatilho for detectado.
     """
-    global FLAG_RALLY
-    
     print("\n" + "="*80)
     print("🔄 MODO IDLE: Executando Tarefas Secundárias")
     print("="*80)
     
-    # Hard Reset para garantir que estamos na tela principal
-    print("🔙 Hard Reset (5x BACK) para Tela Principal...")
-    execute_back(times=5)
+    # Captura contínua compartilhada + vigia do gatilho em segundo plano
+    source = SharedFrameSource(DEVICE_ID).start()
+    watcher = TriggerWatcher(source, GATILHO_TEMPLATE, device_id=DEVICE_ID).start()
+    try:
+        _executar_tarefas_secundarias(source, watcher)
+    finally:
+        watcher.stop()
+        source.stop()
+
+
+def _executar_tarefas_secundarias(source, watcher):
+    global FLAG_RALLY
+    
+    # Volta para a tela principal: rota gravada no índice de telas; sem índice, Hard Reset (5x BACK)
+    if not recover_to_screen("tela_principal", DEVICE_ID):
+        print("🔙 Hard Reset (5x BACK) para Tela Principal...")
+        execute_back(times=5)
     time.sleep(1.5)
     
     # 1. PREPARAÇÃO E PEGAR BAÚ
@@ -377,11 +570,11 @@ def executar_tarefas_secundarias():
     if bau_sequence:
         for i in range(len(bau_sequence)):
             acao_atual = f"📦 Pegando baú #{i}"
-            if executar_com_gatilho("pegar_bau", i, bau_sequence, acao_atual):
+            if executar_com_gatilho("pegar_bau", i, bau_sequence, acao_atual, watcher, source) or aguardar_ou_gatilho(0.5, watcher):
                 print("🚨 Gatilho detectado durante pegar_bau! Abortando tarefas secundárias.")
+                FLAG_RALLY = True
                 execute_back(times=5)
                 return
-            time.sleep(0.5)
         print("✅ pegar_bau concluído.")
     else:
         print("⚠️ Sequência pegar_bau não encontrada. Pulando...")
@@ -396,7 +589,7 @@ def executar_tarefas_secundarias():
     if recursos_sequence:
         for i in range(len(recursos_sequence)):
             acao_atual = f"🌾 Pegando recursos #{i}"
-            if executar_com_gatilho("pegar_recursos", i, recursos_sequence, acao_atual):
+            if executar_com_gatilho("pegar_recursos", i, recursos_sequence, acao_atual, watcher, source):
                 print("🚨 Gatilho detectado durante pegar_recursos! Abortando tarefas secundárias.")
                 execute_back(times=5)
                 return
@@ -421,7 +614,7 @@ def executar_tarefas_secundarias():
             acao_atual = f"⚔️ Matando Mob #{ciclo_mob}"
             
             for i in range(len(mobs_sequence)):
-                if executar_com_gatilho("matar_mobs", i, mobs_sequence, acao_atual):
+                if executar_com_gatilho("matar_mobs", i, mobs_sequence, acao_atual, watcher, source):
                     print("🚨 Gatilho detectado durante matar_mobs! Voltando para Rallies.")
                     execute_back(times=5)
                     return
@@ -438,17 +631,14 @@ def executar_tarefas_secundarias():
                     image_name = str(step)
                 
                 if "01_buscar" in image_name:  # Removido .png para ser mais flexível
-                    click_x = 1200
-                    click_y = 550
+                    # Centro do mapa (1200, 550 na referência 2400x1080)
+                    click_x, click_y = get_device_profile(DEVICE_ID).from_reference(1200, 550)
                     
                     # Debug Visual ANTES do clique (captura a tela atual)
                     # print(f"ℹ️ [Injeção] Preparando clique no centro da tela ({click_x}, {click_y})...")
-                    try:
-                        import cv2
-                        screenshot_path = os.path.join(project_root, "temp_screenshots", "temp_screenshot_rally.png")
-                        capture_screen(DEVICE_ID, screenshot_path)  # Captura ANTES do clique
-                        debug_img = cv2.imread(screenshot_path)
-                        if debug_img is not None:
+                    frame = source.latest()  # Frame mais recente da captura contínua (ANTES do clique)
+                    if frame is not None:
+                        def desenhar_centro(debug_img, click_x=click_x, click_y=click_y):
                             # Desenha um círculo vermelho grande no ponto de clique
                             cv2.circle(debug_img, (click_x, click_y), 30, (0, 0, 255), -1)
                             # Desenha uma cruz amarela para marcar o centro exato
@@ -457,25 +647,27 @@ def executar_tarefas_secundarias():
                             # Adiciona texto descritivo
                             cv2.putText(debug_img, f"CLIQUE CENTRO ({click_x}, {click_y})", (click_x + 40, click_y - 10), 
                                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-                            
-                            debug_filename = os.path.join(project_root, "temp_screenshots", "debug_click_centro.png")
-                            cv2.imwrite(debug_filename, debug_img)
-                            print(f"🖼️ Debug do clique no centro salvo: {debug_filename}")
-                    except Exception as e:
-                        print(f"⚠️ Erro ao salvar debug visual do centro: {e}")
+                        
+                        get_debug_writer().submit(frame.image, "debug_click_centro", desenhar_centro)
                     
                     # Aguarda animação e executa o clique
                     print("ℹ️ Aguardando a animação do mob terminar...")
-                    time.sleep(5.0)
+                    if aguardar_ou_gatilho(5.0, watcher):
+                        break
                     
                     print(f"👆 Clicando no centro da tela em: ({click_x}, {click_y})...")
                     simulate_touch(click_x, click_y, DEVICE_ID) 
-                    time.sleep(0.5)
+                    aguardar_ou_gatilho(0.5, watcher)
 
-                time.sleep(0.5)
+                if aguardar_ou_gatilho(0.5, watcher):
+                    break
             
             # Pequeno delay entre ciclos de mob
-            time.sleep(1.0)
+            if aguardar_ou_gatilho(1.0, watcher):
+                print("🚨 Gatilho detectado durante matar_mobs! Voltando para Rallies.")
+                FLAG_RALLY = True
+                execute_back(times=5)
+                return
     else:
         print("⚠️ Sequência matar_mobs não encontrada.")
         time.sleep(3)
@@ -516,16 +708,31 @@ def main():
             
             rallies_joined = 0  # Contador de rallies que conseguimos entrar
             jah_na_lista = False  # Flag para indicar se já estamos na lista de rallys
+            indice = None  # Posições de todas as linhas (uma varredura por ciclo)
+            
+            # VARREDURA ÚNICA: indexa a lista antes das filas (sem índice, scroll por fila do JSON)
+            if navegar_para_lista_rallys(rally_sequence, fila_atual="🗂️ Indexando lista"):
+                indice = indexar_lista_rallys(scroll_config)
+                jah_na_lista = True
+            total_filas = MAX_FILAS
+            if indice is not None and indice.rows:
+                # Sem ROW_TEMPLATE as linhas são a grade fixa (inclusive o vazio depois do último rally):
+                # só linhas detectadas pelo template substituem o limite de MAX_FILAS
+                total_filas = len(indice.rows) if linhas_detectadas() else min(len(indice.rows), MAX_FILAS)
             
-            # Loop de Filas (1-9) - NUNCA PARA NO MEIO
-            for fila in range(1, MAX_FILAS + 1):
-                fila_atual = f"⚔️  Fila {fila}/{MAX_FILAS}"
+            # Loop de Filas - NUNCA PARA NO MEIO
+            for fila in range(1, total_filas + 1):
+                fila_atual = f"⚔️  Fila {fila}/{total_filas}"
                 print(f"\n{'='*60}")
                 print(f"🎯 Iniciando processo na {fila_atual}")
                 print(f"{'='*60}")
                 
                 # NAVEGAÇÃO ANTES DE CADA FILA (Aliança → Batalha)
                 # OTIMIZAÇÃO: Pula navegação se já estamos na lista (após falha no Passo 5)
+                # Com o índice, a mesma sessão da lista serve para todas as filas: só navega de novo se
+                # a junção anterior realmente saiu da lista (o índice segue da posição em que ela está)
+                if not jah_na_lista and indice is not None and na_lista_rallys():
+                    jah_na_lista = True
                 if not jah_na_lista:
                     if not navegar_para_lista_rallys(rally_sequence, fila_atual=fila_atual):
                         print("🔙 Falha na navegação. Resetando (5x BACK)...")
@@ -533,12 +740,14 @@ def main():
                         time.sleep(1.0)
                         jah_na_lista = False  # Reset flag
                         continue  # Pula para próxima fila
+                    if indice is not None:
+                        indice.reset()  # Lista reaberta: de volta ao topo
                 else:
                     print("⚡ OTIMIZAÇÃO: Já estamos na lista, pulando navegação!")
                     jah_na_lista = False  # Reset flag para próxima iteração
                 
                 # PROCESSAR FILA
-                status = processar_fila(fila, rally_sequence, scroll_config, fila_atual)
+                status = processar_fila(fila, rally_sequence, scroll_config, fila_atual, indice)
                 
                 # Tratamento de status
                 if status == 'REFRESH':
@@ -611,6 +820,7 @@ def main():
             print("🔄 Retornando ao modo rally. Resetando flag de primeiro ciclo...")
 
 if __name__ == "__main__":
+    get_device_registry()  # Acompanha conexões/desconexões em segundo plano (track-devices)
     while True:  # Loop infinito para recuperação de desconexão
         try:
             main()
@@ -621,7 +831,7 @@ if __name__ == "__main__":
             error_msg = str(e)
             
             # Detecta desconexão do dispositivo
-            if "device" in error_msg.lower() and "not found" in error_msg.lower():
+            if ("device" in error_msg.lower() and "not found" in error_msg.lower()) or not verificar_dispositivo_conectado():
                 print(f"\n⚠️ Erro de conexão detectado: {e}")
                 
                 # Aguarda reconexão
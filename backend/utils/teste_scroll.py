@@ -1,6 +1,8 @@
 # Nome do Arquivo: teste_scroll.py
 # Descrição: Script de Calibração Manual de Scroll para Rally Bot
 # Versão: 01.00.00
+# Versão: 01.01.00 (Calibração automática: swipes medidos por correlação de fase, modelo linear gravado nos JSONs)
+# Versão: 01.01.01 (Calibração grava só o scroll_config.json; o seletor de contas do login não é medido)
 # Analista: Antigravity
 # Programador: Gled Carneiro
 # -----------------------------------------------------------------------------
@@ -10,6 +12,10 @@ import os
 import time
 import json
 import subprocess
+import math
+from datetime import datetime
+
+import numpy as np
 
 # ---------------------------------------------------------------------------
 # Configuração de caminho e importação de módulos do projeto
@@ -24,6 +30,10 @@ sys.path.append(os.path.join(backend_dir, "core"))
 from action_executor import execultar_acoes, simulate_scroll
 from adb_utils import simulate_touch, capture_screen
 from image_detection import find_image_on_screen
+from device_profile import get_device_profile
+from frame_source import capture_frame
+from detection_pool import detect_in_frame
+from scroll_tracking import measure_scroll, STALL_PX, MIN_RESPONSE
 
 # ---------------------------------------------------------------------------
 # Configurações
@@ -44,6 +54,12 @@ OFFSETS_FIXOS = {
 }
 OFFSET_CLICK_APOS_SCROLL = 650
 
+# Calibração automática (px na resolução de referência)
+CALIBRACAO_SWIPES = [80, 140, 200, 260]  # Comprimentos medidos (curtos: frames com sobreposição)
+CALIBRACAO_REPETICOES = 2                # Pares (sobe + desce) por comprimento
+CALIBRACAO_MAX_DIVERGENCIA = 0.15        # Subida e descida diferentes além disso: par descartado (fim da lista)
+SWIPE_MIN_END_Y = 100                    # O swipe não termina acima disso (fora da lista)
+
 # ---------------------------------------------------------------------------
 # Funções Auxiliares
 # ---------------------------------------------------------------------------
@@ -149,7 +165,9 @@ def executar_scroll_fila(fila_num, scroll_config):
     try:
         for i in range(num_scrolls):
             print(f"   🔄 Scroll {i+1}/{num_scrolls}...")
-            simulate_scroll(DEVICE_ID, start_coords=[center_x, start_y], end_coords=[center_x, end_y], duration_ms=scroll_duration)
+            # Valores do JSON estão na resolução de referência -> pixels do dispositivo
+            start_coords, end_coords = get_device_profile(DEVICE_ID).scroll_from_config(center_x, start_y, row_height)
+            simulate_scroll(DEVICE_ID, start_coords=start_coords, end_coords=end_coords, duration_ms=scroll_duration)
             time.sleep(0.8)
         
         time.sleep(0.5)
@@ -162,7 +180,7 @@ def executar_scroll_fila(fila_num, scroll_config):
 
 def marcar_posicao_fila(fila_num):
     """Captura screenshot e marca visualmente onde a fila deveria estar."""
-    offset_y = OFFSETS_FIXOS.get(fila_num, OFFSET_CLICK_APOS_SCROLL)
+    offset_y = get_device_profile(DEVICE_ID).length(OFFSETS_FIXOS.get(fila_num, OFFSET_CLICK_APOS_SCROLL))
     template_path = get_template_path("03_fila.png")
     screenshot_path = os.path.join(project_root, "temp_screenshots", f"calibracao_fila_{fila_num}.png")
     
@@ -212,6 +230,155 @@ def marcar_posicao_fila(fila_num):
         print(f"⚠️ Erro ao salvar debug visual: {e}")
         return False
 
+# ---------------------------------------------------------------------------
+# Calibração Automática
+# ---------------------------------------------------------------------------
+def medir_swipe(profile, roi, center_x, start_y, comprimento, duracao, esperado=None):
+    """
+    Executa um swipe de comprimento px (referência; negativo = desce a lista) e mede o
+    deslocamento real do conteúdo por correlação de fase entre os frames antes e depois.
+
+    Returns:
+        float: Deslocamento em px de referência (positivo = lista avançou), ou None se não mediu.
+    """
+    antes = capture_frame(DEVICE_ID).image
+    inicio_y = start_y if comprimento > 0 else start_y - abs(comprimento)
+    start_coords, end_coords = profile.scroll_from_config(center_x, inicio_y, comprimento)
+    simulate_scroll(DEVICE_ID, start_coords=start_coords, end_coords=end_coords, duration_ms=duracao)
+    time.sleep(0.8)
+    depois = capture_frame(DEVICE_ID).image
+    if antes is None or depois is None:
+        return None
+    esperado_px = profile.length(esperado) if esperado is not None else None
+    dy, response = measure_scroll(antes, depois, roi, expected=esperado_px)
+    if response < MIN_RESPONSE:
+        return None
+    return dy / profile.ui_scale
+
+def ajustar_modelo(amostras):
+    """Reta deslocamento = a * swipe + b (mínimos quadrados) e o erro RMS, em px de referência."""
+    swipes = np.array([s for s, _ in amostras], dtype=np.float64)
+    deslocamentos = np.array([d for _, d in amostras], dtype=np.float64)
+    a, b = np.polyfit(swipes, deslocamentos, 1)
+    erro = float(np.sqrt(np.mean((a * swipes + b - deslocamentos) ** 2)))
+    return float(a), float(b), erro
+
+def planejar_scroll(deslocamento, a, b, start_y):
+    """(num_scrolls, row_height) para andar deslocamento px com swipes dentro da tela."""
+    if deslocamento <= 0:
+        return 0, 0
+    maximo = a * (start_y - SWIPE_MIN_END_Y) + b
+    num_scrolls = max(1, math.ceil(deslocamento / maximo))
+    return num_scrolls, int(round((deslocamento / num_scrolls - b) / a))
+
+def aplicar_calibracao(path, chave, a, b, info):
+    """
+    Recalcula num_scrolls/row_height das entradas que rolam (4+) de um JSON de scroll.
+
+    A linha N fica, com a lista no topo, em offset(1) + (N-1) * altura da linha abaixo do template;
+    depois do scroll ela deve estar em offset_y (ou OFFSET_CLICK_APOS_SCROLL). A diferença é o
+    deslocamento que o modelo converte em swipes.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    entradas = config.get(chave, {})
+    offsets = {n: entradas.get(str(n), {}).get("offset_y", OFFSETS_FIXOS[n]) for n in (1, 2, 3)}
+    altura_linha = (offsets[3] - offsets[1]) / 2.0
+    
+    for key, entrada in entradas.items():
+        n = int(key)
+        if n <= 3:
+            continue
+        alvo = entrada.get("offset_y", OFFSET_CLICK_APOS_SCROLL)
+        deslocamento = offsets[1] + (n - 1) * altura_linha - alvo
+        num_scrolls, row_height = planejar_scroll(deslocamento, a, b, entrada.get("start_y", 800))
+        print(f"   • {chave} {n}: deslocamento {deslocamento:.0f}px → {num_scrolls}x {row_height}px "
+              f"(antes: {entrada.get('num_scrolls', 0)}x {entrada.get('row_height', 0)}px)")
+        entrada["num_scrolls"] = num_scrolls
+        entrada["row_height"] = row_height
+        entrada["scroll_duration"] = info["duracao_ms"]
+    
+    config["_calibracao"] = info
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    print(f"✅ {os.path.basename(path)} atualizado.")
+
+def calibrar_automaticamente(rally_sequence, scroll_config):
+    """
+    Mede swipes de vários comprimentos na lista de rallys, ajusta o modelo linear
+    deslocamento = a * swipe + b deste dispositivo e regrava scroll_config.json.
+    O login_scroll_config.json (seletor de contas Google) não é tocado: é outra lista, que não
+    foi medida aqui.
+
+    Cada comprimento é medido em pares: sobe a lista e desce de novo. Assim ela volta perto do
+    topo, e um par cuja subida e descida divergem (lista curta, chegou ao fim) é descartado.
+    """
+    print(f"\n{'='*80}")
+    print("🤖 CALIBRAÇÃO AUTOMÁTICA DE SCROLL")
+    print(f"{'='*80}")
+    
+    if not navegar_para_lista_rallys(rally_sequence):
+        print("❌ Falha na navegação. Tente novamente.")
+        return scroll_config
+    
+    profile = get_device_profile(DEVICE_ID)
+    frame = capture_frame(DEVICE_ID).image
+    header = detect_in_frame(frame, get_template_path("03_fila.png"), device_id=DEVICE_ID) if frame is not None else None
+    if header is None:
+        print("❌ Template 03_fila.png não encontrado: a lista de rallys não está na tela.")
+        return scroll_config
+    topo = header[1] + header[3]
+    roi = (0, topo, frame.shape[1], frame.shape[0] - topo)
+    
+    base = scroll_config.get("4", {})
+    center_x = base.get("center_x", 1200)
+    start_y = base.get("start_y", 800)
+    duracao = base.get("scroll_duration", 1000)
+    
+    amostras = []
+    for comprimento in CALIBRACAO_SWIPES:
+        for _ in range(CALIBRACAO_REPETICOES):
+            # Com 2+ amostras, o modelo parcial desempata picos repetidos (linhas parecidas)
+            esperado = None
+            if len({s for s, _ in amostras}) >= 2:
+                a, b, _ = ajustar_modelo(amostras)
+                esperado = a * comprimento + b
+            subida = medir_swipe(profile, roi, center_x, start_y, comprimento, duracao, esperado)
+            descida = medir_swipe(profile, roi, center_x, start_y, -comprimento, duracao,
+                                  -esperado if esperado is not None else None)
+            if subida is None or descida is None:
+                print(f"   ⚠️ Swipe {comprimento}px: não foi possível medir (tela mudou?)")
+                continue
+            print(f"   📏 Swipe {comprimento}px → sobe {subida:.0f}px / desce {-descida:.0f}px")
+            if subida < STALL_PX or abs(subida + descida) > CALIBRACAO_MAX_DIVERGENCIA * subida:
+                print("      ↪ descartado (lista parou no fim ou medidas divergentes)")
+                continue
+            amostras.append((comprimento, (subida - descida) / 2.0))
+    
+    execute_back(times=5)
+    if len({s for s, _ in amostras}) < 2:
+        print("❌ Amostras insuficientes. Abra uma lista com mais rallys e tente de novo.")
+        return scroll_config
+    
+    a, b, erro = ajustar_modelo(amostras)
+    print(f"\n📐 Modelo: deslocamento = {a:.3f} × swipe {b:+.1f}px (erro RMS {erro:.1f}px, {len(amostras)} amostras)")
+    if a <= 0:
+        print("❌ Modelo inválido (a lista não acompanhou os swipes). Nada foi gravado.")
+        return scroll_config
+    
+    info = {
+        "device_id": DEVICE_ID,
+        "data": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "px_por_px_swipe": round(a, 4),
+        "deslocamento_base_px": round(b, 1),
+        "erro_rms_px": round(erro, 1),
+        "amostras": len(amostras),
+        "duracao_ms": duracao,
+    }
+    print("\n💾 Gravando configurações:")
+    aplicar_calibracao(CONFIG_PATH, "filas", a, b, info)
+    return load_scroll_config()
+
 # ---------------------------------------------------------------------------
 # Menu Interativo
 # ---------------------------------------------------------------------------
@@ -223,6 +390,7 @@ def menu_principal():
     print("\nOpções:")
     print("  [1-9] - Testar scroll para fila específica")
     print("  [A]   - Testar todas as filas (4-9) em sequência")
+    print("  [C]   - Calibração automática (mede os swipes e grava o scroll_config.json)")
     print("  [E]   - Editar configuração de uma fila")
     print("  [V]   - Visualizar configurações atuais")
     print("  [R]   - Reset (voltar para tela inicial)")
@@ -385,6 +553,9 @@ def main():
         elif escolha == "A":
             testar_todas_filas(rally_sequence, scroll_config)
         
+        elif escolha == "C":
+            scroll_config = calibrar_automaticamente(rally_sequence, scroll_config)
+        
         elif escolha == "E":
             scroll_config = editar_configuracao_fila(scroll_config)
         